@@ -0,0 +1,155 @@
+"""Per-room actor: one task applies every event of a room, in arrival order."""
+
+import asyncio
+import os
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, Optional
+from app.metrics import metrics
+
+# Code changes a room accepts ahead of its actor before senders stop reading their sockets
+WS_ROOM_MAILBOX_SIZE = int(os.getenv("WS_ROOM_MAILBOX_SIZE", "256"))
+
+Handler = Callable[..., Awaitable[Any]]
+
+
+class _Mail:
+    """A handler call waiting in a mailbox."""
+
+    __slots__ = ("handler", "args", "kwargs", "future", "credited", "key")
+
+    def __init__(self, handler: Handler, args, kwargs, future=None, credited=False, key=None):
+        self.handler = handler
+        self.args = args
+        self.kwargs = kwargs
+        # Set for call(): the caller waits for the result
+        self.future: Optional[asyncio.Future] = future
+        # Holds a mailbox credit, returned once the handler has run
+        self.credited = credited
+        # Coalescing key for post_latest()
+        self.key = key
+
+
+class RoomActor:
+    """
+    Task that owns a room: handlers posted to its mailbox run one at a time, in order.
+
+    Joins, ops, cursors and leaves of a room are all applied by this task,
+    so they never interleave with each other and a slow room only delays
+    itself. The task starts with the first message and exits once the
+    mailbox is empty and ``keep_alive()`` is false (the room has no
+    connections left), calling ``on_exit``.
+    """
+
+    def __init__(
+        self,
+        room_id: str,
+        keep_alive: Callable[[], bool],
+        on_exit: Callable[["RoomActor"], None],
+        capacity: int = WS_ROOM_MAILBOX_SIZE,
+    ):
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.room_id = room_id
+        self.loop = asyncio.get_running_loop()
+        self._keep_alive = keep_alive
+        self._on_exit = on_exit
+        self._mailbox: Deque[_Mail] = deque()
+        self._wakeup = asyncio.Event()
+        # Bounds the credited (send) messages waiting in the mailbox
+        self._credits = asyncio.Semaphore(capacity)
+        # key -> newest post_latest() message; older ones with the same key are skipped
+        self._latest: Dict[Hashable, _Mail] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._mailbox)
+
+    def is_current(self) -> bool:
+        """True when called from the actor's own task (posting from there would deadlock a call())."""
+        return self._task is not None and asyncio.current_task() is self._task
+
+    def post(self, handler: Handler, *args, **kwargs):
+        """Queue ``handler(*args, **kwargs)`` without waiting for it; errors are logged."""
+        self._enqueue(_Mail(handler, args, kwargs))
+
+    def post_latest(self, key: Hashable, handler: Handler, *args, **kwargs):
+        """Like post(), but a newer message with the same ``key`` supersedes this one if it has not run yet."""
+        mail = _Mail(handler, args, kwargs, key=key)
+        self._latest[key] = mail
+        self._enqueue(mail)
+
+    async def send(self, handler: Handler, *args, **kwargs):
+        """
+        Queue ``handler(*args, **kwargs)`` once the mailbox has room.
+
+        Senders wait while ``capacity`` credited messages are pending, which
+        stops them reading from their sockets until the room catches up.
+        """
+        await self._credits.acquire()
+        self._enqueue(_Mail(handler, args, kwargs, credited=True))
+
+    async def call(self, handler: Handler, *args, **kwargs) -> Any:
+        """Queue ``handler(*args, **kwargs)`` and wait for its result (or exception)."""
+        future = self.loop.create_future()
+        self._enqueue(_Mail(handler, args, kwargs, future=future))
+        return await future
+
+    def wake(self):
+        """Have the actor re-check ``keep_alive()`` (e.g. the room emptied outside of it)."""
+        self._wakeup.set()
+
+    def stop(self):
+        """Cancel the task and every pending message."""
+        if self._task is not None:
+            self._task.cancel()
+        while self._mailbox:
+            mail = self._mailbox.popleft()
+            if mail.future is not None:
+                mail.future.cancel()
+            if mail.credited:
+                self._credits.release()
+        self._latest.clear()
+
+    def _enqueue(self, mail: _Mail):
+        self._mailbox.append(mail)
+        self._wakeup.set()
+        if self._task is None or self._task.done():
+            self._task = self.loop.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            while self._mailbox:
+                await self._deliver(self._mailbox.popleft())
+            if not self._keep_alive():
+                # No await between the empty check and on_exit: nothing can be queued in between
+                self._on_exit(self)
+                return
+            self._wakeup.clear()
+            await self._wakeup.wait()
+
+    async def _deliver(self, mail: _Mail):
+        try:
+            if mail.key is not None:
+                if self._latest.get(mail.key) is not mail:
+                    metrics.incr("ws_room_coalesced_total")
+                    return
+                del self._latest[mail.key]
+            if mail.future is not None and mail.future.cancelled():
+                return
+            result = await mail.handler(*mail.args, **mail.kwargs)
+            if mail.future is not None and not mail.future.done():
+                mail.future.set_result(result)
+        except asyncio.CancelledError:
+            # stop(): the caller must not wait forever for a message that will never finish
+            if mail.future is not None:
+                mail.future.cancel()
+            raise
+        except Exception as e:
+            if mail.future is not None:
+                if not mail.future.done():
+                    mail.future.set_exception(e)
+            else:
+                print(f"[Rooms] Error handling event in room {self.room_id}: {e}")
+        finally:
+            if mail.credited:
+                self._credits.release()
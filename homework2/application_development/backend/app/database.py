@@ -1,7 +1,7 @@
 """Database configuration and session management."""
 
 import os
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect
 from sqlalchemy.orm import sessionmaker, Session, declarative_base
 from typing import Generator
 
@@ -54,8 +54,15 @@ def init_db():
     Initialize database by creating all tables.
     
     Call this function on application startup to create tables.
+    Indexes added to existing tables after they were created are created too.
     """
     Base.metadata.create_all(bind=engine)
+    inspector = inspect(engine)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
 
 
 def drop_db():
@@ -0,0 +1,592 @@
+"""Server-side code execution on a pool of prewarmed, sandboxed worker processes."""
+
+import asyncio
+import os
+import re
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import asdict, dataclass, replace
+from typing import Dict, List, Optional
+from app.metrics import metrics
+from app.runcache import ResultCache, cache_key
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - not available on Windows
+    resource = None
+
+# Maximum number of programs running at the same time (one per core by default)
+EXEC_WORKERS = int(os.getenv("EXEC_WORKERS", str(os.cpu_count() or 1)))
+# Idle interpreters kept started per language, ready to receive code
+EXEC_WARM_WORKERS = int(os.getenv("EXEC_WARM_WORKERS", str(EXEC_WORKERS)))
+# Wall-clock limit of a run
+EXEC_TIMEOUT_SECONDS = float(os.getenv("EXEC_TIMEOUT_SECONDS", "5"))
+# CPU-time limit of a run (RLIMIT_CPU)
+EXEC_CPU_SECONDS = int(os.getenv("EXEC_CPU_SECONDS", "5"))
+# Memory limit of a run
+EXEC_MEMORY_MB = int(os.getenv("EXEC_MEMORY_MB", "256"))
+# stdout/stderr beyond this many bytes per stream are discarded and the run is stopped
+EXEC_MAX_OUTPUT_BYTES = int(os.getenv("EXEC_MAX_OUTPUT_BYTES", str(64 * 1024)))
+# Largest file a program may write inside its scratch directory (RLIMIT_FSIZE)
+EXEC_MAX_FILE_BYTES = int(os.getenv("EXEC_MAX_FILE_BYTES", str(1024 * 1024)))
+EXEC_NODE_BINARY = os.getenv("EXEC_NODE_BINARY", "node")
+# Isolation of the workers: "bwrap" (bubblewrap: read-only system directories, only the
+# scratch directory writable, no network, own PID namespace) or "none" (local development
+# only: resource limits, unprivileged user and a private network namespace)
+EXEC_SANDBOX = os.getenv("EXEC_SANDBOX", "bwrap")
+EXEC_BWRAP_BINARY = os.getenv("EXEC_BWRAP_BINARY", "bwrap")
+# Processes (and threads) the workers' user may have at once (RLIMIT_NPROC): stops fork bombs
+EXEC_MAX_PROCESSES = int(os.getenv("EXEC_MAX_PROCESSES", "256"))
+# Unprivileged user the workers run as when the server is started as root
+EXEC_UID = int(os.getenv("EXEC_UID", "65534"))
+EXEC_GID = int(os.getenv("EXEC_GID", "65534"))
+
+# System directories mounted read-only in the bubblewrap sandbox (symlinks are recreated)
+SANDBOX_SYSTEM_PATHS = ("/usr", "/bin", "/sbin", "/lib", "/lib32", "/lib64", "/libx32")
+
+# Runs inside the Python worker, as defense in depth behind the sandbox: the
+# audit hook cannot be removed once installed, and what it checks against
+# lives in a closure, so rebinding globals (``import __main__``) does not
+# loosen it. User code cannot open sockets, start processes, load native
+# libraries, open databases, signal other processes or modify files outside
+# its scratch directory. The worker then blocks on stdin until it receives
+# a program.
+PYTHON_BOOTSTRAP = r"""
+import os, sys, traceback
+def _install_audit_hook():
+    root = os.path.realpath(os.getcwd()) + os.sep
+    realpath, fsdecode, sep = os.path.realpath, os.fsdecode, os.sep
+    blocked_prefixes = ("socket.", "subprocess.", "os.exec", "os.spawn", "os.posix_spawn",
+                        "ctypes.", "_ctypes.", "sqlite3.")
+    blocked = frozenset({"os.system", "os.fork", "os.forkpty", "os.kill", "os.killpg",
+                         "signal.pthread_kill", "pty.spawn"})
+    # fork_exec of _posixsubprocess raises no audit event of its own
+    blocked_modules = frozenset({"_posixsubprocess", "ctypes", "_ctypes", "sqlite3", "_sqlite3"})
+    path_events = frozenset({"os.remove", "os.rename", "os.rmdir", "os.truncate", "os.chmod", "os.chown",
+                             "os.link", "os.symlink", "os.mkdir", "os.utime", "shutil.rmtree"})
+    write_flags = os.O_WRONLY | os.O_RDWR | os.O_CREAT | os.O_TRUNC | os.O_APPEND
+    def outside(path):
+        if isinstance(path, bytes):
+            path = fsdecode(path)
+        if not isinstance(path, str):
+            return False
+        return not (realpath(path) + sep).startswith(root)
+    def audit(event, args):
+        if event in blocked or event.startswith(blocked_prefixes):
+            raise PermissionError(f"{event} is not allowed in the sandbox")
+        if event == "import":
+            if args[0] in blocked_modules:
+                raise PermissionError(f"import of {args[0]} is not allowed in the sandbox")
+        elif event == "open":
+            path, mode, flags = args
+            writing = any(c in mode for c in "wax+") if isinstance(mode, str) else bool(flags & write_flags)
+            if writing and outside(path):
+                raise PermissionError(f"cannot write {path!r} outside the sandbox")
+        elif event in path_events and args and outside(args[0]):
+            raise PermissionError(f"{event} is not allowed outside the sandbox")
+    sys.addaudithook(audit)
+_install_audit_hook()
+del _install_audit_hook
+_size = int(sys.stdin.buffer.readline())
+_source = sys.stdin.buffer.read(_size).decode("utf-8")
+del _size
+_globals = {"__name__": "__main__", "__builtins__": __builtins__}
+try:
+    exec(compile(_source, "main.py", "exec"), _globals)
+except SystemExit:
+    raise
+except BaseException as e:
+    # Hide the frames of this bootstrap (the exec call and the audit hook)
+    report = traceback.TracebackException.from_exception(e)
+    report.stack = traceback.StackSummary.from_list([f for f in report.stack if f.filename != "<string>"])
+    sys.stderr.write("".join(report.format()))
+    sys.exit(1)
+"""
+
+# Runs inside the Node worker. Programs are evaluated in an empty vm context
+# (no require, process or timers), with console output mirroring the
+# browser runner: objects are printed as indented JSON and a returned value
+# is printed when the program produces no other output.
+NODE_BOOTSTRAP = r"""
+const vm = require('vm');
+const chunks = [];
+process.stdin.on('data', (chunk) => chunks.push(chunk));
+process.stdin.on('end', async () => {
+  const source = Buffer.concat(chunks).toString('utf8');
+  const format = (arg) => (typeof arg === 'object' && arg !== null ? JSON.stringify(arg, null, 2) : String(arg));
+  const writer = (stream) => (...args) => { stream.write(args.map(format).join(' ') + '\n'); };
+  const log = writer(process.stdout);
+  const context = { console: { log, info: log, debug: log, warn: writer(process.stderr), error: writer(process.stderr) } };
+  try {
+    let result = vm.runInNewContext('(function () {' + source + '\n})()', context, { filename: 'main.js' });
+    if (result !== null && typeof result === 'object' && typeof result.then === 'function') {
+      result = await result;
+    }
+    if (result !== undefined) {
+      log(result);
+    }
+  } catch (e) {
+    // Keep the error and the frames of the program, not those of this bootstrap
+    const stack = e && e.stack ? e.stack.split('\n').filter((line) => !line.startsWith('    at ') || line.includes('main.js')) : [String(e)];
+    process.stderr.write(stack.join('\n') + '\n');
+    process.exitCode = 1;
+  }
+});
+"""
+
+
+# Programs that read clocks or random sources are always run, never served from the cache
+NONDETERMINISTIC_PATTERNS = {
+    "python": re.compile(r"\b(random|secrets|uuid|time|datetime|urandom)\b"),
+    "javascript": re.compile(r"\b(Math\.random|Date|performance|crypto)\b"),
+}
+
+
+class UnsupportedLanguageError(ValueError):
+    """Raised when no runtime is available for the requested language."""
+
+
+class SandboxUnavailableError(RuntimeError):
+    """Raised when workers cannot be started inside the sandbox; code is never run without it."""
+
+
+@dataclass
+class ExecutionResult:
+    """Outcome of a single run."""
+    stdout: str
+    stderr: str
+    exit_code: Optional[int]
+    timed_out: bool
+    truncated: bool
+    duration_ms: float
+    # Served from the result cache (or shared with an identical run in flight)
+    cached: bool = False
+
+
+def _limit_resources(memory_limit: bool, unshare_network: bool):
+    """
+    Applied in the worker between fork and exec.
+
+    Anything failing here raises, which aborts the spawn: a worker never
+    starts with less isolation than configured.
+    """
+    if resource is not None:
+        resource.setrlimit(resource.RLIMIT_CPU, (EXEC_CPU_SECONDS, EXEC_CPU_SECONDS + 1))
+        resource.setrlimit(resource.RLIMIT_FSIZE, (EXEC_MAX_FILE_BYTES, EXEC_MAX_FILE_BYTES))
+        resource.setrlimit(resource.RLIMIT_NOFILE, (64, 64))
+        resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+        resource.setrlimit(resource.RLIMIT_NPROC, (EXEC_MAX_PROCESSES, EXEC_MAX_PROCESSES))
+        if memory_limit:
+            # V8 reserves far more address space than it uses, so Node is capped with --max-old-space-size instead
+            memory = EXEC_MEMORY_MB * 1024 * 1024
+            resource.setrlimit(resource.RLIMIT_AS, (memory, memory))
+    if os.geteuid() == 0:
+        # Never run programs as root (root also ignores RLIMIT_NPROC)
+        os.setgroups([])
+        os.setgid(EXEC_GID)
+        os.setuid(EXEC_UID)
+    if unshare_network:
+        # Private network namespace: only a loopback interface
+        os.unshare(os.CLONE_NEWUSER | os.CLONE_NEWNET)
+
+
+def _sandbox_paths() -> List[str]:
+    """Directories the runtimes need: the system ones plus the Python and Node installations."""
+    paths = [path for path in SANDBOX_SYSTEM_PATHS if os.path.lexists(path)]
+    # Installation prefixes only (a virtualenv, /opt/node...), never the application directory
+    prefixes = {sys.prefix, sys.base_prefix, sys.exec_prefix}
+    node = shutil.which(EXEC_NODE_BINARY)
+    if node is not None:
+        prefixes.add(os.path.dirname(os.path.dirname(os.path.realpath(node))))
+    for prefix in sorted(os.path.realpath(prefix) for prefix in prefixes):
+        if not any(prefix == path or prefix.startswith(path + os.sep) for path in paths):
+            paths.append(prefix)
+    return paths
+
+
+def sandbox_command(sandbox: str, workdir: str) -> List[str]:
+    """
+    Command prefix starting a worker inside ``sandbox`` with ``workdir`` as its only writable directory.
+
+    Raises:
+        SandboxUnavailableError: if the sandbox is unknown or not installed
+    """
+    if sandbox == "none":
+        return []
+    if sandbox != "bwrap":
+        raise SandboxUnavailableError(f"unknown sandbox {sandbox!r}")
+    bwrap = shutil.which(EXEC_BWRAP_BINARY)
+    if bwrap is None:
+        raise SandboxUnavailableError(f"{EXEC_BWRAP_BINARY} is not installed")
+    command = [
+        bwrap,
+        # No network, own PID/IPC/UTS namespaces, unprivileged user inside
+        "--unshare-all", "--unshare-user", "--uid", str(EXEC_UID), "--gid", str(EXEC_GID),
+        "--cap-drop", "ALL", "--die-with-parent", "--new-session",
+        "--proc", "/proc", "--dev", "/dev", "--tmpfs", "/tmp",
+    ]
+    for path in _sandbox_paths():
+        if os.path.islink(path):
+            command += ["--symlink", os.readlink(path), path]
+        else:
+            command += ["--ro-bind", path, path]
+    return command + ["--bind", workdir, workdir, "--chdir", workdir, "--"]
+
+
+@dataclass(frozen=True)
+class Runtime:
+    """How to start a warm interpreter for one language."""
+    language: str
+    argv: List[str]
+    memory_limit: bool
+    # Python reads a length-prefixed program followed by the program's own stdin
+    length_prefixed: bool
+
+    def encode(self, code: str, stdin: str) -> bytes:
+        source = code.encode("utf-8")
+        if not self.length_prefixed:
+            return source
+        return b"%d\n" % len(source) + source + stdin.encode("utf-8")
+
+
+def available_runtimes() -> Dict[str, Runtime]:
+    """Runtimes whose interpreter exists on this machine."""
+    runtimes = {
+        "python": Runtime("python", [sys.executable, "-I", "-c", PYTHON_BOOTSTRAP], True, True),
+    }
+    node = shutil.which(EXEC_NODE_BINARY)
+    if node is not None:
+        runtimes["javascript"] = Runtime(
+            "javascript", [node, f"--max-old-space-size={EXEC_MEMORY_MB}", "-e", NODE_BOOTSTRAP], False, False
+        )
+    return runtimes
+
+
+class Worker:
+    """A started interpreter waiting for one program; workers are never reused."""
+
+    def __init__(self, runtime: Runtime, process: asyncio.subprocess.Process, workdir: str):
+        self.runtime = runtime
+        self.process = process
+        self.workdir = workdir
+
+    @classmethod
+    async def spawn(cls, runtime: Runtime, sandbox: str = EXEC_SANDBOX) -> "Worker":
+        """
+        Start an interpreter in a fresh scratch directory.
+
+        Raises:
+            SandboxUnavailableError: if it cannot be started with the configured isolation
+        """
+        workdir = tempfile.mkdtemp(prefix=f"exec-{runtime.language}-")
+        try:
+            if os.geteuid() == 0:
+                os.chown(workdir, EXEC_UID, EXEC_GID)
+            command = sandbox_command(sandbox, workdir) + runtime.argv
+            process = await asyncio.create_subprocess_exec(
+                *command,
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                cwd=workdir,
+                env={"PATH": "/usr/bin:/bin", "LANG": "C.UTF-8", "HOME": workdir, "PYTHONIOENCODING": "utf-8"},
+                # Own process group, so a timeout kills anything the program started
+                start_new_session=True,
+                # bubblewrap sets up the network namespace itself
+                preexec_fn=lambda: _limit_resources(runtime.memory_limit, unshare_network=sandbox == "none"),
+            )
+        except subprocess.SubprocessError as e:
+            shutil.rmtree(workdir, ignore_errors=True)
+            # preexec_fn failed: e.g. Docker's default seccomp profile refuses new user namespaces
+            raise SandboxUnavailableError("could not drop privileges or create the worker's network namespace") from e
+        except BaseException:
+            shutil.rmtree(workdir, ignore_errors=True)
+            raise
+        return cls(runtime, process, workdir)
+
+    @property
+    def alive(self) -> bool:
+        return self.process.returncode is None
+
+    async def run(self, code: str, stdin: str = "", timeout: float = EXEC_TIMEOUT_SECONDS) -> ExecutionResult:
+        """Send the program, wait for it to finish (or kill it) and collect its output."""
+        started = time.perf_counter()
+        overflow = asyncio.Event()
+        stdout_task = asyncio.create_task(_read_capped(self.process.stdout, overflow))
+        stderr_task = asyncio.create_task(_read_capped(self.process.stderr, overflow))
+        timed_out = False
+        try:
+            try:
+                self.process.stdin.write(self.runtime.encode(code, stdin))
+                await self.process.stdin.drain()
+                self.process.stdin.close()
+            except (BrokenPipeError, ConnectionResetError):
+                # The program may exit without reading all of its input
+                pass
+            exited = asyncio.create_task(self.process.wait())
+            overflowed = asyncio.create_task(overflow.wait())
+            done, _ = await asyncio.wait({exited, overflowed}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            overflowed.cancel()
+            if exited not in done:
+                timed_out = not done
+                self.kill()
+            await exited
+            stdout, stdout_truncated = await stdout_task
+            stderr, stderr_truncated = await stderr_task
+        finally:
+            self.kill()
+            stdout_task.cancel()
+            stderr_task.cancel()
+            self.cleanup()
+        return ExecutionResult(
+            stdout=stdout.decode("utf-8", errors="replace"),
+            stderr=stderr.decode("utf-8", errors="replace"),
+            exit_code=self.process.returncode,
+            timed_out=timed_out,
+            truncated=stdout_truncated or stderr_truncated,
+            duration_ms=(time.perf_counter() - started) * 1000,
+        )
+
+    def kill(self):
+        if self.process.returncode is not None:
+            return
+        try:
+            os.killpg(self.process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+    def cleanup(self):
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+async def _read_capped(stream: asyncio.StreamReader, overflow: asyncio.Event):
+    """Read a stream to EOF, keeping at most EXEC_MAX_OUTPUT_BYTES; sets ``overflow`` past the limit."""
+    chunks = []
+    size = 0
+    truncated = False
+    while True:
+        chunk = await stream.read(65536)
+        if not chunk:
+            break
+        if size < EXEC_MAX_OUTPUT_BYTES:
+            chunks.append(chunk[:EXEC_MAX_OUTPUT_BYTES - size])
+        size += len(chunk)
+        if size > EXEC_MAX_OUTPUT_BYTES and not truncated:
+            truncated = True
+            overflow.set()
+    return b"".join(chunks), truncated
+
+
+class ExecutionPool:
+    """
+    Schedules runs over prewarmed single-use workers.
+
+    Each language keeps ``warm`` interpreters already started and blocked
+    on stdin, so a run only pays for sending the program instead of an
+    interpreter boot; a replacement is started as soon as a worker is
+    taken. At most ``size`` programs run at once, one per core by default,
+    and further runs wait for a free slot.
+
+    Before the first run a probe checks that workers start inside
+    ``sandbox``; if they cannot, every run is refused instead of falling
+    back to weaker isolation.
+    """
+
+    def __init__(
+        self,
+        size: int = EXEC_WORKERS,
+        warm: int = EXEC_WARM_WORKERS,
+        cache: Optional[ResultCache] = None,
+        timeout: float = EXEC_TIMEOUT_SECONDS,
+        sandbox: str = EXEC_SANDBOX,
+    ):
+        self.size = max(1, size)
+        self.sandbox = sandbox
+        # None until probed, then "" if the sandbox works or the reason it does not
+        self.sandbox_error: Optional[str] = None
+        self._sandbox_probe: Optional[asyncio.Task] = None
+        self.warm = max(0, warm)
+        self.timeout = timeout
+        self.cache = cache
+        # cache key -> result of the identical run currently executing
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.runtimes: Dict[str, Runtime] = {}
+        self.idle: Dict[str, List[Worker]] = {}
+        # Created on first use: the module-level pool may be driven by more than
+        # one event loop over its lifetime (e.g. TestClient), and asyncio
+        # primitives bind to the loop that first waits on them
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._slots_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._spawning = set()
+        self.started = False
+
+    @property
+    def languages(self) -> List[str]:
+        return sorted(self.runtimes or available_runtimes())
+
+    async def start(self):
+        """Detect the available runtimes, check the sandbox and start the warm workers."""
+        self.runtimes = available_runtimes()
+        self.idle = {language: [] for language in self.runtimes}
+        if not await self.check_sandbox():
+            return
+        self.started = True
+        await asyncio.gather(*(
+            self._add_idle(runtime) for runtime in self.runtimes.values() for _ in range(self.warm)
+        ))
+        print(f"[Execution] {self.warm} warm worker(s) per language for {', '.join(self.runtimes)}")
+
+    async def check_sandbox(self) -> bool:
+        """Run one program in the sandbox (once per pool) and report whether it works."""
+        if self.sandbox_error is None:
+            # Runs arriving together wait for the same probe
+            if self._sandbox_probe is None or self._sandbox_probe.get_loop() is not asyncio.get_running_loop():
+                self._sandbox_probe = asyncio.ensure_future(self._probe_sandbox())
+            error = await asyncio.shield(self._sandbox_probe)
+            if self.sandbox_error is not None:
+                return not self.sandbox_error
+            self.sandbox_error = error
+            metrics.set_gauge("exec_sandbox_available", 0 if self.sandbox_error else 1)
+            if self.sandbox_error:
+                print(
+                    f"[Execution] ERROR: sandbox {self.sandbox!r} is unavailable ({self.sandbox_error}); "
+                    "server-side code execution is disabled"
+                )
+            elif self.sandbox == "none":
+                print(
+                    "[Execution] WARNING: EXEC_SANDBOX=none, programs can read the server's files; "
+                    "use it only for local development"
+                )
+        return not self.sandbox_error
+
+    async def _probe_sandbox(self) -> str:
+        runtime = (self.runtimes or available_runtimes())["python"]
+        try:
+            worker = await Worker.spawn(runtime, self.sandbox)
+            result = await worker.run("print('ok')", timeout=max(self.timeout, 10))
+        except (OSError, SandboxUnavailableError) as e:
+            return str(e) or type(e).__name__
+        if result.stdout != "ok\n":
+            # bubblewrap reports why it could not create the namespaces on stderr
+            return result.stderr.strip()[:200] or f"probe exited with code {result.exit_code}"
+        return ""
+
+    async def stop(self):
+        """Kill idle workers and stop replacing them."""
+        self.started = False
+        for task in list(self._spawning):
+            task.cancel()
+        await asyncio.gather(*self._spawning, return_exceptions=True)
+        for workers in self.idle.values():
+            for worker in workers:
+                worker.kill()
+                await worker.process.wait()
+                worker.cleanup()
+            workers.clear()
+
+    async def run(self, language: str, code: str, stdin: str = "", timeout: Optional[float] = None) -> ExecutionResult:
+        """
+        Run ``code`` in a fresh sandboxed process, killed after ``timeout`` seconds (the pool's by default).
+
+        Raises:
+            UnsupportedLanguageError: if there is no runtime for ``language``
+            SandboxUnavailableError: if programs cannot be run inside the sandbox
+        """
+        if not self.runtimes:
+            self.runtimes = available_runtimes()
+            self.idle = {language: [] for language in self.runtimes}
+        runtime = self.runtimes.get(language)
+        if runtime is None:
+            raise UnsupportedLanguageError(language)
+        if self.cache is None or NONDETERMINISTIC_PATTERNS[language].search(code):
+            return await self._execute(runtime, code, stdin, timeout)
+
+        key = cache_key(language, code, stdin)
+        cached = await self.cache.get(key)
+        if cached is not None:
+            return ExecutionResult(**cached, cached=True)
+        pending = self._inflight.get(key)
+        if pending is not None:
+            # Several people pressed Run on the same snapshot: share the run in flight
+            metrics.incr("exec_cache_coalesced_total")
+            return replace(await asyncio.shield(pending), cached=True)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await self._execute(runtime, code, stdin, timeout)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved when nobody else was waiting
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+        future.set_result(result)
+        # Timeouts and signals (CPU limit) depend on load, not only on the program
+        if not result.timed_out and result.exit_code is not None and result.exit_code >= 0:
+            entry = asdict(result)
+            del entry["cached"]
+            await self.cache.put(key, entry)
+        return result
+
+    async def _execute(self, runtime: Runtime, code: str, stdin: str, timeout: Optional[float]) -> ExecutionResult:
+        if not await self.check_sandbox():
+            metrics.incr("exec_sandbox_refused_total")
+            raise SandboxUnavailableError(self.sandbox_error)
+        loop = asyncio.get_running_loop()
+        if self._slots_loop is not loop:
+            self._slots = asyncio.Semaphore(self.size)
+            self._slots_loop = loop
+        async with self._slots:
+            worker = await self._take(runtime)
+            metrics.incr("exec_runs_total")
+            result = await worker.run(code, stdin, timeout or self.timeout)
+        if result.timed_out:
+            metrics.incr("exec_timeouts_total")
+        return result
+
+    async def _take(self, runtime: Runtime) -> Worker:
+        idle = self.idle[runtime.language]
+        worker = None
+        while idle and worker is None:
+            candidate = idle.pop()
+            if candidate.alive:
+                worker = candidate
+            else:
+                candidate.cleanup()
+        if self.started:
+            self._replenish(runtime)
+        if worker is None:
+            metrics.incr("exec_cold_starts_total")
+            worker = await Worker.spawn(runtime, self.sandbox)
+        return worker
+
+    def _replenish(self, runtime: Runtime):
+        task = asyncio.create_task(self._add_idle(runtime))
+        self._spawning.add(task)
+        task.add_done_callback(self._spawning.discard)
+
+    async def _add_idle(self, runtime: Runtime):
+        try:
+            worker = await Worker.spawn(runtime, self.sandbox)
+        except (OSError, SandboxUnavailableError) as e:
+            print(f"[Execution] Could not start a {runtime.language} worker: {e}")
+            return
+        if self.started and len(self.idle[runtime.language]) < self.warm:
+            self.idle[runtime.language].append(worker)
+        else:
+            worker.kill()
+            await worker.process.wait()
+            worker.cleanup()
+
+
+# Global execution pool
+executor = ExecutionPool(cache=ResultCache())
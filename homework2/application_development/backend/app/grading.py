@@ -0,0 +1,116 @@
+"""Grade a session's code against its hidden test cases on the execution pool."""
+
+import asyncio
+import os
+import secrets
+from typing import List, Optional
+from app.execution import ExecutionPool, ExecutionResult, SandboxUnavailableError, UnsupportedLanguageError, executor
+from app.models import (
+    GradeCaseMessage,
+    GradeCaseResult,
+    GradeFinishedMessage,
+    GradeResponse,
+    GradeStartedMessage,
+    HiddenTestCase,
+)
+from app.websocket import manager
+
+# Default wall-clock limit of each test case
+GRADE_CASE_TIMEOUT_SECONDS = float(os.getenv("GRADE_CASE_TIMEOUT_SECONDS", "2"))
+
+
+def normalize_output(text: str) -> str:
+    """Ignore trailing whitespace on every line and trailing blank lines."""
+    return "\n".join(line.rstrip() for line in text.rstrip().splitlines())
+
+
+def case_status(result: ExecutionResult, expected_output: str) -> str:
+    if result.timed_out:
+        return "timeout"
+    if result.exit_code != 0:
+        return "error"
+    if normalize_output(result.stdout) != normalize_output(expected_output):
+        return "failed"
+    return "passed"
+
+
+async def grade(
+    room_id: str,
+    language: str,
+    code: str,
+    cases: List[HiddenTestCase],
+    stop_on_failure: bool = False,
+    timeout: Optional[float] = None,
+    pool: ExecutionPool = executor,
+) -> GradeResponse:
+    """
+    Run ``code`` against every case in parallel and stream each result to the room.
+
+    All cases are submitted at once; the pool runs as many as it has cores
+    for. Each result is broadcast as a ``grade_case`` message the moment its
+    case finishes, so results arrive in completion order, not case order.
+    With ``stop_on_failure`` the first non-passing case cancels (and kills)
+    the cases still queued or running, which are reported as skipped.
+
+    Raises:
+        UnsupportedLanguageError: if the pool cannot run ``language``
+        SandboxUnavailableError: if the pool cannot run programs inside its sandbox
+    """
+    if language not in pool.languages:
+        raise UnsupportedLanguageError(language)
+    if not await pool.check_sandbox():
+        raise SandboxUnavailableError(pool.sandbox_error)
+    grade_id = secrets.token_urlsafe(8)
+    timeout = timeout or GRADE_CASE_TIMEOUT_SECONDS
+    results: List[Optional[GradeCaseResult]] = [None] * len(cases)
+
+    async def publish(message):
+        # Queued behind the room's own events, without waiting for slow peers
+        await manager.dispatch(room_id, manager.broadcast, room_id, message)
+
+    await publish(GradeStartedMessage(grade_id=grade_id, total=len(cases)))
+
+    async def run_case(index: int, case: HiddenTestCase) -> GradeCaseResult:
+        result = await pool.run(language, code, case.stdin, timeout)
+        return GradeCaseResult(
+            index=index,
+            name=case.name,
+            status=case_status(result, case.expected_output),
+            duration_ms=result.duration_ms,
+        )
+
+    tasks = [asyncio.create_task(run_case(index, case)) for index, case in enumerate(cases)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            case_result = await next_done
+            results[case_result.index] = case_result
+            await publish(GradeCaseMessage(grade_id=grade_id, result=case_result))
+            if stop_on_failure and case_result.status != "passed":
+                break
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    results = [
+        result if result is not None else GradeCaseResult(index=index, name=case.name, status="skipped")
+        for index, (result, case) in enumerate(zip(results, cases))
+    ]
+    passed = sum(1 for result in results if result.status == "passed")
+    skipped = sum(1 for result in results if result.status == "skipped")
+    response = GradeResponse(
+        grade_id=grade_id,
+        total=len(cases),
+        passed=passed,
+        failed=len(cases) - passed - skipped,
+        skipped=skipped,
+        results=results,
+    )
+    await publish(GradeFinishedMessage(
+        grade_id=grade_id,
+        total=response.total,
+        passed=response.passed,
+        failed=response.failed,
+        skipped=response.skipped,
+    ))
+    return response
@@ -0,0 +1,32 @@
+"""In-process counters and gauges exposed through GET /api/metrics."""
+
+from typing import Dict
+
+
+class Metrics:
+    """Minimal metrics registry: monotonically increasing counters and point-in-time gauges."""
+    
+    def __init__(self):
+        self.counters: Dict[str, int] = {}
+        self.gauges: Dict[str, float] = {}
+    
+    def incr(self, name: str, value: int = 1):
+        """Increase a counter by ``value``."""
+        self.counters[name] = self.counters.get(name, 0) + value
+    
+    def set_gauge(self, name: str, value: float):
+        """Set a gauge to its current value."""
+        self.gauges[name] = value
+    
+    def snapshot(self) -> dict:
+        """Return a copy of all counters and gauges."""
+        return {"counters": dict(self.counters), "gauges": dict(self.gauges)}
+    
+    def reset(self):
+        """Clear all metrics (used by tests)."""
+        self.counters.clear()
+        self.gauges.clear()
+
+
+# Global metrics registry
+metrics = Metrics()
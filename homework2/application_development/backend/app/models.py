@@ -1,8 +1,8 @@
 """Pydantic models for request/response validation and SQLAlchemy ORM models."""
 
 from datetime import UTC, datetime, timedelta
-from typing import Optional
-from pydantic import BaseModel, Field
+from typing import Annotated, Dict, List, Literal, Optional, Union
+from pydantic import BaseModel, Field, TypeAdapter
 from sqlalchemy import Column, String, Integer, DateTime, Text, Index
 from sqlalchemy.sql import func
 from app.database import Base
@@ -45,11 +45,123 @@ class SessionResponse(BaseModel):
     last_saved_at: Optional[datetime] = Field(default=None, description="Fecha del último guardado")
 
 
+# Maximum number of sessions accepted by POST /api/sessions:batch
+MAX_BATCH_SESSIONS = 500
+
+
+class BatchCreateSessionsRequest(BaseModel):
+    """Request model for creating several sessions at once."""
+    sessions: List[CreateSessionRequest] = Field(
+        min_length=1,
+        max_length=MAX_BATCH_SESSIONS,
+        description="Sesiones a crear (máximo 500 por petición)"
+    )
+
+
+class BatchCreateSessionsResponse(BaseModel):
+    """Response model for batch session creation."""
+    sessions: List[SessionResponse] = Field(description="Sesiones creadas, en el mismo orden de la petición")
+
+
+class SessionListResponse(BaseModel):
+    """Response model for the paginated session listing."""
+    sessions: List[SessionResponse] = Field(description="Página de sesiones")
+    next_cursor: Optional[str] = Field(default=None, description="Cursor de la página siguiente (null si no hay más)")
+
+
 class SaveCodeRequest(BaseModel):
     """Request model for saving code."""
     code: str = Field(description="Código a guardar")
 
 
+class RunCodeRequest(BaseModel):
+    """Request model for running code on the server."""
+    code: Optional[str] = Field(
+        default=None,
+        description="Código a ejecutar (por defecto, el código actual de la sesión)"
+    )
+    language: Optional[str] = Field(
+        default=None,
+        description="Lenguaje del código (por defecto, el de la sesión)",
+        pattern="^(python|javascript|typescript|java|cpp)$"
+    )
+    stdin: str = Field(default="", description="Entrada estándar del programa (solo Python)")
+
+
+class RunCodeResponse(BaseModel):
+    """Response model for a server-side run."""
+    language: str = Field(description="Lenguaje ejecutado")
+    stdout: str = Field(description="Salida estándar")
+    stderr: str = Field(description="Salida de error")
+    exit_code: Optional[int] = Field(default=None, description="Código de salida (negativo si el proceso fue terminado por una señal)")
+    timed_out: bool = Field(default=False, description="La ejecución superó el tiempo límite")
+    truncated: bool = Field(default=False, description="La salida superó el tamaño máximo y fue recortada")
+    duration_ms: float = Field(description="Duración de la ejecución en milisegundos")
+    cached: bool = Field(default=False, description="Resultado servido desde la caché de ejecuciones")
+
+
+# Maximum number of hidden test cases per session
+MAX_TEST_CASES = 200
+
+
+class HiddenTestCaseInput(BaseModel):
+    """A hidden test case: the program gets ``stdin`` and must print ``expected_output``."""
+    name: Optional[str] = Field(default=None, max_length=200, description="Nombre opcional del caso")
+    stdin: str = Field(default="", description="Entrada estándar del caso")
+    expected_output: str = Field(description="Salida esperada (se ignoran los espacios al final de cada línea)")
+
+
+class SetHiddenTestsRequest(BaseModel):
+    """Request model for replacing the hidden test cases of a session."""
+    cases: List[HiddenTestCaseInput] = Field(
+        max_length=MAX_TEST_CASES,
+        description="Casos de prueba ocultos (máximo 200); una lista vacía los elimina"
+    )
+
+
+class HiddenTestsResponse(BaseModel):
+    """Response model for the hidden test cases of a session (their content is not returned)."""
+    count: int = Field(ge=0, description="Número de casos de prueba guardados")
+
+
+class GradeRequest(BaseModel):
+    """Request model for grading a session."""
+    stop_on_failure: bool = Field(default=False, description="Detener la corrección en el primer caso fallido")
+    timeout_seconds: Optional[float] = Field(
+        default=None,
+        gt=0,
+        le=30,
+        description="Tiempo límite por caso en segundos (por defecto GRADE_CASE_TIMEOUT_SECONDS)"
+    )
+
+
+GradeStatus = Literal["passed", "failed", "error", "timeout", "skipped"]
+
+
+class GradeCaseResult(BaseModel):
+    """Result of one hidden test case."""
+    index: int = Field(ge=0, description="Posición del caso")
+    name: Optional[str] = Field(default=None, description="Nombre del caso")
+    status: GradeStatus = Field(description="passed, failed (salida distinta), error, timeout o skipped")
+    duration_ms: float = Field(default=0, description="Duración de la ejecución en milisegundos")
+
+
+class GradeResponse(BaseModel):
+    """Response model for a grading run."""
+    grade_id: str = Field(description="ID de la corrección (también en los mensajes del WebSocket)")
+    total: int = Field(ge=0, description="Número de casos")
+    passed: int = Field(ge=0, description="Casos superados")
+    failed: int = Field(ge=0, description="Casos fallidos, con error o fuera de tiempo")
+    skipped: int = Field(ge=0, description="Casos no ejecutados por stop_on_failure")
+    results: List[GradeCaseResult] = Field(description="Resultado de cada caso, en orden")
+
+
+class MetricsResponse(BaseModel):
+    """Response model for the metrics endpoint."""
+    counters: Dict[str, int] = Field(default_factory=dict, description="Contadores acumulados")
+    gauges: Dict[str, float] = Field(default_factory=dict, description="Valores instantáneos")
+
+
 class ErrorResponse(BaseModel):
     """Standard error response model."""
     error: str = Field(description="Tipo de error")
@@ -60,7 +172,7 @@ class ErrorResponse(BaseModel):
 # WebSocket Message Models
 class CodeChangeMessage(BaseModel):
     """WebSocket message for code changes."""
-    type: str = Field(default="code_change", description="Tipo de mensaje")
+    type: Literal["code_change"] = Field(default="code_change", description="Tipo de mensaje")
     code: Optional[str] = Field(default=None, description="Código completo (fallback)")
     cursor_position: Optional[int] = Field(default=None, ge=0, description="Posición del cursor")
     user_id: Optional[str] = Field(default=None, description="ID del usuario (solo en mensajes del servidor)")
@@ -70,17 +182,33 @@ class CodeChangeMessage(BaseModel):
     insert: Optional[str] = Field(default=None, description="Texto insertado (diff)")
     delete_length: Optional[int] = Field(default=None, ge=0, description="Cantidad de caracteres eliminados (diff)")
     timestamp: Optional[datetime] = Field(default=None, description="Timestamp del cambio para resolución de conflictos")
+    version: Optional[int] = Field(default=None, ge=0, description="Versión del documento tras aplicar el cambio (solo en mensajes del servidor)")
 
 
 class JoinMessage(BaseModel):
     """WebSocket message for user joining."""
-    type: str = Field(default="join", description="Tipo de mensaje")
+    type: Literal["join"] = Field(default="join", description="Tipo de mensaje")
     username: str = Field(description="Nombre del usuario que se une")
+    epoch: Optional[str] = Field(default=None, description="Época del documento vista por el cliente (reconexión)")
+    last_version: Optional[int] = Field(default=None, ge=0, description="Última versión aplicada por el cliente (reconexión)")
+    user_id: Optional[str] = Field(default=None, max_length=64, description="ID asignado en la conexión anterior (reconexión); necesario para el resync")
+    role: Literal["editor", "spectator"] = Field(default="editor", description="Rol en la sala: los espectadores solo observan")
+    cursors: bool = Field(default=False, description="Espectadores: recibir también los cursores de los editores")
 
 
 class LeaveMessage(BaseModel):
     """WebSocket message for user leaving."""
-    type: str = Field(default="leave", description="Tipo de mensaje")
+    type: Literal["leave"] = Field(default="leave", description="Tipo de mensaje")
+
+
+class HeartbeatMessage(BaseModel):
+    """
+    WebSocket heartbeat, in either direction.
+    
+    The server sends ``ping`` to idle connections and expects any frame
+    (normally ``pong``) back; a client may also ``ping`` and gets a ``pong``.
+    """
+    type: Literal["ping", "pong"] = Field(description="Tipo de mensaje")
 
 
 class UserJoinedMessage(BaseModel):
@@ -96,20 +224,134 @@ class UserLeftMessage(BaseModel):
     user_id: str = Field(description="ID del usuario que se desconectó")
 
 
+class ReconnectMessage(BaseModel):
+    """WebSocket message asking the client to reconnect (the server is shutting down)."""
+    type: str = Field(default="reconnect", description="Tipo de mensaje")
+    retry_after_ms: int = Field(ge=0, description="Milisegundos a esperar antes de reconectar (con jitter)")
+
+
 class ErrorMessage(BaseModel):
     """WebSocket error message."""
     type: str = Field(default="error", description="Tipo de mensaje")
     message: str = Field(description="Mensaje de error")
 
 
+class GradeStartedMessage(BaseModel):
+    """WebSocket message announcing a grading run in the room."""
+    type: str = Field(default="grade_started", description="Tipo de mensaje")
+    grade_id: str = Field(description="ID de la corrección")
+    total: int = Field(ge=0, description="Número de casos")
+
+
+class GradeCaseMessage(BaseModel):
+    """WebSocket message with the result of one test case, sent as soon as it finishes."""
+    type: str = Field(default="grade_case", description="Tipo de mensaje")
+    grade_id: str = Field(description="ID de la corrección")
+    result: GradeCaseResult = Field(description="Resultado del caso")
+
+
+class GradeFinishedMessage(BaseModel):
+    """WebSocket message with the summary of a grading run."""
+    type: str = Field(default="grade_finished", description="Tipo de mensaje")
+    grade_id: str = Field(description="ID de la corrección")
+    total: int = Field(ge=0, description="Número de casos")
+    passed: int = Field(ge=0, description="Casos superados")
+    failed: int = Field(ge=0, description="Casos fallidos")
+    skipped: int = Field(ge=0, description="Casos no ejecutados")
+
+
+class Diagnostic(BaseModel):
+    """A syntax problem found in the room's document (1-indexed lines, 0-indexed columns)."""
+    line: int = Field(ge=1, description="Línea de inicio")
+    column: int = Field(ge=0, description="Columna de inicio")
+    end_line: int = Field(ge=1, description="Línea final")
+    end_column: int = Field(ge=0, description="Columna final")
+    message: str = Field(description="Descripción del problema")
+    severity: Literal["error", "warning"] = Field(default="error", description="Gravedad")
+
+
+class DiagnosticsMessage(BaseModel):
+    """WebSocket message with the syntax diagnostics of the document at a given version."""
+    type: str = Field(default="diagnostics", description="Tipo de mensaje")
+    version: int = Field(ge=0, description="Versión del documento analizada")
+    language: str = Field(description="Lenguaje usado para el análisis")
+    diagnostics: List[Diagnostic] = Field(default_factory=list, description="Problemas encontrados (vacío si el código es válido)")
+
+
+class RoomUser(BaseModel):
+    """A connected user as listed in the room roster."""
+    user_id: str = Field(description="ID del usuario")
+    username: str = Field(description="Nombre del usuario")
+
+
+class PresenceMessage(BaseModel):
+    """WebSocket message with the roster changes of a room, batched over a short window."""
+    type: str = Field(default="presence", description="Tipo de mensaje")
+    joined: List[RoomUser] = Field(default_factory=list, description="Usuarios que se unieron desde el último delta")
+    left: List[str] = Field(default_factory=list, description="IDs de usuarios que se desconectaron desde el último delta")
+    count: int = Field(ge=0, description="Número de usuarios conectados tras aplicar el delta")
+
+
+class SnapshotMessage(BaseModel):
+    """WebSocket message with the room state sent in reply to a join."""
+    type: str = Field(default="snapshot", description="Tipo de mensaje")
+    user_id: str = Field(description="ID asignado al usuario que se une")
+    code: str = Field(description="Texto actual del documento")
+    epoch: str = Field(description="Época del documento; las versiones solo son comparables dentro de una época")
+    version: int = Field(ge=0, description="Versión del documento incluida en el snapshot")
+    language: str = Field(description="Lenguaje de programación de la sala")
+    users: List[RoomUser] = Field(default_factory=list, description="Usuarios conectados a la sala")
+
+
+class ResyncMessage(BaseModel):
+    """
+    WebSocket message sent to a reconnecting client instead of a snapshot.
+    
+    It is followed by the missing ``code_change`` frames, in version order.
+    """
+    type: str = Field(default="resync", description="Tipo de mensaje")
+    user_id: str = Field(description="ID asignado al usuario que se reconecta")
+    epoch: str = Field(description="Época del documento")
+    from_version: int = Field(ge=0, description="Versión desde la que se reenvían operaciones")
+    version: int = Field(ge=0, description="Versión del documento tras aplicar las operaciones reenviadas")
+    users: List[RoomUser] = Field(default_factory=list, description="Usuarios conectados a la sala")
+
+
+class AckMessage(BaseModel):
+    """
+    WebSocket message telling the author of a code change the version it was assigned.
+    
+    Authors do not get their own ops back, so acks are how a client keeps
+    the ``last_version`` it reports on reconnect covering its own edits.
+    """
+    type: str = Field(default="ack", description="Tipo de mensaje")
+    version: int = Field(ge=0, description="Versión del documento tras aplicar el cambio del autor")
+
+
+class BackpressureMessage(BaseModel):
+    """WebSocket message asking the client to slow down its code changes."""
+    type: str = Field(default="backpressure", description="Tipo de mensaje")
+    retry_after_ms: int = Field(ge=0, description="Milisegundos a esperar antes de enviar más cambios")
+
+
 class CursorChangeMessage(BaseModel):
     """WebSocket message for cursor position changes."""
-    type: str = Field(default="cursor_change", description="Tipo de mensaje")
+    type: Literal["cursor_change"] = Field(default="cursor_change", description="Tipo de mensaje")
     line: int = Field(ge=1, description="Número de línea (1-indexed)")
     column: int = Field(ge=0, description="Columna (0-indexed)")
     user_id: Optional[str] = Field(default=None, description="ID del usuario (solo en mensajes del servidor)")
 
 
+# Discriminated union of every message a client may send. The adapter is built
+# once at import time so each frame is parsed from raw JSON straight into the
+# typed model in a single pass (no intermediate dict, no second validation).
+InboundMessage = Annotated[
+    Union[CodeChangeMessage, CursorChangeMessage, JoinMessage, LeaveMessage, HeartbeatMessage],
+    Field(discriminator="type"),
+]
+inbound_message_adapter: TypeAdapter[InboundMessage] = TypeAdapter(InboundMessage)
+
+
 # SQLAlchemy ORM Models
 class Session(Base):
     """SQLAlchemy model for sessions table."""
@@ -125,9 +367,13 @@ class Session(Base):
     last_saved_at = Column(DateTime(timezone=True), nullable=True)
     active_users = Column(Integer, default=0, nullable=False)
     
-    # Index for efficient expiration queries
+    # Index for efficient expiration queries, plus composite indexes backing the
+    # keyset pagination of GET /api/sessions (sort key + session_id tie-breaker)
     __table_args__ = (
         Index('idx_expires_at', 'expires_at'),
+        Index('idx_created_at_session_id', 'created_at', 'session_id'),
+        Index('idx_expires_at_session_id', 'expires_at', 'session_id'),
+        Index('idx_language_created_at_session_id', 'language', 'created_at', 'session_id'),
     )
     
     def is_expired(self) -> bool:
@@ -144,3 +390,22 @@ class Session(Base):
     def __repr__(self):
         return f"<Session(session_id={self.session_id}, language={self.language}, expires_at={self.expires_at})>"
 
+
+class HiddenTestCase(Base):
+    """SQLAlchemy model for the hidden test cases of a session."""
+    __tablename__ = "test_cases"
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    session_id = Column(String, nullable=False)
+    position = Column(Integer, nullable=False)
+    name = Column(String, nullable=True)
+    stdin = Column(Text, nullable=False, default="")
+    expected_output = Column(Text, nullable=False)
+    
+    __table_args__ = (
+        Index('idx_test_cases_session_id_position', 'session_id', 'position'),
+    )
+    
+    def __repr__(self):
+        return f"<HiddenTestCase(session_id={self.session_id}, position={self.position})>"
+
@@ -0,0 +1,61 @@
+"""Token-bucket rate limiting for WebSocket messages."""
+
+import os
+import time
+from typing import Callable
+
+# Per-connection limits (messages per second and burst size)
+WS_CODE_RATE = float(os.getenv("WS_CODE_RATE", "30"))
+WS_CODE_BURST = float(os.getenv("WS_CODE_BURST", "60"))
+WS_CURSOR_RATE = float(os.getenv("WS_CURSOR_RATE", "20"))
+WS_CURSOR_BURST = float(os.getenv("WS_CURSOR_BURST", "20"))
+
+# Per-room limits, shared by every connection in the room
+WS_ROOM_CODE_RATE = float(os.getenv("WS_ROOM_CODE_RATE", "200"))
+WS_ROOM_CODE_BURST = float(os.getenv("WS_ROOM_CODE_BURST", "400"))
+WS_ROOM_CURSOR_RATE = float(os.getenv("WS_ROOM_CURSOR_RATE", "100"))
+WS_ROOM_CURSOR_BURST = float(os.getenv("WS_ROOM_CURSOR_BURST", "100"))
+
+
+class TokenBucket:
+    """
+    Classic token bucket refilled continuously at ``rate`` tokens per second.
+    
+    Supports two admission styles:
+    - ``try_acquire``: take a token only if one is available (drop on overflow)
+    - ``reserve``: always take the token, going into debt, and return how long
+      the caller must wait before acting on it (back-pressure on overflow)
+    """
+    
+    def __init__(self, rate: float, capacity: float, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self._clock = clock
+        self._updated = clock()
+    
+    def _refill(self):
+        now = self._clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+    
+    def available(self) -> float:
+        """Return the number of tokens currently available."""
+        self._refill()
+        return self.tokens
+    
+    def try_acquire(self, tokens: float = 1.0) -> bool:
+        """Take ``tokens`` if available; return False without taking anything otherwise."""
+        self._refill()
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return True
+        return False
+    
+    def reserve(self, tokens: float = 1.0) -> float:
+        """Take ``tokens`` unconditionally and return the seconds to wait until they are covered."""
+        self._refill()
+        self.tokens -= tokens
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / self.rate
@@ -0,0 +1,524 @@
+"""In-memory document state for collaborative rooms."""
+
+import os
+import secrets
+import sys
+import time
+from bisect import bisect_right
+from datetime import UTC, datetime
+from itertools import accumulate
+from typing import Dict, List, Optional, Set, Tuple
+from sqlalchemy import bindparam
+from sqlalchemy.exc import SQLAlchemyError
+from app.database import SessionLocal
+from app.models import CodeChangeMessage, Session as SessionModel
+
+# Number of recent ops kept per room for reconnecting clients
+ROOM_OP_LOG_SIZE = int(os.getenv("ROOM_OP_LOG_SIZE", "256"))
+# Memory the documents of all rooms may hold before the least recently used ones are spilled
+ROOM_MEMORY_BUDGET = int(os.getenv("ROOM_MEMORY_BUDGET_BYTES", str(256 * 1024 * 1024)))
+
+# Estimated cost of a line in LineIndex (a list slot) and of a chunk (list header and two tree slots)
+_LINE_BYTES = 8
+_CHUNK_BYTES = 72
+
+
+class OpLog:
+    """
+    Fixed-size ring buffer of the serialized ops of the last ``capacity`` versions.
+
+    Slot ``version % capacity`` holds the op that produced ``version``, so
+    appending never allocates and older ops are overwritten in place.
+    """
+
+    def __init__(self, capacity: int = ROOM_OP_LOG_SIZE, version: int = 0):
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.capacity = capacity
+        self._frames: List[Optional[str]] = [None] * capacity
+        # Versions in (first_version, last_version] are available
+        self.first_version = version
+        self.last_version = version
+        # Size of the frames held, kept up to date as slots are overwritten
+        self._frame_bytes = 0
+
+    def append(self, version: int, frame: str):
+        """Record the frame of the op that produced ``version`` (must be last_version + 1)."""
+        if version != self.last_version + 1:
+            raise ValueError(f"expected version {self.last_version + 1}, got {version}")
+        slot = version % self.capacity
+        previous = self._frames[slot]
+        if previous is not None:
+            self._frame_bytes -= sys.getsizeof(previous)
+        self._frames[slot] = frame
+        self._frame_bytes += sys.getsizeof(frame)
+        self.last_version = version
+        if self.last_version - self.first_version > self.capacity:
+            self.first_version = self.last_version - self.capacity
+
+    def since(self, version: int) -> Optional[List[str]]:
+        """
+        Return the frames of every op after ``version``, oldest first.
+
+        Returns None when ``version`` is outside the window and the client
+        needs a full snapshot instead.
+        """
+        if version < self.first_version or version > self.last_version:
+            return None
+        return [self._frames[v % self.capacity] for v in range(version + 1, self.last_version + 1)]
+
+    def memory_bytes(self) -> int:
+        """Bytes held by the ring and its frames."""
+        return sys.getsizeof(self._frames) + self._frame_bytes
+
+
+class LineIndex:
+    """
+    Line-start index of a document for offset <-> line/column conversion.
+
+    Line lengths (newline included) are kept in chunks of about
+    ``chunk_lines`` lines, with Fenwick trees over the characters and lines
+    of every chunk. Finding a line or an offset is a tree search plus a scan
+    of one chunk. An edit within a line is a point update. An edit that adds
+    or removes lines splices a single chunk, and the trees are only rebuilt
+    when chunks split or merge, or once deletes have left too many short
+    chunks. Lines are 1-indexed and columns 0-indexed, as in
+    ``CursorChangeMessage``.
+    """
+
+    def __init__(self, text: str = "", chunk_lines: int = 64):
+        if chunk_lines < 1:
+            raise ValueError("chunk_lines must be at least 1")
+        self.chunk_lines = chunk_lines
+        self.reset(text)
+
+    def reset(self, text: str):
+        """Index ``text`` from scratch."""
+        # Only "\n" separates lines, as in the editor's document
+        lengths = [len(line) + 1 for line in text.split("\n")]
+        lengths[-1] -= 1
+        self._chunks = self._split(lengths)
+        self._build()
+        self.length = len(text)
+        self.line_count = len(lengths)
+
+    def replace(self, from_pos: int, to_pos: int, insert: str):
+        """Update the index for ``text[from_pos:to_pos] = insert`` (positions already clamped)."""
+        first_chunk, first_line, first_column = self._locate(from_pos)
+        last_chunk, last_line, last_column = self._locate(to_pos)
+        delta = len(insert) - (to_pos - from_pos)
+        parts = insert.split("\n")
+        if len(parts) == 1 and (first_chunk, first_line) == (last_chunk, last_line):
+            self._chunks[first_chunk][first_line] += delta
+            _fenwick_add(self._chars, first_chunk, delta)
+            self.length += delta
+            return
+
+        removed = (
+            _fenwick_prefix(self._lines, last_chunk) + last_line
+            - _fenwick_prefix(self._lines, first_chunk) - first_line + 1
+        )
+        lengths = [len(part) + 1 for part in parts]
+        lengths[0] += first_column
+        lengths[-1] += self._chunks[last_chunk][last_line] - last_column - 1
+        chunk = self._chunks[first_chunk]
+        if first_chunk == last_chunk and len(chunk) - removed + len(lengths) <= 2 * self.chunk_lines:
+            chunk[first_line:last_line + 1] = lengths
+            _fenwick_add(self._chars, first_chunk, delta)
+            _fenwick_add(self._lines, first_chunk, len(lengths) - removed)
+        else:
+            merged = chunk[:first_line] + lengths + self._chunks[last_chunk][last_line + 1:]
+            self._chunks[first_chunk:last_chunk + 1] = self._split(merged)
+            self._build()
+        self.length += delta
+        self.line_count += len(lengths) - removed
+        if len(self._chunks) > 2 * (self.line_count // self.chunk_lines + 1):
+            # Chunks never merge back on their own: re-split once half of them could go
+            self._chunks = self._split([length for chunk in self._chunks for length in chunk])
+            self._build()
+
+    def memory_bytes(self) -> int:
+        """Estimated bytes held by the index."""
+        return self.line_count * _LINE_BYTES + len(self._chunks) * _CHUNK_BYTES
+
+    def offset(self, line: int, column: int) -> int:
+        """Character offset of (line, column), clamped to the document like the editor does."""
+        index = min(max(line, 1), self.line_count) - 1
+        chunk, remaining = _fenwick_search(self._lines, index)
+        lengths = self._chunks[chunk]
+        start = _fenwick_prefix(self._chars, chunk) + sum(lengths[:remaining])
+        end = start + lengths[remaining]
+        if index < self.line_count - 1:
+            end -= 1  # Stop before the newline
+        return min(start + max(column, 0), end)
+
+    def position(self, offset: int) -> Tuple[int, int]:
+        """(line, column) of a character offset, clamped to the document."""
+        chunk, line, column = self._locate(min(max(offset, 0), self.length))
+        return _fenwick_prefix(self._lines, chunk) + line + 1, column
+
+    def _locate(self, offset: int) -> Tuple[int, int, int]:
+        # (chunk, line within the chunk, column) of an offset in [0, length]
+        chunk, remaining = _fenwick_search(self._chars, offset)
+        if chunk == len(self._chunks):
+            # End of the document: last line, past its end
+            chunk -= 1
+            remaining += sum(self._chunks[chunk])
+        ends = list(accumulate(self._chunks[chunk]))
+        line = min(bisect_right(ends, remaining), len(ends) - 1)
+        return chunk, line, remaining - (ends[line - 1] if line else 0)
+
+    def _split(self, lengths: List[int]) -> List[List[int]]:
+        size = self.chunk_lines
+        return [lengths[i:i + size] for i in range(0, len(lengths), size)]
+
+    def _build(self):
+        self._chars = _fenwick_build([sum(chunk) for chunk in self._chunks])
+        self._lines = _fenwick_build([len(chunk) for chunk in self._chunks])
+
+
+def _fenwick_build(values: List[int]) -> List[int]:
+    # 1-based tree; node i holds the sum of values (i - lowbit(i), i]
+    prefix = [0, *accumulate(values)]
+    return [0] + [prefix[i] - prefix[i - (i & -i)] for i in range(1, len(prefix))]
+
+
+def _fenwick_add(tree: List[int], index: int, delta: int):
+    node = index + 1
+    while node < len(tree):
+        tree[node] += delta
+        node += node & -node
+
+
+def _fenwick_prefix(tree: List[int], index: int) -> int:
+    # Sum of the first ``index`` values
+    total = 0
+    while index > 0:
+        total += tree[index]
+        index &= index - 1
+    return total
+
+
+def _fenwick_search(tree: List[int], target: int) -> Tuple[int, int]:
+    # Largest count of leading values whose sum is <= target, and the remainder
+    index = 0
+    step = 1 << (len(tree).bit_length() - 1)
+    while step:
+        node = index + step
+        if node < len(tree) and tree[node] <= target:
+            index = node
+            target -= tree[node]
+        step >>= 1
+    return index, target
+
+
+class Room:
+    """
+    Server-side copy of a room's document.
+
+    ``version`` increases by one for every applied code change, so a client
+    that received a snapshot at version N knows that the next op it sees
+    must carry version N + 1. ``epoch`` identifies this copy of the document:
+    versions are only comparable within the same epoch (a server restart
+    reloads the room at version 0 under a new epoch).
+    """
+
+    def __init__(self, room_id: str, text: str = "", language: str = "python", version: int = 0):
+        self.room_id = room_id
+        self.text = text
+        self.language = language
+        self.version = version
+        self.epoch = secrets.token_urlsafe(6)
+        self.ops = OpLog(version=version)
+        # Built on the first lookup (see ``lines``): rooms nobody queries pay nothing per op
+        self._lines: Optional[LineIndex] = None
+        # True when the text has changed since it was loaded or last persisted
+        self.dirty = False
+        # Monotonic time of the last join or edit; the least recently used rooms are spilled first
+        self.last_used = time.monotonic()
+
+    @property
+    def lines(self) -> LineIndex:
+        """Line index of the document, built on first use and kept up to date by apply() from then on."""
+        if self._lines is None:
+            self._lines = LineIndex(self.text)
+        return self._lines
+
+    def apply(self, message: CodeChangeMessage) -> int:
+        """
+        Apply a normalized code change (diff or full code) and return the new version.
+
+        Diff positions are clamped to the document length, matching the
+        ``String.slice`` semantics of the frontend's ``applyDiff``.
+        """
+        if message.code is not None:
+            self.text = message.code
+            # Rebuilt from the new text on the next lookup
+            self._lines = None
+        elif message.insert is not None and message.from_pos is not None and message.to_pos is not None:
+            length = len(self.text)
+            from_pos = min(message.from_pos, length)
+            to_pos = min(max(message.to_pos, from_pos), length)
+            self.text = self.text[:from_pos] + message.insert + self.text[to_pos:]
+            if self._lines is not None:
+                self._lines.replace(from_pos, to_pos, message.insert)
+        else:
+            return self.version
+        self.version += 1
+        self.dirty = True
+        self.last_used = time.monotonic()
+        return self.version
+
+    def record(self, version: int, frame: str):
+        """Keep the broadcast frame of an applied op for delta resync."""
+        self.ops.append(version, frame)
+
+    def ops_since(self, epoch: Optional[str], version: Optional[int]) -> Optional[List[str]]:
+        """Frames a client at (epoch, version) is missing, or None if it needs a snapshot."""
+        if epoch != self.epoch or version is None:
+            return None
+        return self.ops.since(version)
+
+    def memory_bytes(self) -> int:
+        """Approximate bytes held by the document, its op log and its line index."""
+        lines = self._lines.memory_bytes() if self._lines is not None else 0
+        return sys.getsizeof(self.text) + self.ops.memory_bytes() + lines
+
+
+class SpilledRoom:
+    """
+    What stays in memory of a room whose document was spilled to the database.
+
+    Keeping the epoch and version lets the room be rehydrated without
+    disturbing its connected clients: the next op still carries version + 1.
+    The op log is not kept, so a client reconnecting afterwards gets a snapshot.
+    """
+
+    __slots__ = ("room_id", "epoch", "version", "language")
+
+    def __init__(self, room: Room):
+        self.room_id = room.room_id
+        self.epoch = room.epoch
+        self.version = room.version
+        self.language = room.language
+
+
+def is_keystroke(message: CodeChangeMessage) -> bool:
+    """True for a diff that inserts and/or deletes at most one character (typing, backspace)."""
+    if message.from_pos is None or message.to_pos is None or message.insert is None:
+        return False
+    deleted = message.to_pos - message.from_pos
+    return 0 <= deleted <= 1 and len(message.insert) <= 1 and (deleted > 0 or message.insert != "")
+
+
+def merge_code_changes(first: CodeChangeMessage, second: CodeChangeMessage) -> Optional[CodeChangeMessage]:
+    """
+    Combine two consecutive changes into one with the same effect, if ``second`` touches ``first``.
+
+    ``second`` must be a keystroke whose range (in the document after
+    ``first``) overlaps or is adjacent to the text ``first`` inserted; the
+    result is a single diff against the document before ``first``. When
+    the changes carry the full code, the later code is kept, and the
+    result keeps the timestamp of the first keystroke (when the merged
+    edit started). Returns None when they cannot be merged.
+    """
+    if not is_keystroke(second) or (first.code is None) != (second.code is None):
+        return None
+    if first.from_pos is None or first.to_pos is None or first.insert is None or first.to_pos < first.from_pos:
+        return None
+    start, end, inserted = first.from_pos, first.to_pos, first.insert
+    inserted_end = start + len(inserted)
+    if second.to_pos < start or second.from_pos > inserted_end:
+        return None
+    # Map the ends of second's range back to the document before first
+    if second.from_pos < start:
+        from_pos, prefix = second.from_pos, ""
+    else:
+        from_pos, prefix = start, inserted[:second.from_pos - start]
+    if second.to_pos > inserted_end:
+        to_pos, suffix = end + second.to_pos - inserted_end, ""
+    else:
+        to_pos, suffix = end, inserted[second.to_pos - start:]
+    return CodeChangeMessage(
+        code=second.code,
+        cursor_position=second.cursor_position,
+        from_pos=from_pos,
+        to_pos=to_pos,
+        insert=prefix + second.insert + suffix,
+        delete_length=(to_pos - from_pos) or None,
+        timestamp=first.timestamp or second.timestamp,
+    )
+
+
+def _common_prefix_length(a: str, b: str) -> int:
+    # Binary search over slice comparisons: each comparison runs in C, unlike a per-character loop
+    low, high = 0, min(len(a), len(b))
+    while low < high:
+        middle = (low + high + 1) // 2
+        if a[low:middle] == b[low:middle]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def diff_texts(old: str, new: str) -> Tuple[int, int, str]:
+    """
+    Single replacement turning ``old`` into ``new``: ``(from_pos, to_pos, insert)``.
+
+    Everything between the longest common prefix and suffix is replaced,
+    the same shape as the frontend's ``calculateDiff``.
+    """
+    if old == new:
+        return len(old), len(old), ""
+    prefix = _common_prefix_length(old, new)
+    limit = min(len(old), len(new)) - prefix
+    suffix = _common_prefix_length(old[::-1][:limit], new[::-1][:limit])
+    return prefix, len(old) - suffix, new[prefix:len(new) - suffix]
+
+
+def session_id_for_room(room_id: str) -> Optional[str]:
+    """Extract the session_id from a room_id (format: room-{session_id})."""
+    if room_id.startswith("room-"):
+        return room_id[len("room-"):]
+    return None
+
+
+def load_room(room_id: str) -> Room:
+    """
+    Build the initial state of a room from its session in the database.
+
+    Rooms without a backing session (or when the database is unavailable)
+    start with an empty document.
+    """
+    db = SessionLocal()
+    try:
+        db_session = db.query(SessionModel).filter(SessionModel.room_id == room_id).first()
+        if db_session is not None:
+            return Room(room_id, text=db_session.code, language=db_session.language)
+    except SQLAlchemyError as e:
+        print(f"[Rooms] Could not load room {room_id} from database: {e}")
+    finally:
+        db.close()
+    return Room(room_id)
+
+
+class RoomGoneError(LookupError):
+    """Raised when a spilled room's session was deleted before it was rehydrated."""
+
+
+def rehydrate_room(spilled: SpilledRoom) -> Room:
+    """
+    Rebuild a spilled room from the text saved when it was spilled.
+
+    Raises SQLAlchemyError if the database cannot be read (the room must
+    then stay spilled: an empty document under the same version would
+    silently diverge from its clients), and RoomGoneError if its session
+    no longer exists (its clients must be closed, not handed an empty
+    document as if it were the live one).
+    """
+    db = SessionLocal()
+    try:
+        db_session = db.query(SessionModel).filter(SessionModel.room_id == spilled.room_id).first()
+    finally:
+        db.close()
+    if db_session is None:
+        raise RoomGoneError(spilled.room_id)
+    room = Room(spilled.room_id, text=db_session.code, language=spilled.language, version=spilled.version)
+    room.epoch = spilled.epoch
+    return room
+
+
+def save_room_texts(texts: Dict[str, str]) -> int:
+    """
+    Persist the document of several rooms in a single transaction.
+
+    Args:
+        texts: room_id -> current text
+
+    Returns:
+        Number of sessions updated, or -1 if the database write failed
+    """
+    saved = save_room_texts_by_id(texts)
+    return -1 if saved is None else len(saved)
+
+
+def save_room_texts_by_id(texts: Dict[str, str]) -> Optional[Set[str]]:
+    """Like save_room_texts(), but return the ids of the rooms saved (None if the write failed)."""
+    if not texts:
+        return set()
+    db = SessionLocal()
+    try:
+        sessions = db.query(SessionModel).filter(SessionModel.room_id.in_(list(texts))).all()
+        saved_at = datetime.now(UTC)
+        for db_session in sessions:
+            db_session.code = texts[db_session.room_id]
+            db_session.last_saved_at = saved_at
+        db.commit()
+        return {db_session.room_id for db_session in sessions}
+    except SQLAlchemyError as e:
+        db.rollback()
+        print(f"[Rooms] Error saving {len(texts)} room(s): {e}")
+        return None
+    finally:
+        db.close()
+
+
+def save_active_users(counts: Dict[str, int]) -> int:
+    """
+    Write the occupancy of several rooms with a single batched UPDATE.
+
+    Args:
+        counts: room_id -> number of connected users
+
+    Returns:
+        Number of rooms written, or -1 if the database write failed
+    """
+    params = [
+        {"b_session_id": session_id_for_room(room_id), "b_active_users": count}
+        for room_id, count in counts.items()
+        if session_id_for_room(room_id) is not None
+    ]
+    if not params:
+        return 0
+    table = SessionModel.__table__
+    statement = (
+        table.update()
+        .where(table.c.session_id == bindparam("b_session_id"))
+        .values(active_users=bindparam("b_active_users"))
+    )
+    db = SessionLocal()
+    try:
+        db.execute(statement, params)
+        db.commit()
+        return len(params)
+    except SQLAlchemyError as e:
+        db.rollback()
+        print(f"[Rooms] Error saving active users for {len(params)} room(s): {e}")
+        return -1
+    finally:
+        db.close()
+
+
+def reset_active_users() -> int:
+    """
+    Zero the occupancy of every session; used at startup, before any connection exists.
+
+    Only safe while the app runs as a single worker: rooms live in this process's
+    memory, so no other process can own connections whose occupancy this would erase.
+    """
+    db = SessionLocal()
+    try:
+        updated = (
+            db.query(SessionModel)
+            .filter(SessionModel.active_users != 0)
+            .update({SessionModel.active_users: 0}, synchronize_session=False)
+        )
+        db.commit()
+        return updated
+    except SQLAlchemyError as e:
+        db.rollback()
+        print(f"[Rooms] Error resetting active users: {e}")
+        return 0
+    finally:
+        db.close()
@@ -1,29 +1,123 @@
 """REST API routes."""
 
+import base64
+import json
 import os
 import secrets
+from dataclasses import asdict
 from datetime import UTC, datetime, timedelta
-from typing import Dict
-from fastapi import APIRouter, HTTPException, status, Depends
+from typing import Dict, Literal, Optional, Tuple
+from fastapi import APIRouter, HTTPException, Query, status, Depends
+from fastapi.responses import StreamingResponse
+from sqlalchemy import insert, tuple_
 from sqlalchemy.orm import Session
 from app.models import (
     HealthResponse,
     CreateSessionRequest,
+    BatchCreateSessionsRequest,
+    BatchCreateSessionsResponse,
     SessionResponse,
+    SessionListResponse,
     SaveCodeRequest,
+    RunCodeRequest,
+    RunCodeResponse,
+    SetHiddenTestsRequest,
+    HiddenTestsResponse,
+    GradeRequest,
+    GradeResponse,
     ErrorResponse,
-    Session as SessionModel
+    MetricsResponse,
+    Session as SessionModel,
+    HiddenTestCase
 )
 from app.database import get_db, init_db
+from app.metrics import metrics
+from app.execution import executor, SandboxUnavailableError, UnsupportedLanguageError
+from app.grading import grade
+from app.websocket import manager, spectator_events
 
 router = APIRouter()
 
+# Page size limits for GET /api/sessions
+SESSION_LIST_DEFAULT_LIMIT = 50
+SESSION_LIST_MAX_LIMIT = 200
+
 # Session duration configuration (5-12 hours)
 SESSION_DURATION_HOURS = int(os.getenv("SESSION_DURATION_HOURS", "8"))
 if SESSION_DURATION_HOURS < 5 or SESSION_DURATION_HOURS > 12:
     SESSION_DURATION_HOURS = 8  # Default to 8 hours if invalid
 
 
+def new_session_row(request: CreateSessionRequest, created_at: datetime) -> Dict:
+    """Column values for a new session created from ``request`` at ``created_at``."""
+    # Generate unique session ID
+    session_id = secrets.token_urlsafe(16)
+    
+    return {
+        "session_id": session_id,
+        "room_id": f"room-{session_id}",
+        "language": request.language or "python",
+        "code": request.initial_code or "# Escribe tu código aquí",
+        "title": request.title,
+        "created_at": created_at,
+        # Expiration time (5-12 hours from now)
+        "expires_at": created_at + timedelta(hours=SESSION_DURATION_HOURS),
+        "active_users": 0,
+    }
+
+
+def session_response(db_session: SessionModel) -> SessionResponse:
+    """
+    Build the API representation of a session.
+    
+    active_users is read live from the WebSocket registry; the stored column
+    is only refreshed by the periodic occupancy flush.
+    """
+    # Generate share URL (frontend URL)
+    share_url = f"http://localhost:5173/session/{db_session.session_id}"
+    
+    return SessionResponse(
+        session_id=db_session.session_id,
+        room_id=db_session.room_id,
+        share_url=share_url,
+        language=db_session.language,
+        initial_code=db_session.code,
+        title=db_session.title,
+        created_at=db_session.created_at,
+        expires_at=db_session.expires_at,
+        active_users=manager.occupancy(db_session.room_id),
+        last_saved_at=db_session.last_saved_at
+    )
+
+
+def get_active_session(db: Session, session_id: str) -> SessionModel:
+    """Load a session, raising 404 if it does not exist and 410 if it has expired."""
+    db_session = db.query(SessionModel).filter(SessionModel.session_id == session_id).first()
+    
+    if not db_session:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Sesión con ID '{session_id}' no encontrada"
+        )
+    
+    # Check if session has expired
+    if db_session.is_expired():
+        raise HTTPException(
+            status_code=status.HTTP_410_GONE,
+            detail=f"Sesión con ID '{session_id}' ha expirado"
+        )
+    
+    return db_session
+
+
+def live_code(db_session: SessionModel) -> Tuple[str, str]:
+    """(code, language) of a session: the live room document if loaded, else the last saved code."""
+    room = manager.rooms.get(db_session.room_id)
+    if room is not None:
+        return room.text, room.language
+    return db_session.code, db_session.language
+
+
 @router.get("/health", response_model=HealthResponse, tags=["health"])
 async def health_check() -> HealthResponse:
     """
@@ -34,6 +128,16 @@ async def health_check() -> HealthResponse:
     return HealthResponse()
 
 
+@router.get("/api/metrics", response_model=MetricsResponse, tags=["metrics"])
+async def get_metrics() -> MetricsResponse:
+    """
+    Métricas del servidor.
+    
+    Retorna los contadores y valores instantáneos del proceso (rate limiting, caches, salas).
+    """
+    return MetricsResponse(**metrics.snapshot())
+
+
 @router.post("/api/sessions", response_model=SessionResponse, status_code=status.HTTP_201_CREATED, tags=["sessions"])
 async def create_session(
     request: CreateSessionRequest = CreateSessionRequest(),
@@ -44,46 +148,127 @@ async def create_session(
     
     Crea una nueva sesión de código y retorna el ID de la sesión y el enlace para compartir.
     """
-    # Generate unique session ID
-    session_id = secrets.token_urlsafe(16)
-    room_id = f"room-{session_id}"
+    # Create session in database
+    db_session = SessionModel(**new_session_row(request, datetime.now(UTC)))
+    
+    db.add(db_session)
+    db.commit()
+    db.refresh(db_session)
     
-    # Calculate expiration time (5-12 hours from now)
+    return session_response(db_session)
+
+
+@router.post(
+    "/api/sessions:batch",
+    response_model=BatchCreateSessionsResponse,
+    status_code=status.HTTP_201_CREATED,
+    tags=["sessions"]
+)
+async def create_sessions_batch(
+    request: BatchCreateSessionsRequest,
+    db: Session = Depends(get_db)
+) -> BatchCreateSessionsResponse:
+    """
+    Crear varias sesiones de código en una sola petición.
+    
+    Todas las sesiones se insertan en una única transacción con un INSERT
+    masivo; la respuesta se construye a partir de los valores insertados,
+    sin volver a leerlos de la base de datos.
+    """
     created_at = datetime.now(UTC)
-    expires_at = created_at + timedelta(hours=SESSION_DURATION_HOURS)
+    rows = [new_session_row(item, created_at) for item in request.sessions]
     
-    initial_code = request.initial_code or "# Escribe tu código aquí"
+    db.execute(insert(SessionModel), rows)
+    db.commit()
     
-    # Create session in database
-    db_session = SessionModel(
-        session_id=session_id,
-        room_id=room_id,
-        language=request.language or "python",
-        code=initial_code,
-        title=request.title,
-        created_at=created_at,
-        expires_at=expires_at,
-        active_users=0
+    return BatchCreateSessionsResponse(
+        sessions=[session_response(SessionModel(**row)) for row in rows]
     )
+
+
+def as_utc(value: datetime) -> datetime:
+    """Normalize aware datetimes to UTC (naive values are taken as UTC already), as stored in the database."""
+    return value.astimezone(UTC) if value.tzinfo is not None else value
+
+
+def encode_cursor(order_by: str, key: datetime, session_id: str) -> str:
+    """Opaque cursor pointing just after the (key, session_id) of the last row of a page."""
+    payload = json.dumps([order_by, key.isoformat(), session_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str, order_by: str) -> Tuple[datetime, str]:
+    """Inverse of encode_cursor; raises 400 for malformed cursors or a different sort order."""
+    try:
+        cursor_order, key, session_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        if cursor_order != order_by:
+            raise ValueError("cursor belongs to another sort order")
+        return datetime.fromisoformat(key), str(session_id)
+    except (ValueError, TypeError, UnicodeError, json.JSONDecodeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Cursor de paginación inválido"
+        )
+
+
+@router.get("/api/sessions", response_model=SessionListResponse, tags=["sessions"])
+async def list_sessions(
+    language: Optional[str] = Query(default=None, pattern="^(python|javascript|typescript|java|cpp)$"),
+    expires_before: Optional[datetime] = Query(default=None, description="Solo sesiones que expiran antes de esta fecha"),
+    created_after: Optional[datetime] = Query(default=None, description="Solo sesiones creadas después de esta fecha"),
+    has_active_users: Optional[bool] = Query(default=None, description="Filtrar por sesiones con o sin usuarios conectados"),
+    order_by: Literal["created_at", "expires_at"] = Query(
+        default="created_at",
+        description="created_at: más recientes primero; expires_at: las que expiran antes primero"
+    ),
+    limit: int = Query(default=SESSION_LIST_DEFAULT_LIMIT, ge=1, le=SESSION_LIST_MAX_LIMIT),
+    cursor: Optional[str] = Query(default=None, description="next_cursor de la página anterior"),
+    db: Session = Depends(get_db)
+) -> SessionListResponse:
+    """
+    Listar sesiones.
     
-    db.add(db_session)
-    db.commit()
-    db.refresh(db_session)
+    Usa paginación por keyset sobre (created_at, session_id) o
+    (expires_at, session_id), respaldada por índices compuestos: cada página
+    cuesta lo mismo sin importar su posición. El filtro has_active_users usa
+    la ocupación guardada periódicamente en la base de datos.
+    """
+    query = db.query(SessionModel)
+    if language is not None:
+        query = query.filter(SessionModel.language == language)
+    if expires_before is not None:
+        query = query.filter(SessionModel.expires_at < as_utc(expires_before))
+    if created_after is not None:
+        query = query.filter(SessionModel.created_at > as_utc(created_after))
+    if has_active_users is not None:
+        query = query.filter(
+            SessionModel.active_users > 0 if has_active_users else SessionModel.active_users == 0
+        )
     
-    # Generate share URL (frontend URL)
-    share_url = f"http://localhost:5173/session/{session_id}"
+    sort_column = SessionModel.created_at if order_by == "created_at" else SessionModel.expires_at
+    keyset = tuple_(sort_column, SessionModel.session_id)
+    if cursor is not None:
+        key, last_session_id = decode_cursor(cursor, order_by)
+        if order_by == "created_at":
+            query = query.filter(keyset < tuple_(key, last_session_id))
+        else:
+            query = query.filter(keyset > tuple_(key, last_session_id))
+    if order_by == "created_at":
+        query = query.order_by(sort_column.desc(), SessionModel.session_id.desc())
+    else:
+        query = query.order_by(sort_column.asc(), SessionModel.session_id.asc())
     
-    return SessionResponse(
-        session_id=db_session.session_id,
-        room_id=db_session.room_id,
-        share_url=share_url,
-        language=db_session.language,
-        initial_code=db_session.code,
-        title=db_session.title,
-        created_at=db_session.created_at,
-        expires_at=db_session.expires_at,
-        active_users=db_session.active_users,
-        last_saved_at=db_session.last_saved_at
+    # One extra row tells whether there is a next page
+    rows = query.limit(limit + 1).all()
+    page = rows[:limit]
+    next_cursor = None
+    if len(rows) > limit:
+        last = page[-1]
+        next_cursor = encode_cursor(order_by, getattr(last, order_by), last.session_id)
+    
+    return SessionListResponse(
+        sessions=[session_response(db_session) for db_session in page],
+        next_cursor=next_cursor
     )
 
 
@@ -97,34 +282,37 @@ async def get_session(
     
     Obtiene la información de una sesión de código existente.
     """
-    db_session = db.query(SessionModel).filter(SessionModel.session_id == session_id).first()
+    db_session = get_active_session(db, session_id)
     
-    if not db_session:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Sesión con ID '{session_id}' no encontrada"
-        )
+    return session_response(db_session)
+
+
+@router.get("/api/sessions/{session_id}/watch", tags=["sessions"])
+async def watch_session(
+    session_id: str,
+    cursors: bool = Query(False, description="Recibir también los cursores de los editores"),
+    db: Session = Depends(get_db)
+) -> StreamingResponse:
+    """
+    Observar una sesión en modo solo lectura (Server-Sent Events).
     
-    # Check if session has expired
-    if db_session.is_expired():
+    Alternativa más barata al WebSocket para espectadores: envía un snapshot
+    del documento y después, a ritmo reducido, un único cambio que agrupa
+    todas las ediciones de cada intervalo. Cada evento ``data:`` lleva el
+    mismo JSON que recibiría un espectador por WebSocket.
+    """
+    db_session = get_active_session(db, session_id)
+    if manager.draining:
         raise HTTPException(
-            status_code=status.HTTP_410_GONE,
-            detail=f"Sesión con ID '{session_id}' ha expirado"
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="El servidor se está reiniciando"
         )
     
-    share_url = f"http://localhost:5173/session/{session_id}"
-    
-    return SessionResponse(
-        session_id=db_session.session_id,
-        room_id=db_session.room_id,
-        share_url=share_url,
-        language=db_session.language,
-        initial_code=db_session.code,
-        title=db_session.title,
-        created_at=db_session.created_at,
-        expires_at=db_session.expires_at,
-        active_users=db_session.active_users,
-        last_saved_at=db_session.last_saved_at
+    return StreamingResponse(
+        spectator_events(db_session.room_id, cursors=cursors),
+        media_type="text/event-stream",
+        # Sin caché ni buffering en proxies: los eventos deben llegar al momento
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
     )
 
 
@@ -138,21 +326,13 @@ async def save_code(
     Guardar código de una sesión.
     
     Actualiza el código de una sesión existente y marca la fecha de último guardado.
+    Si la sala está en memoria, el código guardado pasa a ser su documento (como un
+    cambio más, que reciben los usuarios conectados).
     """
-    db_session = db.query(SessionModel).filter(SessionModel.session_id == session_id).first()
-    
-    if not db_session:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Sesión con ID '{session_id}' no encontrada"
-        )
+    db_session = get_active_session(db, session_id)
     
-    # Check if session has expired
-    if db_session.is_expired():
-        raise HTTPException(
-            status_code=status.HTTP_410_GONE,
-            detail=f"Sesión con ID '{session_id}' ha expirado"
-        )
+    # Before the database write: a spilled room must be rehydrated from the text its clients have
+    await manager.in_room(db_session.room_id, manager.apply_saved_code, db_session.room_id, request.code)
     
     # Update code and last_saved_at
     db_session.code = request.code
@@ -161,18 +341,122 @@ async def save_code(
     db.commit()
     db.refresh(db_session)
     
-    share_url = f"http://localhost:5173/session/{session_id}"
-    
-    return SessionResponse(
-        session_id=db_session.session_id,
-        room_id=db_session.room_id,
-        share_url=share_url,
-        language=db_session.language,
-        initial_code=db_session.code,
-        title=db_session.title,
-        created_at=db_session.created_at,
-        expires_at=db_session.expires_at,
-        active_users=db_session.active_users,
-        last_saved_at=db_session.last_saved_at
+    return session_response(db_session)
+
+
+def sandbox_unavailable() -> HTTPException:
+    """503 for runs refused because the sandbox could not be started on this server."""
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="La ejecución de código en el servidor no está disponible"
     )
 
+
+@router.post("/api/sessions/{session_id}/run", response_model=RunCodeResponse, tags=["execution"])
+async def run_code(
+    session_id: str,
+    request: RunCodeRequest = RunCodeRequest(),
+    db: Session = Depends(get_db)
+) -> RunCodeResponse:
+    """
+    Ejecutar código en el servidor.
+    
+    Ejecuta el código en un proceso aislado (límites de CPU, memoria y
+    archivos, sin red) tomado de un pool de intérpretes ya arrancados. Si la
+    petición no incluye código, se ejecuta el documento actual de la sala
+    (o el último guardado si nadie está conectado).
+    """
+    db_session = get_active_session(db, session_id)
+    
+    current_code, current_language = live_code(db_session)
+    code = request.code if request.code is not None else current_code
+    language = request.language or current_language
+    
+    try:
+        result = await executor.run(language, code, request.stdin)
+    except UnsupportedLanguageError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"La ejecución en el servidor no soporta el lenguaje '{language}'"
+        )
+    except SandboxUnavailableError:
+        raise sandbox_unavailable()
+    
+    return RunCodeResponse(language=language, **asdict(result))
+
+
+@router.put("/api/sessions/{session_id}/tests", response_model=HiddenTestsResponse, tags=["grading"])
+async def set_hidden_tests(
+    session_id: str,
+    request: SetHiddenTestsRequest,
+    db: Session = Depends(get_db)
+) -> HiddenTestsResponse:
+    """
+    Guardar los casos de prueba ocultos de una sesión.
+    
+    Reemplaza todos los casos existentes. El contenido de los casos nunca se
+    devuelve ni se envía a la sala: solo el número de casos guardados.
+    """
+    get_active_session(db, session_id)
+    
+    db.query(HiddenTestCase).filter(HiddenTestCase.session_id == session_id).delete()
+    if request.cases:
+        db.execute(insert(HiddenTestCase), [
+            {
+                "session_id": session_id,
+                "position": position,
+                "name": case.name,
+                "stdin": case.stdin,
+                "expected_output": case.expected_output,
+            }
+            for position, case in enumerate(request.cases)
+        ])
+    db.commit()
+    
+    return HiddenTestsResponse(count=len(request.cases))
+
+
+@router.post("/api/sessions/{session_id}/grade", response_model=GradeResponse, tags=["grading"])
+async def grade_session(
+    session_id: str,
+    request: GradeRequest = GradeRequest(),
+    db: Session = Depends(get_db)
+) -> GradeResponse:
+    """
+    Corregir el código actual de una sesión con sus casos ocultos.
+    
+    Todos los casos se ejecutan en paralelo en el pool de ejecución, cada uno
+    con su propio tiempo límite. El resultado de cada caso se envía a la sala
+    por WebSocket (grade_case) en cuanto termina; con stop_on_failure, el
+    primer caso que no pasa detiene los restantes.
+    """
+    db_session = get_active_session(db, session_id)
+    cases = (
+        db.query(HiddenTestCase)
+        .filter(HiddenTestCase.session_id == session_id)
+        .order_by(HiddenTestCase.position)
+        .all()
+    )
+    if not cases:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"La sesión '{session_id}' no tiene casos de prueba"
+        )
+    
+    code, language = live_code(db_session)
+    try:
+        return await grade(
+            db_session.room_id,
+            language,
+            code,
+            cases,
+            stop_on_failure=request.stop_on_failure,
+            timeout=request.timeout_seconds,
+        )
+    except UnsupportedLanguageError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"La ejecución en el servidor no soporta el lenguaje '{language}'"
+        )
+    except SandboxUnavailableError:
+        raise sandbox_unavailable()
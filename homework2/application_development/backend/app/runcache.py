@@ -0,0 +1,175 @@
+"""Content-addressed cache of execution results, with optional spill to disk."""
+
+import asyncio
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+from app.metrics import metrics
+
+# Memory budget of cached results (stdout + stderr)
+EXEC_CACHE_MAX_BYTES = int(os.getenv("EXEC_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+# Directory that receives results evicted from memory; spill is disabled when unset
+EXEC_CACHE_DIR = os.getenv("EXEC_CACHE_DIR", "")
+# Disk budget of spilled results
+EXEC_CACHE_DISK_MAX_BYTES = int(os.getenv("EXEC_CACHE_DISK_MAX_BYTES", str(256 * 1024 * 1024)))
+
+# Fixed cost per entry (key, dict, OrderedDict node), so tiny results still count
+_ENTRY_OVERHEAD = 256
+
+
+def cache_key(language: str, code: str, stdin: str) -> str:
+    """Hash identifying a run: the same language, program and input give the same key."""
+    digest = hashlib.sha256()
+    for part in (language, code, stdin):
+        data = part.encode("utf-8")
+        # Length-prefixed, so ("ab", "c") and ("a", "bc") differ
+        digest.update(b"%d:" % len(data))
+        digest.update(data)
+    return digest.hexdigest()
+
+
+def _entry_size(result: Dict) -> int:
+    return _ENTRY_OVERHEAD + sum(len(v) for v in result.values() if isinstance(v, str))
+
+
+class ResultCache:
+    """
+    LRU cache of run results bounded by the size of their output.
+
+    Results evicted from memory are written to ``directory`` (one JSON file
+    per key, itself bounded LRU by ``disk_max_bytes``) and promoted back to
+    memory on their next hit. Disk I/O runs in a worker thread.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = EXEC_CACHE_MAX_BYTES,
+        directory: str = EXEC_CACHE_DIR,
+        disk_max_bytes: int = EXEC_CACHE_DISK_MAX_BYTES,
+    ):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.disk_max_bytes = disk_max_bytes
+        self.size = 0
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+        # key -> file size, oldest first; built from the directory on first use
+        self._disk: Optional["OrderedDict[str, int]"] = None
+        self.disk_size = 0
+        # Loads and spills run in worker threads and share the disk index
+        self._disk_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def get(self, key: str) -> Optional[Dict]:
+        """Return the cached result for ``key`` (memory first, then disk), or None."""
+        result = self._entries.get(key)
+        if result is not None:
+            self._entries.move_to_end(key)
+        elif self.directory:
+            result = await asyncio.to_thread(self._load, key)
+            if result is not None:
+                metrics.incr("exec_cache_disk_hits_total")
+                await self.put(key, result)
+        if result is None:
+            self.misses += 1
+            metrics.incr("exec_cache_misses_total")
+        else:
+            self.hits += 1
+            metrics.incr("exec_cache_hits_total")
+        metrics.set_gauge("exec_cache_hit_rate", self.hits / (self.hits + self.misses))
+        return result
+
+    async def put(self, key: str, result: Dict):
+        """Store ``result``, evicting (and spilling) least recently used entries over the budget."""
+        size = _entry_size(result)
+        if size > self.max_bytes:
+            return
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self.size -= _entry_size(previous)
+        self._entries[key] = result
+        self.size += size
+        evicted = {}
+        while self.size > self.max_bytes:
+            old_key, old_result = self._entries.popitem(last=False)
+            self.size -= _entry_size(old_result)
+            evicted[old_key] = old_result
+        metrics.set_gauge("exec_cache_bytes", self.size)
+        if evicted and self.directory:
+            await asyncio.to_thread(self._spill, evicted)
+
+    def clear(self):
+        """Drop the in-memory entries (spilled files are kept)."""
+        self._entries.clear()
+        self.size = 0
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def _disk_index(self) -> "OrderedDict[str, int]":
+        if self._disk is None:
+            files = []
+            for root, _, names in os.walk(self.directory):
+                for name in names:
+                    if name.endswith(".json"):
+                        stat = os.stat(os.path.join(root, name))
+                        files.append((stat.st_mtime, name[:-len(".json")], stat.st_size))
+            self._disk = OrderedDict((key, size) for _, key, size in sorted(files))
+            self.disk_size = sum(self._disk.values())
+        return self._disk
+
+    def _load(self, key: str) -> Optional[Dict]:
+        with self._disk_lock:
+            return self._load_locked(key)
+
+    def _load_locked(self, key: str) -> Optional[Dict]:
+        index = self._disk_index()
+        if key not in index:
+            return None
+        try:
+            with open(self._path(key), encoding="utf-8") as f:
+                result = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"[RunCache] Dropping unreadable cache entry {key}: {e}")
+            self._remove(key)
+            return None
+        # Now in memory again; the file is rewritten if it gets evicted later
+        self._remove(key)
+        return result
+
+    def _spill(self, evicted: Dict[str, Dict]):
+        with self._disk_lock:
+            self._spill_locked(evicted)
+
+    def _spill_locked(self, evicted: Dict[str, Dict]):
+        index = self._disk_index()
+        for key, result in evicted.items():
+            data = json.dumps(result, separators=(",", ":")).encode("utf-8")
+            if len(data) > self.disk_max_bytes:
+                continue
+            path = self._path(key)
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, "wb") as f:
+                    f.write(data)
+            except OSError as e:
+                print(f"[RunCache] Could not spill cache entry {key}: {e}")
+                continue
+            self.disk_size -= index.pop(key, 0)
+            index[key] = len(data)
+            self.disk_size += len(data)
+        while self.disk_size > self.disk_max_bytes and index:
+            self._remove(next(iter(index)))
+
+    def _remove(self, key: str):
+        self.disk_size -= self._disk_index().pop(key, 0)
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,159 @@
+"""Checkpoint in-memory room state to a local memory-mapped file for fast restarts."""
+
+import mmap
+import os
+import struct
+from typing import Dict, List, NamedTuple
+from app.rooms import OpLog, Room
+
+# Path of the snapshot file; checkpoints are disabled when unset
+ROOM_SNAPSHOT_PATH = os.getenv("ROOM_SNAPSHOT_PATH", "")
+# Seconds between checkpoints
+ROOM_SNAPSHOT_INTERVAL = float(os.getenv("ROOM_SNAPSHOT_INTERVAL", "5"))
+
+MAGIC = b"RMSN"
+FORMAT_VERSION = 1
+
+# magic, format version, room count
+_HEADER = struct.Struct("<4sHI")
+# version, dirty flag, first version of the op log, number of op frames
+_ROOM_FIELDS = struct.Struct("<QBQI")
+_LENGTH = struct.Struct("<I")
+
+
+class RoomState(NamedTuple):
+    """Immutable copy of a room taken on the event loop thread."""
+    room_id: str
+    epoch: str
+    language: str
+    text: str
+    version: int
+    dirty: bool
+    ops_first_version: int
+    ops: List[str]
+
+
+def capture(rooms: Dict[str, Room]) -> List[RoomState]:
+    """Copy the state of every room; cheap enough to run on the event loop (strings are shared, not copied)."""
+    states = []
+    for room in rooms.values():
+        first_version = room.ops.first_version
+        states.append(RoomState(
+            room_id=room.room_id,
+            epoch=room.epoch,
+            language=room.language,
+            text=room.text,
+            version=room.version,
+            dirty=room.dirty,
+            ops_first_version=first_version,
+            ops=room.ops.since(first_version) or [],
+        ))
+    return states
+
+
+def write_snapshot(path: str, states: List[RoomState]) -> int:
+    """
+    Write room states to ``path`` through a memory map.
+
+    The file is written next to ``path`` and atomically renamed over it, so a
+    crash mid-checkpoint leaves the previous snapshot intact.
+
+    Returns:
+        Size of the snapshot in bytes
+    """
+    encoded = []
+    size = _HEADER.size
+    for state in states:
+        strings = [s.encode("utf-8") for s in (state.room_id, state.epoch, state.language, state.text)]
+        frames = [frame.encode("utf-8") for frame in state.ops]
+        size += _ROOM_FIELDS.size + _LENGTH.size * (len(strings) + len(frames))
+        size += sum(len(s) for s in strings) + sum(len(f) for f in frames)
+        encoded.append((state, strings, frames))
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w+b") as f:
+        f.truncate(size)
+        with mmap.mmap(f.fileno(), size) as buffer:
+            _HEADER.pack_into(buffer, 0, MAGIC, FORMAT_VERSION, len(encoded))
+            offset = _HEADER.size
+            for state, strings, frames in encoded:
+                for blob in strings:
+                    offset = _pack_blob(buffer, offset, blob)
+                _ROOM_FIELDS.pack_into(
+                    buffer, offset, state.version, int(state.dirty), state.ops_first_version, len(frames)
+                )
+                offset += _ROOM_FIELDS.size
+                for blob in frames:
+                    offset = _pack_blob(buffer, offset, blob)
+            buffer.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return size
+
+
+def read_snapshot(path: str) -> Dict[str, Room]:
+    """
+    Rebuild rooms from a snapshot file.
+
+    Rooms keep their epoch, so clients that were connected before the
+    restart can still resync from the restored op log. A missing, empty or
+    corrupt file yields no rooms.
+    """
+    try:
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size < _HEADER.size:
+                return {}
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                return _parse(memoryview(buffer))
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError, struct.error, UnicodeDecodeError) as e:
+        print(f"[Snapshots] Ignoring unreadable snapshot {path}: {e}")
+        return {}
+
+
+def _parse(view: memoryview) -> Dict[str, Room]:
+    try:
+        magic, format_version, count = _HEADER.unpack_from(view, 0)
+        if magic != MAGIC or format_version != FORMAT_VERSION:
+            raise ValueError("unknown snapshot format")
+        rooms = {}
+        offset = _HEADER.size
+        for _ in range(count):
+            room_id, offset = _unpack_str(view, offset)
+            epoch, offset = _unpack_str(view, offset)
+            language, offset = _unpack_str(view, offset)
+            text, offset = _unpack_str(view, offset)
+            version, dirty, first_version, frame_count = _ROOM_FIELDS.unpack_from(view, offset)
+            offset += _ROOM_FIELDS.size
+            room = Room(room_id, text=text, language=language, version=version)
+            room.epoch = epoch
+            room.dirty = bool(dirty)
+            room.ops = OpLog(version=first_version)
+            for index in range(frame_count):
+                frame, offset = _unpack_str(view, offset)
+                room.ops.append(first_version + index + 1, frame)
+            if room.ops.last_version != version:
+                # Inconsistent op log: keep the document, drop the history
+                room.ops = OpLog(version=version)
+            rooms[room_id] = room
+        return rooms
+    finally:
+        # The memoryview must be released before the mmap can be closed
+        view.release()
+
+
+def _pack_blob(buffer: mmap.mmap, offset: int, blob: bytes) -> int:
+    _LENGTH.pack_into(buffer, offset, len(blob))
+    offset += _LENGTH.size
+    buffer[offset:offset + len(blob)] = blob
+    return offset + len(blob)
+
+
+def _unpack_str(view: memoryview, offset: int):
+    (length,) = _LENGTH.unpack_from(view, offset)
+    offset += _LENGTH.size
+    end = offset + length
+    if end > len(view):
+        raise ValueError("truncated snapshot")
+    return str(view[offset:end], "utf-8"), end
@@ -0,0 +1,251 @@
+"""Read-only spectators: throttled, coalesced room updates instead of per-op fan-out."""
+
+import asyncio
+import os
+import secrets
+from datetime import UTC, datetime
+from typing import Awaitable, Callable, Dict, List, Optional
+from app.models import CodeChangeMessage, RoomUser, SnapshotMessage
+from app.rooms import Room, diff_texts
+from app.metrics import metrics
+
+# Interval between the updates streamed to the spectators of a room
+WS_SPECTATOR_INTERVAL = float(os.getenv("WS_SPECTATOR_INTERVAL_MS", "1000")) / 1000
+# Time a spectator gets to take an update before it is dropped (it reconnects to a fresh snapshot)
+WS_SPECTATOR_SEND_TIMEOUT = float(os.getenv("WS_SPECTATOR_SEND_TIMEOUT", "5"))
+# Updates buffered for an SSE spectator before it counts as too slow
+SSE_SPECTATOR_BUFFER = int(os.getenv("SSE_SPECTATOR_BUFFER", "16"))
+
+Send = Callable[[str], Awaitable[None]]
+Close = Callable[[], Awaitable[None]]
+
+
+class Spectator:
+    """A read-only watcher of a room, reached through ``send`` (a WebSocket or an SSE stream)."""
+
+    __slots__ = ("spectator_id", "send", "close", "cursors")
+
+    def __init__(self, spectator_id: str, send: Send, close: Close, cursors: bool = False):
+        self.spectator_id = spectator_id
+        self.send = send
+        # Ends the spectator's stream; the client reconnects and starts over from a snapshot
+        self.close = close
+        # Opted in to the editors' cursors
+        self.cursors = cursors
+
+
+class WatchedRoom:
+    """The document as last streamed to a room's spectators (they all share it)."""
+
+    def __init__(self, room: Room):
+        self.room_id = room.room_id
+        self.loop = asyncio.get_running_loop()
+        self.epoch = room.epoch
+        self.version = room.version
+        self.text = room.text
+        self.spectators: Dict[str, Spectator] = {}
+        # Spectators with cursors=True; cursors are only collected while there are some
+        self.cursor_watchers = 0
+        # Latest cursor frame of each editor since the previous update: user_id -> frame
+        self.cursors: Dict[str, str] = {}
+        self.task: Optional[asyncio.Task] = None
+
+
+class SpectatorHub:
+    """
+    Streams watched rooms to their spectators every ``interval`` seconds.
+
+    Spectators are not room connections, so editor broadcasts never reach
+    them. Instead one task per watched room compares the document with what
+    its spectators last got and sends a single diff covering every op in
+    between (nothing if it did not change), followed by the latest cursor
+    of each editor for spectators that opted in. A spectator that cannot
+    take an update within ``send_timeout`` is dropped.
+    """
+
+    def __init__(
+        self,
+        get_room: Callable[[str], Optional[Room]],
+        interval: float = WS_SPECTATOR_INTERVAL,
+        send_timeout: float = WS_SPECTATOR_SEND_TIMEOUT,
+    ):
+        self.get_room = get_room
+        self.interval = interval
+        self.send_timeout = send_timeout
+        self.rooms: Dict[str, WatchedRoom] = {}
+
+    def count(self, room_id: Optional[str] = None) -> int:
+        """Number of spectators of a room, or of every room."""
+        if room_id is not None:
+            watched = self.rooms.get(room_id)
+            return len(watched.spectators) if watched is not None else 0
+        return sum(len(watched.spectators) for watched in self.rooms.values())
+
+    async def add(
+        self,
+        room: Room,
+        send: Send,
+        close: Close,
+        users: List[RoomUser],
+        cursors: bool = False,
+    ) -> Spectator:
+        """
+        Send a snapshot to a new spectator and register it for the room's updates.
+
+        The snapshot holds the document as last streamed (not the live one),
+        so the spectator is in step with the others from its first update.
+        """
+        spectator = Spectator(secrets.token_urlsafe(8), send, close, cursors)
+        try:
+            await self._catch_up(room, spectator, users)
+        except BaseException:
+            self._forget_if_unwatched(room.room_id)
+            raise
+        metrics.set_gauge("ws_spectators", self.count())
+        return spectator
+
+    async def _catch_up(self, room: Room, spectator: Spectator, users: List[RoomUser]):
+        seen = None
+        while True:
+            watched = self._watched(room)
+            if seen is None:
+                snapshot = SnapshotMessage(
+                    type="snapshot",
+                    user_id=spectator.spectator_id,
+                    code=watched.text,
+                    epoch=watched.epoch,
+                    version=watched.version,
+                    language=room.language,
+                    users=users
+                )
+                seen = (watched.epoch, watched.version, watched.text)
+                await spectator.send(snapshot.model_dump_json())
+            elif seen != (watched.epoch, watched.version, watched.text):
+                # An update went out while we were sending: catch up before registering
+                frame = update_frame(seen[0], seen[2], watched)
+                seen = (watched.epoch, watched.version, watched.text)
+                await spectator.send(frame)
+            else:
+                break
+        # No await since the last check: the next update this spectator gets starts from ``seen``
+        watched.spectators[spectator.spectator_id] = spectator
+        if spectator.cursors:
+            watched.cursor_watchers += 1
+        if watched.task is None:
+            watched.task = watched.loop.create_task(self._stream(watched))
+
+    def remove(self, room_id: str, spectator: Spectator):
+        """Stop streaming to a spectator (its room's task exits at the next tick if it was the last)."""
+        watched = self.rooms.get(room_id)
+        if watched is None or watched.spectators.pop(spectator.spectator_id, None) is None:
+            return
+        if spectator.cursors:
+            watched.cursor_watchers -= 1
+        if not watched.cursor_watchers:
+            watched.cursors.clear()
+        metrics.set_gauge("ws_spectators", self.count())
+
+    def note_cursor(self, room_id: str, user_id: str, frame: str):
+        """Remember an editor's latest cursor frame for the next update."""
+        watched = self.rooms.get(room_id)
+        if watched is not None and watched.cursor_watchers:
+            watched.cursors[user_id] = frame
+
+    async def publish(self, room_id: str) -> int:
+        """Send the room's pending update to its spectators; returns how many got one."""
+        watched = self.rooms.get(room_id)
+        if watched is None:
+            return 0
+        frames = []
+        room = self.get_room(room_id)
+        if room is not None and (room.epoch, room.version) != (watched.epoch, watched.version):
+            epoch, text = watched.epoch, watched.text
+            watched.epoch, watched.version, watched.text = room.epoch, room.version, room.text
+            frames.append(update_frame(epoch, text, watched))
+        cursor_frames = list(watched.cursors.values())
+        watched.cursors.clear()
+        deliveries = []
+        for spectator in list(watched.spectators.values()):
+            batch = frames + cursor_frames if spectator.cursors else frames
+            if batch:
+                deliveries.append(self._deliver(watched, spectator, batch))
+        if deliveries:
+            await asyncio.gather(*deliveries)
+            metrics.incr("ws_spectator_updates_total", len(deliveries))
+        return len(deliveries)
+
+    async def close_all(self):
+        """End every spectator's stream (shutdown)."""
+        rooms, self.rooms = list(self.rooms.values()), {}
+        spectators = []
+        for watched in rooms:
+            if watched.task is not None:
+                watched.task.cancel()
+            spectators.extend(watched.spectators.values())
+            watched.spectators.clear()
+        metrics.set_gauge("ws_spectators", 0)
+        await asyncio.gather(*(self._close(spectator) for spectator in spectators))
+
+    def _watched(self, room: Room) -> WatchedRoom:
+        watched = self.rooms.get(room.room_id)
+        # State left behind by another event loop (e.g. a finished test client) is dead
+        if watched is None or watched.loop is not asyncio.get_running_loop():
+            watched = self.rooms[room.room_id] = WatchedRoom(room)
+        return watched
+
+    def _forget_if_unwatched(self, room_id: str):
+        watched = self.rooms.get(room_id)
+        if watched is not None and not watched.spectators and watched.task is None:
+            del self.rooms[room_id]
+
+    async def _stream(self, watched: WatchedRoom):
+        try:
+            while watched.spectators:
+                await asyncio.sleep(self.interval)
+                try:
+                    await self.publish(watched.room_id)
+                except Exception as e:
+                    print(f"[Spectators] Error streaming room {watched.room_id}: {e}")
+        finally:
+            # No await since the loop condition: add() cannot have registered anyone in between
+            watched.task = None
+            if self.rooms.get(watched.room_id) is watched:
+                self._forget_if_unwatched(watched.room_id)
+
+    async def _deliver(self, watched: WatchedRoom, spectator: Spectator, frames: List[str]):
+        try:
+            await asyncio.wait_for(self._send_all(spectator, frames), timeout=self.send_timeout)
+        except Exception:
+            # Too slow or gone: a dropped spectator has missed an update, so it must start over
+            self.remove(watched.room_id, spectator)
+            metrics.incr("ws_spectators_dropped_total")
+            await self._close(spectator)
+
+    async def _send_all(self, spectator: Spectator, frames: List[str]):
+        for frame in frames:
+            await spectator.send(frame)
+
+    async def _close(self, spectator: Spectator):
+        try:
+            await asyncio.wait_for(spectator.close(), timeout=self.send_timeout)
+        except Exception:
+            pass
+
+
+def update_frame(epoch: str, text: str, watched: WatchedRoom) -> str:
+    """code_change taking a spectator from (epoch, text) to the watched room's document."""
+    if epoch != watched.epoch:
+        # Another document altogether (the room was reloaded): send it whole
+        message = CodeChangeMessage(type="code_change", code=watched.text, cursor_position=0)
+    else:
+        from_pos, to_pos, insert = diff_texts(text, watched.text)
+        message = CodeChangeMessage(
+            type="code_change",
+            from_pos=from_pos,
+            to_pos=to_pos,
+            insert=insert,
+            delete_length=(to_pos - from_pos) or None
+        )
+    message.version = watched.version
+    message.timestamp = datetime.now(UTC)
+    return message.model_dump_json()
@@ -0,0 +1,98 @@
+"""Syntax checking of room documents in a process pool, off the event loop."""
+
+import ast
+import asyncio
+import multiprocessing
+import os
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+# Quiet period after the last edit before a room's document is parsed
+SYNTAX_CHECK_DEBOUNCE = float(os.getenv("SYNTAX_CHECK_DEBOUNCE_MS", "300")) / 1000
+# Processes parsing documents; parsing holds the GIL, so threads would still compete with the event loop
+SYNTAX_CHECK_WORKERS = int(os.getenv("SYNTAX_CHECK_WORKERS", "1"))
+
+# A diagnostic is a plain dict (line, column, end_line, end_column, message, severity)
+# so it crosses the process boundary without importing the API models in the workers
+Diagnostic = Dict[str, object]
+Parser = Callable[[str], List[Diagnostic]]
+
+# language -> parser; parsers run in the worker processes and must be registered at import time
+PARSERS: Dict[str, Parser] = {}
+
+
+def register_parser(language: str):
+    """Decorator registering the syntax checker of ``language``."""
+    def decorator(parser: Parser) -> Parser:
+        PARSERS[language] = parser
+        return parser
+    return decorator
+
+
+@register_parser("python")
+def parse_python(text: str) -> List[Diagnostic]:
+    try:
+        with warnings.catch_warnings():
+            # Invalid escape sequences and similar warnings are not syntax errors
+            warnings.simplefilter("ignore")
+            ast.parse(text)
+    except SyntaxError as e:
+        line = e.lineno or 1
+        column = max((e.offset or 1) - 1, 0)
+        return [{
+            "line": line,
+            "column": column,
+            "end_line": e.end_lineno or line,
+            "end_column": max((e.end_offset or 0) - 1, column),
+            "message": e.msg,
+            "severity": "error",
+        }]
+    except (ValueError, RecursionError, MemoryError) as e:
+        # Null bytes, or nesting too deep for the parser
+        return [{"line": 1, "column": 0, "end_line": 1, "end_column": 0, "message": str(e), "severity": "error"}]
+    return []
+
+
+def check_syntax(language: str, text: str) -> List[Diagnostic]:
+    """Run the parser of ``language`` (in a worker process)."""
+    return PARSERS[language](text)
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn: the server process has threads, which forking would copy in an undefined state
+        _pool = ProcessPoolExecutor(
+            max_workers=SYNTAX_CHECK_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _pool
+
+
+async def run_syntax_check(language: str, text: str) -> List[Diagnostic]:
+    """
+    Parse ``text`` in the process pool.
+
+    Cancelling the awaiting task cancels the job if it has not started yet;
+    a job already running finishes in its worker and its result is dropped.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_pool(), check_syntax, language, text)
+
+
+def shutdown():
+    """
+    Stop the worker processes, dropping queued jobs.
+
+    Blocks until the workers have exited (a running parse is let finish):
+    not waiting leaks the pool's multiprocessing semaphores. Call it from
+    a thread when an event loop is running.
+    """
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=True, cancel_futures=True)
+        _pool = None
@@ -1,11 +1,19 @@
 """Background tasks for the application."""
 
 import asyncio
+import os
 from datetime import UTC, datetime, timedelta
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 from app.database import SessionLocal
-from app.models import Session as SessionModel
-from app.websocket import active_connections, room_last_activity
+from app.models import Session as SessionModel, HiddenTestCase
+from app.snapshots import capture, write_snapshot
+from app.websocket import manager
+
+# Seconds between batched writes of Session.active_users
+ACTIVE_USERS_FLUSH_INTERVAL = float(os.getenv("ACTIVE_USERS_FLUSH_INTERVAL", "5"))
+# Seconds between checks of the room memory budget (ROOM_MEMORY_BUDGET_BYTES)
+ROOM_SPILL_INTERVAL = float(os.getenv("ROOM_SPILL_INTERVAL", "10"))
 
 
 def cleanup_expired_sessions():
@@ -18,6 +26,10 @@ def cleanup_expired_sessions():
     db: Session = SessionLocal()
     try:
         now = datetime.now(UTC)
+        expired_ids = select(SessionModel.session_id).where(SessionModel.expires_at < now)
+        db.query(HiddenTestCase).filter(
+            HiddenTestCase.session_id.in_(expired_ids)
+        ).delete(synchronize_session=False)
         expired_count = db.query(SessionModel).filter(
             SessionModel.expires_at < now
         ).delete()
@@ -46,9 +58,9 @@ def cleanup_inactive_rooms():
         
         # Find rooms that are empty and inactive
         inactive_room_ids = []
-        for room_id, last_activity in list(room_last_activity.items()):
+        for room_id, last_activity in list(manager.room_last_activity.items()):
             # Check if room has no active connections
-            if room_id not in active_connections or not active_connections[room_id]:
+            if room_id not in manager.active_connections or not manager.active_connections[room_id]:
                 # Check if room has been inactive for more than 5 minutes
                 if last_activity < inactive_threshold:
                     inactive_room_ids.append(room_id)
@@ -63,12 +75,18 @@ def cleanup_inactive_rooms():
                     SessionModel.session_id == session_id
                 ).first()
                 if session:
+                    # Hidden test cases have no foreign key cascade: remove them with their session
+                    db.query(HiddenTestCase).filter(
+                        HiddenTestCase.session_id == session_id
+                    ).delete(synchronize_session=False)
                     db.delete(session)
                     deleted_count += 1
             
-            # Clean up room tracking
-            if room_id in room_last_activity:
-                del room_last_activity[room_id]
+            # Clean up room tracking and in-memory document state
+            manager.room_last_activity.pop(room_id, None)
+            manager.rooms.pop(room_id, None)
+            manager.spilled.pop(room_id, None)
+            manager.diagnostics.pop(room_id, None)
         
         db.commit()
         if deleted_count > 0:
@@ -101,3 +119,70 @@ async def periodic_cleanup(interval_hours: int = 1):
         # Wait for next cleanup cycle
         await asyncio.sleep(interval_hours * 3600)
 
+
+async def checkpoint_rooms(path: str) -> int:
+    """
+    Write the in-memory state of every room to the snapshot file.
+    
+    The state is captured on the event loop; encoding and disk I/O run in a thread.
+    
+    Returns:
+        Number of rooms written
+    """
+    states = capture(manager.rooms)
+    await asyncio.to_thread(write_snapshot, path, states)
+    return len(states)
+
+
+async def periodic_room_snapshots(path: str, interval_seconds: float = 5):
+    """
+    Checkpoint room state to ``path`` every ``interval_seconds``.
+    
+    Args:
+        path: Snapshot file
+        interval_seconds: Seconds between checkpoints
+    """
+    while True:
+        await asyncio.sleep(interval_seconds)
+        try:
+            await checkpoint_rooms(path)
+        except Exception as e:
+            print(f"[Snapshots] Error writing snapshot: {e}")
+
+
+async def periodic_occupancy_flush(interval_seconds: float = 5):
+    """
+    Write changed per-session occupancy (active_users) every ``interval_seconds``.
+    
+    Joins and leaves only touch the in-memory registry; the database sees
+    one batched UPDATE per interval instead of a write per connection.
+    
+    Args:
+        interval_seconds: Seconds between flushes
+    """
+    while True:
+        await asyncio.sleep(interval_seconds)
+        try:
+            await manager.flush_occupancy()
+        except Exception as e:
+            print(f"[Occupancy] Error flushing active users: {e}")
+
+
+async def periodic_room_spill(interval_seconds: float = ROOM_SPILL_INTERVAL):
+    """
+    Keep room documents within ROOM_MEMORY_BUDGET_BYTES, checking every ``interval_seconds``.
+    
+    The least recently used rooms over the budget are written to the
+    database and dropped from memory until their next join or edit.
+    
+    Args:
+        interval_seconds: Seconds between checks
+    """
+    while True:
+        await asyncio.sleep(interval_seconds)
+        try:
+            spilled = await manager.spill_idle_rooms()
+            if spilled:
+                print(f"[Rooms] Spilled {spilled} idle room(s) to the database")
+        except Exception as e:
+            print(f"[Rooms] Error spilling idle rooms: {e}")
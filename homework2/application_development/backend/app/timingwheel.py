@@ -0,0 +1,87 @@
+"""Hierarchical timing wheel for tracking many connection deadlines."""
+
+import math
+from typing import Dict, Hashable, List, Set, Tuple
+
+
+class TimingWheel:
+    """
+    Hierarchical timing wheel (Varghese & Lauck).
+
+    Level 0 has ``slots`` buckets of one ``tick`` each; every level above
+    covers ``slots`` times the span of the level below. Scheduling and
+    cancelling are O(1); advancing one tick touches a single bucket, plus a
+    cascade of one higher-level bucket every ``slots`` ticks. Deadlines
+    beyond the top level's span are parked there and re-placed on cascade.
+    """
+
+    def __init__(self, tick: float, slots: int = 64, levels: int = 3, start: float = 0.0):
+        if tick <= 0 or slots < 2 or levels < 1:
+            raise ValueError("tick must be positive, slots >= 2 and levels >= 1")
+        self.tick = tick
+        self.slots = slots
+        self.levels = levels
+        self.current = math.floor(start / tick)
+        self._wheels: List[List[Set[Hashable]]] = [[set() for _ in range(slots)] for _ in range(levels)]
+        # key -> (level, slot, expiry tick)
+        self._entries: Dict[Hashable, Tuple[int, int, int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+
+    def schedule(self, key: Hashable, deadline: float):
+        """Schedule (or reschedule) ``key`` to expire at ``deadline`` (same clock as ``advance``)."""
+        self.cancel(key)
+        expires = max(math.ceil(deadline / self.tick), self.current + 1)
+        self._place(key, expires)
+
+    def cancel(self, key: Hashable):
+        """Forget ``key``; unknown keys are ignored."""
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            level, slot, _ = entry
+            self._wheels[level][slot].discard(key)
+
+    def advance(self, now: float) -> List[Hashable]:
+        """Move the wheel up to ``now`` and return the keys whose deadline has passed."""
+        target = math.floor(now / self.tick)
+        expired: List[Hashable] = []
+        while self.current < target:
+            self.current += 1
+            # Cascade from the highest level whose bucket boundary was crossed
+            for level in range(self.levels - 1, 0, -1):
+                width = self.slots ** level
+                if self.current % width == 0:
+                    self._cascade(level, (self.current // width) % self.slots, expired)
+            self._cascade(0, self.current % self.slots, expired)
+        return expired
+
+    def _cascade(self, level: int, slot: int, expired: List[Hashable]):
+        bucket = self._wheels[level][slot]
+        if not bucket:
+            return
+        self._wheels[level][slot] = set()
+        for key in bucket:
+            _, _, expires = self._entries.pop(key)
+            if expires <= self.current:
+                expired.append(key)
+            else:
+                self._place(key, expires)
+
+    def _place(self, key: Hashable, expires: int):
+        delta = expires - self.current
+        for level in range(self.levels):
+            width = self.slots ** level
+            if delta < width * self.slots:
+                slot = (expires // width) % self.slots
+                break
+        else:
+            # Beyond the wheel's horizon: park in the farthest top-level bucket
+            level = self.levels - 1
+            width = self.slots ** level
+            slot = ((self.current + width * self.slots - 1) // width) % self.slots
+        self._wheels[level][slot].add(key)
+        self._entries[key] = (level, slot, expires)
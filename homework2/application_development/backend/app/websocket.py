@@ -1,28 +1,132 @@
 """WebSocket handlers for real-time collaboration."""
 
-import json
+import asyncio
+import math
+import os
+import random
 import secrets
-from typing import Dict, Set
+import sys
+import time
+from typing import Dict, List, Optional, Set, Tuple
 from fastapi import WebSocket, WebSocketDisconnect, HTTPException, status
+from pydantic import BaseModel, ValidationError
+from starlette.websockets import WebSocketState
 from app.models import (
     CodeChangeMessage,
     CursorChangeMessage,
     JoinMessage,
     LeaveMessage,
-    UserJoinedMessage,
-    UserLeftMessage,
-    ErrorMessage
+    PresenceMessage,
+    HeartbeatMessage,
+    ReconnectMessage,
+    ErrorMessage,
+    BackpressureMessage,
+    RoomUser,
+    SnapshotMessage,
+    ResyncMessage,
+    AckMessage,
+    DiagnosticsMessage,
+    inbound_message_adapter
 )
-from datetime import datetime
+from app.rooms import (
+    ROOM_MEMORY_BUDGET,
+    Room,
+    RoomGoneError,
+    SpilledRoom,
+    is_keystroke,
+    load_room,
+    merge_code_changes,
+    rehydrate_room,
+    save_active_users,
+    save_room_texts,
+    save_room_texts_by_id,
+)
+from app.actors import RoomActor
+from app.spectators import SSE_SPECTATOR_BUFFER, Spectator, SpectatorHub
+from app.timingwheel import TimingWheel
+from app.syntax import PARSERS, SYNTAX_CHECK_DEBOUNCE, run_syntax_check
+from app.metrics import metrics
+from app.ratelimit import (
+    TokenBucket,
+    WS_CODE_RATE,
+    WS_CODE_BURST,
+    WS_CURSOR_RATE,
+    WS_CURSOR_BURST,
+    WS_ROOM_CODE_RATE,
+    WS_ROOM_CODE_BURST,
+    WS_ROOM_CURSOR_RATE,
+    WS_ROOM_CURSOR_BURST,
+)
+from datetime import UTC, datetime
+
+# Size limits (bytes, UTF-8) checked before a frame is parsed
+# Uvicorn also enforces WS_MAX_FRAME_BYTES at the protocol level (ws_max_size in main.py)
+WS_MAX_FRAME_BYTES = int(os.getenv("WS_MAX_FRAME_BYTES", str(1024 * 1024)))
+WS_MAX_DOCUMENT_BYTES = int(os.getenv("WS_MAX_DOCUMENT_BYTES", str(512 * 1024)))
+
+# Joins/leaves within this window are sent to peers as a single presence delta
+WS_PRESENCE_FLUSH_INTERVAL = float(os.getenv("WS_PRESENCE_FLUSH_MS", "100")) / 1000
+
+# Keystrokes of one user at adjacent positions within this window are applied and
+# broadcast as a single op (0 disables coalescing). Trade-off: peers see the first
+# keystroke of a run up to this much later, in exchange for fewer frames, op log
+# entries and versions; short windows still merge key repeat and fast bursts
+WS_COALESCE_WINDOW = float(os.getenv("WS_COALESCE_MS", "40")) / 1000
+
+# Heartbeats: idle connections get a ping after WS_HEARTBEAT_INTERVAL seconds and are
+# reaped after WS_IDLE_TIMEOUT seconds without receiving any frame
+WS_HEARTBEAT_INTERVAL = float(os.getenv("WS_HEARTBEAT_INTERVAL", "15"))
+WS_IDLE_TIMEOUT = float(os.getenv("WS_IDLE_TIMEOUT", "45"))
+WS_HEARTBEAT_TICK = float(os.getenv("WS_HEARTBEAT_TICK", "1"))
+
+# RFC 6455 close code 1001: endpoint going away (used for idle connections)
+WS_CLOSE_GOING_AWAY = 1001
+
+# Drain on shutdown: clients are told to reconnect after a random delay in
+# [WS_RECONNECT_MIN_MS, WS_RECONNECT_MAX_MS] so they do not all hit the next process at once
+WS_RECONNECT_MIN_MS = int(os.getenv("WS_RECONNECT_MIN_MS", "500"))
+WS_RECONNECT_MAX_MS = int(os.getenv("WS_RECONNECT_MAX_MS", "5000"))
+WS_DRAIN_TIMEOUT = float(os.getenv("WS_DRAIN_TIMEOUT", "10"))
 
-# Store active connections: room_id -> Set[WebSocket]
-active_connections: Dict[str, Set[WebSocket]] = {}
+# RFC 6455 close code 1012: service restart
+WS_CLOSE_SERVICE_RESTART = 1012
 
-# Store user info: websocket -> {user_id, username, room_id}
-user_info: Dict[WebSocket, dict] = {}
+# RFC 6455 close code 1009: message too big to process
+WS_CLOSE_MESSAGE_TOO_BIG = 1009
 
-# Store last activity time for each room: room_id -> datetime
-room_last_activity: Dict[str, datetime] = {}
+# Application close code (4000-4999 range): the room's session no longer exists, do not reconnect
+WS_CLOSE_ROOM_GONE = 4404
+
+
+class Connection:
+    """
+    Registry record of a socket joined to a room.
+    
+    One exists per open connection, so it is slotted (no per-instance
+    dict) and its room_id and username are interned: the thousands of
+    records of a room, or of "Anonymous" users, share one string.
+    """
+    
+    __slots__ = ("user_id", "username", "room_id", "last_seen")
+    
+    def __init__(self, user_id: str, username: str, room_id: str, last_seen: float = 0.0):
+        self.user_id = user_id
+        self.username = sys.intern(username)
+        self.room_id = sys.intern(room_id)
+        # Monotonic time of the last frame received (see touch() and reap_idle())
+        self.last_seen = last_seen
+
+
+class PendingChange:
+    """A user's keystrokes being merged into one op, not yet applied to the room."""
+    
+    def __init__(self, message: CodeChangeMessage, user_id: str, exclude: Optional[WebSocket], timer: asyncio.Task):
+        self.message = message
+        self.user_id = user_id
+        self.exclude = exclude
+        self.timer = timer
+        # Latest cursor of the user, sent right after the op so it never points past it
+        self.cursor: Optional[CursorChangeMessage] = None
 
 
 class ConnectionManager:
@@ -30,116 +134,759 @@ class ConnectionManager:
     
     def __init__(self):
         self.active_connections: Dict[str, Set[WebSocket]] = {}
-        self.user_info: Dict[WebSocket, dict] = {}
+        # Every joined socket: websocket -> Connection
+        self.connections: Dict[WebSocket, Connection] = {}
+        # Last join, leave or edit of each room, for cleanup_inactive_rooms: room_id -> datetime
+        self.room_last_activity: Dict[str, datetime] = {}
+        # Token buckets: websocket -> {message_type: bucket} and room_id -> {message_type: bucket}
+        self.connection_buckets: Dict[WebSocket, Dict[str, TokenBucket]] = {}
+        self.room_buckets: Dict[str, Dict[str, TokenBucket]] = {}
+        # Document state per room: room_id -> Room
+        self.rooms: Dict[str, Room] = {}
+        # Rooms whose document was spilled to the database to stay within ROOM_MEMORY_BUDGET
+        self.spilled: Dict[str, SpilledRoom] = {}
+        # Presence changes waiting for the next delta: room_id -> {user_id: RoomUser, or None if left}
+        self.presence_pending: Dict[str, Dict[str, Optional[RoomUser]]] = {}
+        self.presence_flushes: Dict[str, asyncio.Task] = {}
+        # Liveness: the wheel holding the next time each connection must be checked
+        # (the time of its last received frame is Connection.last_seen)
+        self.deadlines = TimingWheel(WS_HEARTBEAT_TICK, start=time.monotonic())
+        # Set once shutdown starts: new connections are turned away
+        self.draining = False
+        self._drain_task: Optional[asyncio.Task] = None
+        # Rooms whose number of connections changed since the last occupancy flush
+        self.occupancy_changed: Set[str] = set()
+        # Debounced syntax checks: room_id -> task waiting for edits to settle, then parsing
+        self.syntax_checks: Dict[str, asyncio.Task] = {}
+        # Last diagnostics broadcast to each room
+        self.diagnostics: Dict[str, DiagnosticsMessage] = {}
+        # Task applying the events of each room with connections, in order: room_id -> actor
+        self.actors: Dict[str, RoomActor] = {}
+        # Keystrokes waiting to be merged and broadcast: room_id -> pending change (one user at a time)
+        self.pending_changes: Dict[str, PendingChange] = {}
+        # Read-only watchers, streamed throttled updates instead of every op
+        self.spectators = SpectatorHub(lambda room_id: self.rooms.get(room_id))
+        # Spectator WebSockets, on the same deadline wheel as editors: websocket -> (Connection, Spectator)
+        self.watchers: Dict[WebSocket, Tuple[Connection, Spectator]] = {}
     
-    async def connect(self, websocket: WebSocket, room_id: str, username: str = "Anonymous"):
-        """Connect a user to a room."""
-        await websocket.accept()
+    def actor(self, room_id: str) -> RoomActor:
+        """Return the room's actor, starting one if the room has none."""
+        actor = self._running_actor(room_id)
+        if actor is None:
+            actor = self.actors[room_id] = RoomActor(
+                room_id,
+                keep_alive=lambda: bool(self.active_connections.get(room_id)),
+                on_exit=self._actor_exited
+            )
+            metrics.set_gauge("ws_room_actors", len(self.actors))
+        return actor
+    
+    def _running_actor(self, room_id: str) -> Optional[RoomActor]:
+        actor = self.actors.get(room_id)
+        # An actor left behind by another event loop (e.g. a finished test client) is dead
+        if actor is None or actor.loop is not asyncio.get_running_loop():
+            return None
+        return actor
+    
+    def _actor_exited(self, actor: RoomActor):
+        if self.actors.get(actor.room_id) is actor:
+            del self.actors[actor.room_id]
+            metrics.set_gauge("ws_room_actors", len(self.actors))
+    
+    async def in_room(self, room_id: str, handler, *args, **kwargs):
+        """
+        Run ``handler`` in order with the room's other events and return its result.
+        
+        It runs right away when already on the room's actor, or when the room
+        has no actor (no connections, so nothing to interleave with).
+        """
+        actor = self._running_actor(room_id)
+        if actor is None or actor.is_current():
+            return await handler(*args, **kwargs)
+        return await actor.call(handler, *args, **kwargs)
+    
+    async def dispatch(self, room_id: str, handler, *args, **kwargs):
+        """Like in_room(), but hand ``handler`` to the room's actor without waiting for it."""
+        actor = self._running_actor(room_id)
+        if actor is None or actor.is_current():
+            await handler(*args, **kwargs)
+        else:
+            actor.post(handler, *args, **kwargs)
+    
+    async def connect(
+        self,
+        websocket: WebSocket,
+        room_id: str,
+        username: str = "Anonymous",
+        epoch: Optional[str] = None,
+        last_version: Optional[int] = None,
+        previous_user_id: Optional[str] = None
+    ):
+        """
+        Connect a user to a room and bring it up to date with the document.
         
+        A reconnecting client that reports the ``epoch``/``last_version`` it
+        had seen and the user ID it had (``previous_user_id``) keeps that ID
+        and gets a ``resync`` frame followed by only the ops it missed, if
+        they are still in the room's op log; anyone else gets a full
+        ``snapshot``. The replay may include the client's own ops that were
+        applied but not acked before it dropped: keeping its ID is what lets
+        it recognize and skip them. Either way every code_change the client
+        receives afterwards carries the next version, in order.
+        """
+        # websocket_endpoint ya aceptó la conexión; aceptar dos veces es un error ASGI
+        if websocket.application_state != WebSocketState.CONNECTED:
+            await websocket.accept()
+        
+        room_id = sys.intern(room_id)
+        room = await self.get_room(room_id)
+        
+        if previous_user_id is not None and not self._user_connected(room_id, previous_user_id):
+            user_id = previous_user_id
+            missing = room.ops_since(epoch, last_version)
+        else:
+            # Under a new ID the client could not tell its own ops apart in a replay
+            user_id = secrets.token_urlsafe(8)
+            missing = None
+        user = RoomUser(user_id=user_id, username=username)
+        users = self.room_users(room_id) + [user]
+        
+        if missing is None:
+            sent_version = await self._send_snapshot(websocket, room, user_id, users)
+        else:
+            resync = ResyncMessage(
+                type="resync",
+                user_id=user_id,
+                epoch=room.epoch,
+                from_version=last_version,
+                version=room.version,
+                users=users
+            )
+            sent_version = room.version
+            await websocket.send_text(resync.model_dump_json())
+            for frame in missing:
+                await websocket.send_text(frame)
+            metrics.incr("ws_resync_total")
+        
+        # Current syntax errors, if any (peers only hear about diagnostics when they change)
+        known = self.diagnostics.get(room_id)
+        if known is not None and known.diagnostics:
+            await websocket.send_text(known.model_dump_json())
+        
+        # Ops applied while we were sending are not broadcast to this socket yet:
+        # replay them until nothing is pending, then register without yielding
+        while room.version > sent_version:
+            pending = room.ops.since(sent_version)
+            if pending is None:
+                sent_version = await self._send_snapshot(websocket, room, user_id, users)
+                continue
+            sent_version = room.version
+            for frame in pending:
+                await websocket.send_text(frame)
+        
+        self.rooms.setdefault(room_id, room)
         if room_id not in self.active_connections:
             self.active_connections[room_id] = set()
-        
-        user_id = secrets.token_urlsafe(8)
         self.active_connections[room_id].add(websocket)
-        self.user_info[websocket] = {
-            "user_id": user_id,
-            "username": username,
-            "room_id": room_id
-        }
+        now = time.monotonic()
+        self.connections[websocket] = Connection(user_id, username, room_id, last_seen=now)
+        self.occupancy_changed.add(room_id)
+        self.deadlines.schedule(websocket, now + WS_HEARTBEAT_INTERVAL)
         
         # Update last activity time for the room
-        room_last_activity[room_id] = datetime.now()
+        self.room_last_activity[room_id] = datetime.now()
         
-        # Notify other users in the room
-        await self.broadcast_user_joined(room_id, user_id, username, websocket)
+        # Notify other users in the room with the next presence delta
+        self.queue_user_joined(room_id, user_id, username)
+        
+        if room_id not in self.diagnostics:
+            self.schedule_syntax_check(room_id)
         
         return user_id
     
+    async def get_room(self, room_id: str) -> Room:
+        """Return the room's document state, loading (or rehydrating) it from the database on first use."""
+        room = self.rooms.get(room_id)
+        if room is None:
+            spilled = self.spilled.get(room_id)
+            if spilled is not None:
+                try:
+                    loaded = await asyncio.to_thread(rehydrate_room, spilled)
+                except RoomGoneError:
+                    # Its session was deleted while spilled: end the room rather than start it over empty
+                    self.spilled.pop(room_id, None)
+                    await self._close_gone_room(room_id)
+                    raise
+                metrics.incr("rooms_rehydrated_total")
+            else:
+                loaded = await asyncio.to_thread(load_room, room_id)
+            # Another join may have loaded the room while we were waiting
+            room = self.rooms.setdefault(room_id, loaded)
+            self.spilled.pop(room_id, None)
+        room.last_used = time.monotonic()
+        return room
+    
+    async def _close_gone_room(self, room_id: str):
+        """Disconnect every client of a room whose session no longer exists."""
+        metrics.incr("rooms_gone_total")
+        for websocket in list(self.active_connections.get(room_id, ())):
+            self.disconnect(websocket)
+            await close_room_gone(websocket)
+    
+    async def _live_room(self, room_id: str) -> Optional[Room]:
+        """The room's document if it is loaded, rehydrating it if it was spilled; None for other rooms."""
+        if room_id in self.spilled:
+            return await self.get_room(room_id)
+        return self.rooms.get(room_id)
+    
+    def room_memory(self) -> Dict[str, int]:
+        """Approximate bytes held in memory by each room (spilled rooms hold none)."""
+        return {room_id: room.memory_bytes() for room_id, room in self.rooms.items()}
+    
+    async def spill_idle_rooms(self, budget: int = ROOM_MEMORY_BUDGET) -> int:
+        """
+        Spill the least recently used rooms until the rest fit in ``budget`` bytes.
+        
+        The text of every room spilled is written to its session in one
+        batch and only a SpilledRoom is kept; the room is rehydrated from the
+        database on its next join or edit. Rooms with keystrokes pending or
+        spectators watching stay in memory, and so do rooms without a session
+        to write to. Returns the number of rooms spilled.
+        """
+        sizes = self.room_memory()
+        total = sum(sizes.values())
+        self._report_memory(total)
+        if total <= budget:
+            return 0
+        victims: Dict[str, Room] = {}
+        for room in sorted(self.rooms.values(), key=lambda room: room.last_used):
+            if total <= budget:
+                break
+            if room.room_id in self.pending_changes or self.spectators.count(room.room_id):
+                continue
+            victims[room.room_id] = room
+            total -= sizes[room.room_id]
+        texts = {room_id: room.text for room_id, room in victims.items()}
+        saved = await asyncio.to_thread(save_room_texts_by_id, texts)
+        if saved is None:
+            return 0
+        spilled = 0
+        for room_id in saved:
+            if await self.in_room(room_id, self._spill, victims[room_id], texts[room_id]):
+                spilled += 1
+        self._report_memory(sum(self.room_memory().values()))
+        return spilled
+    
+    async def _spill(self, room: Room, text: str) -> bool:
+        if self.rooms.get(room.room_id) is not room or room.text is not text:
+            # Edited since its text was written: in use again, keep it
+            return False
+        del self.rooms[room.room_id]
+        self.spilled[room.room_id] = SpilledRoom(room)
+        metrics.incr("rooms_spilled_total")
+        return True
+    
+    def _report_memory(self, total: int):
+        metrics.set_gauge("rooms_memory_bytes", total)
+        metrics.set_gauge("rooms_in_memory", len(self.rooms))
+        metrics.set_gauge("rooms_spilled", len(self.spilled))
+    
+    async def spectate(self, room_id: str, send, close, cursors: bool = False) -> Spectator:
+        """
+        Add a read-only spectator to a room (see SpectatorHub).
+        
+        Spectators are not connections of the room: they do not count as
+        occupancy or appear in the roster, and get the room's updates at the
+        spectator rate rather than with every op.
+        """
+        room = await self.get_room(room_id)
+        return await self.spectators.add(room, send, close, self.room_users(room_id), cursors=cursors)
+    
+    def watch(self, websocket: WebSocket, room_id: str, spectator: Spectator):
+        """Put a spectator's WebSocket on the heartbeat wheel, so it is pinged and reaped like an editor's."""
+        now = time.monotonic()
+        self.watchers[websocket] = (Connection(spectator.spectator_id, "", room_id, last_seen=now), spectator)
+        self.deadlines.schedule(websocket, now + WS_HEARTBEAT_INTERVAL)
+    
+    def unwatch(self, websocket: WebSocket):
+        """Stop streaming to a spectator's WebSocket and take it off the wheel."""
+        watcher = self.watchers.pop(websocket, None)
+        if watcher is not None:
+            connection, spectator = watcher
+            self.spectators.remove(connection.room_id, spectator)
+        self.deadlines.cancel(websocket)
+    
+    async def _send_snapshot(self, websocket: WebSocket, room: Room, user_id: str, users: List[RoomUser]) -> int:
+        """Send the full room state and return the version it contained."""
+        snapshot = SnapshotMessage(
+            type="snapshot",
+            user_id=user_id,
+            code=room.text,
+            epoch=room.epoch,
+            version=room.version,
+            language=room.language,
+            users=users
+        )
+        await websocket.send_text(snapshot.model_dump_json())
+        return snapshot.version
+    
+    def _user_connected(self, room_id: str, user_id: str) -> bool:
+        for websocket in self.active_connections.get(room_id, ()):
+            connection = self.connections.get(websocket)
+            if connection is not None and connection.user_id == user_id:
+                return True
+        return False
+    
+    def room_users(self, room_id: str) -> List[RoomUser]:
+        """Return the roster of users connected to a room."""
+        users = []
+        for websocket in self.active_connections.get(room_id, ()):
+            connection = self.connections.get(websocket)
+            if connection is not None:
+                users.append(RoomUser(user_id=connection.user_id, username=connection.username))
+        return users
+    
     def disconnect(self, websocket: WebSocket):
         """Disconnect a user from a room."""
-        if websocket not in self.user_info:
+        connection = self.connections.pop(websocket, None)
+        if connection is None:
             return None
-        
-        user_data = self.user_info[websocket]
-        room_id = user_data["room_id"]
-        user_id = user_data["user_id"]
-        username = user_data["username"]
+        room_id = connection.room_id
         
         # Remove from connections
         if room_id in self.active_connections:
             self.active_connections[room_id].discard(websocket)
+            self.occupancy_changed.add(room_id)
             if not self.active_connections[room_id]:
                 # Room is empty, update last activity time
-                room_last_activity[room_id] = datetime.now()
+                self.room_last_activity[room_id] = datetime.now()
                 del self.active_connections[room_id]
+                self.room_buckets.pop(room_id, None)
+                actor = self.actors.get(room_id)
+                if actor is not None:
+                    # Let the actor exit once its mailbox is empty
+                    actor.wake()
             else:
                 # Room still has users, update last activity time
-                room_last_activity[room_id] = datetime.now()
+                self.room_last_activity[room_id] = datetime.now()
         
-        del self.user_info[websocket]
+        self.connection_buckets.pop(websocket, None)
+        self.deadlines.cancel(websocket)
         
         # Notify other users
-        return room_id, user_id, username
+        return room_id, connection.user_id, connection.username
+    
+    async def leave(self, websocket: WebSocket):
+        """Disconnect a user and announce it in the room's next presence delta."""
+        connection = self.connections.get(websocket)
+        room_id = connection.room_id if connection is not None else None
+        pending = self.pending_changes.get(room_id)
+        if pending is not None and pending.exclude is websocket:
+            # Peers still get the user's last keystrokes
+            await self.flush_pending_change(room_id)
+        disconnect_data = self.disconnect(websocket)
+        if disconnect_data:
+            self.queue_user_left(disconnect_data[0], disconnect_data[1])
+        return disconnect_data
+    
+    def restore_rooms(self, rooms: Dict[str, Room]):
+        """Install rooms restored from a snapshot; must run before connections are accepted."""
+        now = datetime.now()
+        for room_id, room in rooms.items():
+            self.rooms.setdefault(room_id, room)
+            # Let cleanup_inactive_rooms expire rooms nobody comes back to
+            self.room_last_activity.setdefault(room_id, now)
+    
+    def occupancy(self, room_id: str) -> int:
+        """Number of users currently connected to a room in this process."""
+        return len(self.active_connections.get(room_id, ()))
+    
+    async def flush_occupancy(self) -> int:
+        """Write the occupancy of every room that changed since the last flush in one batch."""
+        if not self.occupancy_changed:
+            return 0
+        changed, self.occupancy_changed = self.occupancy_changed, set()
+        counts = {room_id: self.occupancy(room_id) for room_id in changed}
+        saved = await asyncio.to_thread(save_active_users, counts)
+        if saved < 0:
+            # Retry on the next flush (counts are re-read then)
+            self.occupancy_changed |= changed
+        return saved
+    
+    async def save_dirty_rooms(self) -> int:
+        """Write every room with unsaved edits to the database in one batch."""
+        dirty = [room for room in self.rooms.values() if room.dirty]
+        if not dirty:
+            return 0
+        texts = {room.room_id: room.text for room in dirty}
+        # Clear first: edits applied while the batch is being written mark the room dirty again
+        for room in dirty:
+            room.dirty = False
+        saved = await asyncio.to_thread(save_room_texts, texts)
+        if saved < 0:
+            for room in dirty:
+                room.dirty = True
+        return saved
+    
+    async def send_reconnect(self, websocket: WebSocket):
+        """Tell a client to reconnect after a jittered delay and close its socket."""
+        message = ReconnectMessage(
+            type="reconnect",
+            retry_after_ms=random.randint(WS_RECONNECT_MIN_MS, WS_RECONNECT_MAX_MS)
+        )
+        try:
+            await websocket.send_text(message.model_dump_json())
+            await websocket.close(code=WS_CLOSE_SERVICE_RESTART)
+        except Exception:
+            pass
+    
+    async def drain(self, timeout: float = WS_DRAIN_TIMEOUT):
+        """
+        Shut down the WebSocket side of the process within ``timeout`` seconds.
+        
+        New connections are refused, every client is sent a ``reconnect``
+        with its own jittered delay and closed, and then all unsaved room
+        documents (and the now-zero occupancy) are written to the database in
+        a single batch, before the earliest client comes back.
+        
+        Runs once: later calls (the lifespan shutdown after the signal
+        handler already drained) wait for the first drain to finish.
+        """
+        if self._drain_task is None:
+            self.draining = True
+            self._drain_task = asyncio.ensure_future(self._drain(timeout))
+        await asyncio.shield(self._drain_task)
+    
+    async def _drain(self, timeout: float):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        # Everyone is leaving: stop the room actors so nothing else touches the rooms
+        for actor in list(self.actors.values()):
+            actor.stop()
+        self.actors.clear()
+        try:
+            await asyncio.wait_for(self.flush_pending_changes(), timeout=max(deadline - loop.time(), 0))
+        except asyncio.TimeoutError:
+            print("[Drain] Timed out flushing pending changes")
+        connections = list(self.connections)
+        print(f"[Drain] Closing {len(connections)} connection(s) in {len(self.active_connections)} room(s)")
+        
+        for websocket in connections:
+            self.disconnect(websocket)
+        if connections or self.spectators.rooms:
+            try:
+                await asyncio.wait_for(
+                    asyncio.gather(
+                        self.spectators.close_all(),
+                        *(self.send_reconnect(ws) for ws in connections)
+                    ),
+                    timeout=max(deadline - loop.time(), 0)
+                )
+            except asyncio.TimeoutError:
+                print("[Drain] Timed out notifying clients")
+        
+        try:
+            saved = await asyncio.wait_for(self.save_dirty_rooms(), timeout=max(deadline - loop.time(), 0))
+            print(f"[Drain] Saved {saved} room(s)")
+            await asyncio.wait_for(self.flush_occupancy(), timeout=max(deadline - loop.time(), 0))
+        except asyncio.TimeoutError:
+            print("[Drain] Timed out saving rooms")
+    
+    def touch(self, websocket: WebSocket):
+        """Record that a frame was received; the wheel entry is only revisited when it fires."""
+        connection = self.connections.get(websocket)
+        if connection is None and websocket in self.watchers:
+            connection = self.watchers[websocket][0]
+        if connection is not None:
+            connection.last_seen = time.monotonic()
+    
+    async def reap_idle(self, now: Optional[float] = None) -> int:
+        """
+        Advance the deadline wheel: ping idle connections and close dead ones.
+        
+        Returns the number of connections reaped.
+        """
+        now = time.monotonic() if now is None else now
+        reaped = 0
+        ping_json = None
+        for websocket in self.deadlines.advance(now):
+            connection = self.connections.get(websocket)
+            spectating = connection is None and websocket in self.watchers
+            if spectating:
+                connection = self.watchers[websocket][0]
+            elif connection is None:
+                continue
+            last_seen = connection.last_seen
+            idle = now - last_seen
+            if idle >= WS_IDLE_TIMEOUT:
+                if spectating:
+                    # Spectators are not part of the room's state: no need to go through its actor
+                    await self._reap_spectator(websocket)
+                else:
+                    # The leave is applied by the room's actor; other rooms are not held up
+                    await self.dispatch(connection.room_id, self._reap, websocket)
+                reaped += 1
+                continue
+            if idle >= WS_HEARTBEAT_INTERVAL:
+                if ping_json is None:
+                    ping_json = HeartbeatMessage(type="ping").model_dump_json()
+                try:
+                    await websocket.send_text(ping_json)
+                except Exception:
+                    pass
+                self.deadlines.schedule(websocket, last_seen + WS_IDLE_TIMEOUT)
+            else:
+                self.deadlines.schedule(websocket, last_seen + WS_HEARTBEAT_INTERVAL)
+        if reaped:
+            metrics.incr("ws_reaped_idle_total", reaped)
+        return reaped
+    
+    async def _reap(self, websocket: WebSocket):
+        await self.leave(websocket)
+        try:
+            await websocket.close(code=WS_CLOSE_GOING_AWAY)
+        except Exception:
+            pass
+    
+    async def _reap_spectator(self, websocket: WebSocket):
+        self.unwatch(websocket)
+        try:
+            await websocket.close(code=WS_CLOSE_GOING_AWAY)
+        except Exception:
+            pass
+    
+    def _buckets(self, websocket: WebSocket, room_id: str):
+        """Return (connection buckets, room buckets), creating them on first use."""
+        connection = self.connection_buckets.get(websocket)
+        if connection is None:
+            connection = self.connection_buckets[websocket] = {
+                "code_change": TokenBucket(WS_CODE_RATE, WS_CODE_BURST),
+                "cursor_change": TokenBucket(WS_CURSOR_RATE, WS_CURSOR_BURST),
+            }
+        room = self.room_buckets.get(room_id)
+        if room is None:
+            room = self.room_buckets[room_id] = {
+                "code_change": TokenBucket(WS_ROOM_CODE_RATE, WS_ROOM_CODE_BURST),
+                "cursor_change": TokenBucket(WS_ROOM_CURSOR_RATE, WS_ROOM_CURSOR_BURST),
+            }
+        return connection, room
+    
+    def allow_cursor_change(self, websocket: WebSocket, room_id: str) -> bool:
+        """
+        Admit a cursor update if both the connection and the room have tokens.
+        
+        Cursor positions are superseded by the next update, so overflow is dropped.
+        """
+        connection, room = self._buckets(websocket, room_id)
+        connection_bucket, room_bucket = connection["cursor_change"], room["cursor_change"]
+        if connection_bucket.available() >= 1 and room_bucket.available() >= 1:
+            connection_bucket.try_acquire()
+            room_bucket.try_acquire()
+            return True
+        metrics.incr("ws_cursor_dropped_total")
+        return False
+    
+    def reserve_code_change(self, websocket: WebSocket, room_id: str) -> float:
+        """
+        Reserve a token for a code change and return the seconds the sender must wait.
+        
+        Diffs cannot be dropped without desynchronizing peers, so overflow is
+        delayed instead (back-pressure) rather than discarded.
+        """
+        connection, room = self._buckets(websocket, room_id)
+        delay = max(connection["code_change"].reserve(), room["code_change"].reserve())
+        if delay > 0:
+            metrics.incr("ws_code_backpressure_total")
+        return delay
+    
+    async def submit_code_change(
+        self,
+        room_id: str,
+        message: CodeChangeMessage,
+        user_id: str,
+        exclude: WebSocket = None
+    ):
+        """
+        Apply and broadcast a client's code change, merging keystrokes first.
+        
+        A keystroke starts a pending change that later keystrokes of the same
+        user at adjacent positions are folded into; it is applied and
+        broadcast as one op after WS_COALESCE_WINDOW, or as soon as anything
+        else (another user's op, a non-adjacent edit, a leave) needs the
+        document in order. Typing "hello" costs one frame, one op log entry
+        and one version instead of five.
+        """
+        pending = self.pending_changes.get(room_id)
+        if pending is not None:
+            if pending.user_id == user_id and self._in_bounds(room_id, pending.message, message):
+                merged = merge_code_changes(pending.message, message)
+                if merged is not None:
+                    pending.message = merged
+                    metrics.incr("ws_ops_coalesced_total")
+                    return
+            await self.flush_pending_change(room_id)
+        
+        if WS_COALESCE_WINDOW > 0 and is_keystroke(message) and self._in_bounds(room_id, None, message):
+            # Stamped now: the merged op is sent a window later but started with this keystroke
+            message.timestamp = message.timestamp or datetime.now(UTC)
+            timer = asyncio.create_task(self._flush_change_later(room_id))
+            self.pending_changes[room_id] = PendingChange(message, user_id, exclude, timer)
+            return
+        await self.broadcast_code_change(room_id=room_id, message=message, user_id=user_id, exclude=exclude)
+    
+    def _in_bounds(self, room_id: str, pending: Optional[CodeChangeMessage], message: CodeChangeMessage) -> bool:
+        # Merging assumes unclamped positions: the diff must fit the document it applies to
+        room = self.rooms.get(room_id)
+        if room is None or room_id not in self.active_connections:
+            return False
+        length = len(room.text)
+        if pending is not None:
+            length += len(pending.insert) - (pending.to_pos - pending.from_pos)
+        return message.to_pos is not None and message.to_pos <= length
+    
+    async def submit_cursor_change(
+        self,
+        room_id: str,
+        message: CursorChangeMessage,
+        user_id: str,
+        exclude: WebSocket = None
+    ):
+        """Broadcast a client's cursor, holding it back while the user's keystrokes are pending."""
+        pending = self.pending_changes.get(room_id)
+        if pending is not None and pending.user_id == user_id:
+            pending.cursor = message
+            return
+        await self.broadcast_cursor_change(room_id=room_id, message=message, user_id=user_id, exclude=exclude)
+    
+    async def _flush_change_later(self, room_id: str):
+        await asyncio.sleep(WS_COALESCE_WINDOW)
+        pending = self.pending_changes.get(room_id)
+        if pending is not None and pending.timer is asyncio.current_task():
+            await self.dispatch(room_id, self.flush_pending_change, room_id, pending)
+    
+    async def apply_saved_code(self, room_id: str, code: str):
+        """
+        Make code saved over REST the document of the room, if it is in memory.
+        
+        It is applied after any pending keystrokes as a full-code op: the
+        room's clients get it as the next version, later joiners get it in
+        their snapshot, and the next save of the room (drain, spill,
+        checkpoint) writes it instead of the old text. Rooms not in memory
+        read it from the database when they load. Must run on the room's actor.
+        """
+        if room_id not in self.rooms and room_id not in self.spilled:
+            return
+        await self.flush_pending_change(room_id)
+        try:
+            room = await self._live_room(room_id)
+        except RoomGoneError:
+            return
+        if room is None or room.text == code:
+            # Usually an editor saving the document everyone already has
+            return
+        message = CodeChangeMessage(code=code)
+        if room_id in self.active_connections:
+            await self.broadcast_code_change(room_id=room_id, message=message)
+            return
+        # No editors connected: applied for the next snapshot, spectators and resyncs
+        message.cursor_position = 0
+        message.timestamp = datetime.now(UTC)
+        message.version = room.apply(message)
+        room.record(message.version, message.model_dump_json())
+    
+    async def flush_pending_change(self, room_id: str, pending: Optional[PendingChange] = None):
+        """Apply and broadcast the room's pending change (only if it is still ``pending``, when given)."""
+        current = self.pending_changes.get(room_id)
+        if current is None or (pending is not None and current is not pending):
+            return
+        del self.pending_changes[room_id]
+        if current.timer is not asyncio.current_task():
+            current.timer.cancel()
+        await self.broadcast_code_change(
+            room_id=room_id,
+            message=current.message,
+            user_id=current.user_id,
+            exclude=current.exclude
+        )
+        if current.cursor is not None:
+            await self.broadcast_cursor_change(
+                room_id=room_id,
+                message=current.cursor,
+                user_id=current.user_id,
+                exclude=current.exclude
+            )
+    
+    async def flush_pending_changes(self):
+        """Apply every pending change (used before the rooms are saved on shutdown)."""
+        for room_id in list(self.pending_changes):
+            await self.flush_pending_change(room_id)
     
     async def broadcast_code_change(
-        self, 
-        room_id: str, 
-        code: str = None, 
-        cursor_position: int = None, 
+        self,
+        room_id: str,
+        message: CodeChangeMessage,
         user_id: str = None,
-        from_pos: int = None,
-        to_pos: int = None,
-        insert: str = None,
-        delete_length: int = None,
-        timestamp: datetime = None,
         exclude: WebSocket = None
     ):
-        """Broadcast code changes to all users in a room. Supports both full code and diffs."""
+        """
+        Broadcast code changes to all users in a room. Supports both full code and diffs.
+        
+        The decoded inbound message is forwarded as-is: only the server-owned
+        fields (user_id, timestamp) are stamped on it before serialization.
+        The author (``exclude``) gets an ``ack`` with the op's version instead.
+        """
         if room_id not in self.active_connections:
             return
         
-        # Validate diff if provided
-        has_diff = from_pos is not None and to_pos is not None and insert is not None
-        if has_diff:
-            # Validate diff parameters
-            if from_pos < 0 or to_pos < from_pos:
-                # Invalid diff, fall back to full code
-                has_diff = False
+        # Validate diff if provided (from_pos >= 0 is already enforced by the model)
+        has_diff = message.from_pos is not None and message.to_pos is not None and message.insert is not None
+        if has_diff and message.to_pos < message.from_pos:
+            # Invalid diff, fall back to full code
+            has_diff = False
         
-        # Create message with diff or full code
-        if has_diff and code is None:
+        if has_diff and message.code is None:
             # Diff only (preferred for efficiency)
-            message = CodeChangeMessage(
-                type="code_change",
-                from_pos=from_pos,
-                to_pos=to_pos,
-                insert=insert,
-                delete_length=delete_length,
-                user_id=user_id,
-                timestamp=timestamp or datetime.utcnow()
-            )
+            message.cursor_position = None
         else:
             # Full code (fallback or explicit)
-            message = CodeChangeMessage(
-                type="code_change",
-                code=code,
-                cursor_position=cursor_position or 0,
-                user_id=user_id,
-                timestamp=timestamp or datetime.utcnow()
-            )
+            message.from_pos = None
+            message.to_pos = None
+            message.insert = None
+            message.delete_length = None
+            message.cursor_position = message.cursor_position or 0
+        message.user_id = user_id
+        message.timestamp = message.timestamp or datetime.now(UTC)
+        
+        # Apply to the room's document so snapshots stay current
+        try:
+            room = await self._live_room(room_id)
+        except RoomGoneError:
+            # Its clients, the author included, were just closed
+            return
+        version = room.version if room is not None else None
+        if room is not None:
+            message.version = room.apply(message)
         
         message_json = message.model_dump_json()
+        ack_json = None
+        if room is not None and message.version != version:
+            room.record(message.version, message_json)
+            self.schedule_syntax_check(room_id)
+            ack_json = AckMessage(type="ack", version=message.version).model_dump_json()
         
         # Update last activity time for the room
-        if room_id in room_last_activity:
-            room_last_activity[room_id] = datetime.now()
+        if room_id in self.room_last_activity:
+            self.room_last_activity[room_id] = datetime.now()
         
         disconnected = []
         for connection in self.active_connections[room_id]:
+            frame = message_json
             if connection == exclude:
-                continue
+                if ack_json is None:
+                    continue
+                frame = ack_json
             try:
-                await connection.send_text(message_json)
+                await connection.send_text(frame)
             except Exception:
                 disconnected.append(connection)
         
@@ -147,19 +894,20 @@ class ConnectionManager:
         for conn in disconnected:
             self.disconnect(conn)
     
-    async def broadcast_cursor_change(self, room_id: str, line: int, column: int, user_id: str, exclude: WebSocket = None):
+    async def broadcast_cursor_change(
+        self,
+        room_id: str,
+        message: CursorChangeMessage,
+        user_id: str,
+        exclude: WebSocket = None
+    ):
         """Broadcast cursor position changes to all users in a room."""
         if room_id not in self.active_connections:
             return
         
-        message = CursorChangeMessage(
-            type="cursor_change",
-            line=line,
-            column=column,
-            user_id=user_id
-        )
-        
+        message.user_id = user_id
         message_json = message.model_dump_json()
+        self.spectators.note_cursor(room_id, user_id, message_json)
         
         disconnected = []
         for connection in self.active_connections[room_id]:
@@ -174,58 +922,186 @@ class ConnectionManager:
         for conn in disconnected:
             self.disconnect(conn)
     
-    async def broadcast_user_joined(self, room_id: str, user_id: str, username: str, exclude: WebSocket = None):
-        """Broadcast user joined notification."""
+    async def broadcast(self, room_id: str, message: BaseModel):
+        """Send a server event to every connection of a room."""
         if room_id not in self.active_connections:
             return
         
-        message = UserJoinedMessage(
-            type="user_joined",
-            user_id=user_id,
-            username=username
-        )
-        
         message_json = message.model_dump_json()
         
         disconnected = []
-        for connection in self.active_connections[room_id]:
-            if connection == exclude:
-                continue
+        for connection in list(self.active_connections[room_id]):
             try:
                 await connection.send_text(message_json)
             except Exception:
                 disconnected.append(connection)
         
         for conn in disconnected:
-            self.disconnect(conn)
+            disconnect_data = self.disconnect(conn)
+            if disconnect_data:
+                self.queue_user_left(disconnect_data[0], disconnect_data[1])
     
-    async def broadcast_user_left(self, room_id: str, user_id: str):
-        """Broadcast user left notification."""
-        if room_id not in self.active_connections:
+    def schedule_syntax_check(self, room_id: str):
+        """
+        Parse the room's document once edits settle for SYNTAX_CHECK_DEBOUNCE seconds.
+        
+        Every edit restarts the wait and cancels a check already queued or
+        parsing, so CPU is only spent on the latest version.
+        """
+        room = self.rooms.get(room_id)
+        if room is None or room.language not in PARSERS:
+            return
+        previous = self.syntax_checks.get(room_id)
+        if previous is not None:
+            previous.cancel()
+        self.syntax_checks[room_id] = asyncio.create_task(self._check_syntax_later(room_id))
+    
+    async def _check_syntax_later(self, room_id: str):
+        try:
+            await asyncio.sleep(SYNTAX_CHECK_DEBOUNCE)
+            room = self.rooms.get(room_id)
+            if room is None or room_id not in self.active_connections:
+                return
+            version, language = room.version, room.language
+            try:
+                diagnostics = await run_syntax_check(language, room.text)
+            except Exception as e:
+                print(f"[Syntax] Could not check room {room_id}: {e}")
+                return
+        finally:
+            if self.syntax_checks.get(room_id) is asyncio.current_task():
+                del self.syntax_checks[room_id]
+        await self.dispatch(room_id, self._publish_diagnostics, room, version, language, diagnostics)
+    
+    async def _publish_diagnostics(self, room: Room, version: int, language: str, diagnostics: List[dict]):
+        room_id = room.room_id
+        if room.version != version or self.rooms.get(room_id) is not room:
+            # Edited while parsing; the newer check will report
+            return
+        message = DiagnosticsMessage(type="diagnostics", version=version, language=language, diagnostics=diagnostics)
+        previous = self.diagnostics.get(room_id)
+        self.diagnostics[room_id] = message
+        if previous is None and not message.diagnostics:
             return
+        if previous is not None and previous.diagnostics == message.diagnostics:
+            return
+        await self.broadcast(room_id, message)
+    
+    def queue_user_joined(self, room_id: str, user_id: str, username: str):
+        """Queue a join for the room's next presence delta."""
+        self._queue_presence(room_id, user_id, RoomUser(user_id=user_id, username=username))
+    
+    def queue_user_left(self, room_id: str, user_id: str):
+        """Queue a leave for the room's next presence delta."""
+        self._queue_presence(room_id, user_id, None)
+    
+    def _queue_presence(self, room_id: str, user_id: str, user: Optional[RoomUser]):
+        pending = self.presence_pending.setdefault(room_id, {})
+        if user is None and pending.get(user_id) is not None:
+            # Joined and left within the same window: peers never need to hear about it
+            del pending[user_id]
+        else:
+            pending[user_id] = user
+        if room_id not in self.presence_flushes:
+            self.presence_flushes[room_id] = asyncio.create_task(self._flush_presence_later(room_id))
+    
+    async def _flush_presence_later(self, room_id: str):
+        try:
+            await asyncio.sleep(WS_PRESENCE_FLUSH_INTERVAL)
+        finally:
+            self.presence_flushes.pop(room_id, None)
+        await self.dispatch(room_id, self.flush_presence, room_id)
+    
+    async def flush_presence(self, room_id: str):
+        """
+        Send the pending joins/leaves of a room as a single presence delta.
         
-        message = UserLeftMessage(
-            type="user_left",
-            user_id=user_id
-        )
+        Every peer receives one frame per flush window, so N users joining
+        within the same window cost O(N) frames instead of O(N²).
+        """
+        pending = self.presence_pending.pop(room_id, None)
+        if not pending or room_id not in self.active_connections:
+            return
         
+        message = PresenceMessage(
+            type="presence",
+            joined=[user for user in pending.values() if user is not None],
+            left=[user_id for user_id, user in pending.items() if user is None],
+            count=len(self.active_connections[room_id])
+        )
         message_json = message.model_dump_json()
         
         disconnected = []
-        for connection in self.active_connections[room_id]:
+        for connection in list(self.active_connections[room_id]):
             try:
                 await connection.send_text(message_json)
             except Exception:
                 disconnected.append(connection)
         
+        # Peers that dropped during the flush are announced in the next delta
         for conn in disconnected:
-            self.disconnect(conn)
+            disconnect_data = self.disconnect(conn)
+            if disconnect_data:
+                self.queue_user_left(disconnect_data[0], disconnect_data[1])
 
 
 # Global connection manager instance
 manager = ConnectionManager()
 
 
+def exceeds_utf8_size(text: str, limit: int) -> bool:
+    """
+    Check whether ``text`` encoded as UTF-8 is larger than ``limit`` bytes.
+    
+    Every character takes 1 to 4 bytes, so the encode (a full copy) is only
+    needed when the character count alone cannot decide.
+    """
+    if len(text) > limit:
+        return True
+    if len(text) * 4 <= limit:
+        return False
+    return len(text.encode("utf-8")) > limit
+
+
+def code_change_too_large(message: CodeChangeMessage) -> bool:
+    """Check a code change against the per-document size limit."""
+    if message.code is not None and exceeds_utf8_size(message.code, WS_MAX_DOCUMENT_BYTES):
+        return True
+    return message.insert is not None and exceeds_utf8_size(message.insert, WS_MAX_DOCUMENT_BYTES)
+
+
+async def close_room_gone(websocket: WebSocket):
+    """Close the connection with WS_CLOSE_ROOM_GONE after telling the client why."""
+    reason = "La sesión ya no existe"
+    error_msg = ErrorMessage(type="error", message=reason)
+    try:
+        await websocket.send_text(error_msg.model_dump_json())
+        await websocket.close(code=WS_CLOSE_ROOM_GONE, reason=reason)
+    except Exception:
+        pass
+
+
+async def close_too_large(websocket: WebSocket, reason: str):
+    """Close the connection with 1009 (message too big) after telling the client why."""
+    metrics.incr("ws_closed_too_large_total")
+    error_msg = ErrorMessage(type="error", message=reason)
+    try:
+        await websocket.send_text(error_msg.model_dump_json())
+        await websocket.close(code=WS_CLOSE_MESSAGE_TOO_BIG, reason=reason)
+    except Exception:
+        pass
+
+
+def describe_decode_error(error: ValidationError) -> str:
+    """Build the client-facing error text for a frame that failed to decode."""
+    first = error.errors()[0]
+    if first["type"] in ("union_tag_invalid", "union_tag_not_found"):
+        # Unknown or missing "type" discriminator
+        message_type = first.get("ctx", {}).get("tag")
+        return f"Tipo de mensaje desconocido: {message_type}"
+    return f"Error al procesar el mensaje: {str(error)}"
+
+
 async def websocket_endpoint(websocket: WebSocket, room_id: str):
     """
     WebSocket endpoint for real-time collaboration.
@@ -234,69 +1110,119 @@ async def websocket_endpoint(websocket: WebSocket, room_id: str):
     - User connections/disconnections
     - Code change broadcasts
     - User join/leave notifications
+    
+    This coroutine only reads and validates frames: the join, every code and
+    cursor change and the leave are handed to the room's actor, which
+    applies them one at a time in arrival order.
     """
     user_id = None
+    # Shared by every connection to the room instead of one copy per URL parsed
+    room_id = sys.intern(room_id)
     
     try:
         # Accept connection and get username from initial message
         await websocket.accept()
+        if manager.draining:
+            # Shutting down: send the client elsewhere before it joins
+            await manager.send_reconnect(websocket)
+            return
         
         # Wait for join message
         initial_message = await websocket.receive_text()
+        if exceeds_utf8_size(initial_message, WS_MAX_FRAME_BYTES):
+            await close_too_large(websocket, "Mensaje demasiado grande")
+            return
         try:
-            join_data = json.loads(initial_message)
-            join_msg = JoinMessage(**join_data)
+            join_msg = JoinMessage.model_validate_json(initial_message)
             username = join_msg.username or "Anonymous"
         except Exception:
+            join_msg = None
             username = "Anonymous"
         
-        # Connect user
-        user_id = await manager.connect(websocket, room_id, username)
+        if join_msg is not None and join_msg.role == "spectator":
+            await watch_room(websocket, room_id, cursors=join_msg.cursors)
+            return
+        
+        # Connect user (a reconnecting client resumes from the version it last saw)
+        user_id = await manager.actor(room_id).call(
+            manager.connect,
+            websocket,
+            room_id,
+            username,
+            epoch=join_msg.epoch if join_msg else None,
+            last_version=join_msg.last_version if join_msg else None,
+            previous_user_id=join_msg.user_id if join_msg else None
+        )
         
         # Listen for messages
         while True:
             data = await websocket.receive_text()
+            manager.touch(websocket)
+            # Reject oversized frames before spending any time parsing them
+            if exceeds_utf8_size(data, WS_MAX_FRAME_BYTES):
+                await close_too_large(websocket, "Mensaje demasiado grande")
+                break
             
             try:
-                message_data = json.loads(data)
-                message_type = message_data.get("type")
+                # Single pass: raw JSON -> typed message, passed unchanged to broadcast
+                message = inbound_message_adapter.validate_json(data)
                 
-                if message_type == "code_change":
-                    code_msg = CodeChangeMessage(**message_data)
+                if message.type == "code_change":
+                    if code_change_too_large(message):
+                        await close_too_large(websocket, "El documento excede el tamaño máximo permitido")
+                        break
+                    delay = manager.reserve_code_change(websocket, room_id)
+                    if delay > 0:
+                        # Over the limit: ask the client to slow down and stop reading
+                        # from this socket until the buckets have refilled
+                        backpressure_msg = BackpressureMessage(
+                            type="backpressure",
+                            retry_after_ms=math.ceil(delay * 1000)
+                        )
+                        await websocket.send_text(backpressure_msg.model_dump_json())
+                        await asyncio.sleep(delay)
                     # Broadcast to all other users in the room
                     # Support both diff and full code messages
-                    await manager.broadcast_code_change(
+                    # (waits while the room's mailbox is full, so a flood stops being read)
+                    await manager.actor(room_id).send(
+                        manager.submit_code_change,
                         room_id=room_id,
-                        code=code_msg.code,
-                        cursor_position=code_msg.cursor_position,
+                        message=message,
                         user_id=user_id,
-                        from_pos=code_msg.from_pos,
-                        to_pos=code_msg.to_pos,
-                        insert=code_msg.insert,
-                        delete_length=code_msg.delete_length,
-                        timestamp=code_msg.timestamp,
                         exclude=websocket
                     )
-                elif message_type == "cursor_change":
-                    cursor_msg = CursorChangeMessage(**message_data)
-                    # Broadcast cursor position changes
-                    await manager.broadcast_cursor_change(
+                elif message.type == "cursor_change":
+                    if not manager.allow_cursor_change(websocket, room_id):
+                        # Over the limit: the next cursor update supersedes this one
+                        continue
+                    # Broadcast cursor position changes; a newer position from
+                    # this socket supersedes one still waiting in the mailbox
+                    manager.actor(room_id).post_latest(
+                        ("cursor_change", websocket),
+                        manager.submit_cursor_change,
                         room_id=room_id,
-                        line=cursor_msg.line,
-                        column=cursor_msg.column,
+                        message=message,
                         user_id=user_id,
                         exclude=websocket
                     )
-                elif message_type == "leave":
+                elif message.type == "leave":
                     break
+                elif message.type == "ping":
+                    await websocket.send_text(HeartbeatMessage(type="pong").model_dump_json())
+                elif message.type == "pong":
+                    # Liveness was already recorded by touch()
+                    continue
                 else:
-                    # Send error for unknown message type
+                    # A second join is not valid once connected
                     error_msg = ErrorMessage(
                         type="error",
-                        message=f"Tipo de mensaje desconocido: {message_type}"
+                        message=f"Tipo de mensaje desconocido: {message.type}"
                     )
                     await websocket.send_text(error_msg.model_dump_json())
             
+            except ValidationError as e:
+                error_msg = ErrorMessage(type="error", message=describe_decode_error(e))
+                await websocket.send_text(error_msg.model_dump_json())
             except Exception as e:
                 # Send error message
                 error_msg = ErrorMessage(
@@ -307,6 +1233,9 @@ async def websocket_endpoint(websocket: WebSocket, room_id: str):
     
     except WebSocketDisconnect:
         pass
+    except RoomGoneError:
+        # Joined (or watched) a room whose session was deleted while it was spilled
+        await close_room_gone(websocket)
     except Exception as e:
         error_msg = ErrorMessage(
             type="error",
@@ -317,10 +1246,103 @@ async def websocket_endpoint(websocket: WebSocket, room_id: str):
         except:
             pass
     finally:
-        # Clean up connection
-        disconnect_data = manager.disconnect(websocket)
-        if disconnect_data:
-            room_id, user_id, username = disconnect_data
-            await manager.broadcast_user_left(room_id, user_id)
+        # Clean up connection, after any of its ops still in the room's mailbox
+        await manager.in_room(room_id, manager.leave, websocket)
 
 
+async def watch_room(websocket: WebSocket, room_id: str, cursors: bool = False):
+    """
+    Serve a read-only spectator over its WebSocket until it leaves.
+    
+    The spectator gets a snapshot and then the room's throttled updates; it
+    may only ping or leave, any edit is refused.
+    """
+    spectator = await manager.spectate(
+        room_id,
+        websocket.send_text,
+        lambda: manager.send_reconnect(websocket),
+        cursors=cursors
+    )
+    manager.watch(websocket, room_id, spectator)
+    try:
+        while True:
+            data = await websocket.receive_text()
+            manager.touch(websocket)
+            if exceeds_utf8_size(data, WS_MAX_FRAME_BYTES):
+                await close_too_large(websocket, "Mensaje demasiado grande")
+                break
+            try:
+                message = inbound_message_adapter.validate_json(data)
+            except ValidationError as e:
+                error_msg = ErrorMessage(type="error", message=describe_decode_error(e))
+                await websocket.send_text(error_msg.model_dump_json())
+                continue
+            if message.type == "leave":
+                break
+            elif message.type == "ping":
+                await websocket.send_text(HeartbeatMessage(type="pong").model_dump_json())
+            elif message.type in ("code_change", "cursor_change"):
+                error_msg = ErrorMessage(type="error", message="Los espectadores no pueden editar la sesión")
+                await websocket.send_text(error_msg.model_dump_json())
+            elif message.type != "pong":
+                error_msg = ErrorMessage(
+                    type="error",
+                    message=f"Tipo de mensaje desconocido: {message.type}"
+                )
+                await websocket.send_text(error_msg.model_dump_json())
+    finally:
+        manager.unwatch(websocket)
+
+
+async def spectator_events(room_id: str, cursors: bool = False):
+    """
+    Server-Sent Events stream of a room for a read-only spectator.
+    
+    Each message the WebSocket spectator would get is one ``data:`` event.
+    A client that stops reading is dropped once SSE_SPECTATOR_BUFFER
+    updates are waiting (EventSource reconnects and starts from a snapshot).
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=SSE_SPECTATOR_BUFFER)
+    
+    async def send(frame: str):
+        try:
+            queue.put_nowait(frame)
+        except asyncio.QueueFull:
+            raise ConnectionError("El espectador no lee los eventos")
+    
+    async def close():
+        # Make room for the end-of-stream marker; whatever was queued is obsolete now
+        while not queue.empty():
+            queue.get_nowait()
+        queue.put_nowait(None)
+    
+    try:
+        spectator = await manager.spectate(room_id, send, close, cursors=cursors)
+    except RoomGoneError:
+        yield f"data: {ErrorMessage(type='error', message='La sesión ya no existe').model_dump_json()}\n\n"
+        return
+    try:
+        while True:
+            try:
+                frame = await asyncio.wait_for(queue.get(), timeout=WS_HEARTBEAT_INTERVAL)
+            except asyncio.TimeoutError:
+                # Comment line, so proxies do not close an idle stream
+                yield ": ping\n\n"
+                continue
+            if frame is None:
+                break
+            yield f"data: {frame}\n\n"
+    finally:
+        manager.spectators.remove(room_id, spectator)
+
+
+async def run_heartbeat(tick: float = WS_HEARTBEAT_TICK):
+    """Background task advancing the connection deadline wheel every tick."""
+    while True:
+        await asyncio.sleep(tick)
+        try:
+            reaped = await manager.reap_idle()
+            if reaped:
+                print(f"[Heartbeat] Reaped {reaped} idle connection(s)")
+        except Exception as e:
+            print(f"[Heartbeat] Error reaping idle connections: {e}")
@@ -0,0 +1,10 @@
+"""Benchmark harnesses for the Coding Interview Platform backend.
+
+Los benchmarks no forman parte de la suite de pytest (``testpaths = tests``);
+se ejecutan bajo demanda, por ejemplo::
+
+    uv run python -m benchmarks.ws_load --rooms 20 --users 4 --duration 30
+
+Cada harness escribe un reporte JSON legible por máquina para poder comparar
+resultados entre commits.
+"""
@@ -0,0 +1,45 @@
+"""Shared payloads for the message codec microbenchmarks."""
+
+import json
+import pytest
+
+# Un keystroke típico (diff de un carácter) frente a un pegado grande que viaja como código completo
+LARGE_CODE = ("def solve(nums):\n    return sorted(nums)[::-1]  # respuesta\n" * 2000)
+
+
+def code_change_payloads():
+    return {
+        "small": {
+            "type": "code_change",
+            "from_pos": 120,
+            "to_pos": 120,
+            "insert": "a",
+            "timestamp": "2026-01-01T12:00:00.123456+00:00",
+        },
+        "large": {
+            "type": "code_change",
+            "code": LARGE_CODE,
+            "cursor_position": 42,
+            "timestamp": "2026-01-01T12:00:00.123456+00:00",
+        },
+    }
+
+
+@pytest.fixture(params=["small", "large"])
+def code_change_raw(request) -> str:
+    """Inbound code_change frame as received from the socket."""
+    return json.dumps(code_change_payloads()[request.param])
+
+
+@pytest.fixture(params=["small", "large"])
+def username(request) -> str:
+    """Short username and a pathological long one."""
+    return "candidate" if request.param == "small" else "x" * 4096
+
+
+class NullWebSocket:
+    """WebSocket stand-in whose sends complete without suspending."""
+
+    async def send_text(self, data: str):
+        return None
+
@@ -0,0 +1,173 @@
+"""
+Memory held per idle WebSocket connection by the connection registry.
+
+Conecta N sockets falsos (sin tráfico) a salas de U usuarios a través del
+``ConnectionManager`` real, como lo haría ``websocket_endpoint``, y mide con
+``tracemalloc`` los bytes que quedan retenidos por conexión una vez asentadas
+las uniones. También compara el registro compacto (``Connection`` con
+``__slots__`` e ids internados) con el diccionario por socket que se usaba antes.
+
+Uso::
+
+    uv run python -m benchmarks.connection_memory --connections 10000,100000
+    uv run python -m benchmarks.connection_memory --connections 1000 --users-per-room 8
+"""
+
+import argparse
+import asyncio
+import gc
+import time
+import tracemalloc
+from typing import Callable, List, Optional
+
+from starlette.websockets import WebSocketState
+
+from app.rooms import Room
+from app.websocket import Connection, ConnectionManager
+from benchmarks.report import write_report
+from benchmarks.rest_api import int_list
+
+
+class IdleSocket:
+    """Accepted socket that takes every frame and never sends any."""
+
+    __slots__ = ()
+
+    application_state = WebSocketState.CONNECTED
+
+    async def send_text(self, data: str):
+        pass
+
+    async def close(self, code: int = 1000, reason: Optional[str] = None):
+        pass
+
+
+def _room_id(index: int) -> str:
+    # A fresh string per call, like the ids parsed out of each request URL
+    return "-".join(("room", str(index)))
+
+
+def _username(index: int) -> str:
+    return "-".join(("user", str(index % 50)))
+
+
+def traced_bytes(build: Callable[[], object]) -> int:
+    """Bytes still allocated once ``build()`` returns (its result is kept alive while measuring)."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        kept = build()
+        gc.collect()
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    del kept
+    return after - before
+
+
+async def measure_registry(connections: int, users_per_room: int) -> dict:
+    """Connect ``connections`` idle sockets and return the bytes retained per connection."""
+    manager = ConnectionManager()
+    room_count = max(1, connections // users_per_room)
+    # Documents are loaded beforehand (no database) and need no syntax checks: only the registry is measured
+    for index in range(room_count):
+        room_id = _room_id(index)
+        manager.rooms[room_id] = Room(room_id, language="javascript")
+    sockets = [IdleSocket() for _ in range(connections)]
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        started = time.perf_counter()
+        for index, websocket in enumerate(sockets):
+            room_id = _room_id(index % room_count)
+            await manager.actor(room_id).call(manager.connect, websocket, room_id, _username(index))
+        # Let the presence deltas go out so only what an idle connection keeps is left
+        await asyncio.gather(*list(manager.presence_flushes.values()))
+        elapsed = time.perf_counter() - started
+        gc.collect()
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+
+    connected = len(manager.connections)
+    for websocket in sockets:
+        manager.disconnect(websocket)
+    for actor in list(manager.actors.values()):
+        actor.stop()
+    return {
+        "connections": connected,
+        "rooms": room_count,
+        "connect_seconds": round(elapsed, 3),
+        "retained_bytes": after - before,
+        "bytes_per_connection": round((after - before) / connected, 1),
+    }
+
+
+def measure_records(connections: int, users_per_room: int) -> dict:
+    """Bytes per registry record: the former per-socket dict against Connection."""
+    room_count = max(1, connections // users_per_room)
+
+    def dicts():
+        return [
+            {"user_id": f"u{index:010d}", "username": _username(index), "room_id": _room_id(index % room_count)}
+            for index in range(connections)
+        ]
+
+    def records():
+        return [
+            Connection(f"u{index:010d}", _username(index), _room_id(index % room_count))
+            for index in range(connections)
+        ]
+
+    dict_bytes = traced_bytes(dicts)
+    record_bytes = traced_bytes(records)
+    return {
+        "dict_bytes_per_record": round(dict_bytes / connections, 1),
+        "connection_bytes_per_record": round(record_bytes / connections, 1),
+        "saved_percent": round(100 * (dict_bytes - record_bytes) / dict_bytes, 1) if dict_bytes else None,
+    }
+
+
+async def run_benchmark(args: argparse.Namespace) -> dict:
+    """Measure every requested connection count and return the report payload."""
+    results = []
+    for connections in args.connections:
+        result = await measure_registry(connections, args.users_per_room)
+        result["records"] = measure_records(connections, args.users_per_room)
+        results.append(result)
+    return {
+        "config": {
+            "connections": args.connections,
+            "users_per_room": args.users_per_room,
+        },
+        "results": results,
+    }
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--connections", type=int_list, default=[10000, 100000], help="Comma separated connection counts")
+    parser.add_argument("--users-per-room", type=int, default=4, help="Connections sharing each room")
+    parser.add_argument("--output", default=None, help="Report path (default: benchmarks/results/)")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None):
+    args = parse_args(argv)
+    report = asyncio.run(run_benchmark(args))
+    path = write_report(report, args.output, "connection_memory")
+    for result in report["results"]:
+        records = result["records"]
+        print(
+            f"[connection_memory] {result['connections']} idle connections: "
+            f"{result['bytes_per_connection']} B/connection "
+            f"(record {records['connection_bytes_per_record']} B vs dict {records['dict_bytes_per_record']} B)"
+        )
+    print(f"[connection_memory] Report written to {path}")
+
+
+if __name__ == "__main__":
+    main()
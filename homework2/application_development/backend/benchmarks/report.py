@@ -0,0 +1,192 @@
+"""Shared helpers for benchmark statistics, process sampling and JSON reports."""
+
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import UTC, datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+BENCHMARKS_DIR = Path(__file__).parent
+RESULTS_DIR = BENCHMARKS_DIR / "results"
+BASELINES_DIR = BENCHMARKS_DIR / "baselines"
+
+
+def percentile(sorted_values: Sequence[float], fraction: float) -> float:
+    """
+    Return the nearest-rank percentile of an already sorted sequence.
+
+    Args:
+        sorted_values: Values sorted in ascending order
+        fraction: Percentile as a fraction between 0 and 1 (e.g. 0.99)
+    """
+    if not sorted_values:
+        return 0.0
+    if fraction <= 0:
+        return sorted_values[0]
+    if fraction >= 1:
+        return sorted_values[-1]
+    rank = math.ceil(fraction * len(sorted_values)) - 1
+    return sorted_values[max(0, min(rank, len(sorted_values) - 1))]
+
+
+def latency_summary(samples_seconds: List[float]) -> Dict[str, float]:
+    """
+    Summarize latency samples (in seconds) as milliseconds.
+
+    Returns count, mean, p50, p99, p999 and max.
+    """
+    values = sorted(samples_seconds)
+    count = len(values)
+    mean = sum(values) / count if count else 0.0
+    return {
+        "count": count,
+        "mean_ms": round(mean * 1000, 3),
+        "p50_ms": round(percentile(values, 0.50) * 1000, 3),
+        "p99_ms": round(percentile(values, 0.99) * 1000, 3),
+        "p999_ms": round(percentile(values, 0.999) * 1000, 3),
+        "max_ms": round((values[-1] if values else 0.0) * 1000, 3),
+    }
+
+
+class ProcessSampler:
+    """
+    Sample CPU time and resident memory of a process through /proc.
+
+    Only Linux exposes /proc; on other platforms the sampler falls back to
+    ``resource.getrusage`` for the current process and reports ``None`` for
+    other processes.
+    """
+
+    def __init__(self, pid: int):
+        self.pid = pid
+        self._clock_ticks = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+        self._start_wall: Optional[float] = None
+        self._start_cpu: Optional[float] = None
+        self.rss_samples: List[int] = []
+
+    def cpu_seconds(self) -> Optional[float]:
+        """Return total user+system CPU seconds consumed by the process."""
+        try:
+            with open(f"/proc/{self.pid}/stat") as f:
+                # El nombre del proceso (campo 2) puede contener espacios; cortar tras ')'
+                fields = f.read().rsplit(")", 1)[1].split()
+            # utime y stime son los campos 14 y 15 (índices 11 y 12 tras el corte)
+            return (int(fields[11]) + int(fields[12])) / self._clock_ticks
+        except (OSError, IndexError, ValueError):
+            if self.pid == os.getpid():
+                import resource
+                usage = resource.getrusage(resource.RUSAGE_SELF)
+                return usage.ru_utime + usage.ru_stime
+            return None
+
+    def rss_bytes(self) -> Optional[int]:
+        """Return the current resident set size of the process in bytes."""
+        try:
+            with open(f"/proc/{self.pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        return int(line.split()[1]) * 1024
+        except (OSError, ValueError):
+            pass
+        return None
+
+    def start(self):
+        """Mark the beginning of the measured interval."""
+        self._start_wall = time.perf_counter()
+        self._start_cpu = self.cpu_seconds()
+        self.rss_samples = []
+        self.sample()
+
+    def sample(self):
+        """Record one RSS sample (call periodically during the run)."""
+        rss = self.rss_bytes()
+        if rss is not None:
+            self.rss_samples.append(rss)
+
+    def summary(self) -> Dict[str, Optional[float]]:
+        """Return CPU utilisation and RSS statistics for the measured interval."""
+        self.sample()
+        wall = time.perf_counter() - self._start_wall if self._start_wall else 0.0
+        end_cpu = self.cpu_seconds()
+        cpu_used = None
+        if end_cpu is not None and self._start_cpu is not None:
+            cpu_used = end_cpu - self._start_cpu
+        return {
+            "cpu_seconds": round(cpu_used, 3) if cpu_used is not None else None,
+            "cpu_percent": round(100 * cpu_used / wall, 1) if cpu_used is not None and wall else None,
+            "rss_start_bytes": self.rss_samples[0] if self.rss_samples else None,
+            "rss_max_bytes": max(self.rss_samples) if self.rss_samples else None,
+            "rss_end_bytes": self.rss_samples[-1] if self.rss_samples else None,
+        }
+
+
+def environment_info() -> Dict[str, Optional[str]]:
+    """Collect metadata that identifies where and on which commit a run happened."""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=BENCHMARKS_DIR,
+            capture_output=True,
+            text=True,
+            timeout=5,
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "commit": commit,
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpu_count": str(os.cpu_count()),
+        "timestamp": datetime.now(UTC).isoformat(),
+    }
+
+
+def write_report(report: dict, output: Optional[str], name: str) -> Path:
+    """
+    Write a benchmark report as JSON.
+
+    Args:
+        report: Report payload (config + results)
+        output: Explicit output path, or None to use benchmarks/results/
+        name: Benchmark name used for the default file name
+    """
+    report = {"benchmark": name, "environment": environment_info(), **report}
+    if output:
+        path = Path(output)
+    else:
+        commit = report["environment"]["commit"] or "nocommit"
+        stamp = datetime.now(UTC).strftime("%Y%m%dT%H%M%SZ")
+        path = RESULTS_DIR / f"{name}-{commit}-{stamp}.json"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(report, indent=2) + "\n")
+    return path
+
+
+def baseline_path(name: str, baseline: str) -> Path:
+    """Return the path of a named baseline for a benchmark."""
+    return BASELINES_DIR / f"{name}-{baseline}.json"
+
+
+def save_baseline(report: dict, name: str, baseline: str) -> Path:
+    """Store a report as a named baseline under benchmarks/baselines/."""
+    return write_report(report, str(baseline_path(name, baseline)), name)
+
+
+def load_baseline(name: str, baseline: str) -> Optional[dict]:
+    """Load a named baseline, or None if it has not been saved yet."""
+    path = baseline_path(name, baseline)
+    if not path.exists():
+        return None
+    return json.loads(path.read_text())
+
+
+def relative_change(current: float, previous: float) -> Optional[float]:
+    """Return the relative change from ``previous`` to ``current`` as a percentage."""
+    if not previous:
+        return None
+    return round(100 * (current - previous) / previous, 1)
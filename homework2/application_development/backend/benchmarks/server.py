@@ -0,0 +1,119 @@
+"""Start the backend under test, either as a local subprocess or in-process."""
+
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import AsyncIterator, Dict, Optional
+from urllib.error import URLError
+from urllib.request import urlopen
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+class RunningServer:
+    """Handle to a server under test: its base URL and the pid to sample."""
+
+    def __init__(self, base_url: str, pid: Optional[int]):
+        self.base_url = base_url.rstrip("/")
+        self.pid = pid
+
+    @property
+    def ws_url(self) -> str:
+        """Base URL for WebSocket connections (ws:// or wss://)."""
+        return "ws" + self.base_url[len("http"):]
+
+
+def free_port() -> int:
+    """Ask the OS for an unused local TCP port."""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_healthy(base_url: str, timeout: float = 30.0):
+    """Poll GET /health until the server answers or the timeout expires."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urlopen(f"{base_url}/health", timeout=1) as response:
+                if response.status == 200:
+                    return
+        except (URLError, OSError):
+            pass
+        time.sleep(0.1)
+    raise TimeoutError(f"Server at {base_url} did not become healthy in {timeout}s")
+
+
+@asynccontextmanager
+async def serve(
+    url: Optional[str] = None,
+    in_process: bool = False,
+    database_url: Optional[str] = None,
+    env: Optional[Dict[str, str]] = None,
+) -> AsyncIterator[RunningServer]:
+    """
+    Provide a running backend for the duration of the context.
+
+    Args:
+        url: Use an already running server instead of starting one
+        in_process: Run uvicorn inside this event loop (CPU/RSS then include the client)
+        database_url: DATABASE_URL for the started server; defaults to a temporary SQLite file
+        env: Extra environment variables for the started server
+    """
+    if url:
+        yield RunningServer(url, pid=None)
+        return
+
+    with tempfile.TemporaryDirectory(prefix="bench-") as tmpdir:
+        server_env = {
+            **os.environ,
+            "DATABASE_URL": database_url or f"sqlite:///{tmpdir}/bench.db",
+            **(env or {}),
+        }
+        port = free_port()
+        base_url = f"http://127.0.0.1:{port}"
+
+        if in_process:
+            # La configuración del backend se lee al importar los módulos,
+            # por eso el entorno se aplica antes de importar main
+            os.environ.update(server_env)
+            import uvicorn
+            sys.path.insert(0, str(BACKEND_DIR))
+            from main import app
+            config = uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning")
+            server = uvicorn.Server(config)
+            task = asyncio.create_task(server.serve())
+            try:
+                await asyncio.to_thread(wait_until_healthy, base_url)
+                yield RunningServer(base_url, pid=os.getpid())
+            finally:
+                server.should_exit = True
+                await task
+            return
+
+        process = subprocess.Popen(
+            [
+                sys.executable, "-m", "uvicorn", "main:app",
+                "--host", "127.0.0.1",
+                "--port", str(port),
+                "--log-level", "warning",
+            ],
+            cwd=BACKEND_DIR,
+            env=server_env,
+        )
+        try:
+            await asyncio.to_thread(wait_until_healthy, base_url)
+            yield RunningServer(base_url, pid=process.pid)
+        finally:
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
@@ -0,0 +1,92 @@
+"""
+Microbenchmarks for WebSocket message decode/encode hot paths.
+
+Ejecutar y comparar contra una línea base guardada en la misma máquina::
+
+    uv run pytest benchmarks/ --benchmark-only --benchmark-warmup=on --benchmark-min-rounds=20 \\
+        --benchmark-storage=benchmarks/baselines/micro \\
+        --benchmark-compare --benchmark-compare-fail=median:35%
+"""
+
+import asyncio
+import json
+import pytest
+from app.models import CodeChangeMessage, CursorChangeMessage, JoinMessage, inbound_message_adapter
+from app.rooms import Room
+from app.websocket import ConnectionManager
+from benchmarks.conftest import LARGE_CODE, NullWebSocket
+
+
+@pytest.mark.benchmark(group="inbound")
+def test_code_change_decode(benchmark, code_change_raw):
+    """Two-pass decode, json.loads + CodeChangeMessage(**data): the reference for the single-pass adapter below."""
+    def decode():
+        return CodeChangeMessage(**json.loads(code_change_raw))
+
+    message = benchmark(decode)
+    assert message.type == "code_change"
+
+
+@pytest.mark.benchmark(group="inbound")
+def test_inbound_adapter_decode(benchmark, code_change_raw):
+    """Single-pass decode of raw JSON through the discriminated-union adapter, as done in websocket_endpoint."""
+    message = benchmark(inbound_message_adapter.validate_json, code_change_raw)
+    assert message.type == "code_change"
+
+
+@pytest.mark.benchmark(group="outbound")
+def test_code_change_encode(benchmark, code_change_raw):
+    """model_dump_json() of an outbound code_change."""
+    message = CodeChangeMessage(**json.loads(code_change_raw), user_id="user-123")
+    payload = benchmark(message.model_dump_json)
+    assert '"code_change"' in payload
+
+
+@pytest.mark.benchmark(group="per-message")
+def test_code_change_inbound_to_fanout(benchmark, code_change_raw):
+    """
+    Full per-message cost on the path websocket_endpoint takes.
+
+    Decode, hand-off to the room's actor, submit_code_change (a keystroke
+    waits in the coalescing buffer), then the flush the coalescing timer
+    would run: apply to the room's document, record in the op log and
+    serialize to one peer.
+    """
+    manager = ConnectionManager()
+    sender, peer = NullWebSocket(), NullWebSocket()
+    manager.active_connections["bench-room"] = {sender, peer}
+    # A document long enough for the small diff's positions; no parser, so no syntax checks
+    manager.rooms["bench-room"] = Room("bench-room", text=LARGE_CODE, language="javascript")
+
+    async def handle():
+        actor = manager.actor("bench-room")
+        message = inbound_message_adapter.validate_json(code_change_raw)
+        await actor.send(manager.submit_code_change, "bench-room", message, "user-123", exclude=sender)
+        await actor.call(manager.flush_pending_change, "bench-room")
+
+    with asyncio.Runner() as runner:
+        benchmark(lambda: runner.run(handle()))
+        for actor in list(manager.actors.values()):
+            actor.stop()
+    assert manager.rooms["bench-room"].version > 0
+
+
+@pytest.mark.benchmark(group="inbound")
+def test_join_message_decode(benchmark, username):
+    """JoinMessage parsing of the first frame of every connection."""
+    raw = json.dumps({"type": "join", "username": username})
+    message = benchmark(lambda: JoinMessage(**json.loads(raw)))
+    assert message.username == username
+
+
+@pytest.mark.benchmark(group="roundtrip")
+def test_cursor_change_roundtrip(benchmark):
+    """CursorChangeMessage decode followed by re-encode with the sender's user_id."""
+    raw = json.dumps({"type": "cursor_change", "line": 120, "column": 17})
+
+    def roundtrip():
+        inbound = CursorChangeMessage(**json.loads(raw))
+        return CursorChangeMessage(line=inbound.line, column=inbound.column, user_id="user-123").model_dump_json()
+
+    payload = benchmark(roundtrip)
+    assert '"line":120' in payload
@@ -0,0 +1,214 @@
+"""
+WebSocket load generator and fan-out latency benchmark.
+
+Simula R salas × U usuarios: cada usuario se une con ``JoinMessage``, escribe
+con un ritmo de tecleo realista (diffs ``code_change`` de un carácter) y mueve
+el cursor (``cursor_change``). El harness mide la latencia extremo a extremo de
+cada entrega de ``code_change`` a cada par, mensajes por segundo, y CPU/RSS del
+servidor, y escribe un reporte JSON.
+
+Uso::
+
+    uv run python -m benchmarks.ws_load --rooms 50 --users 4 --duration 30
+    uv run python -m benchmarks.ws_load --url http://127.0.0.1:8000 --rooms 10
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+from datetime import UTC, datetime
+from typing import List, Optional
+
+from websockets.asyncio.client import connect
+from websockets.exceptions import ConnectionClosed
+
+from benchmarks.report import ProcessSampler, latency_summary, write_report
+from benchmarks.server import serve
+
+
+class LoadStats:
+    """Counters shared by all simulated users."""
+
+    def __init__(self):
+        self.measuring = False
+        self.latencies: List[float] = []
+        self.sent = {"code_change": 0, "cursor_change": 0}
+        self.received = {}
+        self.errors = 0
+        self.connect_failures = 0
+
+    def record_received(self, message_type: str):
+        if self.measuring:
+            self.received[message_type] = self.received.get(message_type, 0) + 1
+
+
+async def simulate_user(
+    ws_url: str,
+    room_id: str,
+    username: str,
+    typing_rate: float,
+    cursor_rate: float,
+    stats: LoadStats,
+    stop: asyncio.Event,
+    rng: random.Random,
+):
+    """Connect one user to a room, type and move the cursor until ``stop`` is set."""
+    try:
+        websocket = await connect(f"{ws_url}/ws/{room_id}", max_size=None)
+    except (OSError, ConnectionClosed):
+        stats.connect_failures += 1
+        return
+
+    async def receive_loop():
+        async for raw in websocket:
+            received_at = time.time()
+            message = json.loads(raw)
+            message_type = message.get("type", "unknown")
+            stats.record_received(message_type)
+            if message_type == "error":
+                stats.errors += 1
+            elif message_type == "code_change" and stats.measuring and message.get("timestamp"):
+                sent_at = datetime.fromisoformat(message["timestamp"]).timestamp()
+                stats.latencies.append(received_at - sent_at)
+
+    async def typing_loop():
+        while not stop.is_set():
+            await asyncio.sleep(rng.expovariate(typing_rate))
+            # Insertar al inicio siempre es un diff válido sin importar el estado del documento
+            await websocket.send(json.dumps({
+                "type": "code_change",
+                "from_pos": 0,
+                "to_pos": 0,
+                "insert": rng.choice("abcdefghijklmnopqrstuvwxyz \n"),
+                "timestamp": datetime.now(UTC).isoformat(),
+            }))
+            if stats.measuring:
+                stats.sent["code_change"] += 1
+
+    async def cursor_loop():
+        while not stop.is_set():
+            await asyncio.sleep(rng.expovariate(cursor_rate))
+            await websocket.send(json.dumps({
+                "type": "cursor_change",
+                "line": rng.randint(1, 40),
+                "column": rng.randint(0, 80),
+            }))
+            if stats.measuring:
+                stats.sent["cursor_change"] += 1
+
+    try:
+        await websocket.send(json.dumps({"type": "join", "username": username}))
+        receiver = asyncio.create_task(receive_loop())
+        senders = [asyncio.create_task(typing_loop())]
+        if cursor_rate > 0:
+            senders.append(asyncio.create_task(cursor_loop()))
+        await stop.wait()
+        for task in senders:
+            task.cancel()
+        await asyncio.gather(*senders, return_exceptions=True)
+        await websocket.send(json.dumps({"type": "leave"}))
+        await websocket.close()
+        await asyncio.gather(receiver, return_exceptions=True)
+    except ConnectionClosed:
+        stats.errors += 1
+
+
+async def run_benchmark(args: argparse.Namespace) -> dict:
+    """Run one load scenario and return the report payload."""
+    rng = random.Random(args.seed)
+    stats = LoadStats()
+    stop = asyncio.Event()
+
+    async with serve(url=args.url, in_process=args.in_process) as server:
+        sampler = ProcessSampler(server.pid) if server.pid else None
+
+        users = []
+        for room in range(args.rooms):
+            for user in range(args.users):
+                users.append(asyncio.create_task(simulate_user(
+                    server.ws_url,
+                    f"bench-room-{room}",
+                    f"user-{room}-{user}",
+                    args.typing_rate,
+                    args.cursor_rate,
+                    stats,
+                    stop,
+                    random.Random(rng.random()),
+                )))
+                # Escalonar las conexiones para no medir una tormenta de handshakes
+                await asyncio.sleep(args.ramp_delay)
+
+        await asyncio.sleep(args.warmup)
+        stats.measuring = True
+        if sampler:
+            sampler.start()
+        started = time.perf_counter()
+        while time.perf_counter() - started < args.duration:
+            await asyncio.sleep(0.5)
+            if sampler:
+                sampler.sample()
+        elapsed = time.perf_counter() - started
+        stats.measuring = False
+        server_usage = sampler.summary() if sampler else None
+
+        stop.set()
+        await asyncio.gather(*users, return_exceptions=True)
+
+    delivered = sum(stats.received.values())
+    return {
+        "config": {
+            "rooms": args.rooms,
+            "users_per_room": args.users,
+            "duration_seconds": args.duration,
+            "warmup_seconds": args.warmup,
+            "typing_rate_hz": args.typing_rate,
+            "cursor_rate_hz": args.cursor_rate,
+            "target": args.url or ("in-process" if args.in_process else "subprocess"),
+        },
+        "results": {
+            "elapsed_seconds": round(elapsed, 3),
+            "sent": stats.sent,
+            "received": stats.received,
+            "sent_per_second": round(sum(stats.sent.values()) / elapsed, 1),
+            "delivered_per_second": round(delivered / elapsed, 1),
+            "code_change_latency": latency_summary(stats.latencies),
+            "errors": stats.errors,
+            "connect_failures": stats.connect_failures,
+            "server": server_usage,
+        },
+    }
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rooms", type=int, default=10, help="Number of rooms (R)")
+    parser.add_argument("--users", type=int, default=3, help="Users per room (U)")
+    parser.add_argument("--duration", type=float, default=20.0, help="Measured seconds")
+    parser.add_argument("--warmup", type=float, default=2.0, help="Seconds before measuring")
+    parser.add_argument("--typing-rate", type=float, default=5.0, help="Keystrokes per second per user")
+    parser.add_argument("--cursor-rate", type=float, default=2.0, help="Cursor updates per second per user (0 disables)")
+    parser.add_argument("--ramp-delay", type=float, default=0.002, help="Seconds between opening connections")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed for reproducible schedules")
+    parser.add_argument("--url", default=None, help="Benchmark an already running server instead of starting one")
+    parser.add_argument("--in-process", action="store_true", help="Run uvicorn in this process")
+    parser.add_argument("--output", default=None, help="Report path (default: benchmarks/results/)")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None):
+    args = parse_args(argv)
+    report = asyncio.run(run_benchmark(args))
+    path = write_report(report, args.output, "ws_load")
+    latency = report["results"]["code_change_latency"]
+    print(
+        f"[ws_load] {args.rooms}x{args.users}: "
+        f"{report['results']['delivered_per_second']} msg/s delivered, "
+        f"p50={latency['p50_ms']}ms p99={latency['p99_ms']}ms p999={latency['p999_ms']}ms"
+    )
+    print(f"[ws_load] Report written to {path}")
+
+
+if __name__ == "__main__":
+    main()
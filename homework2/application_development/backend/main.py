@@ -1,15 +1,65 @@
 """Main FastAPI application entry point."""
 
 import asyncio
+import signal
 from contextlib import asynccontextmanager
 from pathlib import Path
 from fastapi import FastAPI, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from app.routes import router
-from app.websocket import websocket_endpoint
+from app.websocket import manager, websocket_endpoint, run_heartbeat, WS_MAX_FRAME_BYTES
 from app.database import init_db
-from app.tasks import cleanup_expired_sessions, periodic_cleanup
+from app.tasks import (
+    cleanup_expired_sessions,
+    periodic_cleanup,
+    checkpoint_rooms,
+    periodic_room_snapshots,
+    periodic_occupancy_flush,
+    periodic_room_spill,
+    ACTIVE_USERS_FLUSH_INTERVAL,
+)
+from app.rooms import reset_active_users
+from app.execution import executor
+from app import syntax
+from app.snapshots import ROOM_SNAPSHOT_PATH, ROOM_SNAPSHOT_INTERVAL, read_snapshot
+
+
+# Keep references to running drain tasks so they are not garbage collected
+drain_tasks = set()
+
+
+def install_drain_on_signal():
+    """
+    Drain WebSocket clients before uvicorn starts its own shutdown.
+    
+    Uvicorn closes every WebSocket (1012, no delay hint) before the lifespan
+    shutdown runs, so SIGTERM/SIGINT are intercepted here: the drain runs
+    first and then the original uvicorn handler is invoked.
+    """
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        previous = signal.getsignal(sig)
+        if not callable(previous):
+            continue
+        
+        def handle(sig=sig, previous=previous):
+            if manager.draining:
+                # Second signal: stop waiting for the drain
+                previous(sig, None)
+                return
+            
+            async def drain_then_exit():
+                await manager.drain()
+                previous(sig, None)
+            
+            drain_tasks.add(asyncio.ensure_future(drain_then_exit()))
+        
+        try:
+            loop.add_signal_handler(sig, handle)
+        except (NotImplementedError, RuntimeError, ValueError):
+            # Not the main thread (e.g. TestClient) or unsupported platform
+            pass
 
 
 @asynccontextmanager
@@ -18,24 +68,61 @@ async def lifespan(app: FastAPI):
     Lifespan context manager for FastAPI application.
     
     Handles startup and shutdown events:
-    - Startup: Initialize database, cleanup expired sessions, start periodic cleanup task
-    - Shutdown: Cancel periodic cleanup task gracefully
+    - Startup: Initialize database, cleanup expired sessions, restore room snapshots,
+      start periodic cleanup, heartbeat, occupancy, room spill and snapshot tasks, prewarm execution workers
+    - Shutdown: Drain WebSocket clients, save live rooms, cancel background tasks, write a final snapshot,
+      stop execution and syntax-check workers
     """
     # Startup
     init_db()
     # Clean up expired sessions on startup
     cleanup_expired_sessions()
+    # No connections exist yet: occupancy left over from a previous process is stale.
+    # This assumes the app runs as a single worker (rooms are in-memory too); a second
+    # worker would wipe the occupancy flushed by the others
+    reset_active_users()
+    # Restore rooms checkpointed by the previous process before accepting connections
+    if ROOM_SNAPSHOT_PATH:
+        restored = await asyncio.to_thread(read_snapshot, ROOM_SNAPSHOT_PATH)
+        manager.restore_rooms(restored)
+        print(f"[Snapshots] Restored {len(restored)} room(s) from {ROOM_SNAPSHOT_PATH}")
     # Start periodic cleanup task (runs every hour)
     cleanup_task = asyncio.create_task(periodic_cleanup(interval_hours=1))
+    # Ping idle WebSocket connections and reap dead ones
+    heartbeat_task = asyncio.create_task(run_heartbeat())
+    # Batched write of live occupancy to sessions.active_users
+    occupancy_task = asyncio.create_task(periodic_occupancy_flush(ACTIVE_USERS_FLUSH_INTERVAL))
+    # Spill idle room documents to the database when they exceed the memory budget
+    spill_task = asyncio.create_task(periodic_room_spill())
+    background_tasks = [cleanup_task, heartbeat_task, occupancy_task, spill_task]
+    if ROOM_SNAPSHOT_PATH:
+        background_tasks.append(asyncio.create_task(
+            periodic_room_snapshots(ROOM_SNAPSHOT_PATH, ROOM_SNAPSHOT_INTERVAL)
+        ))
+    # Start the interpreters used by POST /api/sessions/{id}/run ahead of the first request
+    await executor.start()
+    install_drain_on_signal()
     
     yield
     
-    # Shutdown: Cancel the periodic cleanup task
-    cleanup_task.cancel()
-    try:
-        await cleanup_task
-    except asyncio.CancelledError:
-        pass
+    # Shutdown: hand clients off to the next process and save live rooms
+    await manager.drain()
+    
+    # Cancel the background tasks
+    for task in background_tasks:
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+    
+    # Final checkpoint so the next process starts from the drained state
+    if ROOM_SNAPSHOT_PATH:
+        await checkpoint_rooms(ROOM_SNAPSHOT_PATH)
+    
+    await executor.stop()
+    # Joins the parser processes without blocking the loop
+    await asyncio.to_thread(syntax.shutdown)
 
 
 # Create FastAPI app
@@ -93,4 +180,5 @@ if static_dir.exists():
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # ws_max_size makes uvicorn refuse oversized frames before buffering them
+    uvicorn.run(app, host="0.0.0.0", port=8000, ws_max_size=WS_MAX_FRAME_BYTES)
@@ -0,0 +1,25 @@
+"""Test-wide settings, applied before the app modules are imported."""
+
+import os
+import shutil
+import stat
+import sys
+
+
+def _reachable_by_others(path: str) -> bool:
+    """Whether an unprivileged user can traverse every directory up to ``path``."""
+    path = os.path.realpath(path)
+    while path != os.path.dirname(path):
+        path = os.path.dirname(path)
+        if not os.stat(path).st_mode & stat.S_IXOTH:
+            return False
+    return True
+
+
+# Production refuses to run code without bubblewrap; machines without it run the
+# execution tests with resource limits, an unprivileged user and a network namespace only
+os.environ.setdefault("EXEC_SANDBOX", "bwrap" if shutil.which("bwrap") else "none")
+# An interpreter installed in a private home (/root/.pyenv...) cannot be started as nobody
+if os.geteuid() == 0 and not _reachable_by_others(sys.executable):
+    os.environ.setdefault("EXEC_UID", "0")
+    os.environ.setdefault("EXEC_GID", "0")
@@ -5,8 +5,9 @@ import asyncio
 from datetime import UTC, datetime, timedelta
 from sqlalchemy.orm import Session
 from app.database import SessionLocal, init_db, drop_db
-from app.models import Session as SessionModel
-from app.tasks import cleanup_expired_sessions, periodic_cleanup
+from app.models import Session as SessionModel, HiddenTestCase
+from app.tasks import cleanup_expired_sessions, cleanup_inactive_rooms, periodic_cleanup
+from app.websocket import manager
 
 
 @pytest.fixture(scope="function")
@@ -71,6 +72,59 @@ class TestSessionCleanup:
         ).first()
         assert active_check is not None
     
+    def test_cleanup_removes_hidden_tests_of_expired_sessions(self, db_session: Session):
+        """Test that the hidden test cases of expired sessions are deleted with them."""
+        now = datetime.now(UTC)
+        db_session.add(SessionModel(
+            session_id="expired-tests-1",
+            room_id="room-expired-tests-1",
+            language="python",
+            code="print('expired')",
+            created_at=now - timedelta(hours=10),
+            expires_at=now - timedelta(hours=2)
+        ))
+        db_session.add(SessionModel(
+            session_id="active-tests-1",
+            room_id="room-active-tests-1",
+            language="python",
+            code="print('active')",
+            created_at=now,
+            expires_at=now + timedelta(hours=8)
+        ))
+        for session_id in ("expired-tests-1", "active-tests-1"):
+            db_session.add(HiddenTestCase(session_id=session_id, position=0, stdin="", expected_output="x"))
+        db_session.commit()
+        
+        cleanup_expired_sessions()
+        
+        remaining = [case.session_id for case in db_session.query(HiddenTestCase).all()]
+        assert remaining == ["active-tests-1"]
+    
+    def test_cleanup_removes_hidden_tests_of_inactive_rooms(self, db_session: Session):
+        """Test that the hidden test cases of inactive rooms are deleted with their session."""
+        now = datetime.now(UTC)
+        for session_id in ("inactive-tests-1", "kept-tests-1"):
+            db_session.add(SessionModel(
+                session_id=session_id,
+                room_id=f"room-{session_id}",
+                language="python",
+                code="print('tests')",
+                created_at=now,
+                expires_at=now + timedelta(hours=8)
+            ))
+            db_session.add(HiddenTestCase(session_id=session_id, position=0, stdin="", expected_output="x"))
+        db_session.commit()
+        manager.room_last_activity["room-inactive-tests-1"] = now - timedelta(minutes=10)
+        
+        try:
+            deleted_count = cleanup_inactive_rooms()
+        finally:
+            manager.room_last_activity.pop("room-inactive-tests-1", None)
+        
+        assert deleted_count == 1
+        remaining = [case.session_id for case in db_session.query(HiddenTestCase).all()]
+        assert remaining == ["kept-tests-1"]
+    
     def test_cleanup_no_expired_sessions(self, db_session: Session):
         """Test cleanup when there are no expired sessions."""
         now = datetime.now(UTC)
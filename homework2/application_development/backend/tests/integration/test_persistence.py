@@ -5,6 +5,7 @@ from datetime import UTC, datetime, timedelta
 from sqlalchemy.orm import Session
 from app.database import SessionLocal, init_db, drop_db
 from app.models import Session as SessionModel
+from app.rooms import reset_active_users, save_active_users
 
 
 @pytest.fixture(scope="function")
@@ -215,3 +216,58 @@ class TestSessionPersistence:
         assert len(expired_sessions) == 1
         assert expired_sessions[0].session_id == "expired-1"
 
+
+@pytest.mark.integration
+class TestActiveUsersPersistence:
+    """Tests for batched active_users writes."""
+    
+    def _add_session(self, db_session: Session, session_id: str, active_users: int = 0):
+        db_session.add(SessionModel(
+            session_id=session_id,
+            room_id=f"room-{session_id}",
+            language="python",
+            code="",
+            created_at=datetime.now(UTC),
+            expires_at=datetime.now(UTC) + timedelta(hours=8),
+            active_users=active_users
+        ))
+        db_session.commit()
+    
+    def test_save_active_users_batch(self, db_session: Session):
+        """Test that several rooms are updated in one call and unknown rooms are ignored."""
+        self._add_session(db_session, "s1")
+        self._add_session(db_session, "s2")
+        
+        saved = save_active_users({"room-s1": 3, "room-s2": 1, "room-missing": 2, "not-a-room": 5})
+        
+        assert saved == 3
+        db_session.expire_all()
+        counts = {s.session_id: s.active_users for s in db_session.query(SessionModel).all()}
+        assert counts == {"s1": 3, "s2": 1}
+    
+    def test_reset_active_users(self, db_session: Session):
+        """Test that stale occupancy from a previous process is cleared."""
+        self._add_session(db_session, "s1", active_users=4)
+        self._add_session(db_session, "s2")
+        
+        assert reset_active_users() == 1
+        db_session.expire_all()
+        assert {s.active_users for s in db_session.query(SessionModel).all()} == {0}
+
+
+@pytest.mark.integration
+class TestSessionIndexes:
+    """Tests for the sessions table indexes."""
+    
+    def test_init_db_adds_missing_indexes(self, db_session: Session):
+        """Test that init_db creates indexes added after the table already existed."""
+        from sqlalchemy import inspect, text
+        from app.database import engine
+        
+        with engine.begin() as connection:
+            connection.execute(text("DROP INDEX idx_created_at_session_id"))
+        
+        init_db()
+        
+        names = {index["name"] for index in inspect(engine).get_indexes("sessions")}
+        assert {"idx_created_at_session_id", "idx_expires_at_session_id", "idx_language_created_at_session_id"} <= names
@@ -1,11 +1,17 @@
 """Integration tests for REST API endpoints."""
 
+import asyncio
 import pytest
+from unittest.mock import patch
 from datetime import UTC, datetime, timedelta
 from fastapi.testclient import TestClient
 from main import app
 from app.database import init_db, drop_db, engine, SessionLocal
+from app.execution import executor
+from app.metrics import metrics
 from app.models import Session as SessionModel
+from app.rooms import Room
+from app.websocket import ConnectionManager, manager
 from sqlalchemy import text
 
 
@@ -40,6 +46,20 @@ class TestHealthEndpoint:
         assert isinstance(data["timestamp"], str)
 
 
+@pytest.mark.integration
+class TestMetricsEndpoint:
+    """Tests for GET /api/metrics endpoint."""
+    
+    def test_metrics_response_structure(self, client):
+        """Test metrics returns counters and gauges."""
+        metrics.incr("test_counter_total")
+        response = client.get("/api/metrics")
+        assert response.status_code == 200
+        data = response.json()
+        assert data["counters"]["test_counter_total"] >= 1
+        assert isinstance(data["gauges"], dict)
+
+
 @pytest.mark.integration
 class TestCreateSessionEndpoint:
     """Tests for POST /api/sessions endpoint."""
@@ -113,6 +133,154 @@ class TestCreateSessionEndpoint:
         assert response.status_code == 422  # Validation error
 
 
+@pytest.mark.integration
+class TestBatchCreateSessionsEndpoint:
+    """Tests for POST /api/sessions:batch endpoint."""
+    
+    def test_batch_create_sessions(self, client):
+        """Test creating several sessions in one request."""
+        response = client.post("/api/sessions:batch", json={"sessions": [
+            {"language": "python", "title": "Entrevista 1"},
+            {"language": "javascript", "initial_code": "console.log(1)"},
+            {},
+        ]})
+        
+        assert response.status_code == 201
+        sessions = response.json()["sessions"]
+        assert len(sessions) == 3
+        assert [s["language"] for s in sessions] == ["python", "javascript", "python"]
+        assert sessions[0]["title"] == "Entrevista 1"
+        assert sessions[1]["initial_code"] == "console.log(1)"
+        assert len({s["session_id"] for s in sessions}) == 3
+        for session in sessions:
+            assert session["room_id"] == f"room-{session['session_id']}"
+            assert session["active_users"] == 0
+    
+    def test_batch_sessions_are_persisted(self, client):
+        """Test that every session of the batch can be fetched afterwards."""
+        response = client.post("/api/sessions:batch", json={"sessions": [{"title": f"s{i}"} for i in range(20)]})
+        
+        for session in response.json()["sessions"]:
+            fetched = client.get(f"/api/sessions/{session['session_id']}")
+            assert fetched.status_code == 200
+            assert fetched.json()["title"] == session["title"]
+            assert fetched.json()["expires_at"][:19] == session["expires_at"][:19]
+    
+    def test_batch_create_empty(self, client):
+        """Test that an empty batch is rejected."""
+        response = client.post("/api/sessions:batch", json={"sessions": []})
+        assert response.status_code == 422
+    
+    def test_batch_create_too_many(self, client):
+        """Test that batches above the limit are rejected."""
+        response = client.post("/api/sessions:batch", json={"sessions": [{}] * 501})
+        assert response.status_code == 422
+    
+    def test_batch_create_invalid_item(self, client):
+        """Test that one invalid item rejects the whole batch."""
+        response = client.post("/api/sessions:batch", json={"sessions": [{}, {"language": "cobol"}]})
+        assert response.status_code == 422
+        db = SessionLocal()
+        try:
+            assert db.query(SessionModel).count() == 0
+        finally:
+            db.close()
+
+
+@pytest.mark.integration
+class TestListSessionsEndpoint:
+    """Tests for GET /api/sessions endpoint."""
+    
+    def _add_sessions(self, count: int, **overrides):
+        base = datetime(2026, 1, 1, tzinfo=UTC)
+        db = SessionLocal()
+        try:
+            for index in range(count):
+                values = {
+                    "session_id": f"s{index:03d}",
+                    "room_id": f"room-s{index:03d}",
+                    "language": "python" if index % 2 == 0 else "javascript",
+                    "code": "",
+                    # Pairs of sessions share created_at to exercise the session_id tie-breaker
+                    "created_at": base + timedelta(minutes=index // 2),
+                    "expires_at": base + timedelta(hours=8, minutes=count - index),
+                    "active_users": 1 if index % 3 == 0 else 0,
+                }
+                values.update(overrides)
+                db.add(SessionModel(**values))
+            db.commit()
+        finally:
+            db.close()
+    
+    def _collect(self, client, **params):
+        ids, cursor = [], None
+        while True:
+            query = dict(params, **({"cursor": cursor} if cursor else {}))
+            response = client.get("/api/sessions", params=query)
+            assert response.status_code == 200
+            data = response.json()
+            ids.extend(session["session_id"] for session in data["sessions"])
+            cursor = data["next_cursor"]
+            if cursor is None:
+                return ids
+    
+    def test_list_paginates_newest_first(self, client):
+        """Test that keyset pages cover every session once, newest first."""
+        self._add_sessions(25)
+        
+        ids = self._collect(client, limit=4)
+        
+        assert ids == [f"s{index:03d}" for index in reversed(range(25))]
+    
+    def test_list_by_expiration(self, client):
+        """Test ordering by expires_at, soonest first."""
+        self._add_sessions(9)
+        
+        ids = self._collect(client, order_by="expires_at", limit=2)
+        
+        assert ids == [f"s{index:03d}" for index in reversed(range(9))]
+    
+    def test_list_filters(self, client):
+        """Test language, created_after, expires_before and has_active_users filters."""
+        self._add_sessions(12)
+        
+        python_ids = self._collect(client, language="python")
+        assert python_ids == [f"s{index:03d}" for index in (10, 8, 6, 4, 2, 0)]
+        
+        recent = self._collect(client, created_after="2026-01-01T00:03:30+00:00")
+        assert recent == ["s011", "s010", "s009", "s008"]
+        
+        expiring = self._collect(client, expires_before="2026-01-01T08:03:00Z", order_by="expires_at")
+        assert expiring == ["s011", "s010"]
+        
+        active = self._collect(client, has_active_users=True)
+        assert active == ["s009", "s006", "s003", "s000"]
+    
+    def test_list_empty(self, client):
+        """Test listing with no sessions."""
+        response = client.get("/api/sessions")
+        assert response.status_code == 200
+        assert response.json() == {"sessions": [], "next_cursor": None}
+    
+    def test_list_invalid_cursor(self, client):
+        """Test that a malformed cursor is rejected."""
+        response = client.get("/api/sessions", params={"cursor": "not-a-cursor"})
+        assert response.status_code == 400
+    
+    def test_list_cursor_from_other_order(self, client):
+        """Test that a cursor cannot be reused with another sort order."""
+        self._add_sessions(3)
+        cursor = client.get("/api/sessions", params={"limit": 1}).json()["next_cursor"]
+        
+        response = client.get("/api/sessions", params={"cursor": cursor, "order_by": "expires_at"})
+        assert response.status_code == 400
+    
+    def test_list_limit_bounds(self, client):
+        """Test that the page size is validated."""
+        assert client.get("/api/sessions", params={"limit": 0}).status_code == 422
+        assert client.get("/api/sessions", params={"limit": 201}).status_code == 422
+
+
 @pytest.mark.integration
 class TestGetSessionEndpoint:
     """Tests for GET /api/sessions/{session_id} endpoint."""
@@ -132,6 +300,22 @@ class TestGetSessionEndpoint:
         assert "room_id" in data
         assert "share_url" in data
     
+    def test_get_session_live_active_users(self, client):
+        """Test that active_users comes from the live WebSocket registry."""
+        session = client.post("/api/sessions").json()
+        room_id = session["room_id"]
+        
+        with client.websocket_connect(f"/ws/{room_id}") as websocket:
+            websocket.send_json({"type": "join", "username": "alice"})
+            assert websocket.receive_json()["type"] == "snapshot"
+            
+            response = client.get(f"/api/sessions/{session['session_id']}")
+            assert response.json()["active_users"] == 1
+            websocket.send_json({"type": "leave"})
+        
+        response = client.get(f"/api/sessions/{session['session_id']}")
+        assert response.json()["active_users"] == 0
+    
     def test_get_session_not_found(self, client):
         """Test getting a non-existent session."""
         response = client.get("/api/sessions/non-existent-session-id")
@@ -217,6 +401,28 @@ class TestSaveCodeEndpoint:
         assert data["initial_code"] == new_code
         assert data["last_saved_at"] is not None
     
+    def test_save_code_replaces_live_room_text(self, client):
+        """Test a REST save is not overwritten by the live room when it is drained later."""
+        session = client.post("/api/sessions", json={"initial_code": "print('viejo')"}).json()
+        live = ConnectionManager()
+        room = Room(session["room_id"], text="print('sin guardar')", language="python")
+        room.dirty = True
+        live.rooms[session["room_id"]] = room
+        
+        with patch("app.routes.manager", live):
+            response = client.put(f"/api/sessions/{session['session_id']}/code", json={"code": "print('guardado')"})
+            assert response.status_code == 200
+            assert client.get(f"/api/sessions/{session['session_id']}").json()["initial_code"] == "print('guardado')"
+        asyncio.run(live.drain(timeout=1))
+        
+        assert room.text == "print('guardado')"
+        db = SessionLocal()
+        try:
+            saved = db.query(SessionModel).filter(SessionModel.session_id == session["session_id"]).first()
+            assert saved.code == "print('guardado')"
+        finally:
+            db.close()
+    
     def test_save_code_not_found(self, client):
         """Test saving code to a non-existent session."""
         response = client.put(
@@ -342,3 +548,184 @@ class TestSaveCodeEndpoint:
         finally:
             db.close()
 
+
+
+@pytest.mark.integration
+class TestRunCodeEndpoint:
+    """Tests for POST /api/sessions/{session_id}/run endpoint."""
+    
+    def test_run_saved_code(self, client):
+        """Test running a session without a body executes its stored code."""
+        create_response = client.post("/api/sessions", json={
+            "language": "python",
+            "initial_code": "print(sum(range(10)))"
+        })
+        session_id = create_response.json()["session_id"]
+        
+        response = client.post(f"/api/sessions/{session_id}/run")
+        assert response.status_code == 200
+        data = response.json()
+        assert data["language"] == "python"
+        assert data["stdout"] == "45\n"
+        assert data["exit_code"] == 0
+        assert data["timed_out"] is False
+        assert data["duration_ms"] >= 0
+    
+    def test_run_live_room_code(self, client):
+        """Test the live document of a connected room takes precedence over the stored code."""
+        create_response = client.post("/api/sessions", json={"initial_code": "print('guardado')"})
+        session = create_response.json()
+        room = Room(session["room_id"], text="print('en vivo')", language="python")
+        
+        with patch.dict(manager.rooms, {session["room_id"]: room}):
+            response = client.post(f"/api/sessions/{session['session_id']}/run")
+        
+        assert response.status_code == 200
+        assert response.json()["stdout"] == "en vivo\n"
+    
+    def test_run_request_code_and_stdin(self, client):
+        """Test code and stdin sent in the request are used."""
+        create_response = client.post("/api/sessions")
+        session_id = create_response.json()["session_id"]
+        
+        response = client.post(
+            f"/api/sessions/{session_id}/run",
+            json={"code": "print(input().upper())", "stdin": "hola\n"}
+        )
+        assert response.status_code == 200
+        assert response.json()["stdout"] == "HOLA\n"
+    
+    def test_run_repeated_code_is_cached(self, client):
+        """Test re-running an identical snapshot is served from the result cache."""
+        create_response = client.post("/api/sessions", json={"initial_code": "print('caché de integración')"})
+        session_id = create_response.json()["session_id"]
+        
+        first = client.post(f"/api/sessions/{session_id}/run").json()
+        second = client.post(f"/api/sessions/{session_id}/run").json()
+        
+        assert first["cached"] is False
+        assert second["cached"] is True
+        assert second["stdout"] == first["stdout"] == "caché de integración\n"
+        assert metrics.snapshot()["counters"]["exec_cache_hits_total"] >= 1
+    
+    def test_run_reports_errors(self, client):
+        """Test a failing program returns its traceback and exit code."""
+        create_response = client.post("/api/sessions")
+        session_id = create_response.json()["session_id"]
+        
+        response = client.post(f"/api/sessions/{session_id}/run", json={"code": "raise ValueError('mal')"})
+        assert response.status_code == 200
+        data = response.json()
+        assert data["exit_code"] == 1
+        assert "ValueError: mal" in data["stderr"]
+    
+    def test_run_unsupported_language(self, client):
+        """Test languages without a server runtime return 400."""
+        create_response = client.post("/api/sessions", json={"language": "java", "initial_code": "class Main {}"})
+        session_id = create_response.json()["session_id"]
+        
+        response = client.post(f"/api/sessions/{session_id}/run")
+        assert response.status_code == 400
+        assert "java" in response.json()["detail"]
+    
+    def test_run_without_sandbox_is_refused(self, client):
+        """Test the server answers 503 instead of running code outside the sandbox."""
+        session_id = client.post("/api/sessions").json()["session_id"]
+        
+        with patch.object(executor, "sandbox_error", "bwrap is not installed"):
+            response = client.post(f"/api/sessions/{session_id}/run", json={"code": "print('sin sandbox')"})
+        
+        assert response.status_code == 503
+    
+    def test_run_not_found(self, client):
+        """Test running code of a non-existent session."""
+        response = client.post("/api/sessions/non-existent-session-id/run")
+        assert response.status_code == 404
+    
+    def test_run_expired_session(self, client):
+        """Test running code of an expired session returns 410."""
+        create_response = client.post("/api/sessions")
+        session_id = create_response.json()["session_id"]
+        db = SessionLocal()
+        try:
+            db_session = db.query(SessionModel).filter(SessionModel.session_id == session_id).first()
+            db_session.expires_at = datetime.now(UTC) - timedelta(hours=1)
+            db.commit()
+        finally:
+            db.close()
+        
+        response = client.post(f"/api/sessions/{session_id}/run")
+        assert response.status_code == 410
+
+
+@pytest.mark.integration
+class TestGradingEndpoints:
+    """Tests for PUT /api/sessions/{session_id}/tests and POST /api/sessions/{session_id}/grade."""
+    
+    CASES = [
+        {"name": "uno", "stdin": "1\n", "expected_output": "2\n"},
+        {"name": "cinco", "stdin": "5\n", "expected_output": "10"},
+        {"name": "siete", "stdin": "7\n", "expected_output": "15\n"},
+    ]
+    
+    def create_graded_session(self, client, code="print(int(input()) * 2)"):
+        session_id = client.post("/api/sessions", json={"initial_code": code}).json()["session_id"]
+        response = client.put(f"/api/sessions/{session_id}/tests", json={"cases": self.CASES})
+        assert response.status_code == 200
+        assert response.json() == {"count": 3}
+        return session_id
+    
+    def test_grade_runs_all_cases(self, client):
+        """Test grading reports the status of every hidden case in order."""
+        session_id = self.create_graded_session(client)
+        
+        response = client.post(f"/api/sessions/{session_id}/grade")
+        assert response.status_code == 200
+        data = response.json()
+        assert (data["total"], data["passed"], data["failed"], data["skipped"]) == (3, 2, 1, 0)
+        assert [r["status"] for r in data["results"]] == ["passed", "passed", "failed"]
+        assert [r["name"] for r in data["results"]] == ["uno", "cinco", "siete"]
+    
+    def test_grade_does_not_leak_hidden_cases(self, client):
+        """Test neither the tests endpoint nor the grade response return stdin or expected output."""
+        session_id = self.create_graded_session(client)
+        
+        data = client.post(f"/api/sessions/{session_id}/grade").json()
+        assert "expected_output" not in str(data)
+        assert "stdin" not in str(data)
+    
+    def test_replacing_cases(self, client):
+        """Test PUT replaces the previous set of cases."""
+        session_id = self.create_graded_session(client)
+        
+        response = client.put(f"/api/sessions/{session_id}/tests", json={"cases": self.CASES[:1]})
+        assert response.json() == {"count": 1}
+        assert client.post(f"/api/sessions/{session_id}/grade").json()["total"] == 1
+    
+    def test_grade_without_cases(self, client):
+        """Test grading a session without hidden cases returns 400."""
+        session_id = client.post("/api/sessions").json()["session_id"]
+        
+        response = client.post(f"/api/sessions/{session_id}/grade")
+        assert response.status_code == 400
+    
+    def test_grade_stop_on_failure(self, client):
+        """Test stop_on_failure stops grading at the first failing case."""
+        session_id = self.create_graded_session(client, code="print(0)")
+        
+        data = client.post(f"/api/sessions/{session_id}/grade", json={"stop_on_failure": True}).json()
+        assert data["failed"] >= 1
+        assert data["passed"] == 0
+        assert data["failed"] + data["skipped"] == 3
+    
+    def test_grade_invalid_timeout(self, client):
+        """Test per-case timeouts must be positive and bounded."""
+        session_id = self.create_graded_session(client)
+        
+        response = client.post(f"/api/sessions/{session_id}/grade", json={"timeout_seconds": 0})
+        assert response.status_code == 422
+    
+    def test_tests_not_found(self, client):
+        """Test setting cases on a non-existent session."""
+        response = client.put("/api/sessions/non-existent-session-id/tests", json={"cases": []})
+        assert response.status_code == 404
@@ -5,6 +5,7 @@ import json
 import asyncio
 from fastapi.testclient import TestClient
 from app.main import app
+from app.models import CodeChangeMessage, CursorChangeMessage
 from app.websocket import manager
 
 client = TestClient(app)
@@ -146,10 +147,7 @@ def test_broadcast_code_change_with_diff():
         try:
             await manager.broadcast_code_change(
                 room_id=room_id,
-                from_pos=0,
-                to_pos=5,
-                insert="hello",
-                delete_length=0,
+                message=CodeChangeMessage(from_pos=0, to_pos=5, insert="hello", delete_length=0),
                 user_id="test-user"
             )
             # If no error, the method accepts the parameters
@@ -171,8 +169,7 @@ def test_broadcast_code_change_with_full_code():
         try:
             await manager.broadcast_code_change(
                 room_id=room_id,
-                code="print('hello')",
-                cursor_position=0,
+                message=CodeChangeMessage(code="print('hello')", cursor_position=0),
                 user_id="test-user"
             )
             assert True
@@ -192,8 +189,7 @@ def test_broadcast_cursor_change():
         try:
             await manager.broadcast_cursor_change(
                 room_id=room_id,
-                line=10,
-                column=20,
+                message=CursorChangeMessage(line=10, column=20),
                 user_id="test-user"
             )
             assert True
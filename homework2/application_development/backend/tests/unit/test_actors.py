@@ -0,0 +1,130 @@
+"""Unit tests for the per-room actor."""
+
+import asyncio
+import pytest
+from app.actors import RoomActor
+
+
+class Recorder:
+    """Stand-in for the manager side of an actor: a log of handled events and an occupancy flag."""
+    
+    def __init__(self):
+        self.events = []
+        self.occupied = True
+        self.exited = []
+    
+    def actor(self, capacity: int = 8) -> RoomActor:
+        return RoomActor("room-1", keep_alive=lambda: self.occupied, on_exit=self.exited.append, capacity=capacity)
+    
+    async def handle(self, event, delay: float = 0):
+        await asyncio.sleep(delay)
+        self.events.append(event)
+        return event
+
+
+@pytest.mark.unit
+class TestRoomActor:
+    """Tests for RoomActor."""
+    
+    @pytest.mark.asyncio
+    async def test_events_run_one_at_a_time_in_order(self):
+        """Test that a slow event is never overtaken by a later one."""
+        room = Recorder()
+        actor = room.actor()
+        
+        actor.post(room.handle, "join", delay=0.02)
+        await actor.send(room.handle, "op-1")
+        actor.post(room.handle, "op-2")
+        assert await actor.call(room.handle, "leave") == "leave"
+        
+        assert room.events == ["join", "op-1", "op-2", "leave"]
+    
+    @pytest.mark.asyncio
+    async def test_call_raises_handler_errors(self):
+        """Test that call() propagates the handler's exception and the actor keeps going."""
+        room = Recorder()
+        actor = room.actor()
+        
+        async def fail():
+            raise ValueError("boom")
+        
+        with pytest.raises(ValueError):
+            await actor.call(fail)
+        assert await actor.call(room.handle, "next") == "next"
+    
+    @pytest.mark.asyncio
+    async def test_posted_errors_are_logged(self, capsys):
+        """Test that a failing fire-and-forget event does not stop the actor."""
+        room = Recorder()
+        actor = room.actor()
+        
+        async def fail():
+            raise ValueError("boom")
+        
+        actor.post(fail)
+        await actor.call(room.handle, "next")
+        
+        assert "boom" in capsys.readouterr().out
+        assert room.events == ["next"]
+    
+    @pytest.mark.asyncio
+    async def test_send_waits_when_mailbox_is_full(self):
+        """Test back-pressure: senders block while ``capacity`` sends are pending."""
+        room = Recorder()
+        actor = room.actor(capacity=2)
+        
+        await actor.send(room.handle, 1, delay=0.05)
+        await actor.send(room.handle, 2)
+        third = asyncio.create_task(actor.send(room.handle, 3))
+        await asyncio.sleep(0.01)
+        assert not third.done()
+        
+        await third
+        await actor.call(room.handle, "done")
+        assert room.events == [1, 2, 3, "done"]
+    
+    @pytest.mark.asyncio
+    async def test_post_latest_coalesces(self):
+        """Test that only the newest pending event per key runs."""
+        room = Recorder()
+        actor = room.actor()
+        
+        actor.post(room.handle, "op", delay=0.01)
+        for position in range(5):
+            actor.post_latest("cursor-a", room.handle, f"a{position}")
+        actor.post_latest("cursor-b", room.handle, "b0")
+        await actor.call(room.handle, "end")
+        
+        assert room.events == ["op", "a4", "b0", "end"]
+    
+    @pytest.mark.asyncio
+    async def test_exits_when_room_empties(self):
+        """Test that the task ends once the mailbox is drained and the room is empty, and restarts on new mail."""
+        room = Recorder()
+        actor = room.actor()
+        await actor.call(room.handle, "join")
+        assert room.exited == []
+        
+        room.occupied = False
+        actor.wake()
+        await asyncio.sleep(0)
+        assert room.exited == [actor]
+        
+        room.occupied = True
+        assert await actor.call(room.handle, "rejoin") == "rejoin"
+    
+    @pytest.mark.asyncio
+    async def test_stop_cancels_pending_calls(self):
+        """Test that stop() cancels the running and queued events."""
+        room = Recorder()
+        actor = room.actor()
+        running = asyncio.create_task(actor.call(room.handle, "slow", delay=10))
+        queued = asyncio.create_task(actor.call(room.handle, "queued"))
+        await asyncio.sleep(0.01)
+        
+        actor.stop()
+        
+        for task in (running, queued):
+            with pytest.raises(asyncio.CancelledError):
+                await task
+        assert room.events == []
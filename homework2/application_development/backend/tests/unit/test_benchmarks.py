@@ -0,0 +1,85 @@
+"""Unit tests for benchmark report helpers."""
+
+import json
+import os
+import pytest
+from benchmarks import report
+from benchmarks.connection_memory import measure_records, measure_registry
+from benchmarks.report import (
+    ProcessSampler,
+    latency_summary,
+    load_baseline,
+    percentile,
+    relative_change,
+    save_baseline,
+    write_report,
+)
+
+
+@pytest.mark.unit
+class TestPercentile:
+    """Tests for nearest-rank percentile calculation."""
+    
+    def test_percentile_empty(self):
+        """Test percentile of an empty sequence is zero."""
+        assert percentile([], 0.5) == 0.0
+    
+    def test_percentile_nearest_rank(self):
+        """Test nearest-rank percentiles over 1..100."""
+        values = list(range(1, 101))
+        assert percentile(values, 0.50) == 50
+        assert percentile(values, 0.99) == 99
+        assert percentile(values, 0.999) == 100
+        assert percentile(values, 1.0) == 100
+    
+    def test_latency_summary_converts_to_milliseconds(self):
+        """Test latency_summary reports milliseconds."""
+        summary = latency_summary([0.001, 0.002, 0.003])
+        assert summary["count"] == 3
+        assert summary["p50_ms"] == 2.0
+        assert summary["max_ms"] == 3.0
+        assert summary["mean_ms"] == 2.0
+
+
+@pytest.mark.unit
+class TestReport:
+    """Tests for process sampling and report output."""
+    
+    def test_process_sampler_current_process(self):
+        """Test sampler returns CPU and RSS for the current process."""
+        sampler = ProcessSampler(os.getpid())
+        sampler.start()
+        summary = sampler.summary()
+        assert summary["cpu_seconds"] is not None
+        assert summary["cpu_seconds"] >= 0
+    
+    def test_write_report(self, tmp_path):
+        """Test report is written as JSON with environment metadata."""
+        path = write_report({"results": {"ok": 1}}, str(tmp_path / "report.json"), "demo")
+        data = json.loads(path.read_text())
+        assert data["benchmark"] == "demo"
+        assert data["results"] == {"ok": 1}
+        assert "python" in data["environment"]
+    
+    def test_baseline_roundtrip(self, tmp_path, monkeypatch):
+        """Test saving and loading a named baseline."""
+        monkeypatch.setattr(report, "BASELINES_DIR", tmp_path)
+        assert load_baseline("demo", "main") is None
+        save_baseline({"results": {"rps": 10}}, "demo", "main")
+        assert load_baseline("demo", "main")["results"] == {"rps": 10}
+    
+    def test_relative_change(self):
+        """Test relative change percentage and zero baseline."""
+        assert relative_change(110, 100) == 10.0
+        assert relative_change(90, 100) == -10.0
+        assert relative_change(5, 0) is None
+    
+    @pytest.mark.asyncio
+    async def test_connection_memory_measures_idle_connections(self):
+        """Test the registry benchmark connects every socket and reports bytes per connection."""
+        result = await measure_registry(8, users_per_room=4)
+        assert result["connections"] == 8
+        assert result["rooms"] == 2
+        assert result["bytes_per_connection"] > 0
+        records = measure_records(8, users_per_room=4)
+        assert records["connection_bytes_per_record"] < records["dict_bytes_per_record"]
@@ -0,0 +1,248 @@
+"""Unit tests for the sandboxed execution pool."""
+
+import asyncio
+import os
+import shutil
+import pytest
+from unittest.mock import patch
+from app import execution
+from app.execution import ExecutionPool, SandboxUnavailableError, UnsupportedLanguageError, sandbox_command
+from app.metrics import metrics
+from app.runcache import ResultCache
+
+
+@pytest.fixture
+async def pool():
+    """Started pool with one warm worker per language."""
+    pool = ExecutionPool(size=2, warm=1)
+    await pool.start()
+    yield pool
+    await pool.stop()
+
+
+@pytest.mark.unit
+class TestExecutionPool:
+    """Tests for ExecutionPool and the worker sandbox."""
+    
+    async def test_runs_python_with_stdin(self, pool):
+        """Test a Python program reads its stdin and prints to stdout."""
+        result = await pool.run("python", "name = input()\nprint(f'hola {name}')", stdin="ana\n")
+        
+        assert result.stdout == "hola ana\n"
+        assert result.stderr == ""
+        assert result.exit_code == 0
+        assert result.timed_out is False
+    
+    async def test_uses_warm_worker_and_replenishes(self, pool):
+        """Test a run takes an already started worker and a replacement is started."""
+        warm = pool.idle["python"][0]
+        
+        await pool.run("python", "print(1)")
+        await asyncio.gather(*pool._spawning)
+        
+        assert warm.process.returncode is not None
+        assert len(pool.idle["python"]) == 1
+        assert pool.idle["python"][0] is not warm
+    
+    async def test_error_traceback_hides_bootstrap(self, pool):
+        """Test uncaught exceptions report only the frames of the program."""
+        result = await pool.run("python", "x = 1\ny = x / 0")
+        
+        assert result.exit_code == 1
+        assert 'File "main.py", line 2' in result.stderr
+        assert "ZeroDivisionError" in result.stderr
+        assert "<string>" not in result.stderr
+    
+    async def test_network_is_blocked(self, pool):
+        """Test programs cannot open sockets."""
+        result = await pool.run("python", "import socket\nsocket.socket()")
+        
+        assert result.exit_code == 1
+        assert "PermissionError" in result.stderr
+    
+    async def test_processes_are_blocked(self, pool):
+        """Test programs cannot start other processes."""
+        result = await pool.run("python", "import subprocess\nsubprocess.run(['ls'])")
+        
+        assert result.exit_code == 1
+        assert "not allowed in the sandbox" in result.stderr
+    
+    @pytest.mark.parametrize("module", ["_posixsubprocess", "sqlite3", "ctypes"])
+    async def test_native_escape_modules_are_blocked(self, pool, module):
+        """Test modules that bypass the audit events cannot be imported."""
+        result = await pool.run("python", f"import {module}")
+        
+        assert result.exit_code == 1
+        assert f"import of {module} is not allowed" in result.stderr
+    
+    async def test_hook_ignores_rebound_globals(self, pool, tmp_path):
+        """Test programs cannot widen the writable directory through __main__."""
+        outside = tmp_path / "outside.txt"
+        code = f"import __main__\n__main__._root = '/'\nopen({str(outside)!r}, 'w')\n"
+        result = await pool.run("python", code)
+        
+        assert "cannot write" in result.stderr
+        assert not outside.exists()
+    
+    async def test_writes_only_inside_scratch_directory(self, pool, tmp_path):
+        """Test programs may write their own directory but nothing outside it."""
+        outside = tmp_path / "outside.txt"
+        code = (
+            "open('inside.txt', 'w').write('ok')\n"
+            "print(open('inside.txt').read())\n"
+            f"open({str(outside)!r}, 'w')\n"
+        )
+        result = await pool.run("python", code)
+        
+        assert result.stdout == "ok\n"
+        assert "cannot write" in result.stderr
+        assert not outside.exists()
+    
+    async def test_memory_limit(self, pool):
+        """Test allocations beyond the memory limit fail inside the program."""
+        result = await pool.run("python", "data = bytearray(2 * 1024 ** 3)")
+        
+        assert result.exit_code == 1
+        assert "MemoryError" in result.stderr
+    
+    async def test_timeout_kills_program(self, pool):
+        """Test programs running past the wall-clock limit are killed."""
+        worker = await execution.Worker.spawn(pool.runtimes["python"], pool.sandbox)
+        result = await worker.run("while True:\n    pass", timeout=0.5)
+        
+        assert result.timed_out is True
+        assert result.exit_code is not None and result.exit_code < 0
+    
+    async def test_output_is_capped(self, pool):
+        """Test endless output is truncated and stops the program."""
+        with patch.object(execution, "EXEC_MAX_OUTPUT_BYTES", 1024):
+            result = await pool.run("python", "while True:\n    print('x' * 100)")
+        
+        assert result.truncated is True
+        assert result.timed_out is False
+        assert len(result.stdout) == 1024
+    
+    async def test_unsupported_language(self, pool):
+        """Test languages without a runtime are rejected."""
+        with pytest.raises(UnsupportedLanguageError):
+            await pool.run("java", "class Main {}")
+    
+    async def test_cold_start_without_warm_workers(self):
+        """Test a pool that was never started still runs code on a fresh worker."""
+        pool = ExecutionPool(size=1, warm=0)
+        
+        result = await pool.run("python", "print('frío')")
+        
+        assert result.stdout == "frío\n"
+    
+    @pytest.mark.skipif(shutil.which(execution.EXEC_NODE_BINARY) is None, reason="Node.js no está instalado")
+    async def test_runs_javascript_in_empty_context(self, pool):
+        """Test JavaScript prints like the browser runner and has no access to require."""
+        result = await pool.run("javascript", "console.log('hola', {a: 1})\nreturn 42")
+        
+        assert result.stdout == 'hola {\n  "a": 1\n}\n42\n'
+        
+        result = await pool.run("javascript", "require('fs')")
+        
+        assert result.exit_code == 1
+        assert "require is not defined" in result.stderr
+
+
+@pytest.mark.unit
+class TestSandbox:
+    """Tests for the sandbox the workers are started in."""
+    
+    def test_bwrap_binds_only_system_directories_and_workdir(self, tmp_path):
+        """Test the bubblewrap command keeps the application directory out of the sandbox."""
+        with patch.object(execution.shutil, "which", side_effect=lambda name: f"/usr/bin/{name}"):
+            command = sandbox_command("bwrap", str(tmp_path))
+        
+        assert command[0] == "/usr/bin/bwrap"
+        assert "--unshare-all" in command
+        assert command[command.index("--uid") + 1] == str(execution.EXEC_UID)
+        assert command[-6:] == ["--bind", str(tmp_path), str(tmp_path), "--chdir", str(tmp_path), "--"]
+        app_dir = os.path.dirname(os.path.realpath(execution.__file__))
+        assert not any(app_dir.startswith(arg + os.sep) or arg == app_dir for arg in command if arg.startswith("/"))
+    
+    def test_unknown_sandbox_is_rejected(self, tmp_path):
+        """Test a misspelled EXEC_SANDBOX does not fall back to no sandbox."""
+        with pytest.raises(SandboxUnavailableError):
+            sandbox_command("docker", str(tmp_path))
+    
+    async def test_missing_bwrap_refuses_runs(self):
+        """Test the pool refuses to run code when bubblewrap is not installed."""
+        pool = ExecutionPool(size=1, warm=0, sandbox="bwrap")
+        
+        with patch.object(execution, "EXEC_BWRAP_BINARY", "bwrap-no-instalado"):
+            await pool.start()
+            with pytest.raises(SandboxUnavailableError):
+                await pool.run("python", "print(1)")
+        
+        assert pool.started is False
+        assert "bwrap-no-instalado" in pool.sandbox_error
+        assert metrics.snapshot()["gauges"]["exec_sandbox_available"] == 0
+    
+    async def test_failed_isolation_aborts_spawn(self, pool):
+        """Test a worker whose privileges or namespace cannot be set up is never started."""
+        def refuse(*args, **kwargs):
+            raise PermissionError("unshare")
+        
+        with patch.object(execution, "_limit_resources", refuse):
+            with pytest.raises(SandboxUnavailableError):
+                await execution.Worker.spawn(pool.runtimes["python"], "none")
+
+
+@pytest.mark.unit
+class TestExecutionPoolCache:
+    """Tests for the result cache in front of ExecutionPool.run."""
+    
+    @pytest.fixture
+    async def cached_pool(self):
+        pool = ExecutionPool(size=2, warm=0, cache=ResultCache(max_bytes=100_000))
+        await pool.check_sandbox()
+        return pool
+    
+    async def test_identical_run_is_served_from_cache(self, cached_pool):
+        """Test a second identical run returns the first result without starting a worker."""
+        first = await cached_pool.run("python", "print(6 * 7)")
+        
+        with patch.object(execution.Worker, "spawn") as spawn:
+            second = await cached_pool.run("python", "print(6 * 7)")
+        
+        spawn.assert_not_called()
+        assert first.cached is False
+        assert second.cached is True
+        assert (second.stdout, second.exit_code) == ("42\n", 0)
+    
+    async def test_stdin_is_part_of_the_key(self, cached_pool):
+        """Test the same program with different input runs again."""
+        first = await cached_pool.run("python", "print(input())", stdin="a\n")
+        second = await cached_pool.run("python", "print(input())", stdin="b\n")
+        
+        assert (first.stdout, second.stdout) == ("a\n", "b\n")
+        assert second.cached is False
+    
+    async def test_nondeterministic_programs_always_run(self, cached_pool):
+        """Test programs using random sources bypass the cache."""
+        await cached_pool.run("python", "import random\nprint(random.random())")
+        second = await cached_pool.run("python", "import random\nprint(random.random())")
+        
+        assert second.cached is False
+        assert len(cached_pool.cache) == 0
+    
+    async def test_timeouts_are_not_cached(self, cached_pool):
+        """Test load-dependent outcomes are not stored."""
+        cached_pool.timeout = 0.3
+        result = await cached_pool.run("python", "while True:\n    pass")
+        
+        assert result.timed_out is True
+        assert len(cached_pool.cache) == 0
+    
+    async def test_concurrent_identical_runs_share_one_worker(self, cached_pool):
+        """Test identical runs in flight at the same time execute once."""
+        with patch.object(execution.Worker, "spawn", wraps=execution.Worker.spawn) as spawn:
+            results = await asyncio.gather(*(cached_pool.run("python", "print('grupo')") for _ in range(3)))
+        
+        assert spawn.await_count == 1
+        assert [r.stdout for r in results] == ["grupo\n"] * 3
+        assert [r.cached for r in results].count(False) == 1
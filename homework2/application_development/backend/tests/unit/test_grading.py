@@ -0,0 +1,108 @@
+"""Unit tests for parallel grading against hidden test cases."""
+
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, patch
+from app.execution import ExecutionPool, ExecutionResult, UnsupportedLanguageError
+from app.grading import case_status, grade, normalize_output
+from app.models import GradeCaseMessage, GradeFinishedMessage, GradeStartedMessage, HiddenTestCase
+from app.websocket import manager
+
+DOUBLE = "n = int(input())\nprint(n * 2)"
+
+
+def cases(*pairs):
+    return [
+        HiddenTestCase(position=i, name=f"caso {i}", stdin=stdin, expected_output=expected)
+        for i, (stdin, expected) in enumerate(pairs)
+    ]
+
+
+def result(stdout="", exit_code=0, timed_out=False) -> ExecutionResult:
+    return ExecutionResult(stdout=stdout, stderr="", exit_code=exit_code, timed_out=timed_out, truncated=False, duration_ms=1.0)
+
+
+@pytest.fixture
+def pool():
+    return ExecutionPool(size=2, warm=0)
+
+
+@pytest.mark.unit
+class TestCaseStatus:
+    """Tests for output comparison."""
+    
+    def test_normalize_ignores_trailing_whitespace(self):
+        """Test trailing spaces and blank lines do not matter, inner ones do."""
+        assert normalize_output("1 \n2\n\n") == normalize_output("1\n2")
+        assert normalize_output(" 1") != normalize_output("1")
+    
+    def test_statuses(self):
+        """Test each kind of outcome maps to its status."""
+        assert case_status(result("4\n"), "4") == "passed"
+        assert case_status(result("5\n"), "4") == "failed"
+        assert case_status(result("", exit_code=1), "4") == "error"
+        assert case_status(result("", exit_code=-9, timed_out=True), "4") == "timeout"
+
+
+@pytest.mark.unit
+class TestGrade:
+    """Tests for grade()."""
+    
+    async def test_grades_all_cases_and_streams_results(self, pool):
+        """Test every case runs, each result is broadcast, and the summary is sent last."""
+        with patch.object(manager, "broadcast", new_callable=AsyncMock) as broadcast:
+            response = await grade("room-g", "python", DOUBLE, cases(("1\n", "2"), ("5\n", "10"), ("7\n", "15")), pool=pool)
+        
+        assert (response.total, response.passed, response.failed, response.skipped) == (3, 2, 1, 0)
+        assert [r.status for r in response.results] == ["passed", "passed", "failed"]
+        assert [r.name for r in response.results] == ["caso 0", "caso 1", "caso 2"]
+        
+        messages = [call.args[1] for call in broadcast.await_args_list]
+        assert all(call.args[0] == "room-g" for call in broadcast.await_args_list)
+        assert isinstance(messages[0], GradeStartedMessage) and messages[0].total == 3
+        assert sorted(m.result.index for m in messages[1:-1] if isinstance(m, GradeCaseMessage)) == [0, 1, 2]
+        assert isinstance(messages[-1], GradeFinishedMessage) and messages[-1].passed == 2
+        assert len({m.grade_id for m in messages}) == 1
+    
+    async def test_hidden_data_is_not_broadcast(self, pool):
+        """Test stdin and expected output never reach the room."""
+        with patch.object(manager, "broadcast", new_callable=AsyncMock) as broadcast:
+            await grade("room-g", "python", DOUBLE, cases(("123456\n", "246912")), pool=pool)
+        
+        frames = "".join(call.args[1].model_dump_json() for call in broadcast.await_args_list)
+        assert "123456" not in frames
+        assert "246912" not in frames
+    
+    async def test_stop_on_failure_skips_remaining(self, pool):
+        """Test the first failing case cancels the ones not yet finished."""
+        slow_cases = cases(("0\n", "wrong"), *[("1\n", "2")] * 5)
+        with patch.object(manager, "broadcast", new_callable=AsyncMock), \
+                patch.object(pool, "run", side_effect=self._fail_first_then_hang):
+            response = await grade("room-g", "python", DOUBLE, slow_cases, stop_on_failure=True, pool=pool)
+        
+        assert response.results[0].status == "failed"
+        assert response.skipped == 5
+        assert response.failed == 1
+    
+    @staticmethod
+    async def _fail_first_then_hang(language, code, stdin, timeout):
+        if stdin == "0\n":
+            return result("0\n")
+        await asyncio.sleep(60)
+    
+    async def test_per_case_timeout(self, pool):
+        """Test a case running past its timeout is reported as timeout."""
+        with patch.object(manager, "broadcast", new_callable=AsyncMock):
+            response = await grade(
+                "room-g", "python", "while True:\n    pass", cases(("", "")), timeout=0.3, pool=pool
+            )
+        
+        assert response.results[0].status == "timeout"
+    
+    async def test_unsupported_language(self, pool):
+        """Test grading a language without runtime fails before announcing anything."""
+        with patch.object(manager, "broadcast", new_callable=AsyncMock) as broadcast:
+            with pytest.raises(UnsupportedLanguageError):
+                await grade("room-g", "java", "class Main {}", cases(("", "")), pool=pool)
+        
+        broadcast.assert_not_awaited()
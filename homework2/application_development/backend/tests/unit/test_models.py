@@ -13,6 +13,8 @@ from app.models import (
     UserJoinedMessage,
     UserLeftMessage,
     ErrorMessage,
+    CursorChangeMessage,
+    inbound_message_adapter,
 )
 
 
@@ -219,3 +221,38 @@ class TestErrorMessage:
         assert message.type == "error"
         assert message.message == "Something went wrong"
 
+
+
+class TestInboundMessageAdapter:
+    """Tests for the discriminated-union decoder of inbound WebSocket frames."""
+    
+    def test_decode_code_change_diff(self):
+        """Test raw JSON decodes straight into CodeChangeMessage."""
+        message = inbound_message_adapter.validate_json(
+            '{"type": "code_change", "from_pos": 3, "to_pos": 3, "insert": "a"}'
+        )
+        assert isinstance(message, CodeChangeMessage)
+        assert message.from_pos == 3
+        assert message.insert == "a"
+    
+    def test_decode_cursor_change(self):
+        """Test cursor_change frames decode into CursorChangeMessage."""
+        message = inbound_message_adapter.validate_json('{"type": "cursor_change", "line": 2, "column": 4}')
+        assert isinstance(message, CursorChangeMessage)
+        assert (message.line, message.column) == (2, 4)
+    
+    def test_decode_leave(self):
+        """Test leave frames decode into LeaveMessage."""
+        message = inbound_message_adapter.validate_json('{"type": "leave"}')
+        assert isinstance(message, LeaveMessage)
+    
+    def test_decode_unknown_type(self):
+        """Test unknown types are rejected by the discriminator."""
+        with pytest.raises(ValidationError) as exc_info:
+            inbound_message_adapter.validate_json('{"type": "unknown_type"}')
+        assert exc_info.value.errors()[0]["type"] == "union_tag_invalid"
+    
+    def test_decode_invalid_json(self):
+        """Test malformed JSON raises ValidationError."""
+        with pytest.raises(ValidationError):
+            inbound_message_adapter.validate_json("not valid json {")
@@ -0,0 +1,146 @@
+"""Unit tests for token-bucket rate limiting of WebSocket messages."""
+
+import json
+import pytest
+from unittest.mock import AsyncMock, patch
+from app.metrics import metrics
+from app.ratelimit import TokenBucket
+from app.websocket import Connection, ConnectionManager, websocket_endpoint, manager
+
+
+class FakeClock:
+    """Manually advanced monotonic clock."""
+    
+    def __init__(self):
+        self.now = 0.0
+    
+    def __call__(self):
+        return self.now
+
+
+@pytest.mark.unit
+class TestTokenBucket:
+    """Tests for TokenBucket."""
+    
+    def test_try_acquire_until_empty(self):
+        """Test burst capacity is consumed and then refused."""
+        bucket = TokenBucket(rate=1, capacity=2, clock=FakeClock())
+        assert bucket.try_acquire()
+        assert bucket.try_acquire()
+        assert not bucket.try_acquire()
+    
+    def test_refill_over_time(self):
+        """Test tokens refill at the configured rate up to capacity."""
+        clock = FakeClock()
+        bucket = TokenBucket(rate=10, capacity=5, clock=clock)
+        for _ in range(5):
+            bucket.try_acquire()
+        clock.now = 0.2
+        assert bucket.available() == pytest.approx(2)
+        clock.now = 10
+        assert bucket.available() == 5
+    
+    def test_reserve_returns_wait_time(self):
+        """Test reserve goes into debt and reports the wait."""
+        bucket = TokenBucket(rate=10, capacity=1, clock=FakeClock())
+        assert bucket.reserve() == 0.0
+        assert bucket.reserve() == pytest.approx(0.1)
+        assert bucket.reserve() == pytest.approx(0.2)
+
+
+@pytest.mark.unit
+class TestConnectionManagerRateLimits:
+    """Tests for per-connection and per-room limits in ConnectionManager."""
+    
+    def setup_method(self):
+        metrics.reset()
+    
+    def test_cursor_over_connection_limit_is_dropped(self):
+        """Test cursor updates beyond the connection burst are dropped and counted."""
+        manager = ConnectionManager()
+        websocket = AsyncMock()
+        manager.connection_buckets[websocket] = {
+            "code_change": TokenBucket(1, 1),
+            "cursor_change": TokenBucket(0.001, 2),
+        }
+        assert manager.allow_cursor_change(websocket, "room-1")
+        assert manager.allow_cursor_change(websocket, "room-1")
+        assert not manager.allow_cursor_change(websocket, "room-1")
+        assert metrics.counters["ws_cursor_dropped_total"] == 1
+    
+    def test_room_limit_is_shared(self):
+        """Test the room bucket limits the sum of all connections."""
+        manager = ConnectionManager()
+        ws1, ws2 = AsyncMock(), AsyncMock()
+        manager.room_buckets["room-1"] = {
+            "code_change": TokenBucket(1, 1),
+            "cursor_change": TokenBucket(0.001, 1),
+        }
+        assert manager.allow_cursor_change(ws1, "room-1")
+        assert not manager.allow_cursor_change(ws2, "room-1")
+    
+    def test_code_change_over_limit_reports_backpressure(self):
+        """Test code changes beyond the limit are delayed, not refused."""
+        manager = ConnectionManager()
+        websocket = AsyncMock()
+        manager.connection_buckets[websocket] = {
+            "code_change": TokenBucket(10, 1),
+            "cursor_change": TokenBucket(1, 1),
+        }
+        assert manager.reserve_code_change(websocket, "room-1") == 0.0
+        assert manager.reserve_code_change(websocket, "room-1") > 0
+        assert metrics.counters["ws_code_backpressure_total"] == 1
+    
+    def test_disconnect_releases_buckets(self):
+        """Test buckets are removed with the connection and the empty room."""
+        manager = ConnectionManager()
+        websocket = AsyncMock()
+        manager.active_connections["room-1"] = {websocket}
+        manager.connections[websocket] = Connection("u1", "a", "room-1")
+        manager.allow_cursor_change(websocket, "room-1")
+        manager.disconnect(websocket)
+        assert websocket not in manager.connection_buckets
+        assert "room-1" not in manager.room_buckets
+    
+    @pytest.mark.asyncio
+    async def test_endpoint_sends_backpressure_and_waits(self):
+        """Test websocket_endpoint signals back-pressure and still broadcasts the diff."""
+        websocket = AsyncMock()
+        websocket.receive_text = AsyncMock(side_effect=[
+            json.dumps({"type": "join", "username": "testuser"}),
+            json.dumps({"type": "code_change", "from_pos": 0, "to_pos": 0, "insert": "a"}),
+            json.dumps({"type": "leave"})
+        ])
+        room_id = "test-room-backpressure"
+        
+        with patch.object(manager, 'connect', new_callable=AsyncMock, return_value="user-123"), \
+             patch.object(manager, 'disconnect', return_value=None), \
+             patch.object(manager, 'reserve_code_change', return_value=0.25), \
+             patch.object(manager, 'broadcast_code_change', new_callable=AsyncMock) as mock_broadcast, \
+             patch('app.websocket.asyncio.sleep', new_callable=AsyncMock) as mock_sleep:
+            
+            await websocket_endpoint(websocket, room_id)
+            
+            sent = json.loads(websocket.send_text.call_args_list[0][0][0])
+            assert sent == {"type": "backpressure", "retry_after_ms": 250}
+            mock_sleep.assert_called_once_with(0.25)
+            mock_broadcast.assert_called_once()
+    
+    @pytest.mark.asyncio
+    async def test_endpoint_drops_cursor_over_limit(self):
+        """Test websocket_endpoint skips the broadcast of a dropped cursor update."""
+        websocket = AsyncMock()
+        websocket.receive_text = AsyncMock(side_effect=[
+            json.dumps({"type": "join", "username": "testuser"}),
+            json.dumps({"type": "cursor_change", "line": 1, "column": 0}),
+            json.dumps({"type": "leave"})
+        ])
+        
+        with patch.object(manager, 'connect', new_callable=AsyncMock, return_value="user-123"), \
+             patch.object(manager, 'disconnect', return_value=None), \
+             patch.object(manager, 'allow_cursor_change', return_value=False), \
+             patch.object(manager, 'broadcast_cursor_change', new_callable=AsyncMock) as mock_broadcast:
+            
+            await websocket_endpoint(websocket, "test-room-cursor-drop")
+            
+            mock_broadcast.assert_not_called()
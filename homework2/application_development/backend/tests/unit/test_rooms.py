@@ -0,0 +1,468 @@
+"""Unit tests for in-memory room document state."""
+
+import random
+import pytest
+from datetime import UTC, datetime, timedelta
+from unittest.mock import MagicMock, patch
+from sqlalchemy.exc import OperationalError
+from app.models import CodeChangeMessage
+from app.rooms import (
+    LineIndex,
+    OpLog,
+    Room,
+    RoomGoneError,
+    SpilledRoom,
+    is_keystroke,
+    merge_code_changes,
+    load_room,
+    rehydrate_room,
+    save_room_texts,
+    save_room_texts_by_id,
+    session_id_for_room,
+)
+
+
+@pytest.mark.unit
+class TestRoom:
+    """Tests for Room.apply."""
+    
+    def test_apply_full_code(self):
+        """Test that a full code change replaces the text and bumps the version."""
+        room = Room("room-123", text="old")
+        
+        version = room.apply(CodeChangeMessage(code="new", cursor_position=0))
+        
+        assert version == 1
+        assert room.text == "new"
+        assert room.dirty is True
+    
+    def test_apply_diff(self):
+        """Test applying an insert/replace diff."""
+        room = Room("room-123", text="hello world")
+        
+        room.apply(CodeChangeMessage(from_pos=6, to_pos=11, insert="there"))
+        
+        assert room.text == "hello there"
+        assert room.version == 1
+    
+    def test_apply_diff_clamps_positions(self):
+        """Test that out-of-range positions are clamped like String.slice."""
+        room = Room("room-123", text="abc")
+        
+        room.apply(CodeChangeMessage(from_pos=10, to_pos=20, insert="d"))
+        
+        assert room.text == "abcd"
+    
+    def test_apply_empty_change_keeps_version(self):
+        """Test that a change without code or diff does not bump the version."""
+        room = Room("room-123", text="abc", version=4)
+        
+        assert room.apply(CodeChangeMessage()) == 4
+        assert room.dirty is False
+    
+    def test_session_id_for_room(self):
+        """Test extracting the session_id from a room_id."""
+        assert session_id_for_room("room-abc") == "abc"
+        assert session_id_for_room("other") is None
+
+
+@pytest.mark.unit
+class TestOpLog:
+    """Tests for the per-room op ring buffer."""
+    
+    def test_since_returns_missing_ops_in_order(self):
+        """Test that only ops after the given version are returned."""
+        log = OpLog(capacity=4)
+        for version in range(1, 4):
+            log.append(version, f"op{version}")
+        
+        assert log.since(1) == ["op2", "op3"]
+        assert log.since(3) == []
+    
+    def test_since_outside_window(self):
+        """Test that versions overwritten by the ring (or in the future) need a snapshot."""
+        log = OpLog(capacity=3)
+        for version in range(1, 7):
+            log.append(version, f"op{version}")
+        
+        assert log.since(2) is None
+        assert log.since(3) == ["op4", "op5", "op6"]
+        assert log.since(7) is None
+    
+    def test_starts_at_initial_version(self):
+        """Test a log for a room loaded at a non-zero version."""
+        log = OpLog(capacity=2, version=10)
+        log.append(11, "op11")
+        
+        assert log.since(10) == ["op11"]
+        assert log.since(9) is None
+    
+    def test_append_rejects_gaps(self):
+        """Test that versions must be appended consecutively."""
+        log = OpLog(capacity=2)
+        
+        with pytest.raises(ValueError):
+            log.append(2, "op2")
+    
+    def test_room_ops_since_requires_same_epoch(self):
+        """Test that a client from another epoch gets a snapshot."""
+        room = Room("room-123")
+        room.record(room.apply(CodeChangeMessage(code="a", cursor_position=0)), "op1")
+        
+        assert room.ops_since(room.epoch, 0) == ["op1"]
+        assert room.ops_since("other-epoch", 0) is None
+        assert room.ops_since(room.epoch, None) is None
+
+
+def reference_position(text: str, offset: int):
+    before = text[:offset]
+    return before.count("\n") + 1, offset - (before.rfind("\n") + 1)
+
+
+@pytest.mark.unit
+class TestRoomMemory:
+    """Tests for the memory accounting of rooms."""
+    
+    def test_op_log_tracks_overwritten_frames(self):
+        """Test that the frame bytes follow the ring as slots are reused."""
+        log = OpLog(capacity=2)
+        empty = log.memory_bytes()
+        log.append(1, "a" * 100)
+        log.append(2, "b" * 100)
+        full = log.memory_bytes()
+        log.append(3, "c")
+        
+        assert full >= empty + 200
+        assert log.memory_bytes() < full - 90
+    
+    def test_room_grows_with_its_document(self):
+        """Test that a longer document and more ops cost more bytes."""
+        room = Room("room-1", text="x = 1\n")
+        before = room.memory_bytes()
+        room.apply(CodeChangeMessage(code="x = 1\n" * 1000))
+        room.record(room.version, "{}" * 100)
+        
+        assert room.memory_bytes() > before + 6000
+    
+    def test_edits_mark_room_used(self):
+        """Test that applying an op refreshes last_used."""
+        room = Room("room-1")
+        room.last_used = 0
+        room.apply(CodeChangeMessage(from_pos=0, to_pos=0, insert="a"))
+        assert room.last_used > 0
+
+
+@pytest.mark.unit
+class TestLineIndex:
+    """Tests for the incremental line-start index."""
+    
+    def test_position_and_offset(self):
+        """Test conversions on a small document (lines from 1, columns from 0)."""
+        index = LineIndex("ab\ncde\n\nf")
+        
+        assert index.line_count == 4
+        assert index.position(0) == (1, 0)
+        assert index.position(2) == (1, 2)
+        assert index.position(3) == (2, 0)
+        assert index.position(7) == (3, 0)
+        assert index.position(9) == (4, 1)
+        assert index.offset(2, 1) == 4
+        assert index.offset(4, 0) == 8
+    
+    def test_clamps_like_the_editor(self):
+        """Test that out-of-range positions land on the nearest valid one."""
+        index = LineIndex("ab\ncde")
+        
+        assert index.position(-5) == (1, 0)
+        assert index.position(100) == (2, 3)
+        assert index.offset(1, 50) == 2  # End of line 1, before its newline
+        assert index.offset(9, 0) == 3
+        assert index.offset(0, -1) == 0
+    
+    def test_trailing_newline_and_empty_document(self):
+        """Test the empty last line after a trailing newline, and an empty document."""
+        assert LineIndex("a\n").position(2) == (2, 0)
+        empty = LineIndex("")
+        assert empty.line_count == 1
+        assert empty.position(0) == (1, 0)
+        assert empty.offset(1, 3) == 0
+    
+    def test_replace_within_a_line(self):
+        """Test a keystroke that does not add or remove lines."""
+        index = LineIndex("ab\ncd")
+        
+        index.replace(1, 1, "xyz")  # "axyzb\ncd"
+        
+        assert index.line_count == 2
+        assert index.position(6) == (2, 0)
+        assert index.offset(2, 2) == 8
+    
+    def test_replace_adding_and_removing_lines(self):
+        """Test edits that split and join lines."""
+        index = LineIndex("ab\ncd")
+        
+        index.replace(1, 1, "\n\n")  # "a\n\nb\ncd"
+        assert index.line_count == 4
+        assert index.position(3) == (3, 0)
+        
+        index.replace(1, 4, "")  # "a\ncd"
+        assert index.line_count == 2
+        assert index.position(2) == (2, 0)
+    
+    def test_matches_rescanning_after_random_edits(self):
+        """Test the index against a full rescan over many random diffs, across chunk splits."""
+        rng = random.Random(7)
+        text = "x\n" * 20
+        index = LineIndex(text, chunk_lines=3)
+        for _ in range(300):
+            from_pos = rng.randint(0, len(text))
+            to_pos = rng.randint(from_pos, min(len(text), from_pos + 6))
+            insert = "".join(rng.choice("ab\n") for _ in range(rng.randint(0, 5)))
+            text = text[:from_pos] + insert + text[to_pos:]
+            index.replace(from_pos, to_pos, insert)
+            
+            assert index.line_count == text.count("\n") + 1
+            for offset in range(0, len(text) + 1, 3):
+                line, column = reference_position(text, offset)
+                assert index.position(offset) == (line, column)
+                assert index.offset(line, column) == offset
+    
+    def test_deletes_compact_chunks(self):
+        """Test that chunks left short by deletes are merged back."""
+        text = "x\n" * 80
+        index = LineIndex(text, chunk_lines=4)
+        # Fold the four lines of every chunk into one, last chunk first, each within its chunk
+        for chunk in reversed(range(20)):
+            text = text[:8 * chunk] + text[8 * chunk + 7:]
+            index.replace(8 * chunk, 8 * chunk + 7, "")
+        
+        assert index.line_count == 21
+        assert len(index._chunks) <= 2 * (index.line_count // 4 + 1)
+        for offset in range(len(text) + 1):
+            assert index.position(offset) == reference_position(text, offset)
+    
+    def test_room_builds_index_on_first_lookup(self):
+        """Test that rooms whose index is never queried do not maintain one."""
+        room = Room("room-123", text="ab")
+        room.apply(CodeChangeMessage(from_pos=2, to_pos=2, insert="\ncd"))
+        
+        assert room._lines is None
+        assert room.lines.position(len(room.text)) == (2, 2)
+    
+    def test_room_keeps_index_in_sync(self):
+        """Test that Room.apply updates the index for diffs and full code changes."""
+        room = Room("room-123", text="ab")
+        assert room.lines.line_count == 1
+        
+        room.apply(CodeChangeMessage(from_pos=2, to_pos=5, insert="\ncd"))
+        assert room.lines.position(len(room.text)) == (2, 2)
+        
+        room.apply(CodeChangeMessage(code="x\ny\nz"))
+        assert room.lines.line_count == 3
+
+
+def keystroke(from_pos: int, to_pos: int, insert: str, code=None) -> CodeChangeMessage:
+    return CodeChangeMessage(from_pos=from_pos, to_pos=to_pos, insert=insert, code=code)
+
+
+def applied(text: str, *messages: CodeChangeMessage) -> str:
+    room = Room("room-123", text=text)
+    for message in messages:
+        room.apply(message)
+    return room.text
+
+
+@pytest.mark.unit
+class TestMergeCodeChanges:
+    """Tests for keystroke coalescing."""
+    
+    def test_is_keystroke(self):
+        """Test that only single-character inserts/deletes qualify."""
+        assert is_keystroke(keystroke(0, 0, "a"))
+        assert is_keystroke(keystroke(2, 3, ""))
+        assert is_keystroke(keystroke(2, 3, "b"))
+        assert not is_keystroke(keystroke(0, 0, ""))
+        assert not is_keystroke(keystroke(0, 0, "ab"))
+        assert not is_keystroke(CodeChangeMessage(code="abc"))
+    
+    def test_typing_merges_into_one_insert(self):
+        """Test that typing "hello" becomes a single insert."""
+        merged = keystroke(3, 3, "h")
+        for index, char in enumerate("ello", start=4):
+            merged = merge_code_changes(merged, keystroke(index, index, char))
+        
+        assert (merged.from_pos, merged.to_pos, merged.insert) == (3, 3, "hello")
+        assert applied("abc", merged) == "abchello"
+    
+    def test_backspace_merges(self):
+        """Test that deleting typed text, and then text before it, folds into the same op."""
+        merged = merge_code_changes(keystroke(3, 3, "x"), keystroke(3, 4, ""))
+        merged = merge_code_changes(merged, keystroke(2, 3, ""))
+        
+        assert (merged.from_pos, merged.to_pos, merged.insert, merged.delete_length) == (2, 3, "", 1)
+        assert applied("abcd", merged) == "abd"
+    
+    def test_distant_edit_is_not_merged(self):
+        """Test that an edit away from the pending one is not merged."""
+        assert merge_code_changes(keystroke(3, 3, "x"), keystroke(10, 10, "y")) is None
+        assert merge_code_changes(keystroke(3, 3, "x"), keystroke(0, 0, "y")) is None
+    
+    def test_full_code_keeps_the_latest(self):
+        """Test that changes carrying the full code keep the later code."""
+        merged = merge_code_changes(keystroke(0, 0, "a", code="a"), keystroke(1, 1, "b", code="ab"))
+        
+        assert merged.code == "ab"
+        assert merge_code_changes(keystroke(0, 0, "a", code="a"), keystroke(1, 1, "b")) is None
+    
+    def test_merged_op_keeps_first_timestamp(self):
+        """Test that a merged op keeps the timestamp of the keystroke that started it."""
+        started = datetime(2026, 1, 1, 12, 0, 0, tzinfo=UTC)
+        first = keystroke(0, 0, "a")
+        first.timestamp = started
+        second = keystroke(1, 1, "b")
+        second.timestamp = started + timedelta(milliseconds=80)
+        
+        assert merge_code_changes(first, second).timestamp == started
+    
+    def test_merged_op_matches_applying_each(self):
+        """Test that a merged op has the same effect as its keystrokes, over random edits."""
+        rng = random.Random(11)
+        for _ in range(500):
+            text = "".join(rng.choice("ab") for _ in range(rng.randint(0, 8)))
+            position = rng.randint(0, len(text))
+            merged = keystroke(position, min(position + rng.randint(0, 1), len(text)), rng.choice(["", "x"]))
+            if not is_keystroke(merged):
+                continue
+            expected = applied(text, merged)
+            for _ in range(5):
+                start = rng.randint(0, len(expected))
+                second = keystroke(start, min(start + rng.randint(0, 1), len(expected)), rng.choice(["", "y"]))
+                candidate = merge_code_changes(merged, second) if is_keystroke(second) else None
+                if candidate is None:
+                    break
+                merged, expected = candidate, applied(expected, second)
+                assert applied(text, merged) == expected
+
+
+@pytest.mark.unit
+class TestLoadRoom:
+    """Tests for load_room."""
+    
+    def test_load_room_from_session(self):
+        """Test that the room starts from the stored session code."""
+        db = MagicMock()
+        db.query.return_value.filter.return_value.first.return_value = MagicMock(code="print(1)", language="javascript")
+        
+        with patch("app.rooms.SessionLocal", return_value=db):
+            room = load_room("room-123")
+        
+        assert room.text == "print(1)"
+        assert room.language == "javascript"
+        assert room.version == 0
+        db.close.assert_called_once()
+    
+    def test_load_room_without_session(self):
+        """Test that unknown rooms start empty."""
+        db = MagicMock()
+        db.query.return_value.filter.return_value.first.return_value = None
+        
+        with patch("app.rooms.SessionLocal", return_value=db):
+            room = load_room("room-123")
+        
+        assert room.text == ""
+        assert room.language == "python"
+    
+    def test_load_room_database_error(self):
+        """Test that database errors fall back to an empty room."""
+        db = MagicMock()
+        db.query.side_effect = OperationalError("SELECT", {}, Exception("db down"))
+        
+        with patch("app.rooms.SessionLocal", return_value=db):
+            room = load_room("room-123")
+        
+        assert room.text == ""
+        db.close.assert_called_once()
+
+
+@pytest.mark.unit
+class TestRehydrateRoom:
+    """Tests for rehydrate_room."""
+    
+    def test_keeps_epoch_and_version(self):
+        """Test that a rehydrated room continues the spilled room's versions."""
+        spilled = SpilledRoom(Room("room-123", text="old", language="javascript", version=7))
+        db = MagicMock()
+        db.query.return_value.filter.return_value.first.return_value = MagicMock(code="saved")
+        
+        with patch("app.rooms.SessionLocal", return_value=db):
+            room = rehydrate_room(spilled)
+        
+        assert (room.text, room.language, room.version, room.epoch) == ("saved", "javascript", 7, spilled.epoch)
+        assert room.ops.since(7) == []
+        db.close.assert_called_once()
+    
+    def test_deleted_session_is_reported(self):
+        """Test that a room whose session is gone is not brought back as an empty document."""
+        spilled = SpilledRoom(Room("room-123", text="old", version=7))
+        db = MagicMock()
+        db.query.return_value.filter.return_value.first.return_value = None
+        
+        with patch("app.rooms.SessionLocal", return_value=db):
+            with pytest.raises(RoomGoneError):
+                rehydrate_room(spilled)
+        db.close.assert_called_once()
+    
+    def test_database_error_is_raised(self):
+        """Test that a failed read leaves the decision to the caller instead of returning an empty room."""
+        spilled = SpilledRoom(Room("room-123", text="old", version=7))
+        db = MagicMock()
+        db.query.side_effect = OperationalError("SELECT", {}, Exception("db down"))
+        
+        with patch("app.rooms.SessionLocal", return_value=db):
+            with pytest.raises(OperationalError):
+                rehydrate_room(spilled)
+        db.close.assert_called_once()
+
+
+@pytest.mark.unit
+class TestSaveRoomTexts:
+    """Tests for save_room_texts."""
+    
+    def test_saves_all_rooms_in_one_commit(self):
+        """Test that every matching session is updated and committed once."""
+        db = MagicMock()
+        sessions = [MagicMock(room_id="room-1"), MagicMock(room_id="room-2")]
+        db.query.return_value.filter.return_value.all.return_value = sessions
+        
+        with patch("app.rooms.SessionLocal", return_value=db):
+            saved = save_room_texts({"room-1": "a", "room-2": "b"})
+        
+        assert saved == 2
+        assert [s.code for s in sessions] == ["a", "b"]
+        assert sessions[0].last_saved_at is not None
+        db.commit.assert_called_once()
+        db.close.assert_called_once()
+    
+    def test_nothing_to_save(self):
+        """Test that an empty batch does not touch the database."""
+        with patch("app.rooms.SessionLocal") as session_local:
+            assert save_room_texts({}) == 0
+        session_local.assert_not_called()
+    
+    def test_database_error(self):
+        """Test that a failed write is rolled back and reported."""
+        db = MagicMock()
+        db.commit.side_effect = OperationalError("UPDATE", {}, Exception("db down"))
+        db.query.return_value.filter.return_value.all.return_value = []
+        
+        with patch("app.rooms.SessionLocal", return_value=db):
+            assert save_room_texts({"room-1": "a"}) == -1
+        db.rollback.assert_called_once()
+    
+    def test_reports_saved_room_ids(self):
+        """Test that save_room_texts_by_id names the rooms that had a session to write to."""
+        db = MagicMock()
+        db.query.return_value.filter.return_value.all.return_value = [MagicMock(room_id="room-1")]
+        
+        with patch("app.rooms.SessionLocal", return_value=db):
+            assert save_room_texts_by_id({"room-1": "a", "room-2": "b"}) == {"room-1"}
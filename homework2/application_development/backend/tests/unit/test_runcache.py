@@ -0,0 +1,107 @@
+"""Unit tests for the execution result cache."""
+
+import os
+import pytest
+from app.metrics import metrics
+from app.runcache import ResultCache, cache_key
+
+
+def result(stdout: str = "ok\n") -> dict:
+    return {"stdout": stdout, "stderr": "", "exit_code": 0, "timed_out": False, "truncated": False, "duration_ms": 1.0}
+
+
+@pytest.mark.unit
+class TestCacheKey:
+    """Tests for cache_key."""
+    
+    def test_same_inputs_same_key(self):
+        """Test identical runs map to the same key."""
+        assert cache_key("python", "print(1)", "") == cache_key("python", "print(1)", "")
+    
+    def test_every_part_matters(self):
+        """Test language, code and stdin all change the key, without ambiguity at the boundaries."""
+        keys = {
+            cache_key("python", "print(1)", ""),
+            cache_key("javascript", "print(1)", ""),
+            cache_key("python", "print(2)", ""),
+            cache_key("python", "print(1)", "x"),
+            cache_key("python", "print(1", ")"),
+        }
+        assert len(keys) == 5
+
+
+@pytest.mark.unit
+class TestResultCache:
+    """Tests for ResultCache."""
+    
+    @pytest.fixture(autouse=True)
+    def reset_metrics(self):
+        metrics.reset()
+        yield
+        metrics.reset()
+    
+    async def test_hit_and_miss_metrics(self):
+        """Test hits return the stored result and the hit rate is published."""
+        cache = ResultCache(max_bytes=10_000)
+        
+        assert await cache.get("a") is None
+        await cache.put("a", result())
+        assert await cache.get("a") == result()
+        
+        snapshot = metrics.snapshot()
+        assert snapshot["counters"]["exec_cache_hits_total"] == 1
+        assert snapshot["counters"]["exec_cache_misses_total"] == 1
+        assert snapshot["gauges"]["exec_cache_hit_rate"] == 0.5
+    
+    async def test_evicts_least_recently_used(self):
+        """Test the memory budget evicts the least recently used entry first."""
+        cache = ResultCache(max_bytes=3 * 300)
+        for key in ("a", "b", "c"):
+            await cache.put(key, result())
+        await cache.get("a")
+        
+        await cache.put("d", result())
+        
+        assert await cache.get("b") is None
+        assert await cache.get("a") is not None
+        assert cache.size <= cache.max_bytes
+    
+    async def test_oversized_results_are_not_cached(self):
+        """Test a result larger than the whole budget is skipped."""
+        cache = ResultCache(max_bytes=1_000)
+        await cache.put("big", result("x" * 2_000))
+        
+        assert len(cache) == 0
+    
+    async def test_spills_to_disk_and_promotes(self, tmp_path):
+        """Test evicted entries are written to disk and served (and promoted) on the next hit."""
+        cache = ResultCache(max_bytes=300, directory=str(tmp_path))
+        await cache.put("aa11", result("first\n"))
+        await cache.put("bb22", result("second\n"))
+        
+        assert os.path.exists(tmp_path / "aa" / "aa11.json")
+        assert await cache.get("aa11") == result("first\n")
+        assert metrics.snapshot()["counters"]["exec_cache_disk_hits_total"] == 1
+        # Promoted back to memory, which spilled the other entry
+        assert not os.path.exists(tmp_path / "aa" / "aa11.json")
+        assert os.path.exists(tmp_path / "bb" / "bb22.json")
+    
+    async def test_disk_survives_restart(self, tmp_path):
+        """Test a new cache on the same directory finds entries spilled by a previous one."""
+        first = ResultCache(max_bytes=300, directory=str(tmp_path))
+        await first.put("aa11", result("first\n"))
+        await first.put("bb22", result("second\n"))
+        
+        second = ResultCache(max_bytes=300, directory=str(tmp_path))
+        
+        assert await second.get("aa11") == result("first\n")
+    
+    async def test_disk_budget(self, tmp_path):
+        """Test the oldest spilled files are removed past the disk budget."""
+        cache = ResultCache(max_bytes=300, directory=str(tmp_path), disk_max_bytes=250)
+        for key in ("aa11", "bb22", "cc33", "dd44"):
+            await cache.put(key, result())
+        
+        assert cache.disk_size <= 250
+        assert not os.path.exists(tmp_path / "aa" / "aa11.json")
+        assert os.path.exists(tmp_path / "cc" / "cc33.json")
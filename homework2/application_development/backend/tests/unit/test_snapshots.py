@@ -0,0 +1,76 @@
+"""Unit tests for memory-mapped room snapshots."""
+
+import pytest
+from app.models import CodeChangeMessage
+from app.rooms import Room
+from app.snapshots import capture, read_snapshot, write_snapshot
+
+
+def make_room(room_id: str, text: str) -> Room:
+    room = Room(room_id, text="", language="javascript")
+    for char in text:
+        message = CodeChangeMessage(from_pos=len(room.text), to_pos=len(room.text), insert=char)
+        room.record(room.apply(message), message.model_dump_json())
+    return room
+
+
+@pytest.mark.unit
+class TestSnapshots:
+    """Tests for write_snapshot/read_snapshot."""
+    
+    def test_roundtrip(self, tmp_path):
+        """Test that text, version, epoch, dirty flag and op log survive a restart."""
+        path = str(tmp_path / "rooms.snap")
+        rooms = {"room-1": make_room("room-1", "héllo"), "room-2": Room("room-2", text="clean")}
+        
+        write_snapshot(path, capture(rooms))
+        restored = read_snapshot(path)
+        
+        assert set(restored) == {"room-1", "room-2"}
+        room = restored["room-1"]
+        assert room.text == "héllo"
+        assert room.language == "javascript"
+        assert room.version == 5
+        assert room.epoch == rooms["room-1"].epoch
+        assert room.dirty is True
+        assert room.ops_since(room.epoch, 3) == rooms["room-1"].ops_since(room.epoch, 3)
+        assert restored["room-2"].dirty is False
+        assert restored["room-2"].version == 0
+    
+    def test_restored_room_keeps_applying_ops(self, tmp_path):
+        """Test that a restored room continues its version sequence and op log."""
+        path = str(tmp_path / "rooms.snap")
+        write_snapshot(path, capture({"room-1": make_room("room-1", "ab")}))
+        room = read_snapshot(path)["room-1"]
+        
+        version = room.apply(CodeChangeMessage(from_pos=2, to_pos=2, insert="c"))
+        room.record(version, "op3")
+        
+        assert room.text == "abc"
+        assert version == 3
+        assert room.ops_since(room.epoch, 2) == ["op3"]
+    
+    def test_missing_file(self, tmp_path):
+        """Test that a missing snapshot restores nothing."""
+        assert read_snapshot(str(tmp_path / "missing.snap")) == {}
+    
+    def test_corrupt_file(self, tmp_path):
+        """Test that a corrupt or truncated snapshot is ignored."""
+        path = tmp_path / "rooms.snap"
+        write_snapshot(str(path), capture({"room-1": make_room("room-1", "abc")}))
+        data = path.read_bytes()
+        
+        path.write_bytes(data[:-3])
+        assert read_snapshot(str(path)) == {}
+        
+        path.write_bytes(b"XXXX" + data[4:])
+        assert read_snapshot(str(path)) == {}
+    
+    def test_write_replaces_previous_snapshot(self, tmp_path):
+        """Test that a new checkpoint replaces the old one without leaving temp files."""
+        path = tmp_path / "rooms.snap"
+        write_snapshot(str(path), capture({"room-1": make_room("room-1", "a")}))
+        write_snapshot(str(path), capture({}))
+        
+        assert read_snapshot(str(path)) == {}
+        assert [p.name for p in tmp_path.iterdir()] == ["rooms.snap"]
@@ -0,0 +1,187 @@
+"""Unit tests for read-only spectators."""
+
+import asyncio
+import json
+import pytest
+from app.models import CodeChangeMessage
+from app.rooms import Room, diff_texts
+from app.spectators import SpectatorHub
+
+
+class Watcher:
+    """Stand-in for a spectator's socket: records the frames it is sent."""
+
+    def __init__(self, fail: bool = False):
+        self.frames = []
+        self.closed = False
+        self.fail = fail
+
+    async def send(self, frame: str):
+        if self.fail:
+            raise ConnectionError("gone")
+        self.frames.append(json.loads(frame))
+
+    async def close(self):
+        self.closed = True
+
+
+def edit(room: Room, from_pos: int, to_pos: int, insert: str):
+    room.apply(CodeChangeMessage(from_pos=from_pos, to_pos=to_pos, insert=insert))
+
+
+@pytest.mark.unit
+class TestDiffTexts:
+    """Tests for diff_texts."""
+
+    @pytest.mark.parametrize("old,new", [
+        ("", ""),
+        ("", "abc"),
+        ("abc", ""),
+        ("hello world", "hello brave world"),
+        ("aaaa", "aa"),
+        ("abcabc", "abXabc"),
+        ("def f():\n    pass\n", "def f(x):\n    return x\n"),
+    ])
+    def test_replacement_turns_old_into_new(self, old, new):
+        """Test that applying the diff reproduces the new text with a minimal range."""
+        from_pos, to_pos, insert = diff_texts(old, new)
+
+        assert old[:from_pos] + insert + old[to_pos:] == new
+        assert from_pos <= to_pos
+        assert len(insert) == len(new) - len(old) + (to_pos - from_pos)
+
+    def test_unchanged_text_is_an_empty_diff(self):
+        """Test that identical texts give an empty insertion."""
+        assert diff_texts("same", "same") == (4, 4, "")
+
+
+@pytest.mark.unit
+class TestSpectatorHub:
+    """Tests for SpectatorHub."""
+
+    @pytest.mark.asyncio
+    async def test_join_gets_snapshot(self):
+        """Test that a new spectator is sent the document and registered."""
+        room = Room("room-1", text="print(1)", version=3)
+        hub = SpectatorHub(lambda room_id: room, interval=60)
+        watcher = Watcher()
+
+        spectator = await hub.add(room, watcher.send, watcher.close, users=[])
+
+        assert watcher.frames[0]["type"] == "snapshot"
+        assert watcher.frames[0]["code"] == "print(1)"
+        assert watcher.frames[0]["version"] == 3
+        assert hub.count("room-1") == 1
+        hub.remove("room-1", spectator)
+        await hub.close_all()
+
+    @pytest.mark.asyncio
+    async def test_ops_are_coalesced_into_one_update(self):
+        """Test that every op since the last update reaches spectators as a single diff."""
+        room = Room("room-1", text="")
+        hub = SpectatorHub(lambda room_id: room, interval=60)
+        watcher = Watcher()
+        await hub.add(room, watcher.send, watcher.close, users=[])
+
+        for index, char in enumerate("abc"):
+            edit(room, index, index, char)
+        assert await hub.publish("room-1") == 1
+
+        update = watcher.frames[-1]
+        assert update["type"] == "code_change"
+        assert (update["from_pos"], update["to_pos"], update["insert"]) == (0, 0, "abc")
+        assert update["version"] == 3
+        assert await hub.publish("room-1") == 0  # Nothing new
+        await hub.close_all()
+
+    @pytest.mark.asyncio
+    async def test_cursors_only_reach_opted_in_spectators(self):
+        """Test that editors' cursors are batched for spectators that asked for them."""
+        room = Room("room-1")
+        hub = SpectatorHub(lambda room_id: room, interval=60)
+        plain, curious = Watcher(), Watcher()
+        await hub.add(room, plain.send, plain.close, users=[])
+        await hub.add(room, curious.send, curious.close, users=[], cursors=True)
+
+        hub.note_cursor("room-1", "alice", json.dumps({"type": "cursor_change", "line": 1}))
+        hub.note_cursor("room-1", "alice", json.dumps({"type": "cursor_change", "line": 2}))
+        await hub.publish("room-1")
+
+        assert [frame["type"] for frame in plain.frames] == ["snapshot"]
+        assert curious.frames[1:] == [{"type": "cursor_change", "line": 2}]
+        await hub.close_all()
+
+    @pytest.mark.asyncio
+    async def test_failing_spectator_is_dropped(self):
+        """Test that a spectator that cannot take an update is removed and closed."""
+        room = Room("room-1")
+        hub = SpectatorHub(lambda room_id: room, interval=60)
+        healthy, broken = Watcher(), Watcher()
+        await hub.add(room, healthy.send, healthy.close, users=[])
+        await hub.add(room, broken.send, broken.close, users=[])
+        broken.fail = True
+
+        edit(room, 0, 0, "x")
+        await hub.publish("room-1")
+
+        assert broken.closed
+        assert hub.count("room-1") == 1
+        assert healthy.frames[-1]["insert"] == "x"
+        await hub.close_all()
+
+    @pytest.mark.asyncio
+    async def test_join_catches_up_with_update_sent_meanwhile(self):
+        """Test that an update streamed while a snapshot is being sent is forwarded before registering."""
+        room = Room("room-1", text="a")
+        hub = SpectatorHub(lambda room_id: room, interval=60)
+        first = Watcher()
+        await hub.add(room, first.send, first.close, users=[])
+        late = Watcher()
+
+        async def slow_send(frame):
+            await asyncio.sleep(0.01)
+            await late.send(frame)
+
+        joining = asyncio.create_task(hub.add(room, slow_send, late.close, users=[]))
+        await asyncio.sleep(0)
+        edit(room, 1, 1, "b")
+        await hub.publish("room-1")
+        await joining
+
+        text = late.frames[0]["code"]
+        for frame in late.frames[1:]:
+            text = text[:frame["from_pos"]] + frame["insert"] + text[frame["to_pos"]:]
+        assert text == "ab"
+        await hub.close_all()
+
+    @pytest.mark.asyncio
+    async def test_stream_task_publishes_and_exits(self):
+        """Test that the room's task streams at its interval and stops with the last spectator."""
+        room = Room("room-1")
+        hub = SpectatorHub(lambda room_id: room, interval=0.01)
+        watcher = Watcher()
+        spectator = await hub.add(room, watcher.send, watcher.close, users=[])
+        task = hub.rooms["room-1"].task
+
+        edit(room, 0, 0, "x")
+        await asyncio.sleep(0.05)
+        assert watcher.frames[-1]["insert"] == "x"
+
+        hub.remove("room-1", spectator)
+        await asyncio.wait_for(task, timeout=1)
+        assert hub.rooms == {}
+
+    @pytest.mark.asyncio
+    async def test_reloaded_room_is_sent_whole(self):
+        """Test that a room replaced under a new epoch reaches spectators as full code."""
+        rooms = {"room-1": Room("room-1", text="old")}
+        hub = SpectatorHub(rooms.get, interval=60)
+        watcher = Watcher()
+        await hub.add(rooms["room-1"], watcher.send, watcher.close, users=[])
+
+        rooms["room-1"] = Room("room-1", text="new")
+        await hub.publish("room-1")
+
+        assert watcher.frames[-1]["code"] == "new"
+        assert watcher.frames[-1]["from_pos"] is None
+        await hub.close_all()
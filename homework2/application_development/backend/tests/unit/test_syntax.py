@@ -0,0 +1,89 @@
+"""Unit tests for background syntax checking."""
+
+import pytest
+from app import syntax
+from app.syntax import PARSERS, check_syntax, parse_python, register_parser, run_syntax_check
+
+
+@pytest.mark.unit
+class TestParsePython:
+    """Tests for parse_python."""
+    
+    def test_valid_code_has_no_diagnostics(self):
+        """Test that code that parses yields an empty list."""
+        assert parse_python("def f(x):\n    return x * 2\n") == []
+    
+    def test_syntax_error_position(self):
+        """Test that a syntax error is reported with 1-based lines and 0-based columns."""
+        diagnostics = parse_python("x = 1\nif x\n    pass\n")
+        
+        assert len(diagnostics) == 1
+        diagnostic = diagnostics[0]
+        assert diagnostic["line"] == 2
+        assert diagnostic["column"] == 4
+        assert diagnostic["severity"] == "error"
+        assert "expected ':'" in diagnostic["message"]
+    
+    def test_indentation_error(self):
+        """Test that indentation errors are syntax diagnostics too."""
+        diagnostics = parse_python("def f():\nreturn 1\n")
+        
+        assert diagnostics[0]["line"] == 2
+    
+    def test_null_byte(self):
+        """Test that source the parser rejects outright still yields a diagnostic."""
+        diagnostics = parse_python("x = 1\0")
+        
+        assert len(diagnostics) == 1
+        assert diagnostics[0]["line"] == 1
+    
+    def test_warnings_are_not_errors(self):
+        """Test that an invalid escape sequence (a SyntaxWarning) is not reported."""
+        assert parse_python('path = "C:\\d"\n') == []
+
+
+@pytest.mark.unit
+class TestParserRegistry:
+    """Tests for the pluggable parser registry."""
+    
+    def test_python_is_registered(self):
+        """Test that Python is checked out of the box."""
+        assert PARSERS["python"] is parse_python
+    
+    def test_register_parser(self):
+        """Test that registered parsers are dispatched by language."""
+        @register_parser("testlang")
+        def parse_testlang(text):
+            return [{"line": 1, "column": 0, "end_line": 1, "end_column": 0, "message": text, "severity": "warning"}]
+        
+        try:
+            assert check_syntax("testlang", "boom")[0]["message"] == "boom"
+        finally:
+            del PARSERS["testlang"]
+
+
+@pytest.mark.unit
+class TestRunSyntaxCheck:
+    """Tests for run_syntax_check."""
+    
+    @pytest.mark.asyncio
+    async def test_parses_in_worker_process(self):
+        """Test a round trip through the process pool."""
+        try:
+            assert await run_syntax_check("python", "print(1)\n") == []
+            diagnostics = await run_syntax_check("python", "print(1\n")
+            assert diagnostics[0]["line"] == 1
+        finally:
+            syntax.shutdown()
+        assert syntax._pool is None
+    
+    @pytest.mark.asyncio
+    async def test_shutdown_joins_workers(self):
+        """Test shutdown waits for the worker processes to exit."""
+        await run_syntax_check("python", "x = 1\n")
+        processes = list(syntax._pool._processes.values())
+        
+        syntax.shutdown()
+        
+        assert processes
+        assert not any(process.is_alive() for process in processes)
@@ -0,0 +1,78 @@
+"""Unit tests for the hierarchical timing wheel."""
+
+import random
+import pytest
+from app.timingwheel import TimingWheel
+
+
+@pytest.mark.unit
+class TestTimingWheel:
+    """Tests for TimingWheel."""
+    
+    def test_expires_at_deadline(self):
+        """Test that a key expires on the tick of its deadline, not before."""
+        wheel = TimingWheel(tick=1.0, slots=8, levels=2)
+        wheel.schedule("a", 5.0)
+        
+        assert wheel.advance(4.9) == []
+        assert wheel.advance(5.0) == ["a"]
+        assert "a" not in wheel
+    
+    def test_cascades_from_higher_levels(self):
+        """Test deadlines beyond the first level are cascaded down and fire on time."""
+        wheel = TimingWheel(tick=1.0, slots=4, levels=3)
+        wheel.schedule("far", 37.0)
+        
+        assert wheel.advance(36.0) == []
+        assert wheel.advance(37.0) == ["far"]
+    
+    def test_deadline_beyond_horizon(self):
+        """Test deadlines past the top level's span still fire at the right tick."""
+        wheel = TimingWheel(tick=1.0, slots=2, levels=2)
+        wheel.schedule("beyond", 20.0)
+        
+        assert wheel.advance(19.0) == []
+        assert wheel.advance(20.0) == ["beyond"]
+    
+    def test_cancel_and_reschedule(self):
+        """Test that cancelled keys never fire and rescheduling replaces the deadline."""
+        wheel = TimingWheel(tick=1.0, slots=8, levels=2)
+        wheel.schedule("a", 3.0)
+        wheel.schedule("b", 3.0)
+        wheel.cancel("a")
+        wheel.schedule("b", 10.0)
+        
+        assert wheel.advance(9.0) == []
+        assert wheel.advance(10.0) == ["b"]
+        assert len(wheel) == 0
+    
+    def test_past_deadline_fires_on_next_tick(self):
+        """Test that a deadline already in the past fires on the next advance."""
+        wheel = TimingWheel(tick=1.0, slots=8, levels=2, start=10.0)
+        wheel.schedule("late", 2.0)
+        
+        assert wheel.advance(11.0) == ["late"]
+    
+    def test_matches_sorted_deadlines(self):
+        """Test random deadlines fire exactly on their tick across levels."""
+        rng = random.Random(7)
+        wheel = TimingWheel(tick=0.5, slots=8, levels=3)
+        deadlines = {key: rng.uniform(0, 400) for key in range(300)}
+        for key, deadline in deadlines.items():
+            wheel.schedule(key, deadline)
+        
+        fired = {}
+        now = 0.0
+        while now <= 401:
+            now += 0.5
+            for key in wheel.advance(now):
+                fired[key] = now
+        
+        assert set(fired) == set(deadlines)
+        for key, deadline in deadlines.items():
+            assert deadline <= fired[key] < deadline + 0.5
+    
+    def test_invalid_configuration(self):
+        """Test that invalid wheel parameters are rejected."""
+        with pytest.raises(ValueError):
+            TimingWheel(tick=0)
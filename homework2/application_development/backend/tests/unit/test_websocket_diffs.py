@@ -1,10 +1,12 @@
 """Unit tests for WebSocket diff functionality."""
 
+import json
 import pytest
 from unittest.mock import AsyncMock, MagicMock
 from datetime import datetime
-from app.websocket import ConnectionManager
-from app.models import CodeChangeMessage, CursorChangeMessage
+from pydantic import ValidationError
+from app.websocket import Connection, ConnectionManager, describe_decode_error
+from app.models import CodeChangeMessage, CursorChangeMessage, inbound_message_adapter
 
 
 @pytest.mark.asyncio
@@ -18,16 +20,13 @@ async def test_broadcast_code_change_with_diff():
     ws2 = AsyncMock()
     
     manager.active_connections[room_id] = {ws1, ws2}
-    manager.user_info[ws1] = {"user_id": "user1", "username": "User1", "room_id": room_id}
-    manager.user_info[ws2] = {"user_id": "user2", "username": "User2", "room_id": room_id}
+    manager.connections[ws1] = Connection("user1", "User1", room_id)
+    manager.connections[ws2] = Connection("user2", "User2", room_id)
     
     # Broadcast diff
     await manager.broadcast_code_change(
         room_id=room_id,
-        from_pos=0,
-        to_pos=5,
-        insert="hello",
-        delete_length=0,
+        message=CodeChangeMessage(from_pos=0, to_pos=5, insert="hello", delete_length=0),
         user_id="user1",
         exclude=ws1
     )
@@ -35,10 +34,12 @@ async def test_broadcast_code_change_with_diff():
     # Check that ws2 received the message
     assert ws2.send_text.called
     call_args = ws2.send_text.call_args[0][0]
-    message_data = eval(call_args) if isinstance(call_args, str) else call_args
+    message_data = json.loads(call_args)
     
     # Verify message contains diff fields
-    assert "from_pos" in str(call_args) or "from_pos" in str(message_data)
+    assert message_data["from_pos"] == 0
+    assert message_data["insert"] == "hello"
+    assert message_data["user_id"] == "user1"
 
 
 @pytest.mark.asyncio
@@ -51,14 +52,13 @@ async def test_broadcast_code_change_with_full_code():
     ws2 = AsyncMock()
     
     manager.active_connections[room_id] = {ws1, ws2}
-    manager.user_info[ws1] = {"user_id": "user1", "username": "User1", "room_id": room_id}
-    manager.user_info[ws2] = {"user_id": "user2", "username": "User2", "room_id": room_id}
+    manager.connections[ws1] = Connection("user1", "User1", room_id)
+    manager.connections[ws2] = Connection("user2", "User2", room_id)
     
     # Broadcast full code
     await manager.broadcast_code_change(
         room_id=room_id,
-        code="print('hello')",
-        cursor_position=0,
+        message=CodeChangeMessage(code="print('hello')", cursor_position=0),
         user_id="user1",
         exclude=ws1
     )
@@ -77,15 +77,17 @@ async def test_broadcast_code_change_invalid_diff_fallback():
     ws1 = AsyncMock()
     
     manager.active_connections[room_id] = {ws1}
-    manager.user_info[ws1] = {"user_id": "user1", "username": "User1", "room_id": room_id}
+    manager.connections[ws1] = Connection("user1", "User1", room_id)
     
     # Broadcast with invalid diff (to < from) but provide full code
     await manager.broadcast_code_change(
         room_id=room_id,
-        code="fallback code",
-        from_pos=10,
-        to_pos=5,  # Invalid: to < from
-        insert="test",
+        message=CodeChangeMessage(
+            code="fallback code",
+            from_pos=10,
+            to_pos=5,  # Invalid: to < from
+            insert="test"
+        ),
         user_id="user1"
     )
     
@@ -105,14 +107,13 @@ async def test_broadcast_cursor_change():
     ws2 = AsyncMock()
     
     manager.active_connections[room_id] = {ws1, ws2}
-    manager.user_info[ws1] = {"user_id": "user1", "username": "User1", "room_id": room_id}
-    manager.user_info[ws2] = {"user_id": "user2", "username": "User2", "room_id": room_id}
+    manager.connections[ws1] = Connection("user1", "User1", room_id)
+    manager.connections[ws2] = Connection("user2", "User2", room_id)
     
     # Broadcast cursor change
     await manager.broadcast_cursor_change(
         room_id=room_id,
-        line=10,
-        column=20,
+        message=CursorChangeMessage(line=10, column=20),
         user_id="user1",
         exclude=ws1
     )
@@ -132,14 +133,13 @@ async def test_broadcast_cursor_change_excludes_sender():
     ws2 = AsyncMock()
     
     manager.active_connections[room_id] = {ws1, ws2}
-    manager.user_info[ws1] = {"user_id": "user1", "username": "User1", "room_id": room_id}
-    manager.user_info[ws2] = {"user_id": "user2", "username": "User2", "room_id": room_id}
+    manager.connections[ws1] = Connection("user1", "User1", room_id)
+    manager.connections[ws2] = Connection("user2", "User2", room_id)
     
     # Broadcast cursor change excluding ws1
     await manager.broadcast_cursor_change(
         room_id=room_id,
-        line=5,
-        column=10,
+        message=CursorChangeMessage(line=5, column=10),
         user_id="user1",
         exclude=ws1
     )
@@ -212,3 +212,17 @@ def test_cursor_change_message_validation():
             column=-1  # Invalid
         )
 
+
+
+def test_describe_decode_error_unknown_type():
+    """Test unknown message types produce the 'desconocido' error text."""
+    with pytest.raises(ValidationError) as exc_info:
+        inbound_message_adapter.validate_json('{"type": "unknown_type"}')
+    assert describe_decode_error(exc_info.value) == "Tipo de mensaje desconocido: unknown_type"
+
+
+def test_describe_decode_error_invalid_field():
+    """Test field validation errors are reported as processing errors."""
+    with pytest.raises(ValidationError) as exc_info:
+        inbound_message_adapter.validate_json('{"type": "cursor_change", "line": 0, "column": 0}')
+    assert describe_decode_error(exc_info.value).startswith("Error al procesar el mensaje")
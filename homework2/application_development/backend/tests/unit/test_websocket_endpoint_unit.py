@@ -4,7 +4,9 @@ import pytest
 import json
 from unittest.mock import AsyncMock, MagicMock, patch
 from fastapi import WebSocket, WebSocketDisconnect
-from app.websocket import websocket_endpoint, manager
+from app.models import CodeChangeMessage
+from app.rooms import Room
+from app.websocket import websocket_endpoint, manager, exceeds_utf8_size
 
 
 @pytest.mark.unit
@@ -29,7 +31,7 @@ class TestWebSocketEndpointUnit:
         with patch.object(manager, 'connect', new_callable=AsyncMock) as mock_connect, \
              patch.object(manager, 'disconnect', return_value=(room_id, "user-123", "testuser")) as mock_disconnect, \
              patch.object(manager, 'broadcast_code_change', new_callable=AsyncMock) as mock_broadcast, \
-             patch.object(manager, 'broadcast_user_left', new_callable=AsyncMock) as mock_broadcast_left:
+             patch.object(manager, 'queue_user_left') as mock_queue_left:
             
             mock_connect.return_value = "user-123"
             
@@ -40,7 +42,7 @@ class TestWebSocketEndpointUnit:
             mock_connect.assert_called_once()
             mock_broadcast.assert_called_once()
             mock_disconnect.assert_called_once()
-            mock_broadcast_left.assert_called_once()  # Lines 228-229
+            mock_queue_left.assert_called_once()  # Lines 228-229
     
     @pytest.mark.asyncio
     async def test_websocket_endpoint_unknown_message_type(self):
@@ -58,7 +60,7 @@ class TestWebSocketEndpointUnit:
         
         with patch.object(manager, 'connect', new_callable=AsyncMock) as mock_connect, \
              patch.object(manager, 'disconnect', return_value=(room_id, "user-123", "testuser")) as mock_disconnect, \
-             patch.object(manager, 'broadcast_user_left', new_callable=AsyncMock):
+             patch.object(manager, 'queue_user_left'):
             
             mock_connect.return_value = "user-123"
             
@@ -83,7 +85,7 @@ class TestWebSocketEndpointUnit:
         
         with patch.object(manager, 'connect', new_callable=AsyncMock) as mock_connect, \
              patch.object(manager, 'disconnect', return_value=(room_id, "user-123", "testuser")) as mock_disconnect, \
-             patch.object(manager, 'broadcast_user_left', new_callable=AsyncMock):
+             patch.object(manager, 'queue_user_left'):
             
             mock_connect.return_value = "user-123"
             
@@ -124,7 +126,7 @@ class TestWebSocketEndpointUnit:
         
         with patch.object(manager, 'connect', new_callable=AsyncMock) as mock_connect, \
              patch.object(manager, 'disconnect', return_value=(room_id, "user-123", "testuser")) as mock_disconnect, \
-             patch.object(manager, 'broadcast_user_left', new_callable=AsyncMock) as mock_broadcast_left:
+             patch.object(manager, 'queue_user_left') as mock_queue_left:
             
             mock_connect.return_value = "user-123"
             
@@ -132,7 +134,7 @@ class TestWebSocketEndpointUnit:
             
             # Should handle WebSocketDisconnect gracefully (line 213-214)
             mock_disconnect.assert_called_once()
-            mock_broadcast_left.assert_called_once()  # Lines 228-229
+            mock_queue_left.assert_called_once()  # Lines 228-229
     
     @pytest.mark.asyncio
     async def test_websocket_endpoint_code_change_none_cursor(self):
@@ -151,16 +153,17 @@ class TestWebSocketEndpointUnit:
         with patch.object(manager, 'connect', new_callable=AsyncMock) as mock_connect, \
              patch.object(manager, 'disconnect', return_value=(room_id, "user-123", "testuser")) as mock_disconnect, \
              patch.object(manager, 'broadcast_code_change', new_callable=AsyncMock) as mock_broadcast, \
-             patch.object(manager, 'broadcast_user_left', new_callable=AsyncMock):
+             patch.object(manager, 'queue_user_left'):
             
             mock_connect.return_value = "user-123"
             
             await websocket_endpoint(websocket, room_id)
             
-            # Verify broadcast_code_change was called with cursor_position=0 (line 191)
+            # The decoded message is passed through unchanged; broadcast applies the default
             mock_broadcast.assert_called_once()
             call_args = mock_broadcast.call_args
-            assert call_args[1]['cursor_position'] == 0
+            assert isinstance(call_args[1]['message'], CodeChangeMessage)
+            assert call_args[1]['message'].cursor_position is None
     
     @pytest.mark.asyncio
     async def test_websocket_endpoint_anonymous_user(self):
@@ -177,7 +180,7 @@ class TestWebSocketEndpointUnit:
         
         with patch.object(manager, 'connect', new_callable=AsyncMock) as mock_connect, \
              patch.object(manager, 'disconnect', return_value=(room_id, "user-123", "Anonymous")) as mock_disconnect, \
-             patch.object(manager, 'broadcast_user_left', new_callable=AsyncMock):
+             patch.object(manager, 'queue_user_left'):
             
             mock_connect.return_value = "user-123"
             
@@ -206,7 +209,7 @@ class TestWebSocketEndpointUnit:
         
         with patch.object(manager, 'connect', new_callable=AsyncMock) as mock_connect, \
              patch.object(manager, 'disconnect', return_value=(room_id, "user-123", "Anonymous")) as mock_disconnect, \
-             patch.object(manager, 'broadcast_user_left', new_callable=AsyncMock):
+             patch.object(manager, 'queue_user_left'):
             
             mock_connect.return_value = "user-123"
             
@@ -232,7 +235,7 @@ class TestWebSocketEndpointUnit:
         
         with patch.object(manager, 'connect', new_callable=AsyncMock) as mock_connect, \
              patch.object(manager, 'disconnect', return_value=(room_id, "user-123", "Anonymous")) as mock_disconnect, \
-             patch.object(manager, 'broadcast_user_left', new_callable=AsyncMock):
+             patch.object(manager, 'queue_user_left'):
             
             mock_connect.return_value = "user-123"
             
@@ -280,15 +283,15 @@ class TestWebSocketEndpointUnit:
         
         with patch.object(manager, 'connect', new_callable=AsyncMock) as mock_connect, \
              patch.object(manager, 'disconnect', return_value=None) as mock_disconnect, \
-             patch.object(manager, 'broadcast_user_left', new_callable=AsyncMock) as mock_broadcast_left:
+             patch.object(manager, 'queue_user_left') as mock_queue_left:
             
             mock_connect.return_value = "user-123"
             
             await websocket_endpoint(websocket, room_id)
             
-            # Should not call broadcast_user_left when disconnect returns None (line 227)
+            # Should not call queue_user_left when disconnect returns None (line 227)
             mock_disconnect.assert_called_once()
-            mock_broadcast_left.assert_not_called()
+            mock_queue_left.assert_not_called()
     
     @pytest.mark.asyncio
     async def test_websocket_endpoint_code_change_with_zero_cursor(self):
@@ -307,14 +310,142 @@ class TestWebSocketEndpointUnit:
         with patch.object(manager, 'connect', new_callable=AsyncMock) as mock_connect, \
              patch.object(manager, 'disconnect', return_value=(room_id, "user-123", "testuser")) as mock_disconnect, \
              patch.object(manager, 'broadcast_code_change', new_callable=AsyncMock) as mock_broadcast, \
-             patch.object(manager, 'broadcast_user_left', new_callable=AsyncMock):
+             patch.object(manager, 'queue_user_left'):
             
             mock_connect.return_value = "user-123"
             
             await websocket_endpoint(websocket, room_id)
             
-            # Verify broadcast_code_change was called with cursor_position=0 (line 191)
+            # Verify broadcast_code_change was called with the typed message
             mock_broadcast.assert_called_once()
             call_args = mock_broadcast.call_args
-            assert call_args[1]['cursor_position'] == 0
+            assert call_args[1]['message'].cursor_position == 0
 
+    
+    @pytest.mark.asyncio
+    async def test_websocket_endpoint_frame_too_large_closes_1009(self):
+        """Test oversized frames close the connection with 1009 before parsing."""
+        websocket = AsyncMock()
+        websocket.accept = AsyncMock()
+        websocket.receive_text = AsyncMock(side_effect=[
+            json.dumps({"type": "join", "username": "testuser"}),
+            json.dumps({"type": "code_change", "code": "x" * 500}),
+            json.dumps({"type": "leave"})
+        ])
+        websocket.send_text = AsyncMock()
+        
+        room_id = "test-room-frame-too-large"
+        
+        with patch('app.websocket.WS_MAX_FRAME_BYTES', 200), \
+             patch('app.websocket.inbound_message_adapter') as mock_adapter, \
+             patch.object(manager, 'connect', new_callable=AsyncMock, return_value="user-123"), \
+             patch.object(manager, 'disconnect', return_value=None), \
+             patch.object(manager, 'broadcast_code_change', new_callable=AsyncMock) as mock_broadcast:
+            
+            await websocket_endpoint(websocket, room_id)
+            
+            websocket.close.assert_called_once()
+            assert websocket.close.call_args[1]["code"] == 1009
+            mock_adapter.validate_json.assert_not_called()
+            mock_broadcast.assert_not_called()
+    
+    @pytest.mark.asyncio
+    async def test_websocket_endpoint_document_too_large_closes_1009(self):
+        """Test a code change larger than the document limit closes with 1009."""
+        websocket = AsyncMock()
+        websocket.accept = AsyncMock()
+        websocket.receive_text = AsyncMock(side_effect=[
+            json.dumps({"type": "join", "username": "testuser"}),
+            json.dumps({"type": "code_change", "code": "x" * 500}),
+            json.dumps({"type": "leave"})
+        ])
+        websocket.send_text = AsyncMock()
+        
+        room_id = "test-room-document-too-large"
+        
+        with patch('app.websocket.WS_MAX_DOCUMENT_BYTES', 100), \
+             patch.object(manager, 'connect', new_callable=AsyncMock, return_value="user-123"), \
+             patch.object(manager, 'disconnect', return_value=None), \
+             patch.object(manager, 'broadcast_code_change', new_callable=AsyncMock) as mock_broadcast:
+            
+            await websocket_endpoint(websocket, room_id)
+            
+            assert websocket.close.call_args[1]["code"] == 1009
+            mock_broadcast.assert_not_called()
+    
+    def test_exceeds_utf8_size(self):
+        """Test UTF-8 size check for ASCII and multi-byte text."""
+        assert not exceeds_utf8_size("abc", 3)
+        assert exceeds_utf8_size("abcd", 3)
+        # "ñ" is 2 bytes in UTF-8
+        assert exceeds_utf8_size("ññ", 3)
+        assert not exceeds_utf8_size("ñ", 3)
+    
+    @pytest.mark.asyncio
+    async def test_websocket_endpoint_ping_gets_pong(self):
+        """Test that a client ping is answered with pong and refreshes liveness."""
+        websocket = AsyncMock()
+        websocket.receive_text = AsyncMock(side_effect=[
+            json.dumps({"type": "join", "username": "testuser"}),
+            json.dumps({"type": "ping"}),
+            json.dumps({"type": "pong"}),
+            json.dumps({"type": "leave"})
+        ])
+        websocket.send_text = AsyncMock()
+        
+        with patch.object(manager, 'connect', new_callable=AsyncMock, return_value="user-123"), \
+             patch.object(manager, 'disconnect', return_value=None), \
+             patch.object(manager, 'touch') as mock_touch:
+            
+            await websocket_endpoint(websocket, "test-room-ping")
+            
+            sent = [json.loads(call[0][0]) for call in websocket.send_text.call_args_list]
+            assert sent == [{"type": "pong"}]
+            assert mock_touch.call_count == 3
+    
+    @pytest.mark.asyncio
+    async def test_websocket_endpoint_refuses_while_draining(self):
+        """Test that new connections get a reconnect hint while the server drains."""
+        websocket = AsyncMock()
+        
+        with patch.object(manager, 'draining', True), \
+             patch.object(manager, 'connect', new_callable=AsyncMock) as mock_connect:
+            
+            await websocket_endpoint(websocket, "test-room-draining")
+            
+            mock_connect.assert_not_called()
+            assert json.loads(websocket.send_text.call_args[0][0])["type"] == "reconnect"
+            websocket.close.assert_called_once_with(code=1012)
+    
+    @pytest.mark.asyncio
+    async def test_spectator_cannot_edit(self):
+        """Test that a spectator join is served read-only and never becomes a room connection."""
+        websocket = AsyncMock()
+        websocket.accept = AsyncMock()
+        websocket.receive_text = AsyncMock(side_effect=[
+            json.dumps({"type": "join", "username": "panel", "role": "spectator"}),
+            json.dumps({"type": "code_change", "code": "print('test')"}),
+            json.dumps({"type": "leave"})
+        ])
+        websocket.send_text = AsyncMock()
+        
+        room_id = "test-room-spectator"
+        manager.rooms[room_id] = Room(room_id, text="x = 1")
+        
+        try:
+            with patch.object(manager, 'connect', new_callable=AsyncMock) as mock_connect, \
+                 patch.object(manager, 'broadcast_code_change', new_callable=AsyncMock) as mock_broadcast:
+                
+                await websocket_endpoint(websocket, room_id)
+                
+                mock_connect.assert_not_called()
+                mock_broadcast.assert_not_called()
+            
+            frames = [json.loads(call[0][0]) for call in websocket.send_text.call_args_list]
+            assert frames[0]["type"] == "snapshot"
+            assert frames[0]["code"] == "x = 1"
+            assert frames[1]["type"] == "error"
+            assert manager.spectators.count(room_id) == 0
+        finally:
+            manager.rooms.pop(room_id, None)
+            await manager.spectators.close_all()
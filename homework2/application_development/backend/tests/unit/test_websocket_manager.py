@@ -1,8 +1,23 @@
 """Unit tests for WebSocket ConnectionManager."""
 
+import asyncio
+import json
+import time
+from datetime import UTC, datetime, timedelta
 import pytest
 from unittest.mock import AsyncMock, MagicMock, patch
-from app.websocket import ConnectionManager
+from app.models import CodeChangeMessage, CursorChangeMessage, ErrorMessage
+from app.rooms import Room, RoomGoneError
+from app.websocket import (
+    Connection,
+    ConnectionManager,
+    WS_HEARTBEAT_INTERVAL,
+    WS_CLOSE_GOING_AWAY,
+    WS_CLOSE_ROOM_GONE,
+    WS_IDLE_TIMEOUT,
+    WS_RECONNECT_MIN_MS,
+    WS_RECONNECT_MAX_MS,
+)
 
 
 @pytest.mark.unit
@@ -13,7 +28,7 @@ class TestConnectionManager:
         """Test ConnectionManager initialization."""
         manager = ConnectionManager()
         assert manager.active_connections == {}
-        assert manager.user_info == {}
+        assert manager.connections == {}
     
     @pytest.mark.asyncio
     async def test_connect_new_room(self):
@@ -28,9 +43,9 @@ class TestConnectionManager:
         assert len(user_id) > 0
         assert "room-123" in manager.active_connections
         assert websocket in manager.active_connections["room-123"]
-        assert websocket in manager.user_info
-        assert manager.user_info[websocket]["username"] == "testuser"
-        assert manager.user_info[websocket]["room_id"] == "room-123"
+        assert websocket in manager.connections
+        assert manager.connections[websocket].username == "testuser"
+        assert manager.connections[websocket].room_id == "room-123"
         websocket.accept.assert_called_once()
     
     @pytest.mark.asyncio
@@ -49,6 +64,22 @@ class TestConnectionManager:
         assert websocket1 in manager.active_connections["room-123"]
         assert websocket2 in manager.active_connections["room-123"]
     
+    @pytest.mark.asyncio
+    async def test_connections_share_interned_ids(self):
+        """Test that records are slotted and share one room id and username string."""
+        manager = ConnectionManager()
+        websocket1 = AsyncMock()
+        websocket2 = AsyncMock()
+        
+        # Equal but distinct strings, like the ids parsed from two request URLs
+        await manager.connect(websocket1, "-".join(("room", "123")), "-".join(("user", "1")))
+        await manager.connect(websocket2, "-".join(("room", "123")), "-".join(("user", "1")))
+        
+        first, second = manager.connections[websocket1], manager.connections[websocket2]
+        assert first.room_id is second.room_id
+        assert first.username is second.username
+        assert not hasattr(first, "__dict__")
+    
     @pytest.mark.asyncio
     async def test_connect_anonymous_user(self):
         """Test connecting with anonymous username."""
@@ -59,24 +90,137 @@ class TestConnectionManager:
         user_id = await manager.connect(websocket, "room-123")
         
         assert user_id is not None
-        assert manager.user_info[websocket]["username"] == "Anonymous"
+        assert manager.connections[websocket].username == "Anonymous"
+    
+    @pytest.mark.asyncio
+    async def test_connect_sends_snapshot_first(self):
+        """Test that the joining user first receives the room snapshot and roster."""
+        manager = ConnectionManager()
+        manager.rooms["room-123"] = Room("room-123", text="print(1)", version=7)
+        existing = AsyncMock()
+        manager.active_connections["room-123"] = {existing}
+        manager.connections[existing] = Connection("user-1", "alice", "room-123")
+        websocket = AsyncMock()
+        
+        user_id = await manager.connect(websocket, "room-123", "bob")
+        
+        snapshot = json.loads(websocket.send_text.call_args_list[0][0][0])
+        assert snapshot["type"] == "snapshot"
+        assert snapshot["user_id"] == user_id
+        assert snapshot["code"] == "print(1)"
+        assert snapshot["version"] == 7
+        assert {user["username"] for user in snapshot["users"]} == {"alice", "bob"}
+        existing.send_text.assert_not_called()
+        await manager.flush_presence("room-123")
+        assert "presence" in existing.send_text.call_args[0][0]
+        await asyncio.gather(*manager.presence_flushes.values())
+    
+    @pytest.mark.asyncio
+    async def test_connect_loads_room_once(self):
+        """Test that the room state is loaded only for the first connection."""
+        manager = ConnectionManager()
+        
+        with patch("app.websocket.load_room", return_value=Room("room-123", text="x")) as load:
+            await manager.connect(AsyncMock(), "room-123", "user1")
+            await manager.connect(AsyncMock(), "room-123", "user2")
+        
+        load.assert_called_once_with("room-123")
+        assert manager.rooms["room-123"].text == "x"
+    
+    @pytest.mark.asyncio
+    async def test_connect_resync_sends_missing_ops(self):
+        """Test that a reconnecting client only receives the ops it missed."""
+        manager = ConnectionManager()
+        room = Room("room-123")
+        manager.rooms["room-123"] = room
+        for version in range(1, 4):
+            room.apply(CodeChangeMessage(code=f"v{version}", cursor_position=0))
+            room.record(version, f"op{version}")
+        websocket = AsyncMock()
+        
+        user_id = await manager.connect(
+            websocket, "room-123", "bob", epoch=room.epoch, last_version=1, previous_user_id="bob-1"
+        )
+        
+        frames = [call[0][0] for call in websocket.send_text.call_args_list]
+        resync = json.loads(frames[0])
+        assert resync["type"] == "resync"
+        assert resync["from_version"] == 1
+        assert resync["version"] == 3
+        assert frames[1:] == ["op2", "op3"]
+        # Kept, so the client can recognize its own ops among the replayed ones
+        assert user_id == resync["user_id"] == "bob-1"
+    
+    @pytest.mark.asyncio
+    async def test_connect_resync_needs_previous_user_id(self):
+        """Test that a client without its previous ID, or whose ID is taken, gets a snapshot and a new ID."""
+        manager = ConnectionManager()
+        room = Room("room-123")
+        manager.rooms["room-123"] = room
+        room.apply(CodeChangeMessage(code="v1", cursor_position=0))
+        room.record(1, "op1")
+        holder, anonymous, impostor = AsyncMock(), AsyncMock(), AsyncMock()
+        manager.active_connections["room-123"] = {holder}
+        manager.connections[holder] = Connection("bob-1", "bob", "room-123")
+        
+        await manager.connect(anonymous, "room-123", "ana", epoch=room.epoch, last_version=0)
+        user_id = await manager.connect(
+            impostor, "room-123", "eve", epoch=room.epoch, last_version=0, previous_user_id="bob-1"
+        )
+        
+        assert json.loads(anonymous.send_text.call_args_list[0][0][0])["type"] == "snapshot"
+        assert json.loads(impostor.send_text.call_args_list[0][0][0])["type"] == "snapshot"
+        assert user_id != "bob-1"
+    
+    @pytest.mark.asyncio
+    async def test_connect_resync_falls_back_to_snapshot(self):
+        """Test that a client from an unknown epoch gets a full snapshot."""
+        manager = ConnectionManager()
+        manager.rooms["room-123"] = Room("room-123", text="abc", version=5)
+        websocket = AsyncMock()
+        
+        await manager.connect(websocket, "room-123", "bob", epoch="stale", last_version=2)
+        
+        snapshot = json.loads(websocket.send_text.call_args_list[0][0][0])
+        assert snapshot["type"] == "snapshot"
+        assert snapshot["code"] == "abc"
+    
+    @pytest.mark.asyncio
+    async def test_connect_replays_ops_applied_during_snapshot(self):
+        """Test that ops applied while the snapshot was being sent are replayed before registering."""
+        manager = ConnectionManager()
+        room = Room("room-123", text="a")
+        manager.rooms["room-123"] = room
+        sender = AsyncMock()
+        manager.active_connections["room-123"] = {sender}
+        websocket = AsyncMock()
+        
+        async def send_text(frame):
+            if json.loads(frame)["type"] == "snapshot":
+                await manager.broadcast_code_change("room-123", CodeChangeMessage(from_pos=1, to_pos=1, insert="b"), "user-1", exclude=sender)
+        
+        websocket.send_text.side_effect = send_text
+        
+        await manager.connect(websocket, "room-123", "bob")
+        
+        frames = [json.loads(call[0][0]) for call in websocket.send_text.call_args_list]
+        assert [frame["type"] for frame in frames] == ["snapshot", "code_change"]
+        assert frames[0]["version"] == 0
+        assert frames[1]["version"] == 1
+        assert websocket in manager.active_connections["room-123"]
     
     def test_disconnect_existing_user(self):
         """Test disconnecting an existing user."""
         manager = ConnectionManager()
         websocket = AsyncMock()
         manager.active_connections["room-123"] = {websocket}
-        manager.user_info[websocket] = {
-            "user_id": "user-123",
-            "username": "testuser",
-            "room_id": "room-123"
-        }
+        manager.connections[websocket] = Connection("user-123", "testuser", "room-123")
         
         result = manager.disconnect(websocket)
         
         assert result == ("room-123", "user-123", "testuser")
         assert websocket not in manager.active_connections.get("room-123", set())
-        assert websocket not in manager.user_info
+        assert websocket not in manager.connections
     
     def test_disconnect_nonexistent_user(self):
         """Test disconnecting a user that doesn't exist."""
@@ -92,11 +236,7 @@ class TestConnectionManager:
         manager = ConnectionManager()
         websocket = AsyncMock()
         manager.active_connections["room-123"] = {websocket}
-        manager.user_info[websocket] = {
-            "user_id": "user-123",
-            "username": "testuser",
-            "room_id": "room-123"
-        }
+        manager.connections[websocket] = Connection("user-123", "testuser", "room-123")
         
         manager.disconnect(websocket)
         
@@ -110,7 +250,7 @@ class TestConnectionManager:
         websocket.send_text = AsyncMock()
         manager.active_connections["room-123"] = {websocket}
         
-        await manager.broadcast_code_change("room-123", "print('test')", 10, "user-123")
+        await manager.broadcast_code_change("room-123", CodeChangeMessage(code="print('test')", cursor_position=10), "user-123")
         
         websocket.send_text.assert_called_once()
         call_args = websocket.send_text.call_args[0][0]
@@ -127,7 +267,7 @@ class TestConnectionManager:
         websocket2.send_text = AsyncMock()
         manager.active_connections["room-123"] = {websocket1, websocket2}
         
-        await manager.broadcast_code_change("room-123", "print('test')", 10, "user-123")
+        await manager.broadcast_code_change("room-123", CodeChangeMessage(code="print('test')", cursor_position=10), "user-123")
         
         assert websocket1.send_text.call_count == 1
         assert websocket2.send_text.call_count == 1
@@ -142,18 +282,47 @@ class TestConnectionManager:
         websocket2.send_text = AsyncMock()
         manager.active_connections["room-123"] = {websocket1, websocket2}
         
-        await manager.broadcast_code_change("room-123", "print('test')", 10, "user-123", exclude=websocket1)
+        await manager.broadcast_code_change("room-123", CodeChangeMessage(code="print('test')", cursor_position=10), "user-123", exclude=websocket1)
         
         websocket1.send_text.assert_not_called()
         websocket2.send_text.assert_called_once()
     
+    @pytest.mark.asyncio
+    async def test_broadcast_code_change_stamps_version(self):
+        """Test that code changes are applied to the room and carry its version."""
+        manager = ConnectionManager()
+        manager.rooms["room-123"] = Room("room-123", text="abc", version=3)
+        websocket = AsyncMock()
+        manager.active_connections["room-123"] = {websocket}
+        
+        await manager.broadcast_code_change("room-123", CodeChangeMessage(from_pos=3, to_pos=3, insert="d"), "user-123")
+        
+        payload = json.loads(websocket.send_text.call_args[0][0])
+        assert payload["version"] == 4
+        assert manager.rooms["room-123"].text == "abcd"
+    
+    @pytest.mark.asyncio
+    async def test_broadcast_code_change_acks_author(self):
+        """Test that the author gets the version assigned to its op instead of the op itself."""
+        manager = ConnectionManager()
+        manager.rooms["room-123"] = Room("room-123", text="abc", version=3)
+        author, peer = AsyncMock(), AsyncMock()
+        manager.active_connections["room-123"] = {author, peer}
+        
+        await manager.broadcast_code_change(
+            "room-123", CodeChangeMessage(from_pos=3, to_pos=3, insert="d"), "user-123", exclude=author
+        )
+        
+        assert json.loads(author.send_text.call_args[0][0]) == {"type": "ack", "version": 4}
+        assert json.loads(peer.send_text.call_args[0][0])["version"] == 4
+    
     @pytest.mark.asyncio
     async def test_broadcast_code_change_nonexistent_room(self):
         """Test broadcasting to nonexistent room."""
         manager = ConnectionManager()
         
         # Should not raise an error
-        await manager.broadcast_code_change("nonexistent", "print('test')", 10, "user-123")
+        await manager.broadcast_code_change("nonexistent", CodeChangeMessage(code="print('test')", cursor_position=10), "user-123")
     
     @pytest.mark.asyncio
     async def test_broadcast_code_change_disconnected_user(self):
@@ -162,143 +331,131 @@ class TestConnectionManager:
         websocket = AsyncMock()
         websocket.send_text = AsyncMock(side_effect=Exception("Connection closed"))
         manager.active_connections["room-123"] = {websocket}
-        manager.user_info[websocket] = {
-            "user_id": "user-123",
-            "username": "testuser",
-            "room_id": "room-123"
-        }
+        manager.connections[websocket] = Connection("user-123", "testuser", "room-123")
         
-        await manager.broadcast_code_change("room-123", "print('test')", 10, "user-123")
+        await manager.broadcast_code_change("room-123", CodeChangeMessage(code="print('test')", cursor_position=10), "user-123")
         
         # Disconnected user should be cleaned up
         assert websocket not in manager.active_connections.get("room-123", set())
-        assert websocket not in manager.user_info
+        assert websocket not in manager.connections
     
     @pytest.mark.asyncio
-    async def test_broadcast_user_joined(self):
-        """Test broadcasting user joined notification."""
-        manager = ConnectionManager()
-        websocket = AsyncMock()
-        websocket.send_text = AsyncMock()
-        manager.active_connections["room-123"] = {websocket}
-        
-        await manager.broadcast_user_joined("room-123", "user-456", "newuser")
-        
-        websocket.send_text.assert_called_once()
-        call_args = websocket.send_text.call_args[0][0]
-        assert "user_joined" in call_args
-        assert "newuser" in call_args
-    
-    @pytest.mark.asyncio
-    async def test_broadcast_user_joined_exclude_new_user(self):
-        """Test that new user is excluded from join notification."""
+    async def test_flush_presence_batches_joins_and_leaves(self):
+        """Test that queued joins/leaves reach every peer as a single presence delta."""
         manager = ConnectionManager()
         websocket1 = AsyncMock()
-        websocket1.send_text = AsyncMock()
         websocket2 = AsyncMock()
-        websocket2.send_text = AsyncMock()
         manager.active_connections["room-123"] = {websocket1, websocket2}
         
-        await manager.broadcast_user_joined("room-123", "user-456", "newuser", exclude=websocket2)
+        manager.queue_user_joined("room-123", "user-1", "alice")
+        manager.queue_user_joined("room-123", "user-2", "bob")
+        manager.queue_user_left("room-123", "user-0")
+        await manager.flush_presence("room-123")
         
-        websocket1.send_text.assert_called_once()
-        websocket2.send_text.assert_not_called()
+        for websocket in (websocket1, websocket2):
+            websocket.send_text.assert_called_once()
+            payload = json.loads(websocket.send_text.call_args[0][0])
+            assert payload["type"] == "presence"
+            assert [user["username"] for user in payload["joined"]] == ["alice", "bob"]
+            assert payload["left"] == ["user-0"]
+            assert payload["count"] == 2
+        await asyncio.gather(*manager.presence_flushes.values())
     
     @pytest.mark.asyncio
-    async def test_broadcast_user_left(self):
-        """Test broadcasting user left notification."""
+    async def test_join_then_leave_in_same_window_is_not_sent(self):
+        """Test that a user who joins and leaves within one window is never announced."""
         manager = ConnectionManager()
         websocket = AsyncMock()
-        websocket.send_text = AsyncMock()
         manager.active_connections["room-123"] = {websocket}
         
-        await manager.broadcast_user_left("room-123", "user-456")
+        manager.queue_user_joined("room-123", "user-1", "alice")
+        manager.queue_user_left("room-123", "user-1")
+        await manager.flush_presence("room-123")
         
-        websocket.send_text.assert_called_once()
-        call_args = websocket.send_text.call_args[0][0]
-        assert "user_left" in call_args
+        websocket.send_text.assert_not_called()
+        await asyncio.gather(*manager.presence_flushes.values())
     
     @pytest.mark.asyncio
-    async def test_broadcast_user_left_nonexistent_room(self):
-        """Test broadcasting user left to nonexistent room."""
+    async def test_presence_flushes_after_window(self):
+        """Test that a queued change is flushed once by the background task."""
         manager = ConnectionManager()
+        websocket = AsyncMock()
+        manager.active_connections["room-123"] = {websocket}
         
-        # Should not raise an error
-        await manager.broadcast_user_left("nonexistent", "user-456")
+        with patch("app.websocket.WS_PRESENCE_FLUSH_INTERVAL", 0):
+            manager.queue_user_joined("room-123", "user-1", "alice")
+            manager.queue_user_joined("room-123", "user-2", "bob")
+            assert len(manager.presence_flushes) == 1
+            await asyncio.gather(*manager.presence_flushes.values())
+        
+        websocket.send_text.assert_called_once()
+        assert manager.presence_flushes == {}
+        assert manager.presence_pending == {}
     
     @pytest.mark.asyncio
-    async def test_broadcast_user_joined_nonexistent_room(self):
-        """Test broadcasting user joined to nonexistent room (line 101)."""
+    async def test_flush_presence_nonexistent_room(self):
+        """Test flushing presence for a room without connections."""
         manager = ConnectionManager()
+        manager.presence_pending["nonexistent"] = {"user-1": None}
         
-        # Should return early without error (line 101)
-        await manager.broadcast_user_joined("nonexistent", "user-456", "newuser")
+        # Should not raise an error
+        await manager.flush_presence("nonexistent")
+        assert "nonexistent" not in manager.presence_pending
     
     @pytest.mark.asyncio
-    async def test_broadcast_user_joined_disconnected_user(self):
-        """Test handling disconnected users during user_joined broadcast."""
+    async def test_flush_presence_disconnected_user(self):
+        """Test that peers dropped during a flush are cleaned up and announced as left."""
         manager = ConnectionManager()
         websocket = AsyncMock()
         websocket.send_text = AsyncMock(side_effect=Exception("Connection closed"))
         manager.active_connections["room-123"] = {websocket}
-        manager.user_info[websocket] = {
-            "user_id": "user-123",
-            "username": "testuser",
-            "room_id": "room-123"
-        }
+        manager.connections[websocket] = Connection("user-123", "testuser", "room-123")
+        manager.queue_user_joined("room-123", "user-456", "newuser")
         
-        await manager.broadcast_user_joined("room-123", "user-456", "newuser")
+        await manager.flush_presence("room-123")
         
-        # Disconnected user should be cleaned up
-        assert websocket not in manager.active_connections.get("room-123", set())
-        assert websocket not in manager.user_info
+        # Disconnected user should be cleaned up and queued for the next delta
+        assert "room-123" not in manager.active_connections
+        assert websocket not in manager.connections
+        assert manager.presence_pending["room-123"] == {"user-123": None}
+        await asyncio.gather(*manager.presence_flushes.values())
     
     @pytest.mark.asyncio
-    async def test_broadcast_user_left_disconnected_user(self):
-        """Test handling disconnected users during user_left broadcast."""
+    async def test_broadcast_sends_to_every_connection(self):
+        """Test server events reach every connection of the room, dropping dead ones."""
         manager = ConnectionManager()
-        websocket = AsyncMock()
-        websocket.send_text = AsyncMock(side_effect=Exception("Connection closed"))
-        manager.active_connections["room-123"] = {websocket}
-        manager.user_info[websocket] = {
-            "user_id": "user-123",
-            "username": "testuser",
-            "room_id": "room-123"
-        }
+        alive, dead = AsyncMock(), AsyncMock()
+        dead.send_text = AsyncMock(side_effect=Exception("Connection closed"))
+        manager.active_connections["room-123"] = {alive, dead}
+        manager.connections[dead] = Connection("user-dead", "dead", "room-123")
         
-        await manager.broadcast_user_left("room-123", "user-456")
+        await manager.broadcast("room-123", ErrorMessage(message="hola"))
         
-        # Disconnected user should be cleaned up
-        assert websocket not in manager.active_connections.get("room-123", set())
-        assert websocket not in manager.user_info
+        assert json.loads(alive.send_text.call_args[0][0]) == {"type": "error", "message": "hola"}
+        assert manager.active_connections["room-123"] == {alive}
+        assert manager.presence_pending["room-123"] == {"user-dead": None}
+        await asyncio.gather(*manager.presence_flushes.values())
     
     @pytest.mark.asyncio
-    async def test_connect_broadcasts_user_joined(self):
-        """Test that connect broadcasts user_joined to other users (line 46)."""
+    async def test_connect_queues_user_joined(self):
+        """Test that connect announces the new user to the room in a presence delta."""
         manager = ConnectionManager()
         websocket1 = AsyncMock()
-        websocket1.accept = AsyncMock()
-        websocket1.send_text = AsyncMock()
         websocket2 = AsyncMock()
-        websocket2.accept = AsyncMock()
-        websocket2.send_text = AsyncMock()
         
-        # Connect first user
-        user_id1 = await manager.connect(websocket1, "room-123", "user1")
-        
-        # Connect second user - first user should receive notification
+        await manager.connect(websocket1, "room-123", "user1")
         user_id2 = await manager.connect(websocket2, "room-123", "user2")
+        await manager.flush_presence("room-123")
         
-        # websocket1 should have received user_joined for user2
-        # (broadcast_user_joined excludes the sender, so websocket2 doesn't receive their own)
-        assert websocket1.send_text.called
-        call_args = websocket1.send_text.call_args[0][0]
-        assert "user_joined" in call_args
-        assert "user2" in call_args
+        payload = json.loads(websocket1.send_text.call_args[0][0])
+        assert payload["type"] == "presence"
+        assert user_id2 in [user["user_id"] for user in payload["joined"]]
+        assert payload["count"] == 2
+        await asyncio.gather(*manager.presence_flushes.values())
     
     @pytest.mark.asyncio
     async def test_disconnect_returns_none_when_not_connected(self):
-        """Test disconnect returns None when websocket not in user_info (line 52-53)."""
+        """Test disconnect returns None when websocket not in connections (line 52-53)."""
         manager = ConnectionManager()
         websocket = AsyncMock()
         
@@ -313,50 +470,647 @@ class TestConnectionManager:
         websocket = AsyncMock()
         websocket.send_text = AsyncMock(side_effect=Exception("Connection closed"))
         manager.active_connections["room-123"] = {websocket}
-        manager.user_info[websocket] = {
-            "user_id": "user-123",
-            "username": "testuser",
-            "room_id": "room-123"
-        }
+        manager.connections[websocket] = Connection("user-123", "testuser", "room-123")
         
-        await manager.broadcast_code_change("room-123", "print('test')", 10, "user-123")
+        await manager.broadcast_code_change("room-123", CodeChangeMessage(code="print('test')", cursor_position=10), "user-123")
         
         # Room should be removed after disconnect cleanup (line 63-64)
         assert "room-123" not in manager.active_connections
+
+
+@pytest.mark.unit
+class TestHeartbeat:
+    """Tests for heartbeat pings and idle connection reaping."""
+    
+    def _register(self, manager, websocket, now):
+        manager.active_connections.setdefault("room-123", set()).add(websocket)
+        manager.connections[websocket] = Connection("user-1", "alice", "room-123", last_seen=now)
+        manager.deadlines.schedule(websocket, now + WS_HEARTBEAT_INTERVAL)
     
     @pytest.mark.asyncio
-    async def test_broadcast_user_joined_empty_room_after_disconnect(self):
-        """Test broadcast_user_joined when room becomes empty after disconnect cleanup."""
+    async def test_idle_connection_gets_ping(self):
+        """Test that a connection idle for the heartbeat interval is pinged, not reaped."""
         manager = ConnectionManager()
         websocket = AsyncMock()
-        websocket.send_text = AsyncMock(side_effect=Exception("Connection closed"))
-        manager.active_connections["room-123"] = {websocket}
-        manager.user_info[websocket] = {
-            "user_id": "user-123",
-            "username": "testuser",
-            "room_id": "room-123"
-        }
+        start = manager.deadlines.current * manager.deadlines.tick
+        self._register(manager, websocket, start)
         
-        await manager.broadcast_user_joined("room-123", "user-456", "newuser")
+        reaped = await manager.reap_idle(start + WS_HEARTBEAT_INTERVAL + 1)
         
-        # Room should be removed after disconnect cleanup
-        assert "room-123" not in manager.active_connections
+        assert reaped == 0
+        assert json.loads(websocket.send_text.call_args[0][0]) == {"type": "ping"}
+        assert websocket in manager.connections
     
     @pytest.mark.asyncio
-    async def test_broadcast_user_left_empty_room_after_disconnect(self):
-        """Test broadcast_user_left when room becomes empty after disconnect cleanup."""
+    async def test_active_connection_is_not_pinged(self):
+        """Test that recent activity pushes the next check out without a ping."""
         manager = ConnectionManager()
         websocket = AsyncMock()
-        websocket.send_text = AsyncMock(side_effect=Exception("Connection closed"))
-        manager.active_connections["room-123"] = {websocket}
-        manager.user_info[websocket] = {
-            "user_id": "user-123",
-            "username": "testuser",
-            "room_id": "room-123"
-        }
+        start = manager.deadlines.current * manager.deadlines.tick
+        self._register(manager, websocket, start)
+        manager.connections[websocket].last_seen = start + WS_HEARTBEAT_INTERVAL - 1
         
-        await manager.broadcast_user_left("room-123", "user-456")
+        await manager.reap_idle(start + WS_HEARTBEAT_INTERVAL + 1)
         
-        # Room should be removed after disconnect cleanup
+        websocket.send_text.assert_not_called()
+        assert websocket in manager.deadlines
+    
+    @pytest.mark.asyncio
+    async def test_dead_connection_is_reaped(self):
+        """Test that a connection silent past the idle timeout is closed and removed."""
+        manager = ConnectionManager()
+        websocket = AsyncMock()
+        start = manager.deadlines.current * manager.deadlines.tick
+        self._register(manager, websocket, start)
+        
+        await manager.reap_idle(start + WS_HEARTBEAT_INTERVAL + 1)
+        reaped = await manager.reap_idle(start + WS_IDLE_TIMEOUT + 1)
+        
+        assert reaped == 1
+        websocket.close.assert_called_once()
+        assert websocket not in manager.connections
         assert "room-123" not in manager.active_connections
+        await asyncio.gather(*manager.presence_flushes.values())
+    
+    def test_disconnect_cancels_deadline(self):
+        """Test that disconnecting removes the connection from the wheel."""
+        manager = ConnectionManager()
+        websocket = AsyncMock()
+        self._register(manager, websocket, 0.0)
+        
+        manager.disconnect(websocket)
+        
+        assert websocket not in manager.deadlines
+
+
+@pytest.mark.unit
+class TestDrain:
+    """Tests for graceful drain on shutdown."""
+    
+    @pytest.mark.asyncio
+    async def test_drain_hands_off_clients_and_saves_rooms(self):
+        """Test that drain sends jittered reconnects, closes sockets and saves dirty rooms in one batch."""
+        manager = ConnectionManager()
+        room = Room("room-123", text="abc")
+        room.apply(CodeChangeMessage(code="abcd", cursor_position=0))
+        manager.rooms["room-123"] = room
+        manager.rooms["room-456"] = Room("room-456", text="clean")
+        websockets = [AsyncMock(), AsyncMock()]
+        for index, websocket in enumerate(websockets):
+            manager.active_connections.setdefault("room-123", set()).add(websocket)
+            manager.connections[websocket] = Connection(f"user-{index}", "u", "room-123")
+        
+        with patch("app.websocket.save_room_texts", return_value=1) as save:
+            await manager.drain(timeout=1)
+        
+        assert manager.draining is True
+        for websocket in websockets:
+            payload = json.loads(websocket.send_text.call_args[0][0])
+            assert payload["type"] == "reconnect"
+            assert WS_RECONNECT_MIN_MS <= payload["retry_after_ms"] <= WS_RECONNECT_MAX_MS
+            websocket.close.assert_called_once_with(code=1012)
+        save.assert_called_once_with({"room-123": "abcd"})
+        assert room.dirty is False
+        assert manager.active_connections == {}
+    
+    @pytest.mark.asyncio
+    async def test_second_drain_waits_for_the_first(self):
+        """Test that the lifespan drain after the signal handler's does not flush and save again."""
+        manager = ConnectionManager()
+        room = Room("room-123", text="abc")
+        room.apply(CodeChangeMessage(code="abcd", cursor_position=0))
+        manager.rooms["room-123"] = room
+        
+        with patch("app.websocket.save_room_texts", return_value=1) as save, \
+             patch.object(manager, "save_dirty_rooms", wraps=manager.save_dirty_rooms) as save_dirty:
+            await asyncio.gather(manager.drain(timeout=1), manager.drain(timeout=1))
+            await manager.drain(timeout=1)
+        
+        save_dirty.assert_awaited_once()
+        save.assert_called_once_with({"room-123": "abcd"})
+    
+    @pytest.mark.asyncio
+    async def test_save_dirty_rooms_keeps_dirty_on_failure(self):
+        """Test that rooms stay dirty when the batch write fails."""
+        manager = ConnectionManager()
+        room = Room("room-123")
+        room.apply(CodeChangeMessage(code="x", cursor_position=0))
+        manager.rooms["room-123"] = room
+        
+        with patch("app.websocket.save_room_texts", return_value=-1):
+            assert await manager.save_dirty_rooms() == -1
+        
+        assert room.dirty is True
+    
+    def test_restore_rooms(self):
+        """Test that restored rooms are installed without replacing live ones."""
+        manager = ConnectionManager()
+        live = Room("room-1", text="live")
+        manager.rooms["room-1"] = live
+        
+        manager.restore_rooms({"room-1": Room("room-1", text="old"), "room-2": Room("room-2", text="restored")})
+        
+        assert manager.rooms["room-1"] is live
+        assert manager.rooms["room-2"].text == "restored"
+
+
+@pytest.mark.unit
+class TestOccupancy:
+    """Tests for live occupancy tracking."""
+    
+    @pytest.mark.asyncio
+    async def test_flush_writes_changed_rooms_once(self):
+        """Test that joins/leaves are collapsed into one batched write per flush."""
+        manager = ConnectionManager()
+        manager.rooms["room-1"] = Room("room-1")
+        manager.rooms["room-2"] = Room("room-2")
+        websocket1, websocket2, websocket3 = AsyncMock(), AsyncMock(), AsyncMock()
+        await manager.connect(websocket1, "room-1", "a")
+        await manager.connect(websocket2, "room-1", "b")
+        await manager.connect(websocket3, "room-2", "c")
+        manager.disconnect(websocket3)
+        
+        with patch("app.websocket.save_active_users", return_value=2) as save:
+            await manager.flush_occupancy()
+            await manager.flush_occupancy()
+        
+        save.assert_called_once_with({"room-1": 2, "room-2": 0})
+        assert manager.occupancy("room-1") == 2
+        await asyncio.gather(*manager.presence_flushes.values())
+    
+    @pytest.mark.asyncio
+    async def test_flush_retries_after_failure(self):
+        """Test that rooms are flushed again when the write fails."""
+        manager = ConnectionManager()
+        manager.occupancy_changed.add("room-1")
+        
+        with patch("app.websocket.save_active_users", return_value=-1):
+            await manager.flush_occupancy()
+        
+        assert manager.occupancy_changed == {"room-1"}
+
+
+@pytest.mark.unit
+class TestSyntaxChecks:
+    """Tests for debounced background syntax checking."""
+    
+    ERROR = {"line": 1, "column": 6, "end_line": 1, "end_column": 6, "message": "'(' was never closed", "severity": "error"}
+    
+    @pytest.fixture(autouse=True)
+    def no_debounce(self):
+        with patch("app.websocket.SYNTAX_CHECK_DEBOUNCE", 0):
+            yield
+    
+    async def joined_manager(self):
+        manager = ConnectionManager()
+        manager.rooms["room-1"] = Room("room-1", text="print(1)")
+        websocket = AsyncMock()
+        await manager.connect(websocket, "room-1", "a")
+        return manager, websocket
+    
+    def sent_diagnostics(self, websocket):
+        payloads = [json.loads(call[0][0]) for call in websocket.send_text.call_args_list]
+        return [payload for payload in payloads if payload["type"] == "diagnostics"]
+    
+    @pytest.mark.asyncio
+    async def test_edits_restart_the_check(self):
+        """Test that only the last of a burst of edits is parsed."""
+        manager, websocket = await self.joined_manager()
+        with patch("app.websocket.run_syntax_check", AsyncMock(return_value=[self.ERROR])) as check:
+            for code in ("print(", "print(1", "print(12"):
+                await manager.broadcast_code_change("room-1", CodeChangeMessage(code=code), "someone-else")
+            await asyncio.gather(*manager.syntax_checks.values(), return_exceptions=True)
+        
+        check.assert_called_once_with("python", "print(12")
+        assert manager.syntax_checks == {}
+        [payload] = self.sent_diagnostics(websocket)
+        assert payload["version"] == 3
+        assert payload["diagnostics"][0]["message"] == self.ERROR["message"]
+    
+    @pytest.mark.asyncio
+    async def test_stale_result_is_dropped(self):
+        """Test that diagnostics of a version edited while parsing are not broadcast."""
+        manager, websocket = await self.joined_manager()
+        room = manager.rooms["room-1"]
+        
+        async def edit_while_parsing(language, text):
+            room.version += 1
+            return [self.ERROR]
+        
+        with patch("app.websocket.run_syntax_check", side_effect=edit_while_parsing):
+            await asyncio.gather(*manager.syntax_checks.values())
+        
+        assert self.sent_diagnostics(websocket) == []
+        assert "room-1" not in manager.diagnostics
+    
+    @pytest.mark.asyncio
+    async def test_broadcasts_only_changes(self):
+        """Test that unchanged diagnostics are not resent, and clearing them is."""
+        manager, websocket = await self.joined_manager()
+        results = [[], [self.ERROR], [self.ERROR], []]
+        with patch("app.websocket.run_syntax_check", AsyncMock(side_effect=results)):
+            await asyncio.gather(*manager.syntax_checks.values())
+            for code in ("print(", "print( ", "print()"):
+                await manager.broadcast_code_change("room-1", CodeChangeMessage(code=code), "someone-else")
+                await asyncio.gather(*manager.syntax_checks.values())
+        
+        sent = self.sent_diagnostics(websocket)
+        assert [len(payload["diagnostics"]) for payload in sent] == [1, 0]
+        assert [payload["version"] for payload in sent] == [1, 3]
+    
+    @pytest.mark.asyncio
+    async def test_joiner_receives_current_errors(self):
+        """Test that a user joining a room with syntax errors is told about them."""
+        manager, _ = await self.joined_manager()
+        with patch("app.websocket.run_syntax_check", AsyncMock(return_value=[self.ERROR])):
+            await asyncio.gather(*manager.syntax_checks.values())
+        
+        joiner = AsyncMock()
+        await manager.connect(joiner, "room-1", "b")
+        
+        [payload] = self.sent_diagnostics(joiner)
+        assert payload["diagnostics"][0]["line"] == 1
+        assert manager.syntax_checks == {}
+    
+    @pytest.mark.asyncio
+    async def test_languages_without_parser_are_skipped(self):
+        """Test that no check is scheduled for languages without a registered parser."""
+        manager = ConnectionManager()
+        manager.rooms["room-1"] = Room("room-1", language="javascript")
+        await manager.connect(AsyncMock(), "room-1", "a")
+        
+        assert manager.syntax_checks == {}
+
+
+@pytest.mark.unit
+class TestRoomActors:
+    """Tests for routing room events through the per-room actor."""
+    
+    @pytest.mark.asyncio
+    async def test_room_events_are_serialized(self):
+        """Test that ops queued behind a join are applied after it, in order, and the actor exits with the room."""
+        manager = ConnectionManager()
+        manager.rooms["room-1"] = Room("room-1", text="")
+        alice, bob = AsyncMock(), AsyncMock()
+        
+        async def slow_send(frame):
+            await asyncio.sleep(0.01)
+        bob.send_text = AsyncMock(side_effect=slow_send)
+        
+        await manager.actor("room-1").call(manager.connect, alice, "room-1", "alice")
+        joining = asyncio.create_task(manager.actor("room-1").call(manager.connect, bob, "room-1", "bob"))
+        await asyncio.sleep(0)
+        for index in range(3):
+            await manager.actor("room-1").send(
+                manager.broadcast_code_change,
+                room_id="room-1",
+                message=CodeChangeMessage(from_pos=index, to_pos=index, insert=str(index)),
+                user_id="alice-id",
+                exclude=alice
+            )
+        await joining
+        await manager.in_room("room-1", manager.leave, alice)
+        
+        frames = [json.loads(call[0][0]) for call in bob.send_text.call_args_list]
+        assert frames[0]["type"] == "snapshot"
+        assert frames[0]["version"] == 0
+        assert [frame["version"] for frame in frames if frame["type"] == "code_change"] == [1, 2, 3]
+        assert manager.rooms["room-1"].text == "012"
+        
+        await manager.in_room("room-1", manager.leave, bob)
+        await asyncio.sleep(0)
+        assert manager.actors == {}
+        await asyncio.gather(*manager.presence_flushes.values(), *manager.syntax_checks.values(), return_exceptions=True)
+    
+    @pytest.mark.asyncio
+    async def test_reaper_hands_leave_to_actor(self):
+        """Test that reaping an idle connection is applied by its room's actor."""
+        manager = ConnectionManager()
+        manager.rooms["room-1"] = Room("room-1")
+        websocket = AsyncMock()
+        await manager.actor("room-1").call(manager.connect, websocket, "room-1", "alice")
+        
+        await manager.reap_idle(time.monotonic() + WS_IDLE_TIMEOUT + WS_HEARTBEAT_INTERVAL + 5)
+        assert websocket in manager.connections  # Queued, not applied from the heartbeat task
+        await manager.in_room("room-1", asyncio.sleep, 0)
+        
+        assert websocket not in manager.connections
+        websocket.close.assert_called_once()
+        await asyncio.gather(*manager.presence_flushes.values(), *manager.syntax_checks.values(), return_exceptions=True)
+    
+    @pytest.mark.asyncio
+    async def test_in_room_runs_inline_without_actor(self):
+        """Test that events for a room without an actor run right away."""
+        manager = ConnectionManager()
+        handler = AsyncMock(return_value="done")
+        
+        assert await manager.in_room("room-1", handler, 1, key="value") == "done"
+        handler.assert_awaited_once_with(1, key="value")
+        assert manager.actors == {}
+
+
+@pytest.mark.unit
+class TestCoalescing:
+    """Tests for merging keystrokes before broadcast."""
+    
+    async def room_with(self, *usernames):
+        manager = ConnectionManager()
+        manager.rooms["room-1"] = Room("room-1", text="abc")
+        websockets = [AsyncMock() for _ in usernames]
+        for websocket, username in zip(websockets, usernames):
+            await manager.connect(websocket, "room-1", username)
+            websocket.send_text.reset_mock()
+        return manager, websockets
+    
+    def code_changes(self, websocket):
+        payloads = [json.loads(call[0][0]) for call in websocket.send_text.call_args_list]
+        return [payload for payload in payloads if payload["type"] == "code_change"]
+    
+    async def settle(self, manager):
+        await asyncio.gather(
+            *(pending.timer for pending in manager.pending_changes.values()),
+            *manager.presence_flushes.values(),
+            *manager.syntax_checks.values(),
+            return_exceptions=True
+        )
+    
+    @pytest.mark.asyncio
+    async def test_typing_is_broadcast_once(self):
+        """Test that typing "hello" reaches peers as one op with one version after the window."""
+        manager, (alice, bob) = await self.room_with("alice", "bob")
+        
+        with patch("app.websocket.WS_COALESCE_WINDOW", 0.01):
+            for index, char in enumerate("hello", start=3):
+                await manager.submit_code_change("room-1", CodeChangeMessage(from_pos=index, to_pos=index, insert=char), "alice-id", alice)
+            assert self.code_changes(bob) == []
+            await asyncio.sleep(0.03)
+        
+        [change] = self.code_changes(bob)
+        assert (change["from_pos"], change["insert"], change["version"]) == (3, "hello", 1)
+        assert manager.rooms["room-1"].text == "abchello"
+        assert manager.pending_changes == {}
+        await self.settle(manager)
+    
+    @pytest.mark.asyncio
+    async def test_merged_op_keeps_first_keystroke_time(self):
+        """Test that a coalesced op is timestamped when its first keystroke arrived, not at flush."""
+        manager, (alice, bob) = await self.room_with("alice", "bob")
+        
+        with patch("app.websocket.WS_COALESCE_WINDOW", 0.05):
+            before = datetime.now(UTC)
+            await manager.submit_code_change("room-1", CodeChangeMessage(from_pos=3, to_pos=3, insert="h"), "alice-id", alice)
+            await manager.submit_code_change("room-1", CodeChangeMessage(from_pos=4, to_pos=4, insert="i"), "alice-id", alice)
+            await asyncio.sleep(0.1)
+        
+        [change] = self.code_changes(bob)
+        stamped = datetime.fromisoformat(change["timestamp"])
+        assert stamped.tzinfo is not None
+        assert before <= stamped < before + timedelta(seconds=0.05)
+        await self.settle(manager)
+    
+    @pytest.mark.asyncio
+    async def test_rest_save_is_broadcast_after_pending_keystrokes(self):
+        """Test that code saved over REST becomes the room's next version for everyone."""
+        manager, (alice, bob) = await self.room_with("alice", "bob")
+        
+        await manager.submit_code_change("room-1", CodeChangeMessage(from_pos=3, to_pos=3, insert="x"), "alice-id", alice)
+        await manager.apply_saved_code("room-1", "guardado")
+        await manager.apply_saved_code("room-1", "guardado")
+        
+        changes = self.code_changes(bob)
+        assert [(change.get("insert"), change.get("code"), change["version"]) for change in changes] == [
+            ("x", None, 1),
+            (None, "guardado", 2),
+        ]
+        assert [change["version"] for change in self.code_changes(alice)] == [2]
+        assert manager.rooms["room-1"].text == "guardado"
+        await self.settle(manager)
+    
+    @pytest.mark.asyncio
+    async def test_other_users_op_flushes_first(self):
+        """Test that a peer's edit is ordered after the pending keystrokes."""
+        manager, (alice, bob) = await self.room_with("alice", "bob")
+        
+        await manager.submit_code_change("room-1", CodeChangeMessage(from_pos=3, to_pos=3, insert="x"), "alice-id", alice)
+        await manager.submit_code_change("room-1", CodeChangeMessage(from_pos=0, to_pos=0, insert="long paste"), "bob-id", bob)
+        
+        assert [change["insert"] for change in self.code_changes(bob)] == ["x"]
+        assert [change["version"] for change in self.code_changes(alice)] == [2]
+        assert manager.rooms["room-1"].text == "long pasteabcx"
+        await self.settle(manager)
+    
+    @pytest.mark.asyncio
+    async def test_cursor_waits_for_pending_keystrokes(self):
+        """Test that the typist's cursor is sent after the op it follows."""
+        manager, (alice, bob) = await self.room_with("alice", "bob")
+        
+        await manager.submit_code_change("room-1", CodeChangeMessage(from_pos=3, to_pos=3, insert="x"), "alice-id", alice)
+        await manager.submit_cursor_change("room-1", CursorChangeMessage(line=1, column=4), "alice-id", alice)
+        bob.send_text.assert_not_called()
+        
+        await manager.leave(alice)
+        
+        types = [json.loads(call[0][0])["type"] for call in bob.send_text.call_args_list]
+        assert types == ["code_change", "cursor_change"]
+        await self.settle(manager)
+    
+    @pytest.mark.asyncio
+    async def test_window_zero_disables_coalescing(self):
+        """Test that keystrokes are broadcast immediately when coalescing is off."""
+        manager, (alice, bob) = await self.room_with("alice", "bob")
+        
+        with patch("app.websocket.WS_COALESCE_WINDOW", 0):
+            await manager.submit_code_change("room-1", CodeChangeMessage(from_pos=3, to_pos=3, insert="x"), "alice-id", alice)
+        
+        assert len(self.code_changes(bob)) == 1
+        await self.settle(manager)
+
 
+@pytest.mark.unit
+class TestSpectators:
+    """Tests for read-only spectators of a room."""
+    
+    @pytest.mark.asyncio
+    async def test_spectators_skip_per_op_fan_out(self):
+        """Test that spectators get the room's ops in the next throttled update, not one frame per op."""
+        manager = ConnectionManager()
+        manager.rooms["room-1"] = Room("room-1", text="")
+        editor, watcher = AsyncMock(), AsyncMock()
+        await manager.connect(editor, "room-1", "alice")
+        await manager.spectate("room-1", watcher.send_text, watcher.close, cursors=True)
+        
+        for index in range(3):
+            await manager.broadcast_code_change("room-1", CodeChangeMessage(from_pos=index, to_pos=index, insert="x"), "alice-id", editor)
+        await manager.broadcast_cursor_change("room-1", CursorChangeMessage(line=1, column=3), "alice-id", editor)
+        assert watcher.send_text.call_count == 1  # Only the snapshot so far
+        assert manager.occupancy("room-1") == 1
+        
+        await manager.spectators.publish("room-1")
+        
+        frames = [json.loads(call[0][0]) for call in watcher.send_text.call_args_list]
+        assert [frame["type"] for frame in frames] == ["snapshot", "code_change", "cursor_change"]
+        assert frames[1]["insert"] == "xxx"
+        assert frames[1]["version"] == 3
+        await manager.spectators.close_all()
+        await asyncio.gather(*manager.presence_flushes.values(), *manager.syntax_checks.values(), return_exceptions=True)
+    
+    @pytest.mark.asyncio
+    async def test_drain_closes_spectators(self):
+        """Test that shutdown ends spectator streams too."""
+        manager = ConnectionManager()
+        manager.rooms["room-1"] = Room("room-1")
+        watcher = AsyncMock()
+        await manager.spectate("room-1", watcher.send_text, watcher.close)
+        
+        with patch("app.websocket.save_room_texts", return_value=0), \
+             patch("app.websocket.save_active_users", return_value=0):
+            await manager.drain(timeout=1)
+        
+        watcher.close.assert_awaited_once()
+        assert manager.spectators.count() == 0
+    
+    @pytest.mark.asyncio
+    async def test_silent_spectator_is_pinged_then_reaped(self):
+        """Test that spectator WebSockets are on the heartbeat wheel like editors."""
+        manager = ConnectionManager()
+        manager.rooms["room-1"] = Room("room-1")
+        websocket = AsyncMock()
+        spectator = await manager.spectate("room-1", websocket.send_text, websocket.close)
+        manager.watch(websocket, "room-1", spectator)
+        start = manager.watchers[websocket][0].last_seen
+        
+        assert await manager.reap_idle(start + WS_HEARTBEAT_INTERVAL + 1) == 0
+        assert json.loads(websocket.send_text.call_args[0][0]) == {"type": "ping"}
+        reaped = await manager.reap_idle(start + WS_IDLE_TIMEOUT + 1)
+        
+        assert reaped == 1
+        websocket.close.assert_awaited_once_with(code=WS_CLOSE_GOING_AWAY)
+        assert manager.watchers == {}
+        assert manager.spectators.count() == 0
+        assert websocket not in manager.deadlines
+    
+    @pytest.mark.asyncio
+    async def test_spectator_frames_keep_it_alive(self):
+        """Test that a spectator's pings push its next check out."""
+        manager = ConnectionManager()
+        manager.rooms["room-1"] = Room("room-1")
+        websocket = AsyncMock()
+        spectator = await manager.spectate("room-1", websocket.send_text, websocket.close)
+        manager.watch(websocket, "room-1", spectator)
+        start = manager.watchers[websocket][0].last_seen
+        
+        with patch("app.websocket.time.monotonic", return_value=start + WS_IDLE_TIMEOUT):
+            manager.touch(websocket)
+        
+        assert await manager.reap_idle(start + WS_IDLE_TIMEOUT + 1) == 0
+        assert manager.spectators.count() == 1
+        manager.unwatch(websocket)
+        assert manager.spectators.count() == 0
+
+
+@pytest.mark.unit
+class TestRoomMemoryBudget:
+    """Tests for spilling idle rooms over the memory budget."""
+    
+    def rooms(self, manager, count):
+        for index in range(count):
+            room = Room(f"room-{index}", text=f"print({index})\n" * 100)
+            room.last_used = index  # room-0 is the least recently used
+            manager.rooms[room.room_id] = room
+    
+    @pytest.mark.asyncio
+    async def test_spills_least_recently_used_rooms(self):
+        """Test that the oldest rooms are written in one batch and dropped until the rest fit."""
+        manager = ConnectionManager()
+        self.rooms(manager, 4)
+        sizes = manager.room_memory()
+        budget = sizes["room-2"] + sizes["room-3"]
+        
+        with patch("app.websocket.save_room_texts_by_id", side_effect=lambda texts: set(texts)) as save:
+            assert await manager.spill_idle_rooms(budget) == 2
+        
+        save.assert_called_once()
+        assert set(save.call_args[0][0]) == {"room-0", "room-1"}
+        assert set(manager.rooms) == {"room-2", "room-3"}
+        assert set(manager.spilled) == {"room-0", "room-1"}
+        assert sum(manager.room_memory().values()) <= budget
+    
+    @pytest.mark.asyncio
+    async def test_keeps_rooms_that_cannot_be_spilled(self):
+        """Test that watched rooms and rooms without a session stay in memory."""
+        manager = ConnectionManager()
+        self.rooms(manager, 3)
+        watcher = AsyncMock()
+        await manager.spectate("room-0", watcher.send_text, watcher.close)
+        
+        with patch("app.websocket.save_room_texts_by_id", return_value={"room-2"}) as save:
+            assert await manager.spill_idle_rooms(0) == 1
+        
+        assert "room-0" not in save.call_args[0][0]
+        assert set(manager.rooms) == {"room-0", "room-1"}
+        await manager.spectators.close_all()
+    
+    @pytest.mark.asyncio
+    async def test_edit_rehydrates_spilled_room(self):
+        """Test that the next op of a connected client finds the room with its versions intact."""
+        manager = ConnectionManager()
+        manager.rooms["room-1"] = Room("room-1", text="abc")
+        alice, bob = AsyncMock(), AsyncMock()
+        await manager.connect(alice, "room-1", "alice")
+        await manager.connect(bob, "room-1", "bob")
+        await manager.broadcast_code_change("room-1", CodeChangeMessage(from_pos=3, to_pos=3, insert="d"), "alice-id", alice)
+        saved = {}
+        
+        with patch("app.websocket.save_room_texts_by_id", side_effect=lambda texts: saved.update(texts) or set(texts)):
+            assert await manager.spill_idle_rooms(0) == 1
+        assert "room-1" not in manager.rooms
+        
+        def from_database(spilled):
+            room = Room(spilled.room_id, text=saved[spilled.room_id], version=spilled.version)
+            room.epoch = spilled.epoch
+            return room
+        
+        with patch("app.websocket.rehydrate_room", side_effect=from_database):
+            await manager.broadcast_code_change("room-1", CodeChangeMessage(from_pos=4, to_pos=4, insert="e"), "alice-id", alice)
+        
+        assert manager.rooms["room-1"].text == "abcde"
+        assert manager.spilled == {}
+        frames = [json.loads(call[0][0]) for call in bob.send_text.call_args_list]
+        assert [frame["version"] for frame in frames if frame["type"] == "code_change"] == [1, 2]
+        await asyncio.gather(*manager.presence_flushes.values(), *manager.syntax_checks.values(), return_exceptions=True)
+    
+    @pytest.mark.asyncio
+    async def test_deleted_session_closes_spilled_room(self):
+        """Test that clients of a spilled room whose session was deleted are closed, not given an empty room."""
+        manager = ConnectionManager()
+        manager.rooms["room-1"] = Room("room-1", text="abc")
+        alice, bob = AsyncMock(), AsyncMock()
+        await manager.connect(alice, "room-1", "alice")
+        await manager.connect(bob, "room-1", "bob")
+        with patch("app.websocket.save_room_texts_by_id", side_effect=lambda texts: set(texts)):
+            assert await manager.spill_idle_rooms(0) == 1
+        bob.send_text.reset_mock()
+        
+        with patch("app.websocket.rehydrate_room", side_effect=RoomGoneError("room-1")):
+            await manager.broadcast_code_change("room-1", CodeChangeMessage(from_pos=3, to_pos=3, insert="d"), "alice-id", alice)
+        
+        for websocket in (alice, bob):
+            websocket.close.assert_awaited_once_with(code=WS_CLOSE_ROOM_GONE, reason="La sesión ya no existe")
+        frames = [json.loads(call[0][0]) for call in bob.send_text.call_args_list]
+        assert [frame["type"] for frame in frames] == ["error"]
+        assert "room-1" not in manager.rooms
+        assert manager.spilled == {}
+        assert manager.connections == {}
+        await asyncio.gather(*manager.presence_flushes.values(), *manager.syntax_checks.values(), return_exceptions=True)
+    
+    @pytest.mark.asyncio
+    async def test_failed_write_spills_nothing(self):
+        """Test that rooms stay in memory when their text could not be saved."""
+        manager = ConnectionManager()
+        self.rooms(manager, 2)
+        
+        with patch("app.websocket.save_room_texts_by_id", return_value=None):
+            assert await manager.spill_idle_rooms(0) == 0
+        
+        assert len(manager.rooms) == 2
+        assert manager.spilled == {}
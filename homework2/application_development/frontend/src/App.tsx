@@ -1,4 +1,4 @@
-import { Routes, Route, useParams } from 'react-router-dom'
+import { Routes, Route, useParams, useSearchParams } from 'react-router-dom'
 import { useEffect } from 'react'
 import { useTranslation } from 'react-i18next'
 import { CodeRunnerProvider } from './contexts/CodeRunnerContext'
@@ -27,7 +27,9 @@ function App() {
 
 function SessionRoute() {
   const { sessionId } = useParams<{ sessionId: string }>()
-  return <EditorPage sessionId={sessionId || null} />
+  // /session/:sessionId?watch=1 abre la sesión como espectador (solo lectura)
+  const [searchParams] = useSearchParams()
+  return <EditorPage sessionId={sessionId || null} spectate={searchParams.get('watch') === '1'} />
 }
 
 export default App
@@ -169,5 +169,25 @@ describe('CodeEditor', () => {
     // El selector debería mantenerse en python después del preventDefault
     expect(languageSelector.value).toBe('python')
   })
-})
 
+  it('should list syntax diagnostics below the editor', () => {
+    render(
+      <CodeEditor
+        value="if x"
+        onChange={mockOnChange}
+        language="python"
+        diagnostics={[{ line: 1, column: 4, end_line: 1, end_column: 4, message: "expected ':'", severity: 'error' }]}
+      />
+    )
+    
+    const list = screen.getByRole('list', { name: /errores de sintaxis/i })
+    expect(list).toHaveTextContent("expected ':'")
+    expect(list).toHaveTextContent(/línea 1, columna 5/i)
+  })
+
+  it('should not render the diagnostics list when there are none', () => {
+    render(<CodeEditor value="" onChange={mockOnChange} diagnostics={[]} />)
+    
+    expect(screen.queryByRole('list', { name: /errores de sintaxis/i })).not.toBeInTheDocument()
+  })
+})
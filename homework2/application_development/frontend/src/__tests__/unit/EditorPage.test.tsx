@@ -379,7 +379,7 @@ describe('EditorPage', () => {
     }, { timeout: 3000 })
   })
 
-  it('should handle WebSocket user_joined message', async () => {
+  it('should count a user joining from a presence message', async () => {
     let messageHandler: ((message: WebSocketMessage) => void) | undefined
 
     mockUseWebSocket.mockImplementation((roomId, onMessage) => {
@@ -410,8 +410,10 @@ describe('EditorPage', () => {
       const { act } = await import('@testing-library/react')
       await act(async () => {
         messageHandler!({
-          type: 'user_joined',
-          user_id: 'user-2',
+          type: 'presence',
+          joined: [{ user_id: 'user-2', username: 'alice' }],
+          left: [],
+          count: 2,
         })
       })
     }
@@ -419,11 +421,11 @@ describe('EditorPage', () => {
     // Active users should increase to 2
     await waitFor(() => {
       const activeUsersLabel = screen.getByText(/usuarios activos/i)
-      expect(activeUsersLabel).toBeInTheDocument()
+      expect(activeUsersLabel.nextElementSibling).toHaveTextContent('2')
     }, { timeout: 2000 })
   })
 
-  it('should handle WebSocket user_left message', async () => {
+  it('should count a user leaving from a presence message', async () => {
     let messageHandler: ((message: WebSocketMessage) => void) | undefined
 
     mockUseWebSocket.mockImplementation((roomId, onMessage) => {
@@ -455,23 +457,104 @@ describe('EditorPage', () => {
     // First add a user
     if (messageHandler) {
       await act(async () => {
-        messageHandler!({ type: 'user_joined', user_id: 'user-2' })
+        messageHandler!({
+          type: 'presence',
+          joined: [{ user_id: 'user-2', username: 'alice' }],
+          left: [],
+          count: 2,
+        })
       })
     }
 
     // Then remove the user
     if (messageHandler) {
       await act(async () => {
-        messageHandler!({ type: 'user_left', user_id: 'user-2' })
+        messageHandler!({ type: 'presence', joined: [], left: ['user-2'], count: 1 })
       })
     }
 
-    // Should maintain minimum of 1
+    await waitFor(() => {
+      expect(screen.getByText(/usuarios activos/i).nextElementSibling).toHaveTextContent('1')
+    }, { timeout: 2000 })
+  })
+
+  it('should handle WebSocket presence message', async () => {
+    let messageHandler: ((message: WebSocketMessage) => void) | undefined
+
+    mockUseWebSocket.mockImplementation((roomId, onMessage) => {
+      if (onMessage) {
+        messageHandler = onMessage
+      }
+      return defaultWebSocketReturn
+    })
+
+    vi.mocked(sessionService.getSession).mockResolvedValueOnce(mockSession)
+
+    renderEditorPage('test-session-id')
+
+    await waitFor(() => {
+      expect(screen.queryByText(/cargando sesión/i)).not.toBeInTheDocument()
+    }, { timeout: 3000 })
+
+    await waitFor(() => {
+      expect(messageHandler).toBeDefined()
+    }, { timeout: 2000 })
+
+    const { act } = await import('@testing-library/react')
+    await act(async () => {
+      messageHandler!({
+        type: 'presence',
+        joined: [{ user_id: 'user-2', username: 'alice' }, { user_id: 'user-3', username: 'bob' }],
+        left: [],
+        count: 3,
+      })
+    })
+
     await waitFor(() => {
       expect(screen.getByText(/usuarios activos/i)).toBeInTheDocument()
     }, { timeout: 2000 })
   })
 
+  it('should show and clear syntax diagnostics from the server', async () => {
+    let messageHandler: ((message: WebSocketMessage) => void) | undefined
+
+    mockUseWebSocket.mockImplementation((roomId, onMessage) => {
+      if (onMessage) {
+        messageHandler = onMessage
+      }
+      return defaultWebSocketReturn
+    })
+
+    vi.mocked(sessionService.getSession).mockResolvedValueOnce(mockSession)
+
+    renderEditorPage('test-session-id')
+
+    await waitFor(() => {
+      expect(messageHandler).toBeDefined()
+    }, { timeout: 3000 })
+
+    const { act } = await import('@testing-library/react')
+    await act(async () => {
+      messageHandler!({
+        type: 'diagnostics',
+        version: 3,
+        language: 'python',
+        diagnostics: [{ line: 2, column: 4, end_line: 2, end_column: 4, message: "expected ':'", severity: 'error' }],
+      })
+    })
+
+    expect(await screen.findByText("expected ':'")).toBeInTheDocument()
+    expect(screen.getByText(/línea 2, columna 5/i)).toBeInTheDocument()
+
+    await act(async () => {
+      messageHandler!({ type: 'diagnostics', version: 4, language: 'python', diagnostics: [] })
+    })
+
+    await waitFor(() => {
+      expect(screen.queryByText("expected ':'")).not.toBeInTheDocument()
+    })
+  })
+
   it('should reset active users when session changes', async () => {
     let messageHandler: ((message: WebSocketMessage) => void) | undefined
 
@@ -500,8 +583,12 @@ describe('EditorPage', () => {
 
     // Add users
     if (messageHandler) {
-      messageHandler({ type: 'user_joined', user_id: 'user-2' })
-      messageHandler({ type: 'user_joined', user_id: 'user-3' })
+      messageHandler({
+        type: 'presence',
+        joined: [{ user_id: 'user-2', username: 'alice' }, { user_id: 'user-3', username: 'bob' }],
+        left: [],
+        count: 3,
+      })
     }
 
     // Load new session
@@ -1097,6 +1184,26 @@ describe('EditorPage', () => {
       }, { timeout: 2000 })
     })
 
+    it('should not save from a spectator page', async () => {
+      vi.mocked(sessionService.getSession).mockResolvedValueOnce(mockSession)
+
+      render(
+        <BrowserRouter>
+          <EditorPage sessionId="test-session-id" spectate />
+        </BrowserRouter>
+      )
+
+      await waitFor(() => {
+        expect(sessionService.getSession).toHaveBeenCalled()
+      }, { timeout: 3000 })
+
+      expect(screen.queryByText(/guardar/i)).not.toBeInTheDocument()
+      if (mockOnExecutionSuccess) {
+        mockOnExecutionSuccess()
+      }
+      expect(sessionService.saveCode).not.toHaveBeenCalled()
+    })
+
     it('should disable save button when code has not changed', async () => {
       vi.mocked(sessionService.getSession).mockResolvedValueOnce(mockSession)
 
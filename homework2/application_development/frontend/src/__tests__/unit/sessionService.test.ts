@@ -154,6 +154,47 @@ describe('sessionService', () => {
     })
   })
 
+  describe('runCode', () => {
+    it('should post the code to the run endpoint', async () => {
+      const mockResult = {
+        language: 'python',
+        stdout: '3\n',
+        stderr: '',
+        exit_code: 0,
+        timed_out: false,
+        truncated: false,
+        duration_ms: 20,
+        cached: false,
+      }
+
+      mockFetch.mockResolvedValueOnce({
+        ok: true,
+        json: async () => mockResult,
+      })
+
+      const result = await sessionService.runCode('test-session-id', 'print(1 + 2)', 'python')
+
+      expect(mockFetch).toHaveBeenCalledWith(
+        expect.stringContaining('/api/sessions/test-session-id/run'),
+        expect.objectContaining({
+          method: 'POST',
+          body: JSON.stringify({ code: 'print(1 + 2)', language: 'python' }),
+        })
+      )
+      expect(result).toEqual(mockResult)
+    })
+
+    it('should throw error on other failures', async () => {
+      mockFetch.mockResolvedValueOnce({
+        ok: false,
+        status: 400,
+        statusText: 'Bad Request',
+      })
+
+      await expect(sessionService.runCode('test-id', 'x', 'java')).rejects.toThrow('Failed to run code: Bad Request')
+    })
+  })
+
   describe('getShareUrl', () => {
     it('should generate correct share URL', () => {
       const originalLocation = window.location
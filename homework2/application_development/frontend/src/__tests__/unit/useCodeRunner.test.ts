@@ -2,6 +2,7 @@ import { describe, it, expect, vi, beforeEach, afterEach } from 'vitest'
 import { renderHook, waitFor, act } from '@testing-library/react'
 import React from 'react'
 import { useCodeRunner } from '../../hooks/useCodeRunner'
+import { sessionService } from '../../services/sessionService'
 import type { PyodideInterface } from '../../types/pyodide'
 
 // Mock de Pyodide
@@ -735,4 +736,58 @@ describe('useCodeRunner', () => {
       expect(result.current.output).toContain('Output from print')
     })
   })
+
+  it('should run code on the server when a session is given', async () => {
+    const runSpy = vi.spyOn(sessionService, 'runCode').mockResolvedValue({
+      language: 'python',
+      stdout: 'desde el servidor\n',
+      stderr: '',
+      exit_code: 0,
+      timed_out: false,
+      truncated: false,
+      duration_ms: 12,
+      cached: false,
+    })
+    const { result } = renderHook(() => useCodeRunner())
+
+    await act(async () => {
+      await result.current.runCode('print("desde el servidor")', 'python', 'session-1')
+    })
+
+    expect(runSpy).toHaveBeenCalledWith('session-1', 'print("desde el servidor")', 'python')
+    expect(result.current.output).toBe('desde el servidor\n')
+    expect(result.current.error).toBeNull()
+    expect(mockPyodide.runPythonAsync).not.toHaveBeenCalled()
+  })
+
+  it('should show stderr and timeouts from the server', async () => {
+    vi.spyOn(sessionService, 'runCode').mockResolvedValue({
+      language: 'python',
+      stdout: '',
+      stderr: '',
+      exit_code: -9,
+      timed_out: true,
+      truncated: false,
+      duration_ms: 5000,
+      cached: false,
+    })
+    const { result } = renderHook(() => useCodeRunner())
+
+    await act(async () => {
+      await result.current.runCode('while True: pass', 'python', 'session-1')
+    })
+
+    expect(result.current.error).toBe('La ejecución superó el tiempo límite')
+  })
+
+  it('should fall back to the browser when the server is unavailable', async () => {
+    vi.spyOn(sessionService, 'runCode').mockRejectedValue(new Error('Network error'))
+    const { result } = renderHook(() => useCodeRunner())
+
+    await act(async () => {
+      await result.current.runCode('console.log("local")', 'javascript', 'session-1')
+    })
+
+    expect(result.current.output).toContain('local')
+  })
 })
@@ -32,10 +32,10 @@ describe('useWebSocket', () => {
         // Mock send
       }
 
-      close() {
+      close(code?: number) {
         this.readyState = WebSocket.CLOSED
         if (this.onclose) {
-          this.onclose(new CloseEvent('close'))
+          this.onclose(new CloseEvent('close', { code }))
         }
       }
     }
@@ -90,6 +90,31 @@ describe('useWebSocket', () => {
     })
   })
 
+  it('should join as spectator when requested', async () => {
+    const sendSpy = vi.fn()
+    const { result } = renderHook(() => useWebSocket('test-room', undefined, undefined, { role: 'spectator', cursors: true }))
+    
+    await waitFor(() => {
+      expect(result.current.isConnected).toBe(true)
+    }, { timeout: 1000 })
+    
+    const ws = wsInstances[0]
+    ws.send = sendSpy
+    if (ws.onopen) {
+      ws.onopen(new Event('open'))
+    }
+    
+    await waitFor(() => {
+      expect(sendSpy).toHaveBeenCalled()
+    })
+    expect(JSON.parse(sendSpy.mock.calls[0][0])).toEqual({
+      type: 'join',
+      username: 'Anonymous',
+      role: 'spectator',
+      cursors: true
+    })
+  })
+
   it('should call onMessage when message is received', async () => {
     const onMessage = vi.fn()
     const { result } = renderHook(() => useWebSocket('test-room', onMessage))
@@ -140,6 +165,28 @@ describe('useWebSocket', () => {
     })
   })
 
+  it('should answer server ping with pong', async () => {
+    const onMessage = vi.fn()
+    const sendSpy = vi.fn()
+    const { result } = renderHook(() => useWebSocket('test-room', onMessage))
+    
+    await waitFor(() => {
+      expect(result.current.isConnected).toBe(true)
+    }, { timeout: 1000 })
+    
+    const ws = wsInstances[0]
+    ws.send = sendSpy
+    
+    if (ws.onmessage) {
+      ws.onmessage(new MessageEvent('message', {
+        data: JSON.stringify({ type: 'ping' }),
+      }))
+    }
+    
+    expect(sendSpy).toHaveBeenCalledWith(JSON.stringify({ type: 'pong' }))
+    expect(onMessage).not.toHaveBeenCalled()
+  })
+
   it('should send message when sendMessage is called', async () => {
     const sendSpy = vi.fn()
     const { result } = renderHook(() => useWebSocket('test-room'))
@@ -197,6 +244,92 @@ describe('useWebSocket', () => {
     }, { timeout: 1000 })
   })
 
+  it('should reconnect after the delay requested by the server', async () => {
+    const { result } = renderHook(() => useWebSocket('test-room'))
+    
+    await waitFor(() => {
+      expect(result.current.isConnected).toBe(true)
+    }, { timeout: 1000 })
+    
+    const ws = wsInstances[0]
+    if (ws.onmessage) {
+      ws.onmessage(new MessageEvent('message', {
+        data: JSON.stringify({ type: 'reconnect', retry_after_ms: 20 }),
+      }))
+    }
+    ws.close()
+    
+    await waitFor(() => {
+      expect(wsInstances.length).toBe(2)
+      expect(result.current.isConnected).toBe(true)
+    }, { timeout: 1000 })
+  })
+
+  it('should not reconnect to a room whose session is gone', async () => {
+    vi.useFakeTimers({ shouldAdvanceTime: true })
+    try {
+      const { result } = renderHook(() => useWebSocket('test-room'))
+      
+      await waitFor(() => {
+        expect(result.current.isConnected).toBe(true)
+      }, { timeout: 1000 })
+      
+      const ws = wsInstances[0]
+      ws.onmessage(new MessageEvent('message', {
+        data: JSON.stringify({ type: 'error', message: 'La sesión ya no existe' }),
+      }))
+      ws.close(4404)
+      await vi.advanceTimersByTimeAsync(15000)
+      
+      expect(wsInstances.length).toBe(1)
+      expect(result.current.isConnected).toBe(false)
+      expect(result.current.error).toBe('La sesión ya no existe')
+    } finally {
+      vi.useRealTimers()
+    }
+  })
+
+  it('should resume from the last version on reconnect and skip its own resent ops', async () => {
+    const onMessage = vi.fn()
+    const { result } = renderHook(() => useWebSocket('test-room', onMessage))
+    
+    await waitFor(() => {
+      expect(result.current.isConnected).toBe(true)
+    }, { timeout: 1000 })
+    
+    const receive = (ws: any, message: WebSocketMessage) => {
+      ws.onmessage(new MessageEvent('message', { data: JSON.stringify(message) }))
+    }
+    const first = wsInstances[0]
+    receive(first, { type: 'snapshot', user_id: 'me', epoch: 'e1', version: 3, code: '', users: [] })
+    receive(first, { type: 'code_change', user_id: 'peer', version: 4, from_pos: 0, to_pos: 0, insert: 'a' })
+    receive(first, { type: 'ack', version: 5 })
+    expect(onMessage).not.toHaveBeenCalledWith(expect.objectContaining({ type: 'ack' }))
+    
+    const sendSpy = vi.spyOn(mockWebSocket.prototype, 'send')
+    receive(first, { type: 'reconnect', retry_after_ms: 20 })
+    first.close()
+    await waitFor(() => {
+      expect(sendSpy).toHaveBeenCalled()
+    }, { timeout: 1000 })
+    
+    const second = wsInstances[1]
+    expect(JSON.parse(sendSpy.mock.calls[0][0])).toEqual({
+      type: 'join',
+      username: 'Anonymous',
+      user_id: 'me',
+      epoch: 'e1',
+      last_version: 5
+    })
+    
+    // Our own op, applied by the server before the ack reached us, comes back in the replay
+    onMessage.mockClear()
+    receive(second, { type: 'resync', user_id: 'me', epoch: 'e1', from_version: 5, version: 6, users: [] })
+    receive(second, { type: 'code_change', user_id: 'me', version: 6, from_pos: 1, to_pos: 1, insert: 'b' })
+    expect(onMessage).toHaveBeenCalledTimes(1)
+    expect(onMessage).toHaveBeenCalledWith(expect.objectContaining({ type: 'resync' }))
+  })
+
   it('should cleanup on unmount', async () => {
     const { result, unmount } = renderHook(() => useWebSocket('test-room'))
     
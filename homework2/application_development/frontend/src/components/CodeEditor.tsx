@@ -9,6 +9,16 @@ import './CodeEditor.css'
 
 export type SupportedLanguage = 'javascript' | 'python' | ''
 
+// Problema de sintaxis detectado por el servidor (líneas desde 1, columnas desde 0)
+export interface EditorDiagnostic {
+  line: number
+  column: number
+  end_line: number
+  end_column: number
+  message: string
+  severity: 'error' | 'warning'
+}
+
 interface CodeEditorProps {
   value: string
   onChange: (value: string) => void
@@ -20,6 +30,8 @@ interface CodeEditorProps {
   onLanguageChangeAttempt?: () => void
   hideLanguageSelector?: boolean
   headerActions?: React.ReactNode
+  diagnostics?: EditorDiagnostic[]
+  readOnly?: boolean
 }
 
 export default function CodeEditor({ 
@@ -32,7 +44,9 @@ export default function CodeEditor({
   isLanguageLocked = false,
   onLanguageChangeAttempt,
   hideLanguageSelector = false,
-  headerActions
+  headerActions,
+  diagnostics = [],
+  readOnly = false
 }: CodeEditorProps) {
   const { t } = useTranslation()
   // La opción vacía es la predeterminada
@@ -176,6 +190,8 @@ export default function CodeEditor({
         onUpdate={handleUpdate}
         theme={oneDark}
         extensions={extensions}
+        editable={!readOnly}
+        readOnly={readOnly}
         basicSetup={{
           lineNumbers: true,
           foldGutter: true,
@@ -190,6 +206,18 @@ export default function CodeEditor({
         placeholder={t('codeEditor.placeholder')}
         className="code-mirror-editor"
       />
+      {diagnostics.length > 0 && (
+        <ul className="code-editor-diagnostics" aria-label={t('codeEditor.diagnostics')}>
+          {diagnostics.map((diagnostic, index) => (
+            <li key={index} className={`code-editor-diagnostic ${diagnostic.severity}`}>
+              <span className="code-editor-diagnostic-position">
+                {t('codeEditor.diagnosticPosition', { line: diagnostic.line, column: diagnostic.column + 1 })}
+              </span>
+              <span>{diagnostic.message}</span>
+            </li>
+          ))}
+        </ul>
+      )}
     </div>
   )
 }
@@ -11,6 +11,7 @@ import './CodeRunner.css'
 interface CodeRunnerProps {
   code: string
   language: SupportedLanguage
+  sessionId?: string | null
   onExecutionSuccess?: () => void
   onSave?: () => void
   isSaving?: boolean
@@ -18,7 +19,7 @@ interface CodeRunnerProps {
   hideControls?: boolean
 }
 
-export default function CodeRunner({ code, language, onExecutionSuccess, onSave, isSaving = false, canSave = false, hideControls = false }: CodeRunnerProps) {
+export default function CodeRunner({ code, language, sessionId, onExecutionSuccess, onSave, isSaving = false, canSave = false, hideControls = false }: CodeRunnerProps) {
   const { t } = useTranslation()
   const { runCode, output, error, isLoading, isPyodideReady, clearOutput } = useCodeRunnerContext()
   const [isOutputExpanded, setIsOutputExpanded] = useState(true)
@@ -61,11 +62,17 @@ export default function CodeRunner({ code, language, onExecutionSuccess, onSave,
       return
     }
 
-    await runCode(code, language)
+    if (sessionId) {
+      await runCode(code, language, sessionId)
+    } else {
+      await runCode(code, language)
+    }
     setIsOutputExpanded(true)
   }
 
-  const isDisabled = isLoading || !language || language === '' || (language === 'python' && !isPyodideReady)
+  // Con sesión el código se ejecuta en el servidor y no hace falta esperar a Pyodide
+  const needsPyodide = language === 'python' && !sessionId
+  const isDisabled = isLoading || !language || language === '' || (needsPyodide && !isPyodideReady)
 
   const OutputIcon = (
     <svg viewBox="0 0 24 24" fill="none" xmlns="http://www.w3.org/2000/svg" width="16" height="16">
@@ -152,7 +159,7 @@ export default function CodeRunner({ code, language, onExecutionSuccess, onSave,
                 {t('codeRunner.clear')}
               </button>
             )}
-            {language === 'python' && !isPyodideReady && !isLoading && (
+            {needsPyodide && !isPyodideReady && !isLoading && (
               <span className="loading-indicator">
                 <svg className="loading-spinner" viewBox="0 0 24 24" fill="none" xmlns="http://www.w3.org/2000/svg">
                   <circle cx="12" cy="12" r="10" stroke="currentColor" strokeWidth="2" strokeDasharray="31.416" strokeDashoffset="31.416" strokeLinecap="round">
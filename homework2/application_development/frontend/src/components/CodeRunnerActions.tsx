@@ -7,6 +7,7 @@ import './CodeRunner.css'
 interface CodeRunnerActionsProps {
   code: string
   language: SupportedLanguage
+  sessionId?: string | null
   onSave?: () => void
   isSaving?: boolean
   canSave?: boolean
@@ -17,6 +18,7 @@ interface CodeRunnerActionsProps {
 export default function CodeRunnerActions({ 
   code, 
   language, 
+  sessionId,
   onSave, 
   isSaving = false, 
   canSave = false,
@@ -50,10 +52,16 @@ export default function CodeRunnerActions({
       return
     }
 
-    await runCode(code, language)
+    if (sessionId) {
+      await runCode(code, language, sessionId)
+    } else {
+      await runCode(code, language)
+    }
   }
 
-  const isDisabled = isLoading || !language || language === '' || (language === 'python' && !isPyodideReady)
+  // Con sesión el código se ejecuta en el servidor y no hace falta esperar a Pyodide
+  const needsPyodide = language === 'python' && !sessionId
+  const isDisabled = isLoading || !language || language === '' || (needsPyodide && !isPyodideReady)
 
   return (
     <div className="code-runner-controls">
@@ -118,7 +126,7 @@ export default function CodeRunnerActions({
           {t('codeRunner.clear')}
         </button>
       )}
-      {language === 'python' && !isPyodideReady && !isLoading && (
+      {needsPyodide && !isPyodideReady && !isLoading && (
         <span className="loading-indicator">
           <svg className="loading-spinner" viewBox="0 0 24 24" fill="none" xmlns="http://www.w3.org/2000/svg">
             <circle cx="12" cy="12" r="10" stroke="currentColor" strokeWidth="2" strokeDasharray="31.416" strokeDashoffset="31.416" strokeLinecap="round">
@@ -3,7 +3,7 @@ import { useCodeRunner } from '../hooks/useCodeRunner'
 import type { SupportedLanguage } from '../components/CodeEditor'
 
 interface CodeRunnerContextType {
-  runCode: (code: string, language: SupportedLanguage) => Promise<void>
+  runCode: (code: string, language: SupportedLanguage, sessionId?: string | null) => Promise<void>
   output: string
   error: string | null
   isLoading: boolean
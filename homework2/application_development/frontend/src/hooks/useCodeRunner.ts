@@ -1,9 +1,10 @@
 import { useState, useCallback, useRef, useEffect } from 'react'
 import type { SupportedLanguage } from '../components/CodeEditor'
 import type { PyodideInterface } from '../types/pyodide'
+import { sessionService } from '../services/sessionService'
 
 interface UseCodeRunnerReturn {
-  runCode: (code: string, language: SupportedLanguage) => Promise<void>
+  runCode: (code: string, language: SupportedLanguage, sessionId?: string | null) => Promise<void>
   output: string
   error: string | null
   isLoading: boolean
@@ -92,7 +93,7 @@ export function useCodeRunner(): UseCodeRunnerReturn {
     }
   }, [])
 
-  const runCode = useCallback(async (code: string, language: SupportedLanguage) => {
+  const runCode = useCallback(async (code: string, language: SupportedLanguage, sessionId?: string | null) => {
     setError(null)
     setOutput('')
     stdoutBufferRef.current = []
@@ -102,6 +103,29 @@ export function useCodeRunner(): UseCodeRunnerReturn {
       return
     }
 
+    // Dentro de una sesión, ejecutar en el pool de workers del servidor (sin esperar a Pyodide)
+    if (sessionId) {
+      setIsLoading(true)
+      try {
+        const result = await sessionService.runCode(sessionId, code, language)
+        if (result.stdout) {
+          setOutput(result.stdout)
+        } else if (result.exit_code === 0) {
+          setOutput('Código ejecutado correctamente.')
+        }
+        if (result.timed_out) {
+          setError('La ejecución superó el tiempo límite')
+        } else if (result.stderr) {
+          setError(result.stderr)
+        }
+        return
+      } catch {
+        // Servidor no disponible: ejecutar en el navegador
+      } finally {
+        setIsLoading(false)
+      }
+    }
+
     try {
       if (language === 'python') {
         // Ejecutar código Python con Pyodide
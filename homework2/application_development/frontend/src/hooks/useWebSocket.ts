@@ -11,18 +11,42 @@ export interface UseWebSocketReturn {
   error: string | null
 }
 
+export interface UseWebSocketOptions {
+  // 'spectator': solo lectura, recibe actualizaciones agrupadas a ritmo reducido
+  role?: 'editor' | 'spectator'
+  // Espectadores: recibir también los cursores de los editores
+  cursors?: boolean
+}
+
 const WS_BASE_URL = import.meta.env.VITE_WS_URL || 'ws://localhost:8000'
 
+// Close code sent when the room's session no longer exists: reconnecting would not bring it back
+const WS_CLOSE_ROOM_GONE = 4404
+
+// Position of this client in the room's document history, reported on reconnect
+interface SyncState {
+  roomId: string
+  userId: string
+  epoch: string
+  version: number
+}
+
 export function useWebSocket(
   roomId: string | null,
   onMessage?: (message: WebSocketMessage) => void,
-  onError?: (error: Event) => void
+  onError?: (error: Event) => void,
+  options: UseWebSocketOptions = {}
 ): UseWebSocketReturn {
+  const { role = 'editor', cursors = false } = options
   const [isConnected, setIsConnected] = useState(false)
   const [error, setError] = useState<string | null>(null)
   const wsRef = useRef<WebSocket | null>(null)
   const reconnectTimeoutRef = useRef<NodeJS.Timeout | null>(null)
   const reconnectAttemptsRef = useRef(0)
+  // Delay requested by the server when it is shutting down (see 'reconnect' messages)
+  const reconnectHintRef = useRef<number | null>(null)
+  // Last version applied (remote ops and acks of our own): lets the server resend only the ops we missed
+  const syncRef = useRef<SyncState | null>(null)
   const maxReconnectAttempts = 5
 
   const connect = useCallback(() => {
@@ -45,10 +69,16 @@ export function useWebSocket(
         setError(null)
         reconnectAttemptsRef.current = 0
 
-        // Send join message
+        // Send join message; an editor reconnecting to the same room asks for a resync
+        const sync = syncRef.current
+        const resume = role === 'editor' && sync && sync.roomId === roomId
+          ? { user_id: sync.userId, epoch: sync.epoch, last_version: sync.version }
+          : {}
         ws.send(JSON.stringify({
           type: 'join',
-          username: 'Anonymous'
+          username: 'Anonymous',
+          ...(role === 'spectator' ? { role, cursors } : {}),
+          ...resume
         }))
       }
 
@@ -57,11 +87,39 @@ export function useWebSocket(
           const message: WebSocketMessage = JSON.parse(event.data)
           
           // Handle different message types
-          if (message.type === 'error') {
+          if (message.type === 'ping') {
+            // Server heartbeat: answer so the connection is not reaped as idle
+            ws.send(JSON.stringify({ type: 'pong' }))
+          } else if (message.type === 'reconnect') {
+            // Server is draining: reconnect after its jittered delay instead of our backoff
+            reconnectHintRef.current = message.retry_after_ms
+          } else if (message.type === 'ack') {
+            // Version assigned to our own code change (it is not sent back to us)
+            if (syncRef.current) {
+              syncRef.current.version = message.version
+            }
+          } else if (message.type === 'error') {
             setError(message.message || 'Unknown error')
             console.error('WebSocket error:', message.message)
-          } else if (onMessage) {
-            onMessage(message)
+          } else {
+            if (message.type === 'snapshot' || message.type === 'resync') {
+              // A resync is followed by the ops after from_version, which update the version as they arrive
+              syncRef.current = {
+                roomId,
+                userId: message.user_id,
+                epoch: message.epoch,
+                version: message.type === 'resync' ? message.from_version : message.version
+              }
+            } else if (message.type === 'code_change' && typeof message.version === 'number' && syncRef.current) {
+              syncRef.current.version = message.version
+              if (message.user_id === syncRef.current.userId) {
+                // Our own op resent after a resync: it is already in the local document
+                return
+              }
+            }
+            if (onMessage) {
+              onMessage(message)
+            }
           }
         } catch (err) {
           console.error('Error parsing WebSocket message:', err)
@@ -76,10 +134,27 @@ export function useWebSocket(
         }
       }
 
-      ws.onclose = () => {
+      ws.onclose = (event) => {
         console.log('WebSocket disconnected from room:', roomId)
         setIsConnected(false)
 
+        if (event.code === WS_CLOSE_ROOM_GONE) {
+          // The error message sent before closing says why; the document is not resumable
+          syncRef.current = null
+          return
+        }
+
+        // Planned server restart: use the server-provided delay without spending an attempt
+        if (reconnectHintRef.current !== null) {
+          const delay = reconnectHintRef.current
+          reconnectHintRef.current = null
+          console.log(`Server restarting, reconnecting in ${delay}ms`)
+          reconnectTimeoutRef.current = setTimeout(() => {
+            connect()
+          }, delay)
+          return
+        }
+
         // Attempt to reconnect if not manually closed
         if (reconnectAttemptsRef.current < maxReconnectAttempts) {
           reconnectAttemptsRef.current++
@@ -99,7 +174,7 @@ export function useWebSocket(
       console.error('Error creating WebSocket:', err)
       setError('Failed to create WebSocket connection')
     }
-  }, [roomId, onMessage, onError])
+  }, [roomId, onMessage, onError, role, cursors])
 
   const sendMessage = useCallback((message: WebSocketMessage) => {
     if (wsRef.current && wsRef.current.readyState === WebSocket.OPEN) {
@@ -1,6 +1,6 @@
 import { useState, useEffect, useRef, useCallback } from 'react'
 import { useTranslation } from 'react-i18next'
-import CodeEditor, { SupportedLanguage } from '../components/CodeEditor'
+import CodeEditor, { SupportedLanguage, type EditorDiagnostic } from '../components/CodeEditor'
 import CodeRunner from '../components/CodeRunner'
 import CodeRunnerActions from '../components/CodeRunnerActions'
 import CollapsiblePanel from '../components/CollapsiblePanel'
@@ -17,9 +17,10 @@ import '../App.css'
 
 interface EditorPageProps {
   sessionId?: string | null
+  spectate?: boolean
 }
 
-export default function EditorPage({ sessionId }: EditorPageProps) {
+export default function EditorPage({ sessionId, spectate = false }: EditorPageProps) {
   const { t } = useTranslation()
   const [code, setCode] = useState('')
   const [language, setLanguage] = useState<SupportedLanguage>('')
@@ -37,6 +38,7 @@ export default function EditorPage({ sessionId }: EditorPageProps) {
   const [syncStatus, setSyncStatus] = useState<'synced' | 'pending'>('synced')
   const [cursorPosition, setCursorPosition] = useState<{ line: number; column: number } | null>(null)
   const [conflictNotification, setConflictNotification] = useState<string | null>(null)
+  const [diagnostics, setDiagnostics] = useState<EditorDiagnostic[]>([])
   const isLocalChangeRef = useRef(false)
   const pendingLocalDiffRef = useRef<CodeDiff | null>(null)
   const pendingLanguageChangeRef = useRef<SupportedLanguage | null>(null)
@@ -129,24 +131,37 @@ export default function EditorPage({ sessionId }: EditorPageProps) {
       // Handle remote cursor changes (will be implemented in cursor visualization)
       // For now, just log it
       console.log('Remote cursor change:', message)
-    } else if (message.type === 'user_joined') {
-      setActiveUsers(prev => prev + 1)
-    } else if (message.type === 'user_left') {
-      setActiveUsers(prev => Math.max(1, prev - 1)) // Minimum 1 (current user)
+    } else if (message.type === 'snapshot' || message.type === 'resync') {
+      if (message.type === 'snapshot') {
+        // Se parte del documento en vivo: los cambios siguientes son relativos a él
+        // (tras una reconexión sin resync, el documento local puede estar desactualizado)
+        setCode(message.code)
+        previousCodeRef.current = message.code
+        pendingLocalDiffRef.current = null
+      }
+      setActiveUsers(Math.max(1, message.users?.length ?? 1))
+    } else if (message.type === 'presence') {
+      setActiveUsers(Math.max(1, message.count))
+    } else if (message.type === 'diagnostics') {
+      // El servidor solo envía diagnósticos cuando cambian (lista vacía = código válido)
+      setDiagnostics(message.diagnostics ?? [])
     }
-  }, [code])
+  }, [code, spectate])
 
   // Reset active users when session changes
   useEffect(() => {
     if (currentSession) {
       setActiveUsers(1) // Reset to 1 when new session is loaded
     }
+    setDiagnostics([])
   }, [currentSession?.session_id])
 
   // Connect WebSocket when session is available
   const { isConnected, sendMessage } = useWebSocket(
     currentSession?.room_id || null,
-    handleWebSocketMessage
+    handleWebSocketMessage,
+    undefined,
+    { role: spectate ? 'spectator' : 'editor' }
   )
 
   useEffect(() => {
@@ -177,7 +192,8 @@ export default function EditorPage({ sessionId }: EditorPageProps) {
 
   // Save code function
   const saveCode = useCallback(async () => {
-    if (!currentSession || isSaving) return
+    // Spectators hold a throttled copy of the document: saving it could overwrite the editors' work
+    if (!currentSession || isSaving || spectate) return
     
     // Don't save if code hasn't changed
     if (code === lastSavedCodeRef.current) return
@@ -193,7 +209,7 @@ export default function EditorPage({ sessionId }: EditorPageProps) {
     } finally {
       setIsSaving(false)
     }
-  }, [currentSession, code, isSaving])
+  }, [currentSession, code, isSaving, spectate])
 
   // Send code changes to WebSocket with throttling and debouncing
   const handleCodeChange = (newCode: string) => {
@@ -249,7 +265,7 @@ export default function EditorPage({ sessionId }: EditorPageProps) {
     }
     
     // Set auto-save timer for 2 minutes of inactivity
-    if (currentSession && !isLargeChange) {
+    if (currentSession && !isLargeChange && !spectate) {
       autoSaveTimerRef.current = setTimeout(() => {
         saveCode()
       }, 2 * 60 * 1000) // 2 minutes
@@ -362,9 +378,9 @@ export default function EditorPage({ sessionId }: EditorPageProps) {
     handleDisconnectSession()
   }
 
-  // Initialize throttles when session is connected
+  // Initialize throttles when session is connected (spectators only receive, never send)
   useEffect(() => {
-    if (currentSession?.room_id && isConnected && sendMessage) {
+    if (currentSession?.room_id && isConnected && sendMessage && !spectate) {
       // Initialize code change throttle
       codeChangeThrottleRef.current = throttle((code: string, diff?: CodeDiff) => {
         if (diff) {
@@ -398,7 +414,7 @@ export default function EditorPage({ sessionId }: EditorPageProps) {
       codeChangeThrottleRef.current = null
       cursorThrottleRef.current = null
     }
-  }, [currentSession?.room_id, isConnected, sendMessage])
+  }, [currentSession?.room_id, isConnected, sendMessage, spectate])
 
   // Cleanup auto-save timer on unmount
   useEffect(() => {
@@ -662,13 +678,16 @@ export default function EditorPage({ sessionId }: EditorPageProps) {
             isLanguageLocked={currentSession !== null && !isSessionCreator}
             onLanguageChangeAttempt={handleLanguageChangeAttempt}
             hideLanguageSelector={currentSession !== null}
+            diagnostics={diagnostics}
+            readOnly={spectate}
             headerActions={
               <CodeRunnerActions
                 code={code}
                 language={language}
-                onSave={currentSession ? saveCode : undefined}
+                sessionId={currentSession?.session_id}
+                onSave={currentSession && !spectate ? saveCode : undefined}
                 isSaving={isSaving}
-                canSave={currentSession !== null && code !== lastSavedCodeRef.current && code.trim() !== ''}
+                canSave={currentSession !== null && !spectate && code !== lastSavedCodeRef.current && code.trim() !== ''}
                 onExecutionSuccess={handleExecutionSuccess}
               />
             }
@@ -676,6 +695,7 @@ export default function EditorPage({ sessionId }: EditorPageProps) {
           <CodeRunner 
             code={code} 
             language={language} 
+            sessionId={currentSession?.session_id}
             onExecutionSuccess={handleExecutionSuccess}
             hideControls={true}
           />
@@ -18,6 +18,17 @@ export interface CreateSessionRequest {
   title?: string
 }
 
+export interface RunCodeResult {
+  language: string
+  stdout: string
+  stderr: string
+  exit_code: number | null
+  timed_out: boolean
+  truncated: boolean
+  duration_ms: number
+  cached: boolean
+}
+
 class SessionService {
   async createSession(request: CreateSessionRequest = {}): Promise<SessionData> {
     try {
@@ -58,6 +69,30 @@ class SessionService {
     }
   }
 
+  async runCode(sessionId: string, code: string, language: string): Promise<RunCodeResult> {
+    try {
+      const response = await fetch(`${API_BASE_URL}/api/sessions/${sessionId}/run`, {
+        method: 'POST',
+        headers: {
+          'Content-Type': 'application/json',
+        },
+        body: JSON.stringify({ code, language }),
+      })
+
+      if (!response.ok) {
+        if (response.status === 404) {
+          throw new Error('Session not found')
+        }
+        throw new Error(`Failed to run code: ${response.statusText}`)
+      }
+
+      return await response.json()
+    } catch (error) {
+      console.error('Error running code:', error)
+      throw error
+    }
+  }
+
   getShareUrl(sessionId: string): string {
     const baseUrl = window.location.origin
     return `${baseUrl}/session/${sessionId}`